@@ -0,0 +1,5 @@
+"""
+Бенчмарки горячего пути
+
+Запуск: python -m benchmarks.<имя>
+"""
@@ -0,0 +1,86 @@
+"""
+Бенчмарк пакетной классификации: BatchClassifier против поштучного IPClassifier
+
+Меряет скалярный и NumPy-путь на пачках 1–256 и classify() с порогом
+BatchClassifier.NUMPY_MIN_BATCH; печатает наименьшую пачку, на которой
+NumPy быстрее, — по ней выбирается порог.
+
+Запуск: python -m benchmarks.bench_batch_classifier
+"""
+
+import random
+import sys
+import os
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.batch_classifier import BatchClassifier, np
+from src.classifier import IPClassifier
+from src.config import TELEGRAM
+from src.packet import build_tcp_packet
+
+BATCH_SIZES = (1, 4, 16, 32, 64, 128, 256)
+PACKETS_PER_SIZE = 20000
+
+
+def make_buffers(count: int, seed: int = 1) -> list:
+    """Смесь: адреса Telegram и прочие, TLS/HTTP/пустые сегменты"""
+    rnd = random.Random(seed)
+    payloads = (b"", b"\x16\x03\x01\x02\x00\x01" + b"\x00" * 200,
+                b"GET / HTTP/1.1\r\nHost: x\r\n\r\n", b"\x17" * 1200)
+    buffers = []
+    for i in range(count):
+        if rnd.random() < 0.3:
+            dst = f"149.154.{rnd.randint(160, 175)}.{rnd.randint(1, 254)}"
+        else:
+            dst = f"{rnd.randint(1, 223)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(1, 254)}"
+        port = rnd.choice((443, 443, 80, 8080, 5222))
+        packet = build_tcp_packet("10.0.0.2", dst, 40000 + i % 20000, port,
+                                  payload=rnd.choice(payloads))
+        buffers.append(bytes(packet.raw))
+    return buffers
+
+
+def _measure(fn, buffers, batch: int) -> float:
+    """ns на пакет"""
+    batches = [buffers[i:i + batch] for i in range(0, len(buffers), batch)]
+    started = time.perf_counter()
+    for chunk in batches:
+        fn(chunk)
+    return (time.perf_counter() - started) * 1e9 / len(buffers)
+
+
+def run(packets: int = PACKETS_PER_SIZE) -> dict:
+    """{пачка: {"scalar", "numpy", "auto"} в нс на пакет} и точка перехода"""
+    ip = IPClassifier.from_config(TELEGRAM)
+    buffers = make_buffers(packets)
+    scalar = BatchClassifier(ip, use_numpy=False)
+    vector = BatchClassifier(ip, min_batch=0) if np is not None else None
+    auto = BatchClassifier(ip)
+    sizes = {}
+    for batch in BATCH_SIZES:
+        sizes[batch] = {
+            "scalar": _measure(scalar.classify, buffers, batch),
+            "numpy": _measure(vector.classify, buffers, batch) if vector else None,
+            "auto": _measure(auto.classify, buffers, batch),
+        }
+    crossover = next((batch for batch, r in sizes.items()
+                      if r["numpy"] is not None and r["numpy"] < r["scalar"]), None)
+    return {"sizes": sizes, "crossover": crossover, "threshold": auto.min_batch}
+
+
+def main():
+    report = run()
+    print(f"{'batch':>6} {'scalar ns/pkt':>14} {'numpy ns/pkt':>13} {'auto ns/pkt':>12}")
+    for batch, r in report["sizes"].items():
+        numpy_ns = r["numpy"] if r["numpy"] is not None else float("nan")
+        print(f"{batch:>6} {r['scalar']:>14.0f} {numpy_ns:>13.0f} {r['auto']:>12.0f}")
+    if np is None:
+        print("numpy не установлен — измерен только скалярный путь")
+    else:
+        print(f"NumPy быстрее с пачки {report['crossover']}, "
+              f"порог NUMPY_MIN_BATCH = {report['threshold']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Бенчмарк самописца: стоимость record() и накладные расходы на конвейер сниффера
+
+Запуск: python -m benchmarks.bench_flight_recorder
+"""
+
+import sys
+import os
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.backend import FakeBackend
+from src.flight_recorder import FlightRecorder, RecordingBackend
+from src.packet import build_tcp_packet
+from src.sniffer import TrafficSniffer
+
+PACKETS = 50000
+
+
+def make_packets(count: int) -> list:
+    sizes = (0, 64, 517, 1400)
+    return [build_tcp_packet("10.0.0.2", "198.51.100.7", 40000 + i % 1000, 443,
+                             payload=b"\x17" * sizes[i % len(sizes)])
+            for i in range(count)]
+
+
+def bench_record(packets) -> float:
+    recorder = FlightRecorder()
+    started = time.perf_counter()
+    for packet in packets:
+        recorder.record(packet)
+    return (time.perf_counter() - started) * 1e9 / len(packets)
+
+
+def bench_sniffer(packets, with_recorder: bool) -> float:
+    backend = FakeBackend(packets)
+    if with_recorder:
+        backend = RecordingBackend(backend, FlightRecorder())
+    sniffer = TrafficSniffer(backend=backend)
+    started = time.perf_counter()
+    sniffer.start()
+    return (time.perf_counter() - started) * 1e9 / len(packets)
+
+
+def main():
+    packets = make_packets(PACKETS)
+    print(f"record():               {bench_record(packets):8.0f} ns/packet")
+    base = bench_sniffer(make_packets(PACKETS), False)
+    recorded = bench_sniffer(make_packets(PACKETS), True)
+    print(f"sniffer without recorder: {base:8.0f} ns/packet")
+    print(f"sniffer with recorder:    {recorded:8.0f} ns/packet "
+          f"(+{recorded - base:.0f} ns, {100 * (recorded - base) / base:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Бенчмарк полос приоритета: время до отправки ClientHello под нагрузкой
+
+Воспроизведение в реальном времени: пакеты поступают в очередь
+«драйвера» по расписанию — всплески ACK медиа-закачки (и сегменты
+отправки по тем же потокам) каждые 10 мс плюс новые соединения
+(SYN, через 1 мс ClientHello к Telegram). Конвейер — как у
+TelegramBypass.run(), цикл — TrafficSniffer.start().
+
+Время до рукопожатия — от поступления ClientHello до отправки его
+первого фрагмента; задержка bulk — от поступления ACK до пересылки.
+Режимы: без полос (по порядку), strict, weighted.
+
+Бэкенды: "replay" — очередь в памяти; "nfqueue" — настоящий NFQueueBackend
+поверх netlink-сокета, в который ядро по расписанию кладёт NFQNL_MSG_PACKET
+(по сообщению на чтение); bulk считается до вердикта ACCEPT, рукопожатие —
+до инъекции первого фрагмента через raw-сокет.
+
+Запуск: python -m benchmarks.bench_lanes [--seconds 3] [--rate 40000] [--hellos 50]
+        [--backend replay|nfqueue]
+"""
+
+import argparse
+import os
+import random
+import socket
+import struct
+import sys
+import tempfile
+import time
+from collections import deque
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.bench_soak import build_pipeline
+from benchmarks.traffic import CLIENT, MSS, TELEGRAM_DCS, TELEGRAM_SNIS, tdesktop_hello
+from src.backend import DivertBackend
+from src.flow_table import flow_key
+from src.lanes import LANE_MODES, LaneScheduler
+from src.nfqueue_backend import (
+    NFQA_PACKET_HDR, NFQA_PAYLOAD, NFQA_VERDICT_HDR, NFQNL_MSG_PACKET, NFQNL_MSG_VERDICT,
+    NFQNL_MSG_VERDICT_BATCH, NF_ACCEPT, NF_INET_LOCAL_OUT, NLM_F_ACK, NLMSG_ERROR,
+    NFQueueBackend, iter_messages, nfq_message, nla, parse_attrs,
+)
+from src.packet import TCP_ACK, TCP_PSH, TCP_SYN, RawPacket, build_tcp_packet
+
+SECONDS = 3.0
+RATE = 40_000
+HELLOS = 50
+BURST_INTERVAL = 0.010
+DOWNLOADS = 4
+UPLOAD_SHARE = 0.1
+
+
+def make_events(seconds: float = SECONDS, rate: int = RATE, hellos: int = HELLOS,
+                seed: int = 1):
+    """Расписание [(время, пакет)] и ключи потоков новых соединений"""
+    rnd = random.Random(seed)
+    events = []
+    downloads = []
+    for i in range(DOWNLOADS):
+        dst, port = TELEGRAM_DCS[i % len(TELEGRAM_DCS)], 30000 + i
+        seq = rnd.getrandbits(32)
+        hello = tdesktop_hello(rnd.choice(TELEGRAM_SNIS), rnd)
+        events.append((0.0, build_tcp_packet(CLIENT, dst, port, 443, payload=hello, seq=seq,
+                                             ack=1, flags=TCP_ACK | TCP_PSH)))
+        downloads.append([dst, port, seq + len(hello)])
+
+    per_burst = int(rate * BURST_INTERVAL)
+    t = BURST_INTERVAL
+    while t < seconds:
+        for i in range(per_burst):
+            flow = downloads[i % DOWNLOADS]
+            if rnd.random() < UPLOAD_SHARE:
+                packet = build_tcp_packet(CLIENT, flow[0], flow[1], 443, payload=b"\x17" * MSS,
+                                          seq=flow[2], ack=1, flags=TCP_ACK | TCP_PSH)
+                flow[2] += MSS
+            else:
+                packet = build_tcp_packet(CLIENT, flow[0], flow[1], 443, seq=flow[2], ack=1)
+            events.append((t, packet))
+        t += BURST_INTERVAL
+
+    keys = set()
+    t = rnd.expovariate(hellos)
+    port = 40000
+    while t < seconds:
+        dst = rnd.choice(TELEGRAM_DCS)
+        seq = rnd.getrandbits(32)
+        events.append((t, build_tcp_packet(CLIENT, dst, port, 443, seq=seq, flags=TCP_SYN)))
+        hello = build_tcp_packet(CLIENT, dst, port, 443, seq=seq + 1, ack=1,
+                                 payload=tdesktop_hello(rnd.choice(TELEGRAM_SNIS), rnd),
+                                 flags=TCP_ACK | TCP_PSH)
+        events.append((t + 0.001, hello))
+        keys.add(flow_key(hello))
+        port += 1
+        t += rnd.expovariate(hellos)
+    events.sort(key=lambda e: e[0])
+    return events, keys
+
+
+class ReplayBackend(DivertBackend):
+    """Очередь «драйвера», которая наполняется по расписанию в реальном времени"""
+
+    read_ahead = True
+
+    def __init__(self, events, hello_keys, **queue_params):
+        super().__init__(**queue_params)
+        self.events = deque(events)
+        self.queue = deque()
+        self.hello_keys = hello_keys
+        self.start = 0.0
+        self._arrival = {}
+        self._hello_arrival = {}
+        self.handshake = []
+        self.bulk = []
+
+    def open(self):
+        self.start = time.perf_counter()
+
+    def _arrive(self):
+        """Переносит в очередь всё, чему пришло время"""
+        events, queue = self.events, self.queue
+        now = time.perf_counter() - self.start
+        while events and events[0][0] <= now:
+            if len(queue) >= self.queue_length:
+                self.drops += 1
+                events.popleft()
+                continue
+            queue.append(events.popleft())
+        return now
+
+    def recv(self):
+        events, queue = self.events, self.queue
+        while True:
+            now = self._arrive()
+            if queue:
+                t, packet = queue.popleft()
+                key = flow_key(packet)
+                if key in self.hello_keys and packet.tcp.payload:
+                    self._hello_arrival.setdefault(key, t)
+                else:
+                    self._arrival[id(packet)] = t
+                return packet
+            if not events:
+                return None
+            time.sleep(min(events[0][0] - now, 0.0005))
+
+    def ready(self) -> bool:
+        self._arrive()
+        return bool(self.queue)
+
+    def send(self, packet):
+        now = time.perf_counter() - self.start
+        t = self._hello_arrival.pop(flow_key(packet), None)
+        if t is not None:
+            self.handshake.append(now - t)
+            return len(packet.raw)
+        t = self._arrival.pop(id(packet), None)
+        if t is not None:
+            self.bulk.append(now - t)
+        return len(packet.raw)
+
+    def pending(self) -> int:
+        return len(self.queue)
+
+
+class ReplayNetlink:
+    """
+    Netlink-сокет NFQUEUE, в который пакеты поступают по расписанию
+
+    Как и ReplayBackend, считает задержки: bulk — до вердикта ACCEPT
+    (пачка принимает все id до своего), рукопожатие — до первой инъекции.
+    Служит и raw-сокетом для инъекций.
+    """
+
+    def __init__(self, events, hello_keys, queue_length: int):
+        self.events = deque(events)
+        self.hello_keys = hello_keys
+        self.queue_length = queue_length
+        self.queue = deque()
+        self.acks = deque()
+        self.start = 0.0
+        self.drops = 0
+        self._next_id = 0
+        self._arrival = {}
+        self._hello_arrival = {}
+        self.handshake = []
+        self.bulk = []
+
+    def _arrive(self):
+        events, queue = self.events, self.queue
+        now = time.perf_counter() - self.start
+        while events and events[0][0] <= now:
+            t, packet = events.popleft()
+            if len(queue) >= self.queue_length:
+                self.drops += 1
+                continue
+            self._next_id += 1
+            key = flow_key(packet)
+            if key in self.hello_keys and packet.tcp.payload:
+                self._hello_arrival.setdefault(key, t)
+            else:
+                self._arrival[self._next_id] = t
+            queue.append(nfq_message(NFQNL_MSG_PACKET, 0, flags=0, attrs=(
+                nla(NFQA_PACKET_HDR, struct.pack("!IHB", self._next_id, 0x0800,
+                                                 NF_INET_LOCAL_OUT)) +
+                nla(NFQA_PAYLOAD, bytes(packet.raw)))))
+        return now
+
+    def recv_into(self, buf, nbytes=0, flags=0):
+        if self.acks:
+            data = self.acks.popleft()
+        else:
+            while True:
+                now = self._arrive()
+                if self.queue:
+                    data = self.queue.popleft()
+                    break
+                if flags & socket.MSG_DONTWAIT:
+                    raise BlockingIOError
+                if not self.events:
+                    return 0
+                time.sleep(min(self.events[0][0] - now, 0.0005))
+        buf[:len(data)] = data
+        return len(data)
+
+    def send(self, data):
+        length, _, msg_flags, seq, _ = struct.unpack_from("=IHHII", data)
+        if msg_flags & NLM_F_ACK:
+            self.acks.append(struct.pack("=IHHII", 36, NLMSG_ERROR, 0, seq, 0) +
+                             struct.pack("=i", 0) + bytes(data[:16]))
+            return len(data)
+        now = time.perf_counter() - self.start
+        buf = memoryview(data)
+        for msg_type, _, _, start, end in iter_messages(buf, len(data)):
+            attrs = parse_attrs(buf, start + 4, end)
+            if msg_type & 0xFF not in (NFQNL_MSG_VERDICT, NFQNL_MSG_VERDICT_BATCH):
+                continue
+            verdict, packet_id = struct.unpack("!II", attrs[NFQA_VERDICT_HDR])
+            if msg_type & 0xFF == NFQNL_MSG_VERDICT:
+                ids = [packet_id]
+            else:
+                ids = [i for i in self._arrival if i <= packet_id]
+            for i in ids:
+                t = self._arrival.pop(i, None)
+                if t is not None and verdict == NF_ACCEPT:
+                    self.bulk.append(now - t)
+        return len(data)
+
+    def sendto(self, data, addr):
+        t = self._hello_arrival.pop(flow_key(RawPacket(data)), None)
+        if t is not None:
+            self.handshake.append(time.perf_counter() - self.start - t)
+
+    def close(self):
+        pass
+
+
+def _percentiles(values) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"count": 0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+
+    def at(p):
+        return round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 3)
+    return {"count": len(values), "p50_ms": at(0.5), "p99_ms": at(0.99),
+            "max_ms": round(values[-1] * 1000, 3)}
+
+
+def run(mode=None, seconds: float = SECONDS, rate: int = RATE, hellos: int = HELLOS,
+        seed: int = 1, backend_kind: str = "replay") -> dict:
+    """mode: None (по порядку) или режим полос из LANE_MODES; backend_kind: replay|nfqueue"""
+    events, keys = make_events(seconds, rate, hellos, seed)
+    if backend_kind == "nfqueue":
+        timing = ReplayNetlink(events, keys, queue_length=4096)
+        backend = NFQueueBackend(sock=timing, inject_sockets={4: timing, 6: timing})
+        backend.open = _timed_open(backend, timing)
+    else:
+        backend = timing = ReplayBackend(events, keys)
+    with tempfile.TemporaryDirectory() as state_dir:
+        app, _ = build_pipeline(state_dir)
+        sniffer = app.sniffer
+        sniffer.backend = backend
+        sniffer.handle_signals = False
+        sniffer.lanes = LaneScheduler(sniffer.flows, mode) if mode else None
+        started = time.perf_counter()
+        sniffer.start()
+        wall = time.perf_counter() - started
+    report = {
+        "mode": mode or "fifo",
+        "backend": backend_kind,
+        "packets": len(events),
+        "wall_s": round(wall, 3),
+        "handshake": _percentiles(timing.handshake),
+        "bulk": _percentiles(timing.bulk),
+        "drops": timing.drops,
+    }
+    if sniffer.lanes is not None:
+        report["lanes"] = sniffer.lanes.get_stats()
+    return report
+
+
+def _timed_open(backend, timing):
+    """open() бэкенда с отсчётом расписания от момента открытия"""
+    open_ = backend.open
+
+    def wrapper():
+        open_()
+        timing.start = time.perf_counter()
+    return wrapper
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Priority lanes benchmark")
+    parser.add_argument("--seconds", type=float, default=SECONDS)
+    parser.add_argument("--rate", type=int, default=RATE, help="Пакетов bulk в секунду")
+    parser.add_argument("--hellos", type=int, default=HELLOS, help="Новых соединений в секунду")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--backend", choices=("replay", "nfqueue"), default="replay")
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'hello p50':>11}{'p99':>9}{'max':>9}{'bulk p50':>10}{'p99':>9}"
+          f"{'drops':>7}{'wall s':>8}")
+    for mode in (None,) + LANE_MODES:
+        r = run(mode, args.seconds, args.rate, args.hellos, args.seed, args.backend)
+        h, b = r["handshake"], r["bulk"]
+        print(f"{r['mode']:<10}{h['p50_ms']:>11}{h['p99_ms']:>9}{h['max_ms']:>9}"
+              f"{b['p50_ms']:>10}{b['p99_ms']:>9}{r['drops']:>7}{r['wall_s']:>8}")
+
+
+if __name__ == "__main__":
+    main()
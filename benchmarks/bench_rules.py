@@ -0,0 +1,161 @@
+"""
+Бенчмарк правил политики: скомпилированный RuleSet против перебора списка
+
+Тысячи синтетических правил (CIDR, порты, суффиксы и подстроки SNI,
+протоколы) и поток запросов с реальными и случайными адресами.
+Перебор — честный: адреса и сети заранее переведены в целые числа.
+Результаты обоих способов сверяются.
+
+Запуск: python -m benchmarks.bench_rules [--rules 1000 5000] [-n 50000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.traffic import OTHER_SNIS, TELEGRAM_SNIS
+from src.classifier import addr_to_int
+from src.rules import Rule, RuleSet, protocol_keys
+from src.strategy import STRATEGIES
+
+RULE_COUNTS = (100, 1000, 5000)
+FLOWS = 50_000
+PROTOCOLS = ("tls", "http", "mtproto", "unknown")
+TLDS = ("com", "net", "org", "ru", "io")
+
+
+def make_rules(count: int, seed: int = 1) -> list:
+    rnd = random.Random(seed)
+    rules = []
+    for i in range(count):
+        match = {}
+        kind = rnd.random()
+        if kind < 0.5:
+            bits = rnd.choice((16, 20, 24, 24, 32))
+            match["cidr"] = [f"{rnd.randint(1, 223)}.{rnd.randint(0, 255)}."
+                             f"{rnd.randint(0, 255)}.0/{bits}"]
+        elif kind < 0.9:
+            match["sni"] = [f"site{i}.{rnd.choice(TLDS)}"]
+        else:
+            match["sni"] = [f"kw{i}x"]
+        if rnd.random() < 0.3:
+            match["port"] = [rnd.choice((443, 80, 8080))]
+        if rnd.random() < 0.2:
+            match["protocol"] = [rnd.choice(PROTOCOLS)]
+        entry = {"name": f"r{i}", "match": match}
+        if rnd.random() < 0.2:
+            entry["action"] = "pass"
+        else:
+            entry["strategy"] = rnd.choice(STRATEGIES)
+        rules.append(Rule.from_dict(entry, i))
+    # Замыкающее правило для Telegram — его находит большинство запросов Telegram
+    rules.append(Rule.from_dict({"name": "telegram", "match": {"sni": list(TELEGRAM_SNIS)}}))
+    return rules
+
+
+def make_flows(count: int, rules_count: int, seed: int = 2) -> list:
+    rnd = random.Random(seed)
+    flows = []
+    for _ in range(count):
+        dst = f"{rnd.randint(1, 223)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(1, 254)}"
+        r = rnd.random()
+        if r < 0.3:
+            sni = f"www.site{rnd.randrange(rules_count)}.{rnd.choice(TLDS)}"
+        elif r < 0.5:
+            sni = rnd.choice(TELEGRAM_SNIS)
+        elif r < 0.8:
+            sni = rnd.choice(OTHER_SNIS)
+        else:
+            sni = None
+        flows.append((dst, rnd.choice((443, 443, 80, 8080)), sni, rnd.choice(PROTOCOLS)))
+    return flows
+
+
+class LinearRules:
+    """Перебор правил по порядку с заранее разобранными условиями"""
+
+    def __init__(self, rules):
+        import ipaddress
+        self.rules = []
+        for rule in rules:
+            nets = [ipaddress.ip_network(c) for c in rule.cidrs]
+            self.rules.append((rule, [(n.version, int(n.network_address),
+                                       int(n.broadcast_address)) for n in nets],
+                               set(rule.ports), set(rule.protocols),
+                               [p for p in rule.sni if "." in p],
+                               [p for p in rule.sni if "." not in p]))
+
+    def match(self, dst_addr, dst_port, sni=None, protocol=None):
+        version, value = addr_to_int(dst_addr)
+        keys = protocol_keys(protocol)
+        name = sni.lower() if sni else None
+        for rule, nets, ports, protocols, suffixes, keywords in self.rules:
+            if ports and dst_port not in ports:
+                continue
+            if protocols and not any(k in protocols for k in keys):
+                continue
+            if nets and not any(v == version and s <= value <= e for v, s, e in nets):
+                continue
+            if suffixes or keywords:
+                if name is None:
+                    continue
+                if not (any(name == p or name.endswith("." + p) for p in suffixes) or
+                        any(k in name for k in keywords)):
+                    continue
+            return rule
+        return None
+
+
+def run(rules_count: int, flows_count: int = FLOWS, seed: int = 1) -> dict:
+    rules = make_rules(rules_count, seed)
+    flows = make_flows(flows_count, rules_count, seed + 1)
+
+    started = time.perf_counter()
+    compiled = RuleSet(rules)
+    compile_s = time.perf_counter() - started
+    linear = LinearRules(rules)
+
+    started = time.perf_counter()
+    fast = [compiled.match(*flow) for flow in flows]
+    compiled_s = time.perf_counter() - started
+
+    # Перебор медленный: на больших списках — по выборке
+    sample = flows[:max(1000, flows_count // max(1, rules_count // 100))]
+    started = time.perf_counter()
+    slow = [linear.match(*flow) for flow in sample]
+    linear_s = time.perf_counter() - started
+
+    mismatches = sum(a is not b for a, b in zip(fast, slow))
+    stats = compiled.get_stats()
+    return {
+        "rules": len(rules),
+        "flows": flows_count,
+        "compile_ms": round(compile_s * 1000, 2),
+        "compiled_us": round(compiled_s / flows_count * 1e6, 3),
+        "linear_us": round(linear_s / len(sample) * 1e6, 3),
+        "matched": sum(stats["matched"].values()),
+        "mismatches": mismatches,
+        "index": stats["index"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compiled policy rules benchmark")
+    parser.add_argument("--rules", type=int, nargs="+", default=list(RULE_COUNTS))
+    parser.add_argument("-n", "--flows", type=int, default=FLOWS)
+    args = parser.parse_args()
+
+    print(f"{'rules':>7}{'compile ms':>12}{'compiled us':>13}{'linear us':>11}"
+          f"{'speedup':>9}{'matched':>9}{'mismatch':>10}")
+    for count in args.rules:
+        r = run(count, args.flows)
+        speedup = r["linear_us"] / r["compiled_us"] if r["compiled_us"] else 0.0
+        print(f"{r['rules']:>7}{r['compile_ms']:>12}{r['compiled_us']:>13}{r['linear_us']:>11}"
+              f"{speedup:>8.1f}x{r['matched']:>9}{r['mismatches']:>10}")
+
+
+if __name__ == "__main__":
+    main()
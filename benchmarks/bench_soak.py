@@ -0,0 +1,202 @@
+"""
+Долгий прогон (soak): память и паузы сборщика мусора на миллионах пакетов
+
+Синтетический трафик (benchmarks.traffic) прогоняется по кругу через
+сниффер, решение TelegramBypass.on_packet, контроллер стратегий и
+самописец. Каждый пакет — свежая копия, как от драйвера. По ходу
+снимаются RSS и счётчики сборщика, в конце — время обработки пакета
+(p50/p99/max), паузы gc по поколениям и, с --tracemalloc, главные
+источники выделений за прогон.
+
+Рост RSS после прогрева больше --budget-mb — ошибка (код выхода 1).
+
+Запуск: python -m benchmarks.bench_soak [-n 2000000] [--budget-mb 32] [--gc-tuning] [--tracemalloc]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.traffic import TrafficGenerator
+from src.backend import FakeBackend
+from src.classifier import IPClassifier
+from src.config import TELEGRAM
+from src.flight_recorder import FlightRecorder, RecordingBackend
+from src.fragmenter import SmartFragmenter
+from src.gc_tuning import GCMonitor, apply_runtime_mode, reset_runtime_mode
+from src.packet import RawPacket
+from src.rst_filter import RSTFilter
+from src.sniffer import TrafficSniffer
+from src.strategy import StrategyController
+from src.telemetry import LatencyHistogram
+
+PACKETS = 1_000_000
+POOL = 50_000
+SAMPLES = 20
+BUDGET_MB = 32.0
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса (psutil, /proc или пик по getrusage)"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return 0
+
+
+def _collect(monitor: GCMonitor):
+    """Полная сборка для замера памяти — не в счёт пауз конвейера"""
+    monitor.uninstall()
+    gc.collect()
+    monitor.install()
+
+
+def build_pipeline(state_dir: str):
+    """Конвейер как у TelegramBypass.run(), но без драйвера и файлов в data/"""
+    from src.main import TelegramBypass
+    app = TelegramBypass(adaptive=False, recorder=False)
+    app.controller = StrategyController(cache_file=os.path.join(state_dir, "strategy.json"))
+    app.fragmenter = SmartFragmenter(controller=app.controller)
+    app.fragmenter.sleep = lambda seconds: None
+    app.ip_classifier = IPClassifier.from_config(TELEGRAM)
+    app.recorder = FlightRecorder(dump_dir=os.path.join(state_dir, "flight"))
+    backend = FakeBackend()
+    app.sniffer = TrafficSniffer(on_packet=app.on_packet, backend=backend,
+                                 ip_classifier=app.ip_classifier,
+                                 rst_filter=RSTFilter(on_fake_rst=app._on_fake_rst))
+    app.sniffer.w = RecordingBackend(backend, app.recorder)
+    return app, backend
+
+
+def run(count: int = PACKETS, budget_mb: float = BUDGET_MB, gc_tuning: bool = False,
+        trace: bool = False, samples: int = SAMPLES, seed: int = 1) -> dict:
+    pool = [(bytes(p.raw), p.direction)
+            for p in TrafficGenerator(seed=seed).packets(min(POOL, count))]
+    monitor = GCMonitor()
+    latency = LatencyHistogram()
+    max_latency = 0.0
+    timeline = []
+    top = []
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        app, backend = build_pipeline(state_dir)
+        process = app.sniffer._process_packet
+        sent = backend.sent
+        previous = apply_runtime_mode() if gc_tuning else None
+        monitor.install()
+        rss_start = rss_bytes()
+        # Прогрев: таблицы потоков и кэши выходят на рабочий размер
+        warm_up = min(count // 10, len(pool))
+        step = max(count // samples, 1)
+        rss_warm = rss_start
+        snapshot = None
+        clock = time.perf_counter
+        started = clock()
+        try:
+            for i in range(count):
+                raw, direction = pool[i % len(pool)]
+                packet = RawPacket(raw, direction=direction)
+                t0 = clock()
+                process(packet)
+                elapsed = clock() - t0
+                sent.clear()
+                latency.add(elapsed)
+                if elapsed > max_latency:
+                    max_latency = elapsed
+                if i + 1 == warm_up:
+                    _collect(monitor)
+                    rss_warm = rss_bytes()
+                    if trace:
+                        tracemalloc.start()
+                        snapshot = tracemalloc.take_snapshot()
+                if (i + 1) % step == 0:
+                    timeline.append({"packets": i + 1,
+                                     "rss_mb": round(rss_bytes() / 2**20, 2),
+                                     "elapsed_s": round(clock() - started, 2),
+                                     "gc_counts": gc.get_count()})
+            wall = clock() - started
+            if snapshot is not None:
+                diff = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")
+                tracemalloc.stop()
+                top = [{"where": str(stat.traceback), "size_diff_kb": round(stat.size_diff / 1024, 1),
+                        "count_diff": stat.count_diff} for stat in diff[:10]]
+            _collect(monitor)
+            rss_end = rss_bytes()
+            gc_stats = monitor.get_stats()
+        finally:
+            monitor.uninstall()
+            if previous is not None:
+                reset_runtime_mode(previous)
+
+    growth_mb = (rss_end - rss_warm) / 2**20
+    return {
+        "packets": count,
+        "gc_tuning": gc_tuning,
+        "wall_s": round(wall, 2),
+        "pps": round(count / wall) if wall else 0,
+        "rss_mb": {"start": round(rss_start / 2**20, 2), "warm": round(rss_warm / 2**20, 2),
+                   "end": round(rss_end / 2**20, 2), "growth": round(growth_mb, 2)},
+        "latency_ms": dict(latency.summary(), max_ms=round(max_latency * 1000.0, 3)),
+        "gc": gc_stats,
+        "flows": len(app.sniffer.flows),
+        "timeline": timeline,
+        "top_allocators": top,
+        "budget_mb": budget_mb,
+        "ok": growth_mb <= budget_mb,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory/GC soak benchmark")
+    parser.add_argument("-n", "--packets", type=int, default=PACKETS)
+    parser.add_argument("--budget-mb", type=float, default=BUDGET_MB,
+                        help="Допустимый рост RSS после прогрева, МБ")
+    parser.add_argument("--gc-tuning", action="store_true", help="Щадящий режим сборщика")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Источники выделений (замедляет прогон в разы)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    report = run(args.packets, args.budget_mb, args.gc_tuning, args.tracemalloc, seed=args.seed)
+    print(f"{'packets':>10}{'rss MB':>10}{'elapsed s':>11}  gc counts")
+    for point in report["timeline"]:
+        print(f"{point['packets']:>10}{point['rss_mb']:>10.2f}{point['elapsed_s']:>11.2f}"
+              f"  {point['gc_counts']}")
+    rss, lat = report["rss_mb"], report["latency_ms"]
+    print(f"\n{report['packets']} packets in {report['wall_s']} s ({report['pps']} pps), "
+          f"gc tuning: {report['gc_tuning']}")
+    print(f"RSS: start {rss['start']} MB, after warm-up {rss['warm']} MB, end {rss['end']} MB, "
+          f"growth {rss['growth']} MB (budget {report['budget_mb']} MB)")
+    print(f"Per packet: p50 {lat['p50_ms']} ms, p99 {lat['p99_ms']} ms, max {lat['max_ms']} ms")
+    for generation, summary in report["gc"]["pause_ms"].items():
+        print(f"GC {generation}: {summary['count']} pauses, mean {summary['mean_ms']} ms, "
+              f"p99 {summary['p99_ms']} ms")
+    print(f"GC max pause: {report['gc']['max_pause_ms']} ms, frozen objects: {report['gc']['frozen']}")
+    for entry in report["top_allocators"]:
+        print(f"  {entry['size_diff_kb']:>+10.1f} KB {entry['count_diff']:>+8}  {entry['where']}")
+    if not report["ok"]:
+        print("FAIL: memory growth over budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Бенчмарк SOCKS5-прокси: установка соединений и пропускная способность
+
+Локальный сервер-заглушка: на TLS-запись ClientHello отвечает
+фиксированной записью (как ServerHello), дальше — эхо. Прокси и
+заглушка работают в отдельном потоке со своим циклом событий, клиенты —
+в основном. Каждый сценарий — напрямую и через прокси:
+
+- handshakes: тысячи соединений одновременно (SOCKS5, ClientHello с SNI
+  Telegram — прокси режет его по SNI, ответ сервера);
+- throughput: несколько потоков гоняют данные через эхо в обе стороны.
+
+Запуск: python -m benchmarks.bench_socks [--connections 2000] [--concurrency 1000] [--streams 8] [--mb 64]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.traffic import tdesktop_hello
+from src.socks_proxy import SocksProxy
+from src.telemetry import LatencyHistogram
+
+CONNECTIONS = 2000
+CONCURRENCY = 1000
+STREAMS = 8
+MEGABYTES = 64
+CHUNK = 65536
+SERVER_HELLO = b"\x16\x03\x03\x00\x40" + b"\x02" + b"\x00" * 63
+
+
+async def stand_in(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                   writers: set = None):
+    """Заглушка сервера: ответ на ClientHello, затем эхо"""
+    if writers is not None:
+        writers.add(writer)
+    try:
+        head = await reader.readexactly(5)
+        if head[0] == 0x16:
+            await reader.readexactly(struct.unpack("!H", head[3:5])[0])
+            writer.write(SERVER_HELLO)
+        else:
+            writer.write(head)
+        while True:
+            data = await reader.read(262144)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        if writers is not None:
+            writers.discard(writer)
+        writer.close()
+
+
+class Stand:
+    """Заглушка и прокси в своём потоке с отдельным циклом событий"""
+
+    def __init__(self, delay_ms: float = 0.0):
+        self.delay_ms = delay_ms
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.proxy = None
+        self.server = None
+        self.server_port = 0
+        self._writers = set()
+
+    def __enter__(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        return self
+
+    async def _start(self):
+        self.server = await asyncio.start_server(
+            lambda r, w: stand_in(r, w, self._writers), "127.0.0.1", 0, backlog=4096)
+        self.server_port = self.server.sockets[0].getsockname()[1]
+        self.proxy = SocksProxy("127.0.0.1", 0, delay_ms=self.delay_ms)
+        await self.proxy.start()
+
+    async def _stop(self):
+        await self.proxy.stop()
+        self.server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await self.server.wait_closed()
+        # Даём обработчикам доработать до выхода из цикла
+        while self._writers or self.proxy.stats["active"]:
+            await asyncio.sleep(0.01)
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+async def socks_connect(proxy_port: int, host: str, port: int):
+    """SOCKS5 CONNECT (приветствие и запрос одним пакетом)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+    writer.write(b"\x05\x01\x00" + b"\x05\x01\x00\x01" + socket.inet_aton(host) +
+                 struct.pack("!H", port))
+    reply = await reader.readexactly(12)
+    if reply[1] != 0 or reply[3] != 0:
+        raise ConnectionError(f"SOCKS5 reply {reply[3]}")
+    return reader, writer
+
+
+async def _connect(stand: Stand, via_proxy: bool):
+    if via_proxy:
+        return await socks_connect(stand.proxy.port, "127.0.0.1", stand.server_port)
+    return await asyncio.open_connection("127.0.0.1", stand.server_port)
+
+
+async def handshakes(stand: Stand, via_proxy: bool, count: int, concurrency: int) -> dict:
+    hellos = [tdesktop_hello("web.telegram.org", random.Random(i)) for i in range(16)]
+    latency = LatencyHistogram()
+    limit = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with limit:
+            started = time.perf_counter()
+            writer = None
+            try:
+                reader, writer = await _connect(stand, via_proxy)
+                writer.write(hellos[i % len(hellos)])
+                await reader.readexactly(len(SERVER_HELLO))
+                latency.add(time.perf_counter() - started)
+            except (OSError, asyncio.IncompleteReadError):
+                errors += 1
+            finally:
+                if writer is not None:
+                    writer.close()
+                    await writer.wait_closed()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    wall = time.perf_counter() - started
+    return dict(latency.summary(), connections=count, errors=errors,
+                per_s=round(count / wall) if wall else 0)
+
+
+async def throughput(stand: Stand, via_proxy: bool, streams: int, megabytes: int) -> dict:
+    total = megabytes * 2**20 // streams
+    chunk = b"\x17" * CHUNK
+
+    async def one():
+        reader, writer = await _connect(stand, via_proxy)
+
+        async def send():
+            sent = 0
+            while sent < total:
+                writer.write(chunk)
+                await writer.drain()
+                sent += len(chunk)
+
+        async def receive():
+            received = 0
+            while received < total:
+                data = await reader.read(262144)
+                if not data:
+                    break
+                received += len(data)
+            return received
+
+        _, received = await asyncio.gather(send(), receive())
+        writer.close()
+        await writer.wait_closed()
+        return received
+
+    started = time.perf_counter()
+    received = sum(await asyncio.gather(*(one() for _ in range(streams))))
+    wall = time.perf_counter() - started
+    return {"streams": streams, "megabytes": round(received / 2**20, 1),
+            "mb_per_s": round(received / 2**20 / wall, 1) if wall else 0}
+
+
+def run(connections: int = CONNECTIONS, concurrency: int = CONCURRENCY,
+        streams: int = STREAMS, megabytes: int = MEGABYTES, delay_ms: float = 0.0) -> dict:
+    async def clients(stand: Stand) -> dict:
+        report = {}
+        for name, via_proxy in (("direct", False), ("proxy", True)):
+            report[name] = {
+                "handshakes": await handshakes(stand, via_proxy, connections, concurrency),
+                "throughput": await throughput(stand, via_proxy, streams, megabytes),
+            }
+        return report
+
+    with Stand(delay_ms) as stand:
+        report = asyncio.run(clients(stand))
+        report["proxy_stats"] = stand.proxy.get_stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SOCKS5 proxy benchmark")
+    parser.add_argument("--connections", type=int, default=CONNECTIONS)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--streams", type=int, default=STREAMS)
+    parser.add_argument("--mb", type=int, default=MEGABYTES)
+    parser.add_argument("--delay-ms", type=float, default=0.0,
+                        help="Пауза между кусками первых байтов")
+    args = parser.parse_args()
+
+    report = run(args.connections, args.concurrency, args.streams, args.mb, args.delay_ms)
+    print(f"{'':<8}{'conn/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}{'MB/s':>9}")
+    for name in ("direct", "proxy"):
+        h, t = report[name]["handshakes"], report[name]["throughput"]
+        print(f"{name:<8}{h['per_s']:>9}{h['p50_ms']:>9}{h['p99_ms']:>9}{h['errors']:>8}"
+              f"{t['mb_per_s']:>9}")
+    stats = report["proxy_stats"]
+    print(f"\nProxy: {stats['connections']} connections, peak active {stats['peak_active']}, "
+          f"split {stats['split']} ({stats['pieces']} pieces), errors {stats['errors']}")
+
+
+if __name__ == "__main__":
+    main()
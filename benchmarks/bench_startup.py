@@ -0,0 +1,97 @@
+"""
+Бенчмарк запуска: время импорта и время до первого обработанного пакета
+
+Каждый замер — отдельный процесс (холодные импорты). Сеть медленная
+или заблокирована: загрузка IP в апдейтере заменена ожиданием
+--network-delay секунд. Сравниваются быстрый старт (хэндл сразу,
+сеть в фоне) и старый порядок (сначала сеть, потом хэндл).
+
+Запуск: python -m benchmarks.bench_startup [--runs 5] [--network-delay 2]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import os
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+
+def child(fast_start: bool, network_delay: float, cache_dir: str):
+    """Один запуск в отдельном процессе: печатает JSON с замерами"""
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import src.main as app_module
+    imported = time.perf_counter()
+
+    from pathlib import Path
+    from src.backend import FakeBackend
+    from src.config import SNIFFER
+    from src.ip_updater import TelegramIPUpdater
+    from src.packet import build_tcp_packet
+    from tests.test_strategy import client_hello
+
+    TelegramIPUpdater.CACHE_FILE = Path(cache_dir) / "telegram_ips.json"
+    TelegramIPUpdater._fetch_from_network = lambda self: time.sleep(network_delay) or []
+    SNIFFER.RULES_CACHE_FILE = str(Path(cache_dir) / "compiled_rules.json")
+
+    hello = build_tcp_packet("10.0.0.2", "149.154.167.51", 40000, 443,
+                             payload=client_hello("web.telegram.org"))
+    app = app_module.TelegramBypass(adaptive=False, recorder=False, fast_start=fast_start,
+                                    backend=FakeBackend([hello]))
+    app.fragmenter.sleep = lambda seconds: None
+    first = []
+    handler = app.on_packet
+
+    def on_packet(*args):
+        result = handler(*args)
+        if not first:
+            first.append(time.perf_counter())
+        return result
+    app.on_packet = on_packet
+    app.run()
+    print(json.dumps({"import_s": imported - started,
+                      "first_packet_s": first[0] - started if first else None}))
+
+
+def measure(fast_start: bool, runs: int, network_delay: float) -> dict:
+    """Медианы по runs запускам, у каждого — пустой кэш IP и правил"""
+    samples = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_startup", "--child",
+                 "--fast" if fast_start else "--slow", "--network-delay", str(network_delay),
+                 "--cache-dir", cache_dir],
+                cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    return {key: statistics.median(s[key] for s in samples)
+            for key in ("import_s", "first_packet_s")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--network-delay", type=float, default=2.0)
+    parser.add_argument("--cache-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--fast", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--slow", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.fast, args.network_delay, args.cache_dir)
+        return
+
+    print(f"{'mode':<12}{'import ms':>11}{'first packet ms':>17}")
+    for name, fast in (("fast start", True), ("blocking", False)):
+        r = measure(fast, args.runs, args.network_delay)
+        print(f"{name:<12}{r['import_s'] * 1000:>11.1f}{r['first_packet_s'] * 1000:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
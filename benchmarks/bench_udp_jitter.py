@@ -0,0 +1,126 @@
+"""
+Добавочная задержка и дрожание для пакетов звонков (UDP)
+
+Несколько звонков (по пакету в 20 мс на поток) проигрываются через
+сниффер в трёх режимах:
+
+- off — UDP не перехватывается (по умолчанию): фильтр без UDP;
+- first_n — UDP-стратегия «observe»: перехват первых пакетов потока,
+  затем поток выгружается обновлением фильтра;
+- all — прежнее поведение: перехватывается каждый пакет звонка.
+
+Фильтр драйвера моделируется снимком выгруженных потоков, который
+меняется только при set_filter — как у настоящего хэндла. Добавочная
+задержка — время обработки пакета в Python (без пути через драйвер,
+который для перехваченного пакета добавляет ещё больше); для
+неперехваченного пакета — ноль.
+
+Запуск: python -m benchmarks.bench_udp_jitter [--calls 4] [--seconds 60]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.traffic import CLIENT, TELEGRAM_DCS
+from src.backend import FakeBackend
+from src.config import TELEGRAM
+from src.flow_table import flow_key
+from src.packet import build_udp_packet
+from src.sniffer import TrafficSniffer
+from src.udp_stage import UDPStage
+
+MODES = ("off", "first_n", "all")
+INTERVAL_S = 0.020
+PAYLOAD = 160
+
+
+class _FilterBackend(FakeBackend):
+    """FakeBackend, запоминающий выгруженные потоки при смене фильтра"""
+
+    def __init__(self, stage):
+        super().__init__()
+        self.stage = stage
+        self.excluded = frozenset()
+        self.filters = 0
+
+    def set_filter(self, filter_str: str):
+        self.excluded = frozenset(key for key, _ in self.stage.offloaded.items())
+        self.filters += 1
+
+
+def call_packets(calls: int, seconds: float, seed: int = 1):
+    """(время, пакет) для calls звонков, по пакету в INTERVAL_S на поток"""
+    rnd = random.Random(seed)
+    flows = [(rnd.choice(TELEGRAM_DCS), rnd.choice(TELEGRAM.UDP_PORTS), 50000 + i)
+             for i in range(calls)]
+    events = []
+    for i in range(int(seconds / INTERVAL_S)):
+        for n, (dst, dst_port, src_port) in enumerate(flows):
+            payload = rnd.randbytes(PAYLOAD)
+            events.append((i * INTERVAL_S + n * 0.001,
+                           build_udp_packet(CLIENT, dst, src_port, dst_port, payload=payload)))
+    return events
+
+
+def run(mode: str, calls: int = 4, seconds: float = 60.0, seed: int = 1) -> dict:
+    now = [0.0]
+    stage = None
+    if mode == "first_n":
+        stage = UDPStage("observe", clock=lambda: now[0])
+    elif mode == "all":
+        # Поток никогда не выгружается — каждый пакет через процесс
+        stage = UDPStage("observe", first_packets=2**62, clock=lambda: now[0])
+    backend = _FilterBackend(stage)
+    sniffer = TrafficSniffer(backend=backend, udp_stage=stage, hello_memo=None)
+    sniffer.w = backend
+    process = sniffer._process_packet
+    clock = time.perf_counter
+
+    added = []
+    diverted = 0
+    for at, packet in call_packets(calls, seconds, seed):
+        now[0] = at
+        if stage is None or flow_key(packet) in backend.excluded:
+            added.append(0.0)
+            continue
+        diverted += 1
+        t0 = clock()
+        process(packet)
+        added.append((clock() - t0) * 1e6)
+        backend.sent.clear()
+
+    ordered = sorted(added)
+    return {
+        "mode": mode,
+        "packets": len(added),
+        "diverted": diverted,
+        "filter_updates": backend.filters,
+        "mean_us": round(statistics.fmean(added), 2),
+        "p99_us": round(ordered[int(len(ordered) * 0.99) - 1], 2),
+        "max_us": round(ordered[-1], 2),
+        "jitter_us": round(statistics.pstdev(added), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP call media: added latency and jitter")
+    parser.add_argument("--calls", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'mode':<9}{'packets':>9}{'diverted':>10}{'refilters':>11}"
+          f"{'mean us':>10}{'p99 us':>10}{'max us':>10}{'jitter us':>11}")
+    for mode in MODES:
+        r = run(mode, args.calls, args.seconds, args.seed)
+        print(f"{r['mode']:<9}{r['packets']:>9}{r['diverted']:>10}{r['filter_updates']:>11}"
+              f"{r['mean_us']:>10}{r['p99_us']:>10}{r['max_us']:>10}{r['jitter_us']:>11}")
+
+
+if __name__ == "__main__":
+    main()
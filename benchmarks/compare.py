@@ -0,0 +1,67 @@
+"""
+Сравнение двух прогонов benchmarks.runner с порогом регрессии
+
+Регрессия — рост ns/пакет или байт на пакет больше чем на threshold %.
+Код выхода 1, если есть хотя бы одна регрессия (для CI).
+
+Запуск: python -m benchmarks.compare baseline.json current.json [--threshold 10]
+"""
+
+import argparse
+import json
+import sys
+from typing import List, Tuple
+
+# Метрики, где больше — хуже
+METRICS = ("ns_per_packet", "alloc_bytes_per_packet")
+
+
+def compare(baseline: dict, current: dict, threshold: float = 10.0) -> Tuple[List[dict], List[dict]]:
+    """
+    Returns:
+        (все строки сравнения, регрессии) — строка: case, metric, before, after, change_pct
+    """
+    rows, regressions = [], []
+    for case, before in baseline["results"].items():
+        after = current["results"].get(case)
+        if after is None:
+            continue
+        for metric in METRICS:
+            old, new = before.get(metric), after.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100.0 if old else 0.0
+            row = {"case": case, "metric": metric, "before": old, "after": new,
+                   "change_pct": round(change, 1)}
+            rows.append(row)
+            if change > threshold:
+                regressions.append(row)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare benchmark results")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Допустимое ухудшение, %% (по умолчанию 10)")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    rows, regressions = compare(baseline, current, args.threshold)
+    for row in rows:
+        mark = "REGRESSION" if row in regressions else ""
+        print(f"{row['case']:<22}{row['metric']:<24}{row['before']:>12}{row['after']:>12}"
+              f"{row['change_pct']:>+9.1f}%  {mark}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold}%")
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Набор бенчмарков горячего пути с результатами в JSON
+
+Для каждого случая: пакетов в секунду, ns на пакет (лучший из repeat
+прогонов) и память на пакет по tracemalloc — сколько байт выделяется
+на время обработки (пик) и сколько блоков остаётся после неё.
+
+Запуск: python -m benchmarks.runner [-n 20000] [-o results.json] [--mix bulk=0.9,chrome=0.1]
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import os
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.traffic import DEFAULT_MIX, TrafficGenerator
+from src.backend import FakeBackend
+from src.classifier import IPClassifier
+from src.config import TELEGRAM
+from src.fragmenter import SmartFragmenter
+from src.packet import RawPacket
+from src.sniffer import TrafficSniffer
+from src.tls_parser import get_sni_from_payload
+
+PACKETS = 20000
+REPEAT = 5
+
+
+def _copies(packets: List[RawPacket]) -> List[RawPacket]:
+    """Свежие копии: фрагментатор меняет пакеты на месте"""
+    return [RawPacket(bytes(p.raw), direction=p.direction) for p in packets]
+
+
+def _bench_get_sni(packets):
+    payloads = [bytes(p.tcp.payload) for p in packets
+                if p.tcp is not None and p.is_outbound and p.tcp.payload]
+    return payloads, get_sni_from_payload
+
+
+def _bench_ip_classify(packets):
+    ip = IPClassifier.from_config(TELEGRAM)
+    return [p.dst_addr for p in packets], ip.contains
+
+
+def _bench_checksums(packets):
+    return _copies(packets), lambda packet: packet.recalculate_checksums()
+
+
+def _bench_sniffer(packets):
+    """_process_packet с решением TelegramBypass.on_packet на FakeBackend"""
+    from src.main import TelegramBypass
+    app = TelegramBypass(adaptive=False, recorder=False)
+    app.fragmenter.sleep = lambda seconds: None
+    app.ip_classifier = IPClassifier.from_config(TELEGRAM)
+    backend = FakeBackend()
+    app.sniffer = TrafficSniffer(on_packet=app.on_packet, backend=backend,
+                                 ip_classifier=app.ip_classifier)
+    app.sniffer.w = backend
+
+    def process(packet):
+        app.sniffer._process_packet(packet)
+        backend.sent.clear()
+    return _copies(packets), process
+
+
+def _bench_fragmenter(packets):
+    """process_packet_adaptive для исходящих TCP-сегментов с данными"""
+    fragmenter = SmartFragmenter()
+    fragmenter.sleep = lambda seconds: None
+    backend = FakeBackend()
+
+    def process(packet):
+        fragmenter.process_packet_adaptive(backend, packet)
+        backend.sent.clear()
+    items = [p for p in _copies(packets)
+             if p.tcp is not None and p.is_outbound and p.tcp.payload]
+    return items, process
+
+
+# Имя -> подготовка: (входы, функция на один вход)
+CASES: Dict[str, Callable] = {
+    "get_sni": _bench_get_sni,
+    "ip_classify": _bench_ip_classify,
+    "checksums": _bench_checksums,
+    "sniffer_process": _bench_sniffer,
+    "fragmenter_adaptive": _bench_fragmenter,
+}
+
+
+def measure(prepare: Callable, packets: List[RawPacket], repeat: int = REPEAT) -> dict:
+    """Лучшее время из repeat прогонов и память за отдельный прогон"""
+    best = None
+    count = 0
+    for _ in range(repeat):
+        items, fn = prepare(packets)
+        count = len(items)
+        gc.collect()
+        started = time.perf_counter_ns()
+        for item in items:
+            fn(item)
+        elapsed = time.perf_counter_ns() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    items, fn = prepare(packets)
+    gc.collect()
+    tracemalloc.start()
+    peak_total = 0
+    base_blocks = sys.getallocatedblocks()
+    for item in items:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn(item)
+        peak_total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    retained = sys.getallocatedblocks() - base_blocks
+
+    count = max(count, 1)
+    return {
+        "packets": count,
+        "ns_per_packet": round(best / count, 1),
+        "pps": round(count * 1e9 / best) if best else 0,
+        "alloc_bytes_per_packet": round(peak_total / count, 1),
+        "retained_blocks_per_packet": round(retained / count, 3),
+    }
+
+
+def parse_mix(text: Optional[str]) -> Dict[str, float]:
+    """"bulk=0.9,chrome=0.1" -> {"bulk": 0.9, "chrome": 0.1}"""
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+def run(count: int = PACKETS, mix: Optional[Dict[str, float]] = None, seed: int = 1,
+        repeat: int = REPEAT, cases: Optional[List[str]] = None) -> dict:
+    mix = mix or dict(DEFAULT_MIX)
+    packets = TrafficGenerator(mix, seed).packets(count)
+    results = {}
+    for name in cases or CASES:
+        results[name] = measure(CASES[name], packets, repeat)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "packets": count,
+            "seed": seed,
+            "mix": mix,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot path benchmarks")
+    parser.add_argument("-n", "--packets", type=int, default=PACKETS)
+    parser.add_argument("-r", "--repeat", type=int, default=REPEAT)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mix", help="Смесь трафика: kind=weight,... (по умолчанию DEFAULT_MIX)")
+    parser.add_argument("--case", nargs="+", choices=list(CASES), help="Только эти случаи")
+    parser.add_argument("-o", "--output", help="Файл для результатов JSON")
+    args = parser.parse_args()
+
+    report = run(args.packets, parse_mix(args.mix), args.seed, args.repeat, args.case)
+    print(f"{'case':<22}{'pkts':>8}{'ns/pkt':>10}{'pps':>11}{'alloc B/pkt':>13}{'retained':>10}")
+    for name, r in report["results"].items():
+        print(f"{name:<22}{r['packets']:>8}{r['ns_per_packet']:>10.0f}{r['pps']:>11}"
+              f"{r['alloc_bytes_per_packet']:>13.0f}{r['retained_blocks_per_packet']:>10.3f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
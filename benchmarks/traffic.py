@@ -0,0 +1,254 @@
+"""
+Генератор синтетического трафика для бенчмарков
+
+ClientHello в духе Chrome, Firefox, Telegram Desktop и постквантовый
+(X25519MLKEM768, ClientHello на два сегмента), инициализация MTProto,
+HTTP-запросы, сегменты медиа, UDP звонков и RST — в заданной пропорции.
+Всё детерминировано по seed.
+"""
+
+import random
+import struct
+from typing import Dict, List, Optional
+
+from src.packet import (Direction, RawPacket, build_tcp_packet, build_udp_packet,
+                        TCP_ACK, TCP_PSH, TCP_RST)
+
+MSS = 1460
+CLIENT = "10.0.0.2"
+
+TELEGRAM_SNIS = ("web.telegram.org", "telegram.org", "t.me", "core.telegram.org")
+OTHER_SNIS = ("www.google.com", "example.com", "cdn.jsdelivr.net", "github.com",
+              "www.wikipedia.org", "api.twitter.com")
+TELEGRAM_DCS = ("149.154.175.50", "149.154.167.51", "149.154.175.100",
+                "149.154.167.91", "91.108.56.130")
+
+# Доли типов пакетов по умолчанию (сумма не обязана быть 1)
+DEFAULT_MIX: Dict[str, float] = {
+    "chrome": 0.06,
+    "firefox": 0.03,
+    "tdesktop": 0.03,
+    "pq": 0.03,
+    "mtproto": 0.05,
+    "http": 0.05,
+    "bulk": 0.60,
+    "udp": 0.10,
+    "rst": 0.05,
+}
+
+_GREASE = tuple(0x0A0A + 0x1010 * i for i in range(16))
+
+
+# === ClientHello ===
+
+def _ext(ext_type: int, data: bytes) -> bytes:
+    return struct.pack("!HH", ext_type, len(data)) + data
+
+
+def _u16_list(values) -> bytes:
+    body = b"".join(struct.pack("!H", v) for v in values)
+    return struct.pack("!H", len(body)) + body
+
+
+def _sni(name: str) -> bytes:
+    host = name.encode()
+    entry = struct.pack("!BH", 0, len(host)) + host
+    return _ext(0x0000, struct.pack("!H", len(entry)) + entry)
+
+
+def _alpn(protocols) -> bytes:
+    body = b"".join(bytes([len(p)]) + p for p in protocols)
+    return _ext(0x0010, struct.pack("!H", len(body)) + body)
+
+
+def _key_share(shares) -> bytes:
+    body = b"".join(struct.pack("!HH", group, len(key)) + key for group, key in shares)
+    return _ext(0x0033, struct.pack("!H", len(body)) + body)
+
+
+def _hello(rnd: random.Random, ciphers, extensions, pad_to: Optional[int] = None) -> bytes:
+    """TLS-запись с ClientHello из готовых расширений"""
+    ext = b"".join(extensions)
+    body = (b"\x03\x03" + rnd.randbytes(32) +
+            b"\x20" + rnd.randbytes(32) +                 # session id
+            _u16_list(ciphers) + b"\x01\x00")
+    if pad_to is not None:
+        # Расширение padding (Chrome): ClientHello не короче pad_to
+        missing = pad_to - (len(body) + 2 + len(ext) + 4)
+        if missing > 0:
+            ext += _ext(0x0015, bytes(missing))
+    body += struct.pack("!H", len(ext)) + ext
+    handshake = b"\x01" + len(body).to_bytes(3, "big") + body
+    return b"\x16\x03\x01" + struct.pack("!H", len(handshake)) + handshake
+
+
+def chrome_hello(sni: str, rnd: random.Random, pq: bool = False) -> bytes:
+    grease = rnd.choice(_GREASE)
+    shares = [(grease, b"\x00"), (0x001D, rnd.randbytes(32))]
+    groups = [grease, 0x001D, 0x0017, 0x0018]
+    if pq:
+        # X25519MLKEM768: 1184 байта ML-KEM + 32 байта X25519
+        shares.insert(1, (0x11EC, rnd.randbytes(1216)))
+        groups.insert(1, 0x11EC)
+    extensions = [
+        _ext(grease, b""),
+        _sni(sni),
+        _ext(0x0017, b""),                                    # extended_master_secret
+        _ext(0xFF01, b"\x00"),                                # renegotiation_info
+        _ext(0x000A, _u16_list(groups)),
+        _ext(0x000B, b"\x01\x00"),                            # ec_point_formats
+        _ext(0x0023, b""),                                    # session_ticket
+        _alpn((b"h2", b"http/1.1")),
+        _ext(0x0005, b"\x01\x00\x00\x00\x00"),                # status_request
+        _ext(0x000D, _u16_list((0x0403, 0x0804, 0x0401, 0x0503, 0x0805, 0x0501, 0x0806, 0x0601))),
+        _ext(0x0012, b""),                                    # SCT
+        _key_share(shares),
+        _ext(0x002D, b"\x01\x01"),                            # psk_key_exchange_modes
+        _ext(0x002B, b"\x06" + struct.pack("!HHH", rnd.choice(_GREASE), 0x0304, 0x0303)),
+        _ext(0x001B, b"\x02\x00\x02"),                        # compress_certificate
+        _ext(0x4469, b"\x00\x03\x02h2"),                      # application_settings
+    ]
+    # Chrome перемешивает порядок расширений (кроме GREASE в начале)
+    middle = extensions[1:]
+    rnd.shuffle(middle)
+    ciphers = (rnd.choice(_GREASE), 0x1301, 0x1302, 0x1303, 0xC02B, 0xC02F,
+               0xC02C, 0xC030, 0xCCA9, 0xCCA8, 0xC013, 0xC014, 0x009C, 0x009D,
+               0x002F, 0x0035)
+    return _hello(rnd, ciphers, [extensions[0]] + middle, pad_to=None if pq else 512)
+
+
+def firefox_hello(sni: str, rnd: random.Random) -> bytes:
+    extensions = [
+        _sni(sni),
+        _ext(0x0017, b""),
+        _ext(0xFF01, b"\x00"),
+        _ext(0x000A, _u16_list((0x001D, 0x0017, 0x0018, 0x0019, 0x0100, 0x0101))),
+        _ext(0x000B, b"\x01\x00"),
+        _ext(0x0023, b""),
+        _alpn((b"h2", b"http/1.1")),
+        _ext(0x0005, b"\x01\x00\x00\x00\x00"),
+        _ext(0x0022, _u16_list((0x0403, 0x0503, 0x0603, 0x0203))),   # delegated_credentials
+        _key_share([(0x001D, rnd.randbytes(32)), (0x0017, b"\x04" + rnd.randbytes(64))]),
+        _ext(0x002B, b"\x04" + struct.pack("!HH", 0x0304, 0x0303)),
+        _ext(0x000D, _u16_list((0x0403, 0x0503, 0x0603, 0x0804, 0x0805, 0x0806, 0x0401,
+                                0x0501, 0x0601, 0x0203, 0x0201))),
+        _ext(0x002D, b"\x01\x01"),
+        _ext(0x001C, b"\x40\x01"),                            # record_size_limit
+    ]
+    ciphers = (0x1301, 0x1303, 0x1302, 0xC02B, 0xC02F, 0xCCA9, 0xCCA8, 0xC02C,
+               0xC030, 0xC00A, 0xC009, 0xC013, 0xC014, 0x009C, 0x009D, 0x002F, 0x0035)
+    return _hello(rnd, ciphers, extensions, pad_to=512)
+
+
+def tdesktop_hello(sni: str, rnd: random.Random) -> bytes:
+    """Telegram Desktop: короткий набор, без ALPN h2 (sni="" — подключение по IP)"""
+    extensions = [_sni(sni)] if sni else []
+    extensions += [
+        _ext(0x000A, _u16_list((0x001D, 0x0017))),
+        _ext(0x000D, _u16_list((0x0403, 0x0804, 0x0401))),
+        _key_share([(0x001D, rnd.randbytes(32))]),
+        _ext(0x002B, b"\x02" + struct.pack("!H", 0x0304)),
+        _ext(0x002D, b"\x01\x01"),
+    ]
+    return _hello(rnd, (0x1301, 0x1302, 0x1303, 0xC02B, 0xC02F), extensions)
+
+
+def mtproto_init(rnd: random.Random) -> bytes:
+    kind = rnd.choice(("abridged", "intermediate", "padded", "obfuscated2"))
+    if kind == "abridged":
+        return b"\xef" + bytes([40]) + rnd.randbytes(160)
+    if kind == "intermediate":
+        return b"\xee\xee\xee\xee" + struct.pack("<I", 160) + rnd.randbytes(160)
+    if kind == "padded":
+        return b"\xdd\xdd\xdd\xdd" + struct.pack("<I", 168) + rnd.randbytes(168)
+    while True:
+        init = rnd.randbytes(64)
+        if init[0] not in (0xef, 0x16) and init[4:8] != b"\x00" * 4:
+            return init
+
+
+def http_request(host: str, rnd: random.Random) -> bytes:
+    path = f"/{rnd.randbytes(6).hex()}"
+    return (f"GET {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: Mozilla/5.0\r\n"
+            f"Accept: */*\r\nConnection: keep-alive\r\n\r\n").encode()
+
+
+# === Смесь пакетов ===
+
+class TrafficGenerator:
+    """
+    Пакеты заданной смеси типов (DEFAULT_MIX по умолчанию)
+
+    telegram_share — доля потоков к Telegram среди рукопожатий и медиа.
+    """
+
+    def __init__(self, mix: Optional[Dict[str, float]] = None, seed: int = 1,
+                 telegram_share: float = 0.5):
+        self.mix = dict(mix or DEFAULT_MIX)
+        unknown = set(self.mix) - set(DEFAULT_MIX)
+        if unknown:
+            raise ValueError(f"Unknown traffic kinds: {', '.join(sorted(unknown))}")
+        self.rnd = random.Random(seed)
+        self.telegram_share = telegram_share
+        self._kinds = list(self.mix)
+        self._weights = [self.mix[k] for k in self._kinds]
+        self._port = 20000
+
+    def _flow(self, telegram: bool):
+        self._port = 20000 + (self._port - 19999) % 40000
+        if telegram:
+            return self.rnd.choice(TELEGRAM_DCS), self.rnd.choice(TELEGRAM_SNIS), self._port
+        dst = f"{self.rnd.randint(1, 223)}.{self.rnd.randint(0, 255)}." \
+              f"{self.rnd.randint(0, 255)}.{self.rnd.randint(1, 254)}"
+        return dst, self.rnd.choice(OTHER_SNIS), self._port
+
+    def _tcp(self, dst: str, port: int, payload: bytes, dst_port: int = 443,
+             flags: int = TCP_ACK | TCP_PSH) -> List[RawPacket]:
+        """Сегменты не длиннее MSS"""
+        out = []
+        seq = self.rnd.getrandbits(32)
+        for start in range(0, max(len(payload), 1), MSS):
+            chunk = payload[start:start + MSS]
+            out.append(build_tcp_packet(CLIENT, dst, port, dst_port, payload=chunk,
+                                        seq=(seq + start) & 0xFFFFFFFF, ack=1, flags=flags))
+        return out
+
+    def make(self, kind: str) -> List[RawPacket]:
+        """Пакеты одного события: hello может занять два сегмента"""
+        rnd = self.rnd
+        telegram = rnd.random() < self.telegram_share
+        dst, sni, port = self._flow(telegram)
+        if kind == "chrome":
+            return self._tcp(dst, port, chrome_hello(sni, rnd))
+        if kind == "firefox":
+            return self._tcp(dst, port, firefox_hello(sni, rnd))
+        if kind == "tdesktop":
+            return self._tcp(dst, port, tdesktop_hello(sni, rnd))
+        if kind == "pq":
+            return self._tcp(dst, port, chrome_hello(sni, rnd, pq=True))
+        if kind == "mtproto":
+            return self._tcp(rnd.choice(TELEGRAM_DCS), port, mtproto_init(rnd))
+        if kind == "http":
+            return self._tcp(dst, port, http_request(sni, rnd), dst_port=80)
+        if kind == "bulk":
+            return self._tcp(dst, port, rnd.randbytes(MSS))[:1]
+        if kind == "udp":
+            return [build_udp_packet(CLIENT, rnd.choice(TELEGRAM_DCS), port,
+                                     rnd.choice((533, 596, 1400)),
+                                     payload=rnd.randbytes(rnd.randint(60, 200)))]
+        if kind == "rst":
+            return [build_tcp_packet(dst, CLIENT, 443, port, flags=TCP_RST | TCP_ACK,
+                                     seq=rnd.getrandbits(32), direction=Direction.INBOUND)]
+        raise ValueError(f"Unknown traffic kind: {kind}")
+
+    def packets(self, count: int) -> List[RawPacket]:
+        """Ровно count пакетов по смеси"""
+        out: List[RawPacket] = []
+        while len(out) < count:
+            kind = self.rnd.choices(self._kinds, self._weights)[0]
+            out += self.make(kind)
+        return out[:count]
+
+
+def generate(count: int, mix: Optional[Dict[str, float]] = None, seed: int = 1) -> List[RawPacket]:
+    return TrafficGenerator(mix, seed).packets(count)
@@ -0,0 +1,299 @@
+"""
+Отвод пакетов на анализ в отдельный процесс
+
+Поток захвата копирует выбранные пакеты в кольцевой буфер в
+multiprocessing.shared_memory (одна запись — одно копирование) и сразу
+пропускает пакет дальше. Дорогой анализ (полный разбор ClientHello,
+DNS, запись pcap) делает отдельный процесс. При переполнении кольца
+пакет не ждёт — запись отбрасывается и считается.
+
+Кольцо — один писатель и один читатель: писатель двигает только
+write_idx, читатель — только read_idx, блокировок нет. Данные слота
+записываются раньше, чем публикуется индекс.
+"""
+
+import queue
+import struct
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from src.config import SNIFFER
+from src.logger import logger
+
+# Что лежит в слоте
+TAG_PACKET = 0
+TAG_HELLO = 1      # первый сегмент TLS-потока
+TAG_DNS = 2        # входящий DNS-ответ
+
+# Заголовок кольца: индексы на разных кеш-линиях
+_WRITE_OFF = 0
+_READ_OFF = 64
+_CTRL_OFF = 96
+_HEADER_SIZE = 128
+_IDX = struct.Struct("<Q")
+_CTRL = struct.Struct("<IIB")          # slots, slot_size, stop
+# Слот: время, исходная длина, сохранённая длина, направление, тег
+_SLOT = struct.Struct("<dIHBB")
+
+
+class ShmRing:
+    """
+    Кольцо слотов фиксированного размера в разделяемой памяти (SPSC)
+
+    name=None — создать новое кольцо, иначе подключиться к существующему.
+    """
+
+    def __init__(self, slots: int = SNIFFER.TAP_SLOTS,
+                 slot_size: int = SNIFFER.TAP_SLOT_SIZE,
+                 name: Optional[str] = None):
+        # multiprocessing — только когда отвод действительно включён
+        from multiprocessing import shared_memory
+        if name is None:
+            self.shm = shared_memory.SharedMemory(
+                create=True, size=_HEADER_SIZE + slots * slot_size)
+            self.buf = self.shm.buf
+            self.buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+            _CTRL.pack_into(self.buf, _CTRL_OFF, slots, slot_size, 0)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.buf = self.shm.buf
+            slots, slot_size, _ = _CTRL.unpack_from(self.buf, _CTRL_OFF)
+            self.owner = False
+        self.name = self.shm.name
+        self.slots = slots
+        self.slot_size = slot_size
+        self.capacity = slot_size - _SLOT.size
+        # Локальные копии своего индекса: чужой читаем только при необходимости
+        self._write = _IDX.unpack_from(self.buf, _WRITE_OFF)[0]
+        self._read = _IDX.unpack_from(self.buf, _READ_OFF)[0]
+        self.dropped = 0
+
+    # === Писатель ===
+
+    def push(self, data, ts: float = 0.0, direction: int = 0, tag: int = TAG_PACKET) -> bool:
+        """Копирует data в следующий слот. False — кольцо заполнено, запись отброшена"""
+        write = self._write
+        if write - self._read >= self.slots:
+            self._read = _IDX.unpack_from(self.buf, _READ_OFF)[0]
+            if write - self._read >= self.slots:
+                self.dropped += 1
+                return False
+        size = min(len(data), self.capacity)
+        off = _HEADER_SIZE + (write % self.slots) * self.slot_size
+        _SLOT.pack_into(self.buf, off, ts, len(data), size, direction, tag)
+        self.buf[off + _SLOT.size:off + _SLOT.size + size] = data[:size]
+        self._write = write + 1
+        _IDX.pack_into(self.buf, _WRITE_OFF, write + 1)
+        return True
+
+    # === Читатель ===
+
+    def pop(self) -> Optional[tuple]:
+        """(время, исходная длина, направление, тег, байты) или None, если пусто"""
+        read = self._read
+        if read >= self._write:
+            self._write = _IDX.unpack_from(self.buf, _WRITE_OFF)[0]
+            if read >= self._write:
+                return None
+        off = _HEADER_SIZE + (read % self.slots) * self.slot_size
+        ts, orig_len, size, direction, tag = _SLOT.unpack_from(self.buf, off)
+        data = bytes(self.buf[off + _SLOT.size:off + _SLOT.size + size])
+        self._read = read + 1
+        _IDX.pack_into(self.buf, _READ_OFF, read + 1)
+        return ts, orig_len, direction, tag, data
+
+    # === Общее ===
+
+    def __len__(self) -> int:
+        return (_IDX.unpack_from(self.buf, _WRITE_OFF)[0] -
+                _IDX.unpack_from(self.buf, _READ_OFF)[0])
+
+    @property
+    def consumed(self) -> int:
+        return _IDX.unpack_from(self.buf, _READ_OFF)[0]
+
+    @property
+    def stopping(self) -> bool:
+        return bool(self.buf[_CTRL_OFF + 8])
+
+    def request_stop(self):
+        self.buf[_CTRL_OFF + 8] = 1
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# === Анализаторы (работают в процессе-анализаторе) ===
+
+def _analyze_hello(ts, orig_len, direction, tag, data) -> Optional[tuple]:
+    if tag != TAG_HELLO:
+        return None
+    from src.packet import RawPacket
+    from src.tls_parser import ClientHelloParser, TLSParserError
+    packet = RawPacket(data, direction=direction)
+    try:
+        hello = ClientHelloParser(packet.tcp.payload).parse()
+    except TLSParserError:
+        hello = None
+    if hello is None:
+        return None
+    return ("hello", packet.dst_addr, hello.sni,
+            len(hello.cipher_suites), [e.type for e in hello.extensions])
+
+
+def _analyze_dns(ts, orig_len, direction, tag, data) -> Optional[tuple]:
+    if tag != TAG_DNS:
+        return None
+    from src.dns_observer import parse_dns_response
+    from src.packet import RawPacket
+    packet = RawPacket(data, direction=direction)
+    parsed = parse_dns_response(packet.udp.payload) if packet.udp is not None else None
+    if parsed is None:
+        return None
+    return ("dns", parsed[0], parsed[1])
+
+
+class _PcapRecorder:
+    def __init__(self, path: str):
+        from src.pcap import PcapWriter
+        self.writer = PcapWriter(path)
+
+    def __call__(self, ts, orig_len, direction, tag, data):
+        self.writer.write(ts, data, orig_len)
+        return None
+
+    def close(self):
+        self.writer.close()
+
+
+ANALYZERS: Dict[str, Callable] = {
+    "hello": _analyze_hello,
+    "dns": _analyze_dns,
+}
+
+
+def run_analyzer(ring_name: str, names: Sequence[str], results,
+                 pcap_path: Optional[str] = None, poll_s: float = 0.001):
+    """Точка входа процесса-анализатора: читает кольцо до остановки"""
+    ring = ShmRing(name=ring_name)
+    try:
+        # Кольцо принадлежит основному процессу — не даём трекеру его удалить
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(ring.shm._name, "shared_memory")
+    except Exception:
+        pass
+
+    handlers = [ANALYZERS[n] for n in names if n in ANALYZERS]
+    recorder = _PcapRecorder(pcap_path) if pcap_path else None
+    if recorder is not None:
+        handlers.append(recorder)
+    try:
+        while True:
+            item = ring.pop()
+            if item is None:
+                if ring.stopping:
+                    break
+                time.sleep(poll_s)
+                continue
+            for handler in handlers:
+                try:
+                    result = handler(*item)
+                except Exception as e:
+                    result = ("error", type(e).__name__, str(e))
+                if result is not None:
+                    results.put(result)
+    finally:
+        if recorder is not None:
+            recorder.close()
+        ring.close()
+
+
+class AnalysisTap:
+    """
+    Отвод пакетов на анализ в отдельный процесс
+
+    offer() вызывается в потоке захвата и стоит одно копирование в кольцо.
+    Результаты анализаторов забираются poll_results() без блокировки.
+    """
+
+    def __init__(self,
+                 analyzers: Sequence[str] = SNIFFER.TAP_ANALYZERS,
+                 slots: int = SNIFFER.TAP_SLOTS,
+                 slot_size: int = SNIFFER.TAP_SLOT_SIZE,
+                 pcap_path: Optional[str] = SNIFFER.TAP_PCAP_FILE):
+        self.analyzers = tuple(analyzers)
+        self.slots = slots
+        self.slot_size = slot_size
+        self.pcap_path = pcap_path
+        self.ring: Optional[ShmRing] = None
+        self.process = None
+        self.results = None
+        self.stats = {"offered": 0, "results": 0}
+
+    @property
+    def handles_dns(self) -> bool:
+        return "dns" in self.analyzers
+
+    def start(self):
+        import multiprocessing
+        ctx = multiprocessing.get_context("spawn")
+        self.ring = ShmRing(self.slots, self.slot_size)
+        self.results = ctx.Queue()
+        self.process = ctx.Process(
+            target=run_analyzer,
+            args=(self.ring.name, self.analyzers, self.results, self.pcap_path),
+            name="tg-bypass-analyzer",
+            daemon=True,
+        )
+        self.process.start()
+        logger.info(f"Analysis tap: {self.slots} slots x {self.slot_size} B, "
+                    f"analyzers: {', '.join(self.analyzers) or '-'}")
+
+    def offer(self, packet, tag: int = TAG_PACKET) -> bool:
+        """Копирует пакет в кольцо. False — кольцо заполнено, пакет не отведён"""
+        self.stats["offered"] += 1
+        return self.ring.push(packet.raw, time.time(), int(packet.direction), tag)
+
+    def poll_results(self, limit: int = 256) -> List[tuple]:
+        """Готовые результаты анализаторов (не блокирует)"""
+        out = []
+        while len(out) < limit:
+            try:
+                out.append(self.results.get_nowait())
+            except queue.Empty:
+                break
+        self.stats["results"] += len(out)
+        return out
+
+    def stop(self, timeout: float = 5.0) -> List[tuple]:
+        """Дожидается разбора очереди и останавливает анализатор"""
+        if self.ring is None:
+            return []
+        self.ring.request_stop()
+        remaining = []
+        deadline = time.monotonic() + timeout
+        # Читаем результаты, пока процесс жив: иначе он может застрять на put()
+        while self.process.is_alive() and time.monotonic() < deadline:
+            remaining += self.poll_results()
+            self.process.join(0.01)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        remaining += self.poll_results()
+        self.stats["dropped"] = self.ring.dropped
+        self.stats["consumed"] = self.ring.consumed
+        self.ring.close()
+        self.ring = None
+        return remaining
+
+    def get_stats(self) -> dict:
+        stats = self.stats.copy()
+        if self.ring is not None:
+            stats["dropped"] = self.ring.dropped
+            stats["queued"] = len(self.ring)
+            stats["consumed"] = self.ring.consumed
+        return stats
@@ -0,0 +1,514 @@
+"""
+Бэкенды перехвата пакетов
+
+Сниффер работает с любым объектом, который ведёт себя как pydivert.WinDivert:
+контекстный менеджер, итерация по пакетам и send(packet).
+"""
+
+import time
+from collections import deque
+from typing import Iterable, List, Optional, Tuple
+
+from src.config import SNIFFER
+from src.logger import logger
+from src.packet import Direction, RawPacket
+
+# pydivert грузит WinDivert.dll при импорте — импортируем при открытии хэндла
+pydivert = None
+
+
+def _load_pydivert():
+    global pydivert
+    if pydivert is None:
+        from src.windivert_loader import setup_windivert_path
+        setup_windivert_path()
+        try:
+            import pydivert as module
+        except ImportError:  # Linux, тесты
+            return None
+        pydivert = module
+    return pydivert
+
+
+class DivertBackend:
+    """
+    Базовый бэкенд: очередь с параметрами QUEUE_LENGTH/TIME/SIZE
+    """
+
+    # Хэндл только наблюдает: пакеты уходят в сеть и без send()
+    sniff_only = False
+    # recv() не ждёт, пока ready() — True: можно читать вперёд (src.lanes);
+    # пакеты завершаются через done() в любом порядке
+    read_ahead = False
+
+    def __init__(self,
+                 queue_length: int = SNIFFER.QUEUE_LENGTH,
+                 queue_time: int = SNIFFER.QUEUE_TIME,
+                 queue_size: int = SNIFFER.QUEUE_SIZE):
+        self.queue_length = queue_length
+        self.queue_time = queue_time
+        self.queue_size = queue_size
+        self.drops = 0
+
+    def open(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def recv(self):
+        """Возвращает следующий пакет или None, если поток пакетов закончился"""
+        raise NotImplementedError
+
+    def send(self, packet):
+        raise NotImplementedError
+
+    def send_batch(self, packets):
+        """Отправляет пачку пакетов по порядку"""
+        send = self.send
+        for packet in packets:
+            send(packet)
+
+    def clone(self, packet):
+        """Независимая копия пакета (для отложенной отправки)"""
+        return RawPacket(bytes(packet.raw), direction=packet.direction)
+
+    def reply(self, packet, raw: bytes):
+        """Входящий пакет raw в ответ на перехваченный packet (для send())"""
+        return RawPacket(raw, direction=Direction.INBOUND)
+
+    def pending(self) -> int:
+        """Сколько пакетов уже ждёт в очереди (точно или оценка)"""
+        return 0
+
+    def ready(self) -> bool:
+        """Следующий recv() вернёт пакет без ожидания (только при read_ahead)"""
+        return False
+
+    def done(self, packet):
+        """Пакет обработан (отправлен через send() или отброшен)"""
+
+    def detach(self, packet):
+        """
+        Пакет будет обработан в другом потоке: бэкенд больше не ждёт его
+        в send() и не держит о нём состояния (вызывать из потока recv)
+        """
+
+    def set_queue_params(self, length: int, time_ms: int, size: int):
+        """Меняет параметры очереди (на открытом хэндле — сразу)"""
+        self.queue_length = length
+        self.queue_time = time_ms
+        self.queue_size = size
+
+    def set_filter(self, filter_str: str):
+        """Меняет фильтр перехвата (где фильтр задаёт процесс, а не правила ядра)"""
+
+    def get_queue_stats(self) -> dict:
+        return {
+            "queue_length": self.queue_length,
+            "queue_time": self.queue_time,
+            "queue_size": self.queue_size,
+            "queue_drops": self.drops,
+        }
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            packet = self.recv()
+            if packet is None:
+                return
+            yield packet
+
+
+class BackendWrapper(DivertBackend):
+    """
+    Обёртка над другим бэкендом: всё, кроме переопределённого, — как у inner
+    """
+
+    def __init__(self, inner: DivertBackend):
+        super().__init__(inner.queue_length, inner.queue_time, inner.queue_size)
+        self.inner = inner
+
+    @property
+    def sniff_only(self) -> bool:
+        return self.inner.sniff_only
+
+    @property
+    def read_ahead(self) -> bool:
+        return self.inner.read_ahead
+
+    @property
+    def drops(self) -> int:
+        return self.inner.drops
+
+    @drops.setter
+    def drops(self, value: int):
+        pass
+
+    def open(self):
+        self.inner.open()
+
+    def close(self):
+        self.inner.close()
+
+    def recv(self):
+        return self.inner.recv()
+
+    def send(self, packet):
+        return self.inner.send(packet)
+
+    def clone(self, packet):
+        return self.inner.clone(packet)
+
+    def reply(self, packet, raw: bytes):
+        return self.inner.reply(packet, raw)
+
+    def pending(self) -> int:
+        return self.inner.pending()
+
+    def ready(self) -> bool:
+        return self.inner.ready()
+
+    def done(self, packet):
+        self.inner.done(packet)
+
+    def detach(self, packet):
+        self.inner.detach(packet)
+
+    def set_queue_params(self, length: int, time_ms: int, size: int):
+        self.inner.set_queue_params(length, time_ms, size)
+
+    def set_filter(self, filter_str: str):
+        self.inner.set_filter(filter_str)
+
+    def get_queue_stats(self) -> dict:
+        return self.inner.get_queue_stats()
+
+    def clock(self) -> float:
+        return self.inner.clock()
+
+
+class WinDivertBackend(DivertBackend):
+    """
+    Перехват через драйвер WinDivert (pydivert)
+
+    Драйвер не сообщает о переполнении очереди, поэтому глубина очереди
+    оценивается по времени: если recv() вернулся почти мгновенно,
+    пакет уже ждал в очереди.
+    """
+
+    BURST_GAP_S = 0.0002
+    FLAG_SNIFF = 0x0001     # WINDIVERT_FLAG_SNIFF
+
+    def __init__(self, filter_str: str, flags: int = 0, **queue_params):
+        super().__init__(**queue_params)
+        self.filter_str = filter_str
+        self.flags = flags
+        self.sniff_only = bool(flags & self.FLAG_SNIFF)
+        self._handle = None
+        self._backlog = 0
+
+    def open(self):
+        if _load_pydivert() is None:
+            raise RuntimeError("pydivert не установлен")
+        self._handle = pydivert.WinDivert(self.filter_str, flags=self.flags)
+        self._handle.open()
+        self._apply_queue_params(self._handle)
+
+    def close(self):
+        if self._handle is not None and self._handle.is_open:
+            self._handle.close()
+        self._handle = None
+
+    def recv(self):
+        started = time.perf_counter()
+        packet = self._handle.recv()
+        if time.perf_counter() - started < self.BURST_GAP_S:
+            self._backlog += 1
+        else:
+            self._backlog = 0
+        return packet
+
+    def send(self, packet):
+        return self._handle.send(packet)
+
+    def clone(self, packet):
+        return pydivert.Packet(bytes(packet.raw), packet.interface, packet.direction)
+
+    def reply(self, packet, raw: bytes):
+        # Адрес WinDivert (wd_addr) — интерфейс исходного пакета, направление входящее
+        return pydivert.Packet(raw, packet.interface, pydivert.Direction.INBOUND)
+
+    def pending(self) -> int:
+        return self._backlog
+
+    def set_queue_params(self, length: int, time_ms: int, size: int):
+        super().set_queue_params(length, time_ms, size)
+        if self._handle is not None:
+            self._apply_queue_params(self._handle)
+
+    def set_filter(self, filter_str: str):
+        """
+        Фильтр драйвера не меняется на лету: открывается новый хэндл, потом
+        закрывается старый. Пакеты, ещё ждавшие в очереди старого хэндла,
+        теряются — поэтому вызывающий ограничивает частоту смен.
+
+        Raises:
+            OSError: драйвер не принял фильтр; старый хэндл продолжает работать
+        """
+        if self._handle is None:
+            self.filter_str = filter_str
+            return
+        handle = pydivert.WinDivert(filter_str, flags=self.flags)
+        handle.open()
+        try:
+            self._apply_queue_params(handle)
+        except OSError:
+            handle.close()
+            raise
+        old, self._handle = self._handle, handle
+        self.filter_str = filter_str
+        if old.is_open:
+            old.close()
+
+    def _apply_queue_params(self, handle):
+        handle.set_param(pydivert.Param.QUEUE_LEN, self.queue_length)
+        handle.set_param(pydivert.Param.QUEUE_TIME, self.queue_time)
+        handle.set_param(pydivert.Param.QUEUE_SIZE, self.queue_size)
+
+
+class FakeBackend(DivertBackend):
+    """
+    Бэкенд без драйвера: отдаёт заранее заданные пакеты
+
+    Пакеты поступают «всплесками»: следующий всплеск попадает в очередь,
+    когда предыдущий вычитан. Очередь ограничена queue_length/queue_size,
+    лишние пакеты отбрасываются и считаются в drops — как у драйвера.
+    """
+
+    read_ahead = True
+
+    def __init__(self,
+                 packets: Optional[Iterable[RawPacket]] = None,
+                 bursts: Optional[Iterable[Iterable[RawPacket]]] = None,
+                 **queue_params):
+        super().__init__(**queue_params)
+        self._bursts = deque(list(b) for b in (bursts or []))
+        if packets is not None:
+            self._bursts.append(list(packets))
+        self.queue = deque()
+        self.queued_bytes = 0
+        self.sent: List[RawPacket] = []
+        self.is_open = False
+        # Сценарное время: момент поступления текущего всплеска
+        self.now = 0.0
+        self._times = deque()
+
+    @classmethod
+    def from_timeline(cls, events: Iterable[Tuple[float, RawPacket]],
+                      **queue_params) -> "FakeBackend":
+        """
+        Бэкенд по сценарию [(время, пакет), ...]
+
+        Каждый пакет поступает отдельно; clock() возвращает время текущего пакета.
+        """
+        events = list(events)
+        backend = cls(bursts=[[packet] for _, packet in events], **queue_params)
+        backend._times = deque(t for t, _ in events)
+        return backend
+
+    def clock(self) -> float:
+        return self.now
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def feed(self, packets: Iterable[RawPacket]):
+        """Кладёт пакеты в очередь с учётом её пределов"""
+        for packet in packets:
+            size = len(packet.raw)
+            if (len(self.queue) >= self.queue_length or
+                    self.queued_bytes + size > self.queue_size):
+                self.drops += 1
+                continue
+            self.queue.append(packet)
+            self.queued_bytes += size
+
+    def recv(self):
+        if not self.queue:
+            if not self._bursts:
+                return None
+            if self._times:
+                self.now = self._times.popleft()
+            self.feed(self._bursts.popleft())
+            if not self.queue:
+                return self.recv()
+        packet = self.queue.popleft()
+        self.queued_bytes -= len(packet.raw)
+        return packet
+
+    def send(self, packet):
+        # Фрагментатор меняет пакет на месте, поэтому сохраняем снимок
+        self.sent.append(RawPacket(bytes(packet.raw), direction=packet.direction))
+        return len(packet.raw)
+
+    def pending(self) -> int:
+        return len(self.queue)
+
+    def ready(self) -> bool:
+        return bool(self.queue)
+
+
+class PcapBackend(DivertBackend):
+    """
+    Воспроизведение захвата pcap/pcapng (офлайн, без драйвера)
+
+    Направление пакета определяется по портам: на порт из outbound_ports —
+    исходящий, с такого порта — входящий. send() ничего не отправляет,
+    только считает. clock() — время захвата текущего пакета.
+    """
+
+    sniff_only = True
+
+    def __init__(self, path, outbound_ports: Optional[Iterable[int]] = None,
+                 **queue_params):
+        super().__init__(**queue_params)
+        self.path = path
+        self.outbound_ports = frozenset(outbound_ports or
+                                        set(SNIFFER.TCP_PORTS) | set(SNIFFER.UDP_PORTS))
+        self._packets = None
+        self.now = 0.0
+        self.sent_packets = 0
+        self.sent_bytes = 0
+        self.skipped = 0
+
+    def open(self):
+        from src.pcap import read_packets
+        self._packets = read_packets(self.path)
+
+    def close(self):
+        self._packets = None
+
+    def clock(self) -> float:
+        return self.now
+
+    def recv(self):
+        for ts, data in self._packets:
+            try:
+                packet = RawPacket(data)
+            except (ValueError, IndexError):
+                self.skipped += 1
+                continue
+            if (packet.dst_port not in self.outbound_ports and
+                    packet.src_port in self.outbound_ports):
+                packet.direction = Direction.INBOUND
+            self.now = ts
+            return packet
+        return None
+
+    def send(self, packet):
+        self.sent_packets += 1
+        self.sent_bytes += len(packet.raw)
+        return len(packet.raw)
+
+
+def _next_pow2(n: int) -> int:
+    return 1 << max(0, int(n) - 1).bit_length()
+
+
+class QueueTuner:
+    """
+    Адаптивный подбор параметров очереди
+
+    Следит за глубиной очереди при каждом recv и временем обработки пакета.
+    Раз в EVAL_EVERY пакетов (или сразу после потерь) поднимает
+    QUEUE_LENGTH/TIME/SIZE с запасом HEADROOM, но не выше лимитов
+    и никогда не ниже значений из конфига.
+
+    Не заданные параметры берутся из SNIFFER при создании, а не при
+    импорте — после того, как конфиг поменяли из командной строки.
+    """
+
+    HEADROOM = 2
+    EVAL_EVERY = 256
+
+    def __init__(self,
+                 length: Optional[int] = None,
+                 time_ms: Optional[int] = None,
+                 size: Optional[int] = None,
+                 max_length: Optional[int] = None,
+                 max_time: Optional[int] = None,
+                 max_size: Optional[int] = None):
+        self.length = SNIFFER.QUEUE_LENGTH if length is None else length
+        self.time_ms = SNIFFER.QUEUE_TIME if time_ms is None else time_ms
+        self.size = SNIFFER.QUEUE_SIZE if size is None else size
+        self.max_length = SNIFFER.QUEUE_LENGTH_MAX if max_length is None else max_length
+        self.max_time = SNIFFER.QUEUE_TIME_MAX if max_time is None else max_time
+        self.max_size = SNIFFER.QUEUE_SIZE_MAX if max_size is None else max_size
+
+        self.peak_backlog = 0
+        self.adjustments = 0
+        self._last_drops = 0
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_peak = 0
+        self._count = 0
+        self._proc_total = 0.0
+        self._bytes_total = 0
+
+    def observe(self, backlog: int, processing_s: float,
+                packet_len: int, drops: int = 0) -> Optional[tuple]:
+        """
+        Учитывает один обработанный пакет
+
+        Returns:
+            (length, time_ms, size), если параметры нужно поменять, иначе None
+        """
+        self._count += 1
+        self._proc_total += processing_s
+        self._bytes_total += packet_len
+        if backlog > self._window_peak:
+            self._window_peak = backlog
+            if backlog > self.peak_backlog:
+                self.peak_backlog = backlog
+
+        if self._count < self.EVAL_EVERY and drops == self._last_drops:
+            return None
+        return self._evaluate(drops)
+
+    def _evaluate(self, drops: int) -> Optional[tuple]:
+        avg_proc = self._proc_total / self._count
+        avg_len = self._bytes_total / self._count
+
+        need_length = _next_pow2((self._window_peak + 1) * self.HEADROOM)
+        if drops > self._last_drops:
+            need_length = max(need_length, self.length * 2)
+        self._last_drops = drops
+        length = min(max(self.length, need_length), self.max_length)
+
+        # Очередь должна успевать вычитываться до истечения QUEUE_TIME
+        need_time = int(length * avg_proc * 1000 * self.HEADROOM) + 1
+        time_ms = min(max(self.time_ms, need_time), self.max_time)
+
+        need_size = int(length * avg_len * self.HEADROOM)
+        size = min(max(self.size, need_size), self.max_size)
+
+        self._reset_window()
+        if (length, time_ms, size) == (self.length, self.time_ms, self.size):
+            return None
+
+        logger.info(f"Queue params: length {self.length}->{length}, "
+                    f"time {self.time_ms}->{time_ms} ms, size {self.size}->{size}")
+        self.length, self.time_ms, self.size = length, time_ms, size
+        self.adjustments += 1
+        return (length, time_ms, size)
@@ -0,0 +1,417 @@
+"""
+Классификация назначений: IP-диапазоны и доменные правила Telegram
+"""
+
+import bisect
+import ipaddress
+import json
+import os
+import socket
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.config import TELEGRAM
+from src.logger import logger
+
+
+def _prefix_to_cidr(prefix: str) -> str:
+    """'149.154.' -> '149.154.0.0/16', '149.154.167.220' -> '149.154.167.220/32'"""
+    if "/" in prefix or ":" in prefix:
+        return prefix
+    octets = [o for o in prefix.split(".") if o != ""]
+    bits = 8 * len(octets)
+    octets += ["0"] * (4 - len(octets))
+    return f"{'.'.join(octets)}/{bits}"
+
+
+def _cidr_intervals(cidrs: Iterable[str]) -> List[Tuple[int, int, int]]:
+    """CIDR -> [(версия, начало, конец)]; некорректные пропускаются"""
+    items = []
+    for cidr in cidrs:
+        try:
+            net = ipaddress.ip_network(cidr, strict=False)
+        except ValueError:
+            logger.debug(f"Bad CIDR: {cidr}")
+            continue
+        items.append((net.version, int(net.network_address), int(net.broadcast_address)))
+    return items
+
+
+def _merge(intervals: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def addr_to_int(addr: str) -> Tuple[int, int]:
+    """Адрес -> (версия, целое)"""
+    if ":" in addr:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, addr), "big")
+    return 4, int.from_bytes(socket.inet_aton(addr), "big")
+
+
+class IPClassifier:
+    """
+    Проверка принадлежности адреса Telegram
+
+    Статические диапазоны (конфиг, кэш апдейтера) хранятся как отсортированные
+    непересекающиеся интервалы, поиск — bisect. CIDR из источников апдейтера
+    меняются вставками и удалениями (apply_diff) поверх статических. Выученные
+    из DNS адреса хранятся отдельно, с истечением по TTL и ограничением размера.
+    """
+
+    CACHE_MAX = 65536
+
+    def __init__(self,
+                 ranges: Iterable[Tuple[str, str]] = (),
+                 cidrs: Iterable[str] = (),
+                 max_learned: int = TELEGRAM.LEARNED_IPS_MAX,
+                 clock: Callable[[], float] = time.time):
+        self.max_learned = max_learned
+        self.clock = clock
+        # addr -> момент истечения (time.time)
+        self.learned: Dict[str, float] = {}
+        self._cache: Dict[str, bool] = {}
+        # Растёт при любом изменении множества адресов (для внешних индексов)
+        self.generation = 0
+        self._starts = {4: [], 6: []}
+        self._ends = {4: [], 6: []}
+        self._intervals = {4: [], 6: []}
+        # Слитые интервалы без источников апдейтера и сами CIDR источников
+        self._static = {4: [], 6: []}
+        self._sourced = {4: set(), 6: set()}
+        self.add_ranges(ranges)
+        self.add_cidrs(cidrs)
+
+    @classmethod
+    def from_config(cls, config=TELEGRAM, **kwargs) -> "IPClassifier":
+        classifier = cls(ranges=config.IP_RANGES,
+                         cidrs=[_prefix_to_cidr(p) for p in config.IP_PREFIXES],
+                         **kwargs)
+        classifier.apply_diff(added=config.IP_SOURCED or ())
+        return classifier
+
+    @classmethod
+    def from_config_cached(cls, cache_file: Path, config=TELEGRAM, **kwargs) -> "IPClassifier":
+        """
+        Как from_config, но слитые интервалы конфига берутся из кэш-файла
+
+        Кэш действителен, пока не изменились исходные диапазоны и префиксы;
+        иначе интервалы собираются заново и кэш перезаписывается. CIDR
+        апдейтера (IP_SOURCED) в кэш не входят и накладываются поверх.
+        """
+        sources = {"ranges": [list(r) for r in config.IP_RANGES],
+                   "prefixes": sorted(config.IP_PREFIXES)}
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("sources") == sources:
+                classifier = cls(**kwargs)
+                for version in (4, 6):
+                    intervals = [tuple(i) for i in data[f"v{version}"]]
+                    classifier._static[version] = intervals
+                    classifier._set_intervals(version, intervals)
+                classifier.generation += 1
+                classifier.apply_diff(added=config.IP_SOURCED or ())
+                return classifier
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        classifier = cls.from_config(config, **kwargs)
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache_file.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"sources": sources,
+                           "v4": classifier._static[4],
+                           "v6": classifier._static[6]}, f)
+            os.replace(tmp, cache_file)
+        except OSError as e:
+            logger.error(f"Ошибка сохранения кэша правил: {e}")
+        return classifier
+
+    # === Статические диапазоны ===
+
+    def add_ranges(self, ranges: Iterable[Tuple[str, str]]):
+        intervals = [(addr_to_int(a), addr_to_int(b)) for a, b in ranges]
+        self._extend([(a[0], a[1], b[1]) for a, b in intervals])
+
+    def add_prefixes(self, prefixes: Iterable[str]):
+        """Префиксы в формате конфига ("149.154.", "1.2.3.4")"""
+        self.add_cidrs(_prefix_to_cidr(p) for p in prefixes)
+
+    def add_cidrs(self, cidrs: Iterable[str]):
+        self._extend(_cidr_intervals(cidrs))
+
+    def _extend(self, items: Iterable[Tuple[int, int, int]]):
+        changed = set()
+        for version, start, end in items:
+            self._static[version].append((start, end))
+            self._intervals[version].append((start, end))
+            changed.add(version)
+        for version in changed:
+            self._static[version] = _merge(self._static[version])
+            self._set_intervals(version, _merge(self._intervals[version]))
+        if changed:
+            self._cache.clear()
+            self.generation += 1
+
+    def apply_diff(self, added: Iterable[str] = (), removed: Iterable[str] = ()) -> bool:
+        """
+        Вставки и удаления CIDR источников апдейтера (src.ip_updater)
+
+        Удаление не задевает диапазоны конфига; пустая разница ничего не
+        пересобирает. Returns: True, если множество адресов изменилось
+        """
+        changed = set()
+        for version, start, end in _cidr_intervals(removed):
+            if (start, end) in self._sourced[version]:
+                self._sourced[version].discard((start, end))
+                changed.add(version)
+        for version, start, end in _cidr_intervals(added):
+            if (start, end) not in self._sourced[version]:
+                self._sourced[version].add((start, end))
+                changed.add(version)
+        for version in changed:
+            self._set_intervals(version, _merge(self._static[version] + list(self._sourced[version])))
+        if changed:
+            self._cache.clear()
+            self.generation += 1
+        return bool(changed)
+
+    def _set_intervals(self, version: int, intervals: List[Tuple[int, int]]):
+        self._intervals[version] = intervals
+        self._starts[version] = [s for s, _ in intervals]
+        self._ends[version] = [e for _, e in intervals]
+
+    def intervals(self, version: int = 4) -> List[Tuple[int, int]]:
+        """Отсортированные непересекающиеся интервалы [start, end]"""
+        return list(self._intervals[version])
+
+    def _in_static(self, addr: str) -> bool:
+        version, value = addr_to_int(addr)
+        starts = self._starts[version]
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value <= self._ends[version][i]
+
+    # === Выученные адреса ===
+
+    def learn(self, addr: str, ttl: int) -> bool:
+        """Добавляет адрес на ttl секунд. True если адрес новый"""
+        is_new = addr not in self.learned
+        if is_new and len(self.learned) >= self.max_learned:
+            self._evict()
+        self.learned[addr] = self.clock() + ttl
+        if is_new:
+            self.generation += 1
+        return is_new
+
+    def _evict(self):
+        """Освобождает место: сначала истёкшие, иначе ближайший к истечению"""
+        now = self.clock()
+        expired = [a for a, exp in self.learned.items() if exp <= now]
+        for addr in expired:
+            del self.learned[addr]
+        if len(self.learned) >= self.max_learned:
+            del self.learned[min(self.learned, key=self.learned.get)]
+        self.generation += 1
+
+    # === Проверка ===
+
+    def contains(self, addr: str) -> bool:
+        expires = self.learned.get(addr)
+        if expires is not None:
+            if expires > self.clock():
+                return True
+            del self.learned[addr]
+            self.generation += 1
+
+        hit = self._cache.get(addr)
+        if hit is None:
+            hit = self._in_static(addr)
+            if len(self._cache) >= self.CACHE_MAX:
+                self._cache.clear()
+            self._cache[addr] = hit
+        return hit
+
+    __contains__ = contains
+
+    # === Экспорт в кэш-файл апдейтера ===
+
+    def export_learned(self, cache_file: Path):
+        """Сохраняет живые выученные адреса в ключ "learned" кэш-файла"""
+        now = self.clock()
+        try:
+            data = {}
+            if cache_file.exists():
+                with open(cache_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            data["learned"] = [{"ip": a, "expires": round(exp, 1)}
+                               for a, exp in self.learned.items() if exp > now]
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache_file.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, cache_file)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения выученных IP: {e}")
+
+    def import_learned(self, cache_file: Path) -> int:
+        """Загружает неистёкшие выученные адреса из кэш-файла"""
+        if not cache_file.exists():
+            return 0
+        now = self.clock()
+        count = 0
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                entries = json.load(f).get("learned", [])
+            for entry in entries:
+                if entry["expires"] > now and len(self.learned) < self.max_learned:
+                    self.learned[entry["ip"]] = entry["expires"]
+                    count += 1
+        except Exception as e:
+            logger.error(f"Ошибка загрузки выученных IP: {e}")
+        if count:
+            self.generation += 1
+        return count
+
+
+class DomainClassifier:
+    """
+    Сопоставление имён (SNI, Host, DNS) с правилами Telegram
+
+    Шаблоны с точкой сравниваются как суффикс домена ("t.me" совпадает
+    с "t.me" и "x.t.me", но не с "art.media"), без точки — как подстрока.
+    """
+
+    CACHE_MAX = 4096
+
+    def __init__(self, patterns: Optional[Iterable[str]] = None):
+        patterns = [p.lower() for p in (patterns or TELEGRAM.SNI_PATTERNS)]
+        self.suffixes = tuple(p for p in patterns if "." in p)
+        self.dotted_suffixes = tuple("." + p for p in self.suffixes)
+        self.keywords = tuple(p for p in patterns if "." not in p)
+        self._cache: Dict[str, bool] = {}
+
+    def matches(self, name: Optional[str]) -> bool:
+        if not name:
+            return False
+        hit = self._cache.get(name)
+        if hit is not None:
+            return hit
+        lowered = name.lower().rstrip(".")
+        hit = (lowered in self.suffixes or
+               lowered.endswith(self.dotted_suffixes) or
+               any(k in lowered for k in self.keywords))
+        if len(self._cache) >= self.CACHE_MAX:
+            self._cache.clear()
+        self._cache[name] = hit
+        return hit
+
+
+class HelloMemo:
+    """
+    Память отпечатков ClientHello: отпечаток -> (is_telegram, стратегия)
+
+    Голоса даёт классификация по SNI и IP: «за» — поток к Telegram,
+    «против» — SNI есть, но не из правил. Отпечаток считается формой
+    клиента Telegram после MIN_VOTES голосов «за» при доле «против» не
+    выше MAX_OTHER_SHARE (браузер, открывший web.telegram.org, не должен
+    сделать «телеграмным» весь браузерный трафик). Отпечатки из
+    TELEGRAM.HELLO_FINGERPRINTS закреплены и не вытесняются.
+
+    Ключ — отпечаток без признака SNI и числа расширений: рукопожатие
+    клиента к IP-литералу (без SNI) попадает в ту же запись, что и с SNI.
+    """
+
+    MIN_VOTES = 3
+    MAX_OTHER_SHARE = 0.1
+
+    def __init__(self, max_entries: int = TELEGRAM.HELLO_MEMO_MAX,
+                 pinned: Optional[Dict[str, Optional[str]]] = None):
+        self.max_entries = max_entries
+        pinned = TELEGRAM.HELLO_FINGERPRINTS if pinned is None else pinned
+        self.pinned = {self.key(fp): strategy for fp, strategy in pinned.items()}
+        # отпечаток -> [голоса «за», голоса «против», стратегия]
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+    @staticmethod
+    def key(fingerprint: str) -> str:
+        """t13d1516h2_b_c -> 13h2_b_c"""
+        return fingerprint[1:3] + fingerprint[8:]
+
+    def lookup(self, fingerprint: str) -> Optional[Tuple[bool, Optional[str]]]:
+        """(is_telegram, стратегия) или None, пока голосов недостаточно"""
+        fingerprint = self.key(fingerprint)
+        if fingerprint in self.pinned:
+            self.stats["hits"] += 1
+            return True, self.pinned[fingerprint]
+        entry = self._entries.get(fingerprint)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(fingerprint)
+        decided = self._decide(entry)
+        if decided is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return decided, entry[2] if decided else None
+
+    def _decide(self, entry: list) -> Optional[bool]:
+        yes, no, _ = entry
+        if yes >= self.MIN_VOTES and no <= self.MAX_OTHER_SHARE * (yes + no):
+            return True
+        if no >= self.MIN_VOTES and not yes:
+            return False
+        return None
+
+    def vote(self, fingerprint: str, is_telegram: bool):
+        fingerprint = self.key(fingerprint)
+        if fingerprint in self.pinned:
+            return
+        entry = self._entries.get(fingerprint)
+        if entry is None:
+            if len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evicted"] += 1
+            entry = self._entries[fingerprint] = [0, 0, None]
+        entry[0 if is_telegram else 1] += 1
+
+    def set_strategy(self, fingerprint: str, strategy: str):
+        """Стратегия, которая сейчас работает для потоков с этим отпечатком"""
+        entry = self._entries.get(self.key(fingerprint))
+        if entry is not None:
+            entry[2] = strategy
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self.pinned)
+
+    def get_stats(self) -> dict:
+        telegram = sum(1 for entry in self._entries.values() if self._decide(entry))
+        return dict(self.stats, entries=len(self), telegram=telegram + len(self.pinned))
+
+
+class FlowVerdict:
+    """Результат классификации первого payload потока (кэшируется на поток)"""
+
+    __slots__ = ("is_telegram", "sni", "protocol", "fingerprint", "strategy", "rule")
+
+    def __init__(self, is_telegram: bool = False, sni: Optional[str] = None,
+                 protocol: Optional[str] = None):
+        self.is_telegram = is_telegram
+        self.sni = sni
+        self.protocol = protocol
+        # Отпечаток ClientHello и подсказка стратегии из HelloMemo
+        self.fingerprint: Optional[str] = None
+        self.strategy: Optional[str] = None
+        # Сработавшее правило политики (src.rules.Rule)
+        self.rule = None
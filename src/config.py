@@ -4,7 +4,7 @@
 """
 
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 
 @dataclass
@@ -17,14 +17,46 @@ class TelegramConfig:
     SNI_PATTERNS: List[str] = None
     
     IP_RANGES: List[Tuple[str, str]] = None
+
+    # Точные CIDR из источников апдейтера (src.ip_updater); в классификаторе
+    # хранятся отдельно от диапазонов конфига и меняются разницами
+    IP_SOURCED: List[str] = None
     
     MTProto_PORTS: List[int] = None
 
     TCP_PORTS: List[int] = None
     UDP_PORTS: List[int] = None
 
+    # Предел адресов, выученных из DNS-ответов
+    LEARNED_IPS_MAX: int = 4096
+
+    # Источники списков IP для апдейтера (src.ip_updater): type, name, url/path, timeout
+    IP_SOURCES: List[Dict] = None
+    # Период условного обновления списков в работающем процессе, с (0 — только при старте)
+    IP_REFRESH_INTERVAL: float = 6 * 3600.0
+
+    # Память отпечатков ClientHello (JA4-подобных): классификация без SNI
+    HELLO_MEMO: bool = True
+    HELLO_MEMO_MAX: int = 1024
+    # Известные отпечатки клиентов Telegram -> стратегия (или None)
+    HELLO_FINGERPRINTS: Dict[str, Optional[str]] = None
+
     
     def __post_init__(self):
+        if self.HELLO_FINGERPRINTS is None:
+            self.HELLO_FINGERPRINTS = {}
+        if self.IP_SOURCED is None:
+            self.IP_SOURCED = []
+        if self.IP_SOURCES is None:
+            self.IP_SOURCES = [
+                # Официальный список Telegram (по строке на CIDR)
+                {"type": "cidr_list", "name": "telegram",
+                 "url": "https://core.telegram.org/resources/cidr.txt", "timeout": 10.0},
+                # Анонсы AS62041 (Telegram Messenger Inc)
+                {"type": "ripestat", "name": "ripestat",
+                 "url": "https://stat.ripe.net/data/announced-prefixes/data.json"
+                        "?resource=AS62041", "timeout": 15.0},
+            ]
         if self.SNI_PATTERNS is None:
             self.SNI_PATTERNS = [
                 "telegram",
@@ -68,21 +100,13 @@ class TelegramConfig:
                 10000, 10001, 10002, 10003,  # WebRTC медиа диапазон
             ]
     
-    def update_ips_from_network(self):
+    def update_ips_from_network(self, allow_network: bool = True):
         """Обновляет IP из сети (вызывать при старте)"""
         try:
             from src.ip_updater import get_telegram_ips
-            new_ips = get_telegram_ips()
+            new_ips = get_telegram_ips(allow_network=allow_network)
             if new_ips:
-                # Добавляем новые IP к существующим
-                existing = set(self.IP_PREFIXES)
-                for ip in new_ips:
-                    # Берём первые 2 октета для префикса
-                    parts = ip.split(".")
-                    if len(parts) >= 2:
-                        prefix = f"{parts[0]}.{parts[1]}."
-                        existing.add(prefix)
-                self.IP_PREFIXES = list(existing)
+                self.IP_SOURCED = list(new_ips)
                 return True
         except Exception as e:
             from src.logger import logger
@@ -112,6 +136,14 @@ class FragmentationConfig:
     DEFAULT_DELAY_MS: float = 10.0
     MAX_DELAY_MS: float = 100.0
     MIN_DELAY_MS: float = 0.0
+    # Самонастройка стратегии по диапазонам назначения
+    ADAPTIVE_STRATEGY: bool = True
+    SMALL_DELAY_MS: float = 5.0
+    STRATEGY_CACHE_FILE: str = "data/strategy_cache.json"
+    # Планы разрезов первых сегментов: повтор (ретрансмит) уходит с теми же
+    # границами и без задержки, пока поток не прошёл рукопожатие
+    PLAN_CACHE_MAX: int = 4096
+    PLAN_CACHE_TTL_S: float = 30.0
 
 
 @dataclass
@@ -121,6 +153,81 @@ class SnifferConfig:
     UDP_PORTS: List[int] = None
     FILTER_TEMPLATE: str = "tcp.DstPort == {}"
 
+    # Очередь WinDivert (значения по умолчанию — как у драйвера 2.x)
+    QUEUE_LENGTH: int = 4096       # пакетов
+    QUEUE_TIME: int = 2000         # мс
+    QUEUE_SIZE: int = 4194304      # байт
+    # Адаптивный режим: поднимать параметры очереди по наблюдаемым всплескам
+    QUEUE_ADAPTIVE: bool = False
+    # Безопасные пределы для адаптивного режима (лимиты WinDivert 2.x)
+    QUEUE_LENGTH_MAX: int = 16384
+    QUEUE_TIME_MAX: int = 16000
+    QUEUE_SIZE_MAX: int = 33554432
+    # Перехватывать и входящее направление (SYN/ACK, ServerHello) для телеметрии
+    DIVERT_INBOUND: bool = False
+    # Перехватывать входящие RST и SYN/ACK для отсева RST, внедрённых DPI
+    DIVERT_RST: bool = True
+
+    # Бэкенд перехвата: "auto" (WinDivert на Windows, NFQUEUE на Linux),
+    # "windivert" или "nfqueue"
+    BACKEND: str = "auto"
+    # NFQUEUE: номер очереди, метка своих пакетов (SO_MARK) и размер пачки вердиктов
+    NFQUEUE_NUM: int = 0
+    NFQUEUE_MARK: int = 0x7467
+    NFQUEUE_VERDICT_BATCH: int = 64
+    # При переполнении очереди ядро пропускает пакеты, а не отбрасывает
+    NFQUEUE_FAIL_OPEN: bool = True
+
+    # Отвод пакетов на анализ в отдельный процесс (кольцо в shared memory)
+    TAP_SLOTS: int = 4096
+    TAP_SLOT_SIZE: int = 2048
+    TAP_ANALYZERS: Tuple[str, ...] = ("hello", "dns")
+    TAP_PCAP_FILE: Optional[str] = None
+
+    # Самописец последних пакетов (дамп в pcapng при ошибке/сигнале)
+    RECORDER_ENABLED: bool = True
+    RECORDER_PACKETS: int = 1024
+    RECORDER_SNAPLEN: int = 1600
+    RECORDER_DIR: str = "data/flight"
+
+    # Быстрый старт: сначала открыть хэндл с правилами из кэша,
+    # обновление IP из сети — в фоне
+    FAST_START: bool = True
+    RULES_CACHE_FILE: str = "data/compiled_rules.json"
+    # Правила политики по назначениям (src.rules), секция rules
+    RULES_FILE: str = "config.yaml"
+
+    # Сборщик мусора: замер пауз всегда, щадящий режим (freeze + пороги) — по флагу
+    GC_MONITOR: bool = True
+    GC_TUNING: bool = False
+    GC_THRESHOLDS: Tuple[int, int, int] = (10000, 50, 1000)
+
+    # Встраиваемый asyncio-движок: пределы очередей (обратное давление)
+    ENGINE_QUEUE_SIZE: int = 1024
+    ENGINE_EVENTS_SIZE: int = 1024
+
+    # UDP (звонки): по умолчанию не перехватывается. Стратегия из
+    # src.udp_stage.UDP_STRATEGIES включает перехват первых пакетов потока
+    UDP_STRATEGY: Optional[str] = None
+    UDP_FIRST_PACKETS: int = 8
+    # Не больше UDPStage.MAX_EXCLUDED: каждый поток — исключение в фильтре
+    UDP_MAX_OFFLOADED: int = 32
+    UDP_REFILTER_INTERVAL_S: float = 1.0
+
+    # QUIC (UDP/443) к адресам Telegram: быстрый отказ вместо таймаута
+    # рукопожатия (src.quic_filter). "icmp", "drop" или None — не перехватывать
+    QUIC_FAST_FAIL: Optional[str] = None
+    QUIC_PORTS: Tuple[int, ...] = (443,)
+
+    # Полосы приоритета (src.lanes): рукопожатия не ждут за закачками.
+    # "strict", "weighted" или None — обработка в порядке поступления.
+    # Нужен бэкенд с опережающим чтением (NFQUEUE), WinDivert — по порядку
+    LANES: Optional[str] = None
+    # Пределы очередей и веса полос: handshake, control, bulk
+    LANE_LIMITS: Tuple[int, int, int] = (1024, 1024, 4096)
+    LANE_WEIGHTS: Tuple[int, int, int] = (16, 8, 64)
+    LANE_BULK_BATCH: int = 64
+
     def __post_init__(self):
         if self.PORTS is None:
             self.PORTS = [443, 80, 8080]
@@ -135,7 +242,24 @@ class SnifferConfig:
         return " or ".join(conditions)
 
 
+@dataclass
+class ProxyConfig:
+    """Режим без драйвера: локальный SOCKS5 / HTTP CONNECT прокси"""
+    HOST: str = "127.0.0.1"
+    PORT: int = 1080
+    BACKLOG: int = 4096
+    # Стратегия разбиения первых байтов (src.strategy.STRATEGIES), правила важнее
+    STRATEGY: str = "split"
+    SPLIT_DELAY_MS: float = 0.0
+    # Сколько ждать первых байтов клиента (протоколы, где первым говорит сервер)
+    FIRST_DATA_TIMEOUT_S: float = 2.0
+    CONNECT_TIMEOUT_S: float = 10.0
+    HANDSHAKE_TIMEOUT_S: float = 10.0
+    RELAY_BUFFER: int = 262144
+
+
 # Глобальные инстансы конфигов
 TELEGRAM = TelegramConfig()
 FRAGMENTATION = FragmentationConfig()
-SNIFFER = SnifferConfig()
\ No newline at end of file
+SNIFFER = SnifferConfig()
+PROXY = ProxyConfig()
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""
+Изучение адресов Telegram по DNS-ответам
+
+Сниффер перехватывает входящие ответы UDP/53. Если запрошенное имя подходит
+под доменные правила, адреса из A/AAAA-записей добавляются в IPClassifier
+на время TTL записи. Это не зависит от сторонних API со списками сетей.
+"""
+
+import socket
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from src.classifier import DomainClassifier, IPClassifier
+from src.logger import logger
+
+TYPE_A = 1
+TYPE_AAAA = 28
+
+
+def _skip_name(buf: memoryview, pos: int) -> int:
+    """Пропускает имя (с учётом сжатия), возвращает позицию после него"""
+    while True:
+        length = buf[pos]
+        if length == 0:
+            return pos + 1
+        if length & 0xC0 == 0xC0:
+            return pos + 2
+        pos += 1 + length
+
+
+def _read_name(buf: memoryview, pos: int) -> str:
+    """Читает имя (с учётом сжатия). Число переходов ограничено"""
+    labels = []
+    for _ in range(64):
+        length = buf[pos]
+        if length == 0:
+            break
+        if length & 0xC0 == 0xC0:
+            pos = ((length & 0x3F) << 8) | buf[pos + 1]
+            continue
+        labels.append(bytes(buf[pos + 1:pos + 1 + length]).decode("ascii", "replace"))
+        pos += 1 + length
+    return ".".join(labels)
+
+
+def parse_dns_response(data) -> Optional[Tuple[str, List[Tuple[str, int]]]]:
+    """
+    Разбирает DNS-ответ без копирования сообщения
+
+    Returns:
+        (запрошенное имя, [(адрес, ttl), ...]) или None, если это не
+        успешный ответ с одним вопросом
+    """
+    buf = memoryview(data)
+    if len(buf) < 12:
+        return None
+    flags = (buf[2] << 8) | buf[3]
+    qdcount = (buf[4] << 8) | buf[5]
+    ancount = (buf[6] << 8) | buf[7]
+    # QR=1 (ответ), RCODE=0
+    if not flags & 0x8000 or flags & 0x000F or qdcount != 1:
+        return None
+
+    try:
+        qname = _read_name(buf, 12)
+        pos = _skip_name(buf, 12) + 4   # qtype + qclass
+
+        answers = []
+        for _ in range(ancount):
+            pos = _skip_name(buf, pos)
+            rtype = (buf[pos] << 8) | buf[pos + 1]
+            ttl = int.from_bytes(buf[pos + 4:pos + 8], "big")
+            rdlength = (buf[pos + 8] << 8) | buf[pos + 9]
+            pos += 10
+            if pos + rdlength > len(buf):
+                break
+            if rtype == TYPE_A and rdlength == 4:
+                answers.append((socket.inet_ntop(socket.AF_INET, buf[pos:pos + 4]), ttl))
+            elif rtype == TYPE_AAAA and rdlength == 16:
+                answers.append((socket.inet_ntop(socket.AF_INET6, buf[pos:pos + 16]), ttl))
+            pos += rdlength
+    except IndexError:
+        return None
+    return qname, answers
+
+
+class DNSObserver:
+    """
+    Наблюдатель DNS-ответов, пополняющий IPClassifier
+    """
+
+    MIN_TTL = 60          # не даём коротким TTL выкидывать адрес посреди соединения
+    MAX_TTL = 86400
+    EXPORT_INTERVAL_S = 60.0
+
+    def __init__(self,
+                 ip_classifier: IPClassifier,
+                 domains: Optional[DomainClassifier] = None,
+                 cache_file: Optional[Path] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ip_classifier = ip_classifier
+        self.domains = domains or DomainClassifier()
+        self.cache_file = cache_file
+        self.clock = clock
+        self._last_export = clock()
+        self.stats = {
+            "responses": 0,
+            "matched": 0,
+            "learned": 0,
+            "malformed": 0,
+        }
+
+    def on_packet(self, packet) -> None:
+        """Входящий UDP-пакет с порта 53"""
+        udp = packet.udp
+        if udp is None:
+            return
+        self.observe(udp.payload)
+
+    def observe(self, data) -> int:
+        """Обрабатывает DNS-ответ, возвращает число новых адресов"""
+        parsed = parse_dns_response(data)
+        if parsed is None:
+            self.stats["malformed"] += 1
+            return 0
+        return self.apply(*parsed)
+
+    def apply(self, qname: str, answers: List[Tuple[str, int]]) -> int:
+        """Применяет разобранный ответ (в том числе разобранный вне потока захвата)"""
+        self.stats["responses"] += 1
+        if not answers or not self.domains.matches(qname):
+            return 0
+
+        self.stats["matched"] += 1
+        new = 0
+        for addr, ttl in answers:
+            ttl = min(max(ttl, self.MIN_TTL), self.MAX_TTL)
+            if self.ip_classifier.learn(addr, ttl):
+                new += 1
+                logger.debug(f"DNS: {qname} -> {addr} (ttl {ttl})")
+        self.stats["learned"] += new
+        if new:
+            self.maybe_export()
+        return new
+
+    def maybe_export(self, force: bool = False):
+        """Сохраняет выученные адреса в кэш-файл (не чаще EXPORT_INTERVAL_S)"""
+        if self.cache_file is None:
+            return
+        now = self.clock()
+        if force or now - self._last_export >= self.EXPORT_INTERVAL_S:
+            self.ip_classifier.export_learned(self.cache_file)
+            self._last_export = now
+
+    def get_stats(self) -> dict:
+        stats = self.stats.copy()
+        stats["learned_active"] = len(self.ip_classifier.learned)
+        return stats
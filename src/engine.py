@@ -0,0 +1,376 @@
+"""
+Встраиваемый движок на asyncio
+
+Тот же конвейер, что и у TelegramBypass.run(), но без блокирующего цикла,
+sys.exit и обработчиков сигналов — для запуска внутри чужого event loop:
+
+    engine = Engine(backend=my_backend)
+    await engine.start()
+    async for event in engine.events():
+        ...
+    await engine.stop()
+
+Приём пакетов — в отдельном потоке (recv блокирующий), обработка —
+в event loop. Между ними ограниченная очередь: когда обработка не
+успевает, поток приёма ждёт и перестаёт вычитывать драйвер, очередь
+копится уже в нём (QUEUE_LENGTH/SIZE). Задержки между фрагментами не
+блокируют цикл: сегменты после первой паузы уходят по таймерам loop.
+
+Состояние вердиктов NFQueueBackend (прочитанные пакеты, пачка ACCEPT)
+не должно трогаться из двух потоков. Поток приёма сразу отпускает каждый
+пакет (detach: вердикт DROP), а loop отправляет его инъекцией, а не
+ACCEPT — вердикты остаются в потоке приёма.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional
+
+from src.backend import BackendWrapper, DivertBackend
+from src.config import SNIFFER
+from src.flow_table import flow_key
+from src.logger import logger
+
+
+class _ScheduledSender(BackendWrapper):
+    """
+    Отправка с отложенными сегментами вместо sleep()
+
+    sleep() фрагментатора лишь сдвигает срок следующей отправки внутри
+    текущего пакета. Сегмент со сроком в будущем копируется и уходит
+    по таймеру loop; сегменты одного потока не обгоняют друг друга.
+    """
+
+    def __init__(self, inner: DivertBackend, loop: asyncio.AbstractEventLoop):
+        super().__init__(inner)
+        self.loop = loop
+        self._base = 0.0
+        self._offset = 0.0
+        # Поток -> очередь [срок, пакет, таймер] в порядке отправки
+        self._queues: Dict[Optional[tuple], deque] = {}
+        self.pending_count = 0
+        self.stats = {"immediate": 0, "scheduled": 0, "fired": 0,
+                      "flushed": 0, "peak_pending": 0}
+
+    def begin(self):
+        """Начало обработки очередного пакета"""
+        self._base = self.loop.time()
+        self._offset = 0.0
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            self._offset += seconds
+
+    @property
+    def offset(self) -> float:
+        return self._offset
+
+    def send(self, packet):
+        key = flow_key(packet) if packet.tcp is not None else None
+        queue = self._queues.get(key)
+        due = self._base + self._offset
+        if queue is None and due <= self.loop.time():
+            self.stats["immediate"] += 1
+            return self.inner.send(packet)
+
+        # Фрагментатор меняет пакет на месте — откладываем копию
+        copy = self.inner.clone(packet)
+        if queue is None:
+            queue = self._queues[key] = deque()
+        else:
+            due = max(due, queue[-1][0])
+        queue.append([due, copy, self.loop.call_at(due, self._fire, key)])
+        self.pending_count += 1
+        self.stats["scheduled"] += 1
+        if self.pending_count > self.stats["peak_pending"]:
+            self.stats["peak_pending"] = self.pending_count
+        return len(copy.raw)
+
+    def _fire(self, key):
+        # Каждый таймер отправляет голову очереди потока: сроки в ней не убывают
+        queue = self._queues[key]
+        _, packet, _ = queue.popleft()
+        if not queue:
+            del self._queues[key]
+        self.pending_count -= 1
+        self.stats["fired"] += 1
+        try:
+            self.inner.send(packet)
+        except Exception as e:
+            logger.error(f"Engine: delayed send failed: {e}")
+
+    def flush(self) -> int:
+        """Отменяет таймеры и сразу отправляет всё отложенное по порядку сроков"""
+        entries = []
+        for queue in self._queues.values():
+            for i, entry in enumerate(queue):
+                entry[2].cancel()
+                entries.append((entry[0], i, entry[1]))
+        self._queues.clear()
+        self.pending_count = 0
+        entries.sort(key=lambda e: (e[0], e[1]))
+        for _, _, packet in entries:
+            self.inner.send(packet)
+        self.stats["flushed"] += len(entries)
+        return len(entries)
+
+
+class _TelemetryTap:
+    """Запоминает стратегию последнего фрагментированного пакета и передаёт дальше"""
+
+    def __init__(self, inner=None):
+        self.inner = inner
+        self.strategy: Optional[str] = None
+
+    def clock(self) -> float:
+        return self.inner.clock() if self.inner is not None else time.perf_counter()
+
+    def on_fragmented(self, packet, strategy: str, seconds: float):
+        self.strategy = strategy
+        if self.inner is not None:
+            self.inner.on_fragmented(packet, strategy, seconds)
+
+
+@dataclass
+class DecisionEvent:
+    """Решение по первому сегменту потока или по фрагментированному пакету"""
+    time: float               # loop.time()
+    dst: str
+    dst_port: int
+    protocol: Optional[str]
+    sni: Optional[str]
+    is_telegram: bool
+    action: str               # "fragment" | "pass"
+    strategy: Optional[str] = None
+    delay_ms: float = 0.0     # суммарная задержка между фрагментами
+
+
+class Engine:
+    """
+    Конвейер TelegramBypass под управлением asyncio
+
+    Args:
+        app: готовый TelegramBypass (иначе создаётся из app_kwargs)
+        queue_size: предел очереди принятых, но не обработанных пакетов
+        events_size: предел очереди событий; лишние события отбрасываются
+    """
+
+    # Сколько пакетов обработать подряд, прежде чем отдать управление таймерам
+    BATCH = 32
+
+    def __init__(self, app=None,
+                 queue_size: int = SNIFFER.ENGINE_QUEUE_SIZE,
+                 events_size: int = SNIFFER.ENGINE_EVENTS_SIZE,
+                 **app_kwargs):
+        if app is None:
+            from src.main import TelegramBypass
+            app = TelegramBypass(**app_kwargs)
+        self.app = app
+        self.queue_size = queue_size
+        self.events_size = events_size
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.sender: Optional[_ScheduledSender] = None
+        self._inbox: Optional[asyncio.Queue] = None
+        self._events: Optional[asyncio.Queue] = None
+        self._reader: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+        self._credits: Optional[threading.Semaphore] = None
+        self._tap: Optional[_TelemetryTap] = None
+        self._stopping = False
+        self._closed = False
+        self.running = False
+        self.stats_counters = {"received": 0, "processed": 0, "backpressure": 0,
+                               "dropped_on_stop": 0, "events": 0, "events_dropped": 0,
+                               "inbox_peak": 0}
+
+    # === Жизненный цикл ===
+
+    async def start(self):
+        """Собирает конвейер, открывает хэндл и запускает приём"""
+        if self.running:
+            return
+        self.loop = asyncio.get_running_loop()
+        app = self.app
+        # prepare() может читать кэши и ходить в сеть — не в потоке loop
+        if not await self.loop.run_in_executor(None, app.prepare, False):
+            raise RuntimeError("Environment is not ready (see log)")
+        sniffer = app.sniffer
+
+        inner = sniffer.backend or sniffer._create_backend()
+        self.sender = _ScheduledSender(inner, self.loop)
+        sniffer.backend = sniffer.w = self.sender
+        # В теневом режиме задержки только учитываются отчётом
+        if not app.shadow:
+            app.fragmenter.sleep = self.sender.sleep
+        self._tap = _TelemetryTap(app.fragmenter.telemetry)
+        app.fragmenter.telemetry = self._tap
+        self._decide = sniffer.on_packet
+        sniffer.on_packet = self._on_packet
+
+        # Размер очереди ограничивают «кредиты» потока приёма
+        self._inbox = asyncio.Queue()
+        self._credits = threading.Semaphore(self.queue_size)
+        self._events = asyncio.Queue(self.events_size)
+        self._stopping = self._closed = False
+
+        await self.loop.run_in_executor(None, self.sender.open)
+        sniffer.running = True
+        if sniffer.on_started is not None:
+            sniffer.on_started()
+        self._reader = threading.Thread(target=self._read_loop, name="tg-bypass-engine-recv",
+                                        daemon=True)
+        self._reader.start()
+        self._task = self.loop.create_task(self._process_loop())
+        self.running = True
+        logger.info(f"Engine started (queue={self.queue_size}, events={self.events_size})")
+
+    async def wait(self):
+        """Ждёт, пока поток пакетов не закончится (FakeBackend, pcap)"""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def stop(self):
+        """
+        Останавливает приём, дообрабатывает очередь, досылает отложенные
+        сегменты и только потом закрывает хэндл
+        """
+        if not self.running:
+            return
+        self._stopping = True
+        self.app.sniffer.running = False
+        # Пакеты, уже переданные потоком приёма, дообрабатываются
+        await asyncio.sleep(0)
+        if not self._task.done():
+            await self._inbox.join()
+        sent = self.sender.flush()
+        if sent:
+            logger.debug(f"Engine: flushed {sent} delayed segments")
+
+        self._closed = True
+        await self.loop.run_in_executor(None, self.sender.close)
+        await self.loop.run_in_executor(None, self._reader.join)
+        if not self._task.done():
+            self._inbox.put_nowait(None)
+        await self._task
+
+        self.app.shutdown()
+        self.running = False
+        # Конец потока событий должен поместиться даже без потребителя
+        while self._events.full():
+            self._events.get_nowait()
+            self.stats_counters["events_dropped"] += 1
+        self._events.put_nowait(None)
+        logger.info("Engine stopped")
+
+    # === Приём и обработка ===
+
+    def _read_loop(self):
+        """Поток приёма: recv и передача в loop, пока есть место в очереди"""
+        credits = self._credits
+        while not self._stopping:
+            try:
+                packet = self.sender.recv()
+            except Exception as e:
+                if not self._stopping:
+                    logger.error(f"Engine: recv failed: {e}")
+                break
+            if packet is None:
+                break
+            self.sender.detach(packet)
+            # Очередь полна — ждём, пока обработка освободит место
+            if not credits.acquire(blocking=False):
+                self.stats_counters["backpressure"] += 1
+                while not credits.acquire(timeout=0.1):
+                    if self._stopping:
+                        return
+            try:
+                self.loop.call_soon_threadsafe(self._offer, packet)
+            except RuntimeError:  # loop закрыт
+                return
+        if not self._stopping:
+            self.loop.call_soon_threadsafe(self._inbox.put_nowait, None)
+
+    def _offer(self, packet):
+        inbox = self._inbox
+        inbox.put_nowait(packet)
+        self.stats_counters["received"] += 1
+        if inbox.qsize() > self.stats_counters["inbox_peak"]:
+            self.stats_counters["inbox_peak"] = inbox.qsize()
+
+    async def _process_loop(self):
+        inbox = self._inbox
+        process = self.app.sniffer._process_packet
+        sender = self.sender
+        counters = self.stats_counters
+        batch = 0
+        while True:
+            packet = await inbox.get()
+            if packet is None:
+                inbox.task_done()
+                return
+            if self._closed:
+                counters["dropped_on_stop"] += 1
+            else:
+                sender.begin()
+                process(packet)
+                counters["processed"] += 1
+            inbox.task_done()
+            self._credits.release()
+            batch += 1
+            if batch >= self.BATCH:
+                batch = 0
+                await asyncio.sleep(0)
+
+    def _on_packet(self, packet, sni, is_telegram, w):
+        tap = self._tap
+        tap.strategy = None
+        result = self._decide(packet, sni, is_telegram, w)
+        if tap.strategy is not None or sni is not None:
+            verdict = self.app.sniffer.verdict
+            self._emit(DecisionEvent(
+                time=self.loop.time(),
+                dst=str(packet.dst_addr),
+                dst_port=packet.tcp.dst_port,
+                protocol=verdict.protocol if verdict else None,
+                sni=sni,
+                is_telegram=is_telegram or tap.strategy is not None,
+                action="fragment" if tap.strategy is not None else "pass",
+                strategy=tap.strategy,
+                delay_ms=round(self.sender.offset * 1000.0, 3),
+            ))
+        return result
+
+    def _emit(self, event: DecisionEvent):
+        try:
+            self._events.put_nowait(event)
+            self.stats_counters["events"] += 1
+        except asyncio.QueueFull:
+            # Медленный потребитель событий не тормозит трафик
+            self.stats_counters["events_dropped"] += 1
+
+    # === Наблюдение ===
+
+    async def events(self) -> AsyncIterator[DecisionEvent]:
+        """События решений; итерация заканчивается после stop()"""
+        while True:
+            event = await self._events.get()
+            if event is None:
+                # Другим потребителям тоже нужен конец потока
+                self._events.put_nowait(None)
+                return
+            yield event
+
+    def stats(self) -> dict:
+        stats = dict(self.stats_counters)
+        stats["running"] = self.running
+        if self._inbox is not None:
+            stats["inbox"] = self._inbox.qsize()
+        if self.sender is not None:
+            stats["timers"] = dict(self.sender.stats, pending=self.sender.pending_count)
+        if self.app.sniffer is not None:
+            stats["sniffer"] = self.app.sniffer.get_stats()
+        stats["fragmenter"] = self.app.fragmenter.get_stats()
+        return stats
@@ -0,0 +1,148 @@
+"""
+«Бортовой самописец»: последние пакеты до и после обработки
+
+Кольцо фиксированного размера, память выделяется один раз при старте.
+Запись пакета — одно копирование байтов в слот плюс несколько чисел
+в заранее выделенные массивы. По ошибке фрагментации, по сигналу или по
+запросу кольцо сбрасывается в pcapng с комментариями о принятых решениях.
+"""
+
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.backend import BackendWrapper, DivertBackend
+from src.config import SNIFFER
+from src.logger import logger
+from src.pcap import EPB_INBOUND, EPB_OUTBOUND, PcapngWriter
+
+_INBOUND = 0x1      # пакет входящий
+_SENT = 0x2         # запись сделана при отправке (после обработки)
+
+
+class FlightRecorder:
+    """
+    Кольцо последних packets пакетов, не длиннее snaplen байт каждый
+    """
+
+    MAX_NOTES = 4096
+
+    def __init__(self,
+                 packets: int = SNIFFER.RECORDER_PACKETS,
+                 snaplen: int = SNIFFER.RECORDER_SNAPLEN,
+                 dump_dir: str = SNIFFER.RECORDER_DIR,
+                 min_dump_interval_s: float = 60.0):
+        self.size = packets
+        self.snaplen = snaplen
+        self.dump_dir = Path(dump_dir)
+        self.min_dump_interval_s = min_dump_interval_s
+
+        self._data = bytearray(packets * snaplen)
+        self._view = memoryview(self._data)
+        self._ts = array("d", bytes(8 * packets))
+        self._len = array("I", bytes(4 * packets))
+        self._cap = array("H", bytes(2 * packets))
+        self._flags = array("B", bytes(packets))
+        self._note = array("H", bytes(2 * packets))
+        # Тексты решений хранятся один раз, в слотах — только номер
+        self._notes: Dict[str, int] = {"": 0}
+        self._note_texts = [""]
+
+        self.count = 0
+        self._last_in = -1
+        self._last_dump = None
+        self.dumps = 0
+
+    # === Запись ===
+
+    def record(self, packet, sent: bool = False):
+        """Копирует пакет в очередной слот"""
+        raw = packet.raw
+        i = self.count % self.size
+        n = len(raw)
+        off = i * self.snaplen
+        if n <= self.snaplen:
+            cap = n
+            self._view[off:off + n] = raw
+        else:
+            cap = self.snaplen
+            self._view[off:off + cap] = memoryview(raw)[:cap]
+        self._ts[i] = time.time()
+        self._len[i] = n
+        self._cap[i] = cap
+        self._flags[i] = (_SENT if sent else 0) | (_INBOUND if packet.is_inbound else 0)
+        self._note[i] = 0
+        self.count += 1
+        if not sent:
+            self._last_in = i
+
+    def annotate(self, text: str):
+        """Решение по последнему принятому пакету"""
+        if self._last_in < 0:
+            return
+        note = self._notes.get(text)
+        if note is None:
+            if len(self._note_texts) >= self.MAX_NOTES:
+                text, note = "...", 0
+            else:
+                note = len(self._note_texts)
+                self._notes[text] = note
+                self._note_texts.append(text)
+        self._note[self._last_in] = note
+
+    # === Сброс ===
+
+    def dump(self, path: Optional[str] = None, reason: str = "on demand",
+             force: bool = True) -> Optional[Path]:
+        """
+        Пишет кольцо (от старых к новым) в pcapng
+
+        force=False — не чаще min_dump_interval_s (для автоматических триггеров).
+        """
+        now = time.monotonic()
+        if (not force and self._last_dump is not None and
+                now - self._last_dump < self.min_dump_interval_s):
+            return None
+        self._last_dump = now
+
+        if path is None:
+            self.dump_dir.mkdir(parents=True, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            path = self.dump_dir / f"flight-{stamp}-{self.dumps}.pcapng"
+        path = Path(path)
+
+        total = min(self.count, self.size)
+        first = self.count - total
+        with PcapngWriter(path, comment=f"tg-bypass flight recorder: {reason}",
+                          snaplen=self.snaplen) as writer:
+            for seq in range(first, self.count):
+                i = seq % self.size
+                flags = self._flags[i]
+                off = i * self.snaplen
+                note = self._note_texts[self._note[i]]
+                comment = ("sent" if flags & _SENT else "recv") + (f": {note}" if note else "")
+                writer.write(self._ts[i], self._view[off:off + self._cap[i]],
+                             orig_len=self._len[i], comment=comment,
+                             flags=EPB_INBOUND if flags & _INBOUND else EPB_OUTBOUND)
+        self.dumps += 1
+        logger.info(f"Flight recorder: {total} packets -> {path} ({reason})")
+        return path
+
+
+class RecordingBackend(BackendWrapper):
+    """Пишет в самописец каждый принятый и каждый отправленный пакет"""
+
+    def __init__(self, inner: DivertBackend, recorder: FlightRecorder):
+        super().__init__(inner)
+        self.recorder = recorder
+
+    def recv(self):
+        packet = self.inner.recv()
+        if packet is not None:
+            self.recorder.record(packet)
+        return packet
+
+    def send(self, packet):
+        self.recorder.record(packet, sent=True)
+        return self.inner.send(packet)
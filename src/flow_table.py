@@ -0,0 +1,89 @@
+"""
+Ограниченная таблица TCP/UDP-потоков
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+def flow_key(packet) -> tuple:
+    """
+    Ключ потока: (адрес сервера, порт сервера, порт клиента)
+
+    Одинаков для исходящих и входящих пакетов одного соединения.
+    """
+    if packet.is_outbound:
+        return (packet.dst_addr, packet.dst_port, packet.src_port)
+    return (packet.src_addr, packet.src_port, packet.dst_port)
+
+
+class FlowTable:
+    """
+    LRU-таблица состояний потоков с вытеснением по размеру и простою
+
+    Все операции O(1) (кроме expire, который снимает только устаревший хвост).
+    Поток, простоявший дольше idle_timeout, для get() и in уже не существует.
+    """
+
+    def __init__(self,
+                 max_flows: int = 4096,
+                 idle_timeout: float = 120.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_flows = max_flows
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self._flows: "OrderedDict[Hashable, list]" = OrderedDict()
+        self.evicted = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._flows.get(key)
+        if entry is None:
+            return default
+        now = self.clock()
+        if now - entry[1] >= self.idle_timeout:
+            del self._flows[key]
+            return default
+        entry[1] = now
+        self._flows.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        if key in self._flows:
+            self._flows.move_to_end(key)
+        elif len(self._flows) >= self.max_flows:
+            self._flows.popitem(last=False)
+            self.evicted += 1
+        self._flows[key] = [value, self.clock()]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._flows.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def expire(self, now: Optional[float] = None,
+               on_expire: Optional[Callable[[Hashable, Any], None]] = None) -> int:
+        """Удаляет потоки, простаивающие дольше idle_timeout"""
+        now = self.clock() if now is None else now
+        removed = 0
+        while self._flows:
+            key, entry = next(iter(self._flows.items()))
+            if now - entry[1] < self.idle_timeout:
+                break
+            del self._flows[key]
+            removed += 1
+            if on_expire is not None:
+                on_expire(key, entry[0])
+        return removed
+
+    def items(self):
+        return ((k, e[0]) for k, e in self._flows.items())
+
+    def clear(self):
+        self._flows.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._flows.get(key)
+        return entry is not None and self.clock() - entry[1] < self.idle_timeout
+
+    def __len__(self) -> int:
+        return len(self._flows)
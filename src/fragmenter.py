@@ -4,15 +4,29 @@
 
 from src.config import TELEGRAM, FRAGMENTATION
 from src.logger import logger
+from src.flow_table import FlowTable, flow_key
+from src.strategy import FragmentPlan, StrategyController, _seq_after, build_plan
+from src.tls_parser import is_tls_client_hello
+from src.mtproto_handler import MTProtoFragmenter
 import time
-import pydivert
-from typing import Optional
+from dataclasses import dataclass
+from typing import Optional, Tuple
 import functools
 
 class FragmentationError(Exception):
     pass
 
 
+@dataclass
+class _SentPlan:
+    """Разрезанный первый сегмент потока: по нему узнаётся ретрансмит"""
+    seq: int
+    ack: int
+    length: int
+    offsets: Tuple[int, ...]
+    strategy: str
+
+
 class TCPFragmenter:
     """
     Фрагментирует TCP-пакеты для сбивания DPI с толку
@@ -31,8 +45,8 @@ class TCPFragmenter:
         }
         
     def process_packet(self,
-                   w: pydivert.WinDivert,
-                   packet: pydivert.Packet) -> None:
+                   w: "pydivert.WinDivert",
+                   packet: "pydivert.Packet") -> None:
         """
         Обрабатывает пакет: фрагментирует или пропускает как есть
         """
@@ -60,8 +74,8 @@ class TCPFragmenter:
             raise FragmentationError(f"Failed to fragment packet: {e}")
             
     def _fragment(self, 
-                  w: pydivert.WinDivert, 
-                  packet: pydivert.Packet) -> None:
+                  w: "pydivert.WinDivert", 
+                  packet: "pydivert.Packet") -> None:
         """
         Разбивает пакет на два фрагмента с корректными SEQ номерами
         """
@@ -120,13 +134,29 @@ class SmartFragmenter(TCPFragmenter):
 
     def __init__(self, 
                  first_fragment_size: int = 1,
-                 inter_fragment_delay_ms: float = 10.0):
+                 inter_fragment_delay_ms: float = 10.0,
+                 controller: Optional[StrategyController] = None):
         # Вызываем родительский __init__ с именованными аргументами
         super().__init__(
             first_fragment_size=first_fragment_size,
             inter_fragment_delay_ms=inter_fragment_delay_ms
         )
     
+        # Самонастройка стратегии (None — старое поведение по размеру пакета)
+        self.controller = controller
+        # Свои планы разбиения для MTProto-транспортов
+        self.mtproto = MTProtoFragmenter(self)
+        # Потоки, для которых первый сегмент уже обработан
+        self._planned = FlowTable(max_flows=8192, idle_timeout=300.0)
+        # Отправленные планы первых сегментов — до конца рукопожатия
+        self._sent_plans = FlowTable(max_flows=FRAGMENTATION.PLAN_CACHE_MAX,
+                                     idle_timeout=FRAGMENTATION.PLAN_CACHE_TTL_S)
+        self.stats["retransmits"] = 0
+        # Подменяется в симуляторе/тестах
+        self.sleep = time.sleep
+        # HandshakeTelemetry: время, проведённое во фрагментаторе
+        self.telemetry = None
+
         self.blocked_snis = set()
         self.telegram_snis = TELEGRAM.SNI_PATTERNS
         self.telegram_ip_ranges = TELEGRAM.IP_RANGES
@@ -154,19 +184,94 @@ class SmartFragmenter(TCPFragmenter):
         else:  # > 500KB - видео, большие файлы
             return (500, 1.0)     # Минимальная фрагментация
 
-    def process_packet_adaptive(self, w: pydivert.WinDivert, packet: pydivert.Packet) -> None:
+    def observe_packet(self, packet: "pydivert.Packet") -> None:
+        """
+        Передаёт исходящий пакет контроллеру для определения исхода рукопожатия
+
+        Вызывается для пакетов, которые не идут через process_packet_adaptive.
+        """
+        if self.controller is not None and len(self.controller.pending):
+            tcp = packet.tcp
+            if tcp is not None:
+                self.controller.observe_outbound(flow_key(packet), tcp, len(tcp.payload))
+        if len(self._sent_plans) and packet.tcp is not None:
+            self._cached_plan(flow_key(packet), packet.tcp, len(packet.tcp.payload))
+
+    def forget_flow(self, key: tuple) -> None:
+        """Соединение закрыто или начато заново (SYN, FIN, RST): план потока сброшен"""
+        self._planned.pop(key)
+        self._sent_plans.pop(key)
+
+    def plan_packet(self, packet: "pydivert.Packet", payload: bytes,
+                    strategy: Optional[str] = None, rule=None) -> Optional[FragmentPlan]:
         """
-        Адаптивная фрагментация на основе размера пакета
+        Выбирает план для первого сегмента потока (или повтора ClientHello)
+
+        strategy — подсказка для диапазона, который контроллер ещё не видел;
+        rule — правило политики со своей стратегией (контроллер не спрашивается)
+
+        Returns:
+            FragmentPlan или None, если сегмент нужно отправить как есть
+        """
+        key = flow_key(packet)
+        if key in self._planned and not is_tls_client_hello(payload):
+            return None
+        self._planned.put(key, True)
+        if rule is not None:
+            plan = rule.build_plan(payload, self.first_fragment_size, self.inter_fragment_delay_ms)
+        else:
+            strategy = self.controller.choose(packet.dst_addr, hint=strategy)
+            plan = build_plan(strategy, payload,
+                              first_fragment_size=self.first_fragment_size,
+                              delay_ms=self.inter_fragment_delay_ms)
+        return plan if plan.offsets else None
+
+    def process_packet_adaptive(self, w: "pydivert.WinDivert", packet: "pydivert.Packet",
+                                protocol: Optional[str] = None,
+                                strategy: Optional[str] = None,
+                                rule=None) -> None:
+        """
+        Адаптивная фрагментация: по правилу, стратегии контроллера или по размеру пакета
+
+        Args:
+            protocol: протокол потока из классификации сниффера
+                      ("tls", "mtproto_<транспорт>", ...), если известен
+            strategy: подсказка стратегии (память отпечатков ClientHello)
+            rule: правило политики потока (src.rules.Rule); стратегия правила
+                  важнее контроллера и MTProto-планов
         """
         try:
             payload = packet.tcp.payload
+
+            if self.controller is not None:
+                self.controller.observe_outbound(flow_key(packet), packet.tcp, len(payload))
             
             if not payload:
+                if len(self._sent_plans):
+                    self._cached_plan(flow_key(packet), packet.tcp, 0)
                 w.send(packet)
                 self.stats["passed"] += 1
                 return
             
             payload_size = len(payload)
+
+            if len(self._sent_plans):
+                sent = self._cached_plan(flow_key(packet), packet.tcp, payload_size)
+                if sent is not None:
+                    self._resend(w, packet, payload, sent)
+                    return
+
+            if rule is not None and rule.strategy is not None:
+                self._process_with_controller(w, packet, payload, rule=rule)
+                return
+
+            if protocol is not None and protocol.startswith("mtproto_"):
+                self._process_mtproto(w, packet, payload, protocol[len("mtproto_"):])
+                return
+
+            if self.controller is not None:
+                self._process_with_controller(w, packet, payload, strategy)
+                return
             
             # Статистика по размерам
             if payload_size < 1024:
@@ -188,7 +293,15 @@ class SmartFragmenter(TCPFragmenter):
                 return
             
             # Применяем фрагментацию с адаптивными параметрами
+            key = flow_key(packet)
+            if key not in self._planned:
+                self._planned.put(key, True)
+                self._remember_plan(key, packet, payload_size, (frag_size,), "static")
+            started = self.telemetry.clock() if self.telemetry is not None else 0.0
             self._fragment_with_params(w, packet, frag_size, delay)
+            if self.telemetry is not None:
+                self.telemetry.on_fragmented(packet, "static",
+                                             self.telemetry.clock() - started)
             self.stats["fragmented"] += 1
             
         except Exception as e:
@@ -201,32 +314,102 @@ class SmartFragmenter(TCPFragmenter):
                 pass
             raise FragmentationError(f"Adaptive fragmentation failed: {e}")
 
-    def _fragment_with_params(self, w: pydivert.WinDivert, packet: pydivert.Packet, 
+    def _process_with_controller(self, w: "pydivert.WinDivert",
+                                 packet: "pydivert.Packet", payload: bytes,
+                                 hint: Optional[str] = None, rule=None) -> None:
+        """Фрагментирует только первый сегмент потока по выбранной стратегии"""
+        plan = self.plan_packet(packet, payload, hint, rule)
+        if plan is None:
+            w.send(packet)
+            self.stats["passed"] += 1
+            return
+
+        key = flow_key(packet)
+        seq, ack = packet.tcp.seq_num, packet.tcp.ack_num
+        self._remember_plan(key, packet, len(payload), plan.offsets, plan.strategy)
+        started = self.telemetry.clock() if self.telemetry is not None else 0.0
+        self._send_segments(w, packet, payload, plan.offsets, plan.delay_ms)
+        if self.telemetry is not None:
+            self.telemetry.on_fragmented(packet, plan.strategy,
+                                         self.telemetry.clock() - started)
+        if self.controller is not None and rule is None:
+            self.controller.on_handshake_sent(key, packet.dst_addr, plan.strategy, seq, ack)
+        self.stats["fragmented"] += 1
+
+    def _remember_plan(self, key: tuple, packet: "pydivert.Packet", length: int,
+                       offsets, strategy: str):
+        tcp = packet.tcp
+        self._sent_plans.put(key, _SentPlan(tcp.seq_num, tcp.ack_num, length,
+                                            tuple(offsets), strategy))
+
+    def _cached_plan(self, key: tuple, tcp, length: int) -> Optional[_SentPlan]:
+        """
+        План, если сегмент — ретрансмит разрезанного первого сегмента (тот же seq и длина)
+
+        Запись удаляется, когда поток прошёл рукопожатие: ACK на данные
+        сервера или FIN/RST.
+        """
+        sent = self._sent_plans.get(key)
+        if sent is None:
+            return None
+        if tcp.rst or tcp.fin or _seq_after(tcp.ack_num, sent.ack):
+            self._sent_plans.pop(key)
+            return None
+        if length == sent.length and tcp.seq_num == sent.seq:
+            return sent
+        return None
+
+    def _resend(self, w: "pydivert.WinDivert", packet: "pydivert.Packet",
+                payload: bytes, sent: _SentPlan):
+        """Ретрансмит: те же границы сегментов, без разбора, выбора стратегии и задержек"""
+        self._send_segments(w, packet, payload, sent.offsets, 0.0)
+        if self.controller is not None:
+            # Исход повтора тоже учитывается: стратегия та же, что у оригинала
+            self.controller.on_handshake_sent(flow_key(packet), packet.dst_addr,
+                                              sent.strategy, sent.seq, sent.ack)
+        self.stats["retransmits"] = self.stats.get("retransmits", 0) + 1
+
+    def _process_mtproto(self, w: "pydivert.WinDivert", packet: "pydivert.Packet",
+                         payload: bytes, transport: str) -> None:
+        """Первый сегмент MTProto-потока — по плану MTProtoFragmenter, остальные как есть"""
+        key = flow_key(packet)
+        if key not in self._planned:
+            self._planned.put(key, True)
+            started = self.telemetry.clock() if self.telemetry is not None else 0.0
+            if self.mtproto.process_mtproto(w, packet, payload, transport):
+                if self.telemetry is not None:
+                    self.telemetry.on_fragmented(packet, f"mtproto_{transport}",
+                                                 self.telemetry.clock() - started)
+                self.stats["fragmented"] += 1
+                return
+        w.send(packet)
+        self.stats["passed"] += 1
+
+    def _fragment_with_params(self, w: "pydivert.WinDivert", packet: "pydivert.Packet", 
                               frag_size: int, delay_ms: float) -> None:
         """
         Фрагментация с заданными параметрами (вместо self.first_fragment_size)
         """
-        payload = packet.tcp.payload
-        split_pos = frag_size
-
+        self._send_segments(w, packet, packet.tcp.payload, (frag_size,), delay_ms)
 
-        # Сохраняем оригинальные значения
+    def _send_segments(self, w: "pydivert.WinDivert", packet: "pydivert.Packet",
+                       payload: bytes, offsets, delay_ms: float) -> None:
+        """
+        Отправляет payload сегментами по заданным смещениям разрезов
+        """
         orig_seq = packet.tcp.seq_num
-        orig_ack = packet.tcp.ack_num
-        
-        # === ФРАГМЕНТ 1 ===
-        packet.tcp.payload = payload[:split_pos]
-        packet.tcp.psh = False
-        packet.recalculate_checksums()
-        w.send(packet)
+        bounds = (0,) + tuple(offsets) + (len(payload),)
+        last = len(bounds) - 2
 
-        # Задержка
-        if delay_ms > 0:
-            time.sleep(delay_ms / 1000.0)
+        for i in range(last + 1):
+            start, end = bounds[i], bounds[i + 1]
+            packet.tcp.seq_num = (orig_seq + start) & 0xFFFFFFFF
+            packet.tcp.payload = payload[start:end]
+            # PSH только у последнего фрагмента
+            packet.tcp.psh = i == last
+            packet.recalculate_checksums()
+            w.send(packet)
 
-        # === ФРАГМЕНТ 2 ===
-        packet.tcp.seq_num = orig_seq + split_pos
-        packet.tcp.payload = payload[split_pos:]
-        packet.tcp.psh = True
-        packet.recalculate_checksums()
-        w.send(packet)
+            # Задержка между фрагментами
+            if i != last and delay_ms > 0:
+                self.sleep(delay_ms / 1000.0)
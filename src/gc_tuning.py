@@ -0,0 +1,90 @@
+"""
+Сборщик мусора в долгоживущем процессе: замер пауз и щадящий режим
+
+На каждый пакет создаются короткоживущие объекты (пакеты, срезы bytes,
+строки), и циклический сборщик периодически проходит по всем
+долгоживущим контейнерам — это видно как выбросы задержки. Щадящий
+режим после старта переносит уже созданные объекты в постоянное
+поколение (gc.freeze) и реже запускает старшие поколения.
+
+Пороги gc в CPython общие на процесс, не на поток: «для потока захвата»
+значит — под его профиль выделений.
+"""
+
+import gc
+import time
+from typing import Optional, Tuple
+
+from src.config import SNIFFER
+from src.logger import logger
+from src.telemetry import LatencyHistogram
+
+
+class GCMonitor:
+    """Длительности пауз сборщика по поколениям через gc.callbacks"""
+
+    def __init__(self):
+        self.pauses = [LatencyHistogram() for _ in range(3)]
+        self.collected = [0, 0, 0]
+        self.max_pause_s = 0.0
+        self._started: Optional[float] = None
+        self.installed = False
+
+    def _callback(self, phase: str, info: dict):
+        if phase == "start":
+            self._started = time.perf_counter()
+            return
+        if self._started is None:
+            return
+        pause = time.perf_counter() - self._started
+        self._started = None
+        generation = info["generation"]
+        self.pauses[generation].add(pause)
+        self.collected[generation] += info["collected"]
+        if pause > self.max_pause_s:
+            self.max_pause_s = pause
+
+    def install(self):
+        if not self.installed:
+            gc.callbacks.append(self._callback)
+            self.installed = True
+
+    def uninstall(self):
+        if self.installed:
+            gc.callbacks.remove(self._callback)
+            self.installed = False
+
+    def get_stats(self) -> dict:
+        return {
+            "pause_ms": {f"gen{i}": h.summary() for i, h in enumerate(self.pauses)},
+            "collected": {f"gen{i}": n for i, n in enumerate(self.collected)},
+            "max_pause_ms": round(self.max_pause_s * 1000.0, 3),
+            "threshold": gc.get_threshold(),
+            "frozen": gc.get_freeze_count(),
+        }
+
+
+def apply_runtime_mode(thresholds: Optional[Tuple[int, int, int]] = None
+                       ) -> Tuple[int, int, int]:
+    """
+    Щадящий режим: собрать мусор старта, заморозить выжившее, поднять пороги
+
+    Вызывать, когда конвейер собран и хэндл открыт (классификаторы,
+    таблицы и кэши уже созданы). Без thresholds берётся SNIFFER.GC_THRESHOLDS
+    на момент вызова (CLI меняет его после импорта).
+    Returns: прежние пороги для reset_runtime_mode.
+    """
+    if thresholds is None:
+        thresholds = SNIFFER.GC_THRESHOLDS
+    previous = gc.get_threshold()
+    gc.collect()
+    gc.freeze()
+    gc.set_threshold(*thresholds)
+    logger.info(f"GC: frozen {gc.get_freeze_count()} objects, threshold {previous} -> {thresholds}")
+    return previous
+
+
+def reset_runtime_mode(previous: Tuple[int, int, int]):
+    """Возвращает прежние пороги и размораживает объекты"""
+    gc.set_threshold(*previous)
+    gc.unfreeze()
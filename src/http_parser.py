@@ -0,0 +1,95 @@
+"""
+Быстрый разбор HTTP-запросов: метод и заголовок Host
+
+Работает по первому сегменту потока без копирования: поиск ограничен
+MAX_SCAN байтами, не-HTTP payload отбрасывается по первым байтам.
+"""
+
+from typing import Optional, Tuple
+
+# Методы с пробелом: "GETX" не считается запросом
+HTTP_METHODS = (
+    b"GET ", b"POST ", b"HEAD ", b"PUT ", b"DELETE ",
+    b"OPTIONS ", b"CONNECT ", b"PATCH ", b"TRACE ",
+)
+_FIRST_BYTES = frozenset(m[0] for m in HTTP_METHODS)
+
+# Заголовки запроса дальше этой границы не ищем
+MAX_SCAN = 4096
+
+
+def _as_searchable(payload):
+    """bytes/bytearray ищутся на месте, остальное — копия первых MAX_SCAN байт"""
+    if isinstance(payload, (bytes, bytearray)):
+        return payload
+    return bytes(memoryview(payload)[:MAX_SCAN])
+
+
+def is_http_request(payload) -> bool:
+    """Быстрая проверка: начинается ли payload с метода HTTP"""
+    if len(payload) < 4 or payload[0] not in _FIRST_BYTES:
+        return False
+    head = bytes(payload[:8])
+    return head.startswith(HTTP_METHODS)
+
+
+def find_host_header(payload) -> Optional[Tuple[int, int, int]]:
+    """
+    Находит заголовок Host в первом сегменте HTTP-запроса
+
+    Returns:
+        (начало строки заголовка, начало имени хоста, длина имени) или None.
+        Порт (":8080") в длину имени не входит.
+    """
+    if not is_http_request(payload):
+        return None
+    data = _as_searchable(payload)
+    limit = min(len(data), MAX_SCAN)
+
+    # Пропускаем строку запроса
+    pos = data.find(b"\r\n", 0, limit)
+    while 0 <= pos < limit:
+        line = pos + 2
+        end = data.find(b"\r\n", line, limit)
+        if end < 0:
+            end = limit
+        if end == line:
+            return None     # конец заголовков
+        if end - line > 5 and data[line:line + 5].lower() == b"host:":
+            start = line + 5
+            while start < end and data[start] in b" \t":
+                start += 1
+            stop = start
+            while stop < end and data[stop] not in b" \t:":
+                stop += 1
+            # IPv6-литерал "[::1]:80" — до закрывающей скобки
+            if start < end and data[start] == 0x5b:
+                close = data.find(b"]", start, end)
+                stop = close + 1 if close > 0 else end
+            if stop == start:
+                return None
+            return (line, start, stop - start)
+        pos = end if end < limit else -1
+    return None
+
+
+def find_host_offset(payload) -> Optional[Tuple[int, int]]:
+    """
+    Положение имени хоста из Host внутри payload (аналог find_sni_offset)
+
+    Returns:
+        (смещение начала имени, длина имени) или None
+    """
+    found = find_host_header(payload)
+    if found is None:
+        return None
+    return found[1], found[2]
+
+
+def get_host_from_payload(payload) -> Optional[str]:
+    """Имя хоста из заголовка Host (без порта) или None"""
+    found = find_host_offset(payload)
+    if found is None:
+        return None
+    start, length = found
+    return bytes(payload[start:start + length]).decode("ascii", "replace").strip("[]").lower()
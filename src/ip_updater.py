@@ -1,48 +1,218 @@
 """
 Автообновление IP-адресов Telegram из официальных источников
+
+Источники опрашиваются условными запросами (If-None-Match /
+If-Modified-Since, для файлов — по времени изменения): неизменный список
+стоит ответа 304 и не трогает ни кэш, ни классификатор. Списки источников
+сливаются с указанием, откуда пришёл каждый CIDR, а разница с прежним
+набором (IPDiff) применяется к живому классификатору вставками и
+удалениями (IPClassifier.apply_diff).
 """
 
+import ipaddress
 import json
-import urllib.request
-import urllib.error
+import os
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Set
+from typing import Dict, Iterable, List, Optional, Set
+
+from src.config import TELEGRAM
 from src.logger import logger
 
+USER_AGENT = "TelegramBypass/1.0"
+
+
+def normalize_cidrs(cidrs: Iterable[str]) -> List[str]:
+    """Отсортированные уникальные CIDR в каноническом виде; мусор пропускается"""
+    result = set()
+    for cidr in cidrs:
+        try:
+            result.add(str(ipaddress.ip_network(cidr.strip(), strict=False)))
+        except ValueError:
+            logger.debug(f"Bad CIDR: {cidr!r}")
+    return sorted(result)
+
+
+def parse_cidr_lines(body: bytes) -> List[str]:
+    """Список по строке на CIDR; пустые строки и комментарии (#) пропускаются"""
+    lines = (line.split("#", 1)[0].strip() for line in body.decode("utf-8").splitlines())
+    return normalize_cidrs(line for line in lines if line)
+
+
+# === Источники ===
+
+class IPSource:
+    """
+    Источник списка CIDR
+
+    fetch(state) получает словарь состояния источника из кэша (валидаторы
+    прошлого ответа), обновляет его и возвращает список или None, если
+    список не изменился.
+    """
+
+    def __init__(self, name: str, timeout: float = 10.0):
+        self.name = name
+        self.timeout = timeout
+
+    def fetch(self, state: dict) -> Optional[List[str]]:
+        raise NotImplementedError
+
+
+class HTTPSource(IPSource):
+    """Список по HTTP(S) с условными запросами по ETag и Last-Modified"""
+
+    def __init__(self, name: str, url: str, timeout: float = 10.0):
+        super().__init__(name, timeout)
+        self.url = url
+
+    def fetch(self, state: dict) -> Optional[List[str]]:
+        # urllib.request тянет http.client, ssl, email — только при обращении к сети
+        import urllib.error
+        import urllib.request
+        headers = {"User-Agent": USER_AGENT}
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+        request = urllib.request.Request(self.url, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = response.read()
+                validators = {"etag": response.headers.get("ETag"),
+                              "last_modified": response.headers.get("Last-Modified")}
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            raise
+        for key, value in validators.items():
+            if value:
+                state[key] = value
+            else:
+                state.pop(key, None)
+        return self.parse(body)
+
+    def parse(self, body: bytes) -> List[str]:
+        raise NotImplementedError
+
+
+class CIDRListSource(HTTPSource):
+    """Опубликованный список по строке на CIDR (core.telegram.org/resources/cidr.txt)"""
+
+    def parse(self, body: bytes) -> List[str]:
+        return parse_cidr_lines(body)
+
+
+class RIPEstatSource(HTTPSource):
+    """
+    JSON со списком префиксов: {"data": {"prefixes": [{"prefix": ...}]}}
+
+    Как у RIPEstat announced-prefixes; понимает и ipv4_prefixes/ipv6_prefixes
+    (формат BGPView).
+    """
+
+    def parse(self, body: bytes) -> List[str]:
+        data = json.loads(body.decode("utf-8")).get("data") or {}
+        entries = []
+        for key in ("prefixes", "ipv4_prefixes", "ipv6_prefixes"):
+            entries += data.get(key) or []
+        return normalize_cidrs(entry["prefix"] for entry in entries if "prefix" in entry)
+
+
+class FileSource(IPSource):
+    """Локальный файл по строке на CIDR; перечитывается при изменении"""
+
+    def __init__(self, name: str, path: str, timeout: float = 0.0):
+        super().__init__(name, timeout)
+        self.path = Path(path)
+
+    def fetch(self, state: dict) -> Optional[List[str]]:
+        stat = self.path.stat()
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        if state.get("stamp") == stamp:
+            return None
+        cidrs = parse_cidr_lines(self.path.read_bytes())
+        state["stamp"] = stamp
+        return cidrs
+
+
+SOURCE_TYPES = {
+    "cidr_list": CIDRListSource,
+    "ripestat": RIPEstatSource,
+    "file": FileSource,
+}
+
+
+def build_source(spec: dict) -> IPSource:
+    """Источник по описанию из TELEGRAM.IP_SOURCES: {"type": ..., "name": ..., ...}"""
+    spec = dict(spec)
+    kind = spec.pop("type", None)
+    if kind not in SOURCE_TYPES:
+        raise ValueError(f"Unknown IP source type: {kind} "
+                         f"(available: {', '.join(SOURCE_TYPES)})")
+    return SOURCE_TYPES[kind](**spec)
+
+
+# === Слияние и разница ===
+
+def merge_sources(lists: Dict[str, Iterable[str]]) -> Dict[str, List[str]]:
+    """{источник: CIDR} -> {CIDR: [источники]}"""
+    provenance: Dict[str, Set[str]] = {}
+    for name, cidrs in lists.items():
+        for cidr in cidrs:
+            provenance.setdefault(cidr, set()).add(name)
+    return {cidr: sorted(names) for cidr, names in sorted(provenance.items())}
+
+
+@dataclass
+class IPDiff:
+    """Разница наборов CIDR: что вставить и что удалить"""
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+    @classmethod
+    def between(cls, old: Iterable[str], new: Iterable[str]) -> "IPDiff":
+        old, new = set(old), set(new)
+        return cls(added=sorted(new - old), removed=sorted(old - new))
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed)
+
 
 class TelegramIPUpdater:
     """
     Обновляет списки IP Telegram из официальных источников
     """
-    
-    # Официальные источники Telegram
-    SOURCES = {
-        "asn": "https://ipinfo.io/AS62041/json",  # ASN Telegram Messenger Inc
-        "bgp": "https://api.bgpview.io/asn/62041/prefixes",
-    }
-    
+
     CACHE_FILE = Path("data/telegram_ips.json")
     CACHE_TTL_HOURS = 24  # Обновляем раз в сутки
-    
-    def __init__(self):
+
+    def __init__(self, sources: Optional[List[IPSource]] = None):
         self.CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
-    
-    def get_ips(self) -> List[str]:
+        if sources is None:
+            sources = [build_source(spec) for spec in TELEGRAM.IP_SOURCES]
+        self.sources = sources
+        # Разница последнего refresh() с прежним набором
+        self.last_diff = IPDiff()
+
+    def get_ips(self, allow_network: bool = True) -> List[str]:
         """
         Возвращает актуальный список IP-адресов Telegram
-        
+
+        Args:
+            allow_network: False — только кэш (адреса учатся из DNS)
+
         Returns:
             Список IP-префиксов (CIDR или отдельные IP)
         """
         # Пробуем загрузить из кэша
-        if self._is_cache_valid():
+        if self._is_cache_valid() or not allow_network:
             logger.debug("Загрузка IP из кэша")
-            return self._load_from_cache()
-        
+            return self._load_from_cache() if self.CACHE_FILE.exists() else []
+
         # Пробуем обновить из сети
         try:
             ips = self._fetch_from_network()
-            self._save_to_cache(ips)
             logger.info(f"IP-адреса обновлены: {len(ips)} записей")
             return ips
         except Exception as e:
@@ -51,81 +221,105 @@ class TelegramIPUpdater:
             if self.CACHE_FILE.exists():
                 return self._load_from_cache()
             return []
-    
+
+    def refresh(self) -> IPDiff:
+        """
+        Опрашивает источники и сохраняет кэш, если что-то изменилось
+
+        Недоступный источник сохраняет прежний список. Returns: разница с
+        прежним набором (пустая — ничего не изменилось)
+
+        Raises:
+            OSError: не ответил ни один источник
+        """
+        data = self._load_data()
+        old_state = data.get("sources", {})
+        state, lists, changed, failed = {}, {}, False, []
+        for source in self.sources:
+            entry = dict(old_state.get(source.name, {}))
+            try:
+                cidrs = source.fetch(entry)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.debug(f"Источник IP {source.name} недоступен: {e}")
+                failed.append(source.name)
+                entry = dict(old_state.get(source.name, {}))
+                cidrs = None
+            if cidrs is not None:
+                entry["cidrs"] = cidrs
+            if entry != old_state.get(source.name):
+                changed = True
+            state[source.name] = entry
+            lists[source.name] = entry.get("cidrs", [])
+        if self.sources and len(failed) == len(self.sources):
+            raise OSError(f"IP sources unavailable: {', '.join(failed)}")
+        changed = changed or set(state) != set(old_state)
+
+        provenance = merge_sources(lists)
+        self.last_diff = IPDiff.between(data.get("ips", []), provenance)
+        if changed or self.last_diff:
+            data.update(ips=list(provenance), provenance=provenance, sources=state,
+                        updated=time.time())
+            self._save_data(data)
+        elif self.CACHE_FILE.exists():
+            # 304 у всех: кэш свежий, переписывать нечего
+            os.utime(self.CACHE_FILE)
+        if self.last_diff:
+            logger.info(f"IP-адреса: +{len(self.last_diff.added)} "
+                        f"-{len(self.last_diff.removed)}")
+        return self.last_diff
+
+    def provenance(self) -> Dict[str, List[str]]:
+        """CIDR -> источники, по кэшу"""
+        return self._load_data().get("provenance", {})
+
     def _is_cache_valid(self) -> bool:
         """Проверяет, актуален ли кэш"""
         if not self.CACHE_FILE.exists():
             return False
-        
-        import time
+
         cache_age = time.time() - self.CACHE_FILE.stat().st_mtime
         return cache_age < (self.CACHE_TTL_HOURS * 3600)
-    
+
     def _load_from_cache(self) -> List[str]:
         """Загружает IP из кэша"""
+        return self._load_data().get("ips", [])
+
+    def _load_data(self) -> dict:
+        if not self.CACHE_FILE.exists():
+            return {}
         try:
             with open(self.CACHE_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                return data.get("ips", [])
+                return json.load(f)
         except Exception as e:
             logger.error(f"Ошибка загрузки кэша: {e}")
-            return []
-    
-    def _save_to_cache(self, ips: List[str]):
-        """Сохраняет IP в кэш"""
+            return {}
+
+    def _save_data(self, data: dict):
+        """Сохраняет кэш целиком (остальные ключи, например "learned", сохраняются)"""
         try:
-            with open(self.CACHE_FILE, "w", encoding="utf-8") as f:
-                json.dump({
-                    "ips": ips,
-                    "updated": str(Path().stat().st_mtime)
-                }, f, indent=2)
+            tmp = self.CACHE_FILE.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, self.CACHE_FILE)
         except Exception as e:
             logger.error(f"Ошибка сохранения кэша: {e}")
-    
+
     def _fetch_from_network(self) -> List[str]:
-        """Загружает IP из официальных источников"""
-        ips = set()
-        
-        # Пробуем BGPView API
-        try:
-            data = self._fetch_json(self.SOURCES["bgp"])
-            if data and "data" in data:
-                for prefix in data["data"].get("ipv4_prefixes", []):
-                    ips.add(prefix["prefix"])
-        except Exception as e:
-            logger.debug(f"BGPView недоступен: {e}")
-        
-        # Пробуем ipinfo.io
-        try:
-            data = self._fetch_json(self.SOURCES["asn"])
-            if data and "prefixes" in data:
-                for prefix in data["prefixes"]:
-                    ips.add(prefix["netblock"])
-        except Exception as e:
-            logger.debug(f"ipinfo.io недоступен: {e}")
-        
-        return sorted(list(ips))
-    
-    def _fetch_json(self, url: str) -> dict:
-        """Загружает JSON по URL"""
-        req = urllib.request.Request(
-            url,
-            headers={
-                "User-Agent": "TelegramBypass/1.0",
-                "Accept": "application/json"
-            }
-        )
-        
-        with urllib.request.urlopen(req, timeout=10) as response:
-            return json.loads(response.read().decode("utf-8"))
+        """Обновляет кэш из источников. Returns: слитый список"""
+        self.refresh()
+        return self._load_from_cache()
 
 
 # Глобальный инстанс
 _ip_updater = None
 
-def get_telegram_ips() -> List[str]:
-    """Получает актуальные IP Telegram (с кэшированием updater'а)"""
+def get_ip_updater() -> TelegramIPUpdater:
+    """Общий апдейтер (кэш валидаторов и last_diff)"""
     global _ip_updater
     if _ip_updater is None:
         _ip_updater = TelegramIPUpdater()
-    return _ip_updater.get_ips()
\ No newline at end of file
+    return _ip_updater
+
+def get_telegram_ips(allow_network: bool = True) -> List[str]:
+    """Получает актуальные IP Telegram (с кэшированием updater'а)"""
+    return get_ip_updater().get_ips(allow_network=allow_network)
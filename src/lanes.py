@@ -0,0 +1,148 @@
+"""
+Полосы приоритета для перехваченных пакетов
+
+В обычном цикле сниффера пакеты обрабатываются строго по очереди, и
+ClientHello нового соединения ждёт за всеми сегментами закачки, что
+пришли раньше. С полосами цикл перед каждой пачкой вычитывает всё, что
+уже ждёт в очереди бэкенда, и дёшево раскладывает пакеты по полосам:
+
+- handshake: данные потока, который сниффер ещё не классифицировал;
+- control: SYN, RST, входящие управляющие пакеты, UDP (DNS, QUIC, звонки);
+- bulk: остальное — данные известных потоков, чистые ACK, FIN.
+
+Полосы берутся по строгому приоритету ("strict") или по весам
+("weighted": bulk не голодает при потоке рукопожатий); bulk — пачками
+по LANE_BULK_BATCH, после каждой пачки очередь бэкенда вычитывается
+снова. Полосы ограничены: пока какая-то полна, чтение не идёт, и пакеты
+копятся в очереди драйвера.
+
+Данные одного потока не обгоняют друг друга: известный поток целиком
+идёт в bulk, FIN — тоже.
+
+Опережающее чтение нужно бэкенду с неблокирующим recv (read_ahead,
+ready()). Отдельный поток приёма не годится: под GIL передача пакета
+между потоками стоит дороже, чем выигрыш от перестановки.
+
+Так читает NFQueueBackend: неблокирующий recv с MSG_DONTWAIT, а вердикт
+каждому пакету — по done() после обработки, в любом порядке. У pydivert
+нет неблокирующего пакетного recv (WinDivertRecvEx), поэтому на WinDivert
+полосы выключаются с предупреждением и пакеты идут по порядку.
+"""
+
+from collections import deque
+from typing import List, Optional, Sequence, Tuple
+
+from src.config import SNIFFER
+from src.flow_table import FlowTable, flow_key
+
+LANE_HANDSHAKE = 0
+LANE_CONTROL = 1
+LANE_BULK = 2
+LANES = ("handshake", "control", "bulk")
+LANE_MODES = ("strict", "weighted")
+
+
+class LaneScheduler:
+    """
+    Ограниченные очереди полос и выбор следующей пачки
+
+    put() кладёт пакет в его полосу, пока full() не стало True;
+    take() возвращает (полоса, пачка) по приоритету. flows — таблица
+    потоков сниффера (TrafficSniffer подставляет свою).
+    """
+
+    def __init__(self,
+                 flows: Optional[FlowTable] = None,
+                 mode: str = "strict",
+                 limits: Sequence[int] = SNIFFER.LANE_LIMITS,
+                 weights: Sequence[int] = SNIFFER.LANE_WEIGHTS,
+                 bulk_batch: int = SNIFFER.LANE_BULK_BATCH):
+        if mode not in LANE_MODES:
+            raise ValueError(f"Unknown lane mode: {mode} (available: {', '.join(LANE_MODES)})")
+        if min(weights) <= 0:
+            raise ValueError("Lane weights must be positive")
+        self.flows = flows if flows is not None else FlowTable()
+        self.mode = mode
+        self.limits = tuple(limits)
+        self.weights = tuple(weights)
+        self.bulk_batch = bulk_batch
+        self.queues = tuple(deque() for _ in LANES)
+        self._credits = list(self.weights)
+        self._queued = 0
+        self._full = False
+        self.stats = {"received": 0, "batches": 0, "lane_full": 0,
+                      "by_lane": dict.fromkeys(LANES, 0), "peak": dict.fromkeys(LANES, 0)}
+
+    def classify(self, packet) -> int:
+        """Полоса пакета: только заголовки и наличие потока в таблице"""
+        tcp = packet.tcp
+        if tcp is None or packet.is_inbound or tcp.syn or tcp.rst:
+            return LANE_CONTROL
+        if tcp.payload and flow_key(packet) not in self.flows:
+            return LANE_HANDSHAKE
+        return LANE_BULK
+
+    def put(self, packet) -> int:
+        """Кладёт пакет в его полосу (вызывать, пока не full()). Returns: полоса"""
+        lane = self.classify(packet)
+        queue = self.queues[lane]
+        queue.append(packet)
+        self._queued += 1
+        stats = self.stats
+        name = LANES[lane]
+        stats["received"] += 1
+        stats["by_lane"][name] += 1
+        if len(queue) > stats["peak"][name]:
+            stats["peak"][name] = len(queue)
+        if len(queue) >= self.limits[lane]:
+            self._full = True
+            stats["lane_full"] += 1
+        return lane
+
+    def full(self) -> bool:
+        """Какая-то полоса достигла предела — читать дальше нельзя"""
+        return self._full
+
+    def __len__(self) -> int:
+        return self._queued
+
+    def take(self) -> Tuple[Optional[int], List]:
+        """Следующая пачка по приоритету; (None, []) — полосы пусты"""
+        if not self._queued:
+            return None, []
+        lane = self._pick()
+        queue = self.queues[lane]
+        count = min(len(queue), self.bulk_batch) if lane == LANE_BULK else len(queue)
+        if self.mode == "weighted":
+            count = min(count, self._credits[lane])
+            self._credits[lane] -= count
+        batch = [queue.popleft() for _ in range(count)]
+        self._queued -= count
+        if self._full:
+            self._full = any(len(q) >= limit for q, limit in zip(self.queues, self.limits))
+        self.stats["batches"] += 1
+        return lane, batch
+
+    def _pick(self) -> int:
+        queues = self.queues
+        if self.mode == "strict":
+            return next(lane for lane, queue in enumerate(queues) if queue)
+        # Веса: полоса с пакетами и остатком кредита; кончились у всех — новый круг
+        while True:
+            for lane, queue in enumerate(queues):
+                if queue and self._credits[lane] > 0:
+                    return lane
+            self._credits = list(self.weights)
+
+    def drain(self) -> List:
+        """Забирает всё необработанное (при остановке)"""
+        packets = [packet for queue in self.queues for packet in queue]
+        for queue in self.queues:
+            queue.clear()
+        self._queued = 0
+        self._full = False
+        return packets
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, mode=self.mode,
+                    queued={name: len(q) for name, q in zip(LANES, self.queues)})
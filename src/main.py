@@ -4,19 +4,37 @@ Telegram DPI Bypass Tool
 Главный модуль
 """
 
+import os
+import signal
 import sys
 import argparse
-import ctypes
+import threading
+import time
+from collections import deque
+from pathlib import Path
 from typing import Optional
 
-# Настраиваем путь к WinDivert ПЕРЕД импортом pydivert
-from src.windivert_loader import setup_windivert_path, check_driver
-setup_windivert_path()
-
+# WinDivert.dll грузится при открытии хэндла (src.backend), не при импорте
+from src.windivert_loader import check_driver
 from src.sniffer import TrafficSniffer
-from src.fragmenter import SmartFragmenter
+from src.fragmenter import SmartFragmenter, FragmentationError
+from src.strategy import StrategyController
+from src.telemetry import HandshakeTelemetry
+from src.classifier import IPClassifier
+from src.dns_observer import DNSObserver
+from src.ip_updater import IPDiff, TelegramIPUpdater, get_ip_updater
+from src.rst_filter import RSTFilter
+from src.backend import DivertBackend, PcapBackend
+from src.analysis_tap import AnalysisTap
+from src.flight_recorder import FlightRecorder, RecordingBackend
+from src.gc_tuning import GCMonitor, apply_runtime_mode
+from src.udp_stage import UDP_STRATEGIES
+from src.quic_filter import QUIC_ACTIONS
+from src.lanes import LANE_MODES
+from src.rules import load_rules
+from src.shadow import ShadowBackend, ShadowReport, attach as attach_shadow
 from src.tls_parser import get_sni_from_payload
-from src.config import TELEGRAM, FRAGMENTATION
+from src.config import TELEGRAM, FRAGMENTATION, SNIFFER, PROXY
 from src.logger import setup_logger, logger
 
 class TelegramBypass:
@@ -27,105 +45,336 @@ class TelegramBypass:
     def __init__(self, 
                  fragment_size: int = 1,
                  delay_ms: float = 10.0,
-                 verbose: bool = False):
+                 verbose: bool = False,
+                 adaptive: bool = FRAGMENTATION.ADAPTIVE_STRATEGY,
+                 telemetry: bool = False,
+                 dns_learn: bool = False,
+                 shadow: bool = False,
+                 pcap: Optional[str] = None,
+                 tap: bool = False,
+                 recorder: bool = SNIFFER.RECORDER_ENABLED,
+                 fast_start: bool = SNIFFER.FAST_START,
+                 backend: Optional[DivertBackend] = None,
+                 gc_tuning: bool = SNIFFER.GC_TUNING):
         self.fragment_size = fragment_size
         self.delay_ms = delay_ms
         self.verbose = verbose
         
+        # Самонастройка стратегии; -s/-d задают последнюю, самую дорогую ступень
+        self.controller = StrategyController() if adaptive else None
         self.fragmenter = SmartFragmenter(
             first_fragment_size=fragment_size,
-            inter_fragment_delay_ms=delay_ms
+            inter_fragment_delay_ms=delay_ms,
+            controller=self.controller
         )
+        # Телеметрия задержек рукопожатия (включает перехват входящих)
+        self.telemetry = HandshakeTelemetry() if telemetry else None
+        self.fragmenter.telemetry = self.telemetry
+        # Изучение адресов по DNS вместо сторонних API
+        self.dns_learn = dns_learn
+        self.ip_classifier: Optional[IPClassifier] = None
+        self.dns_observer: Optional[DNSObserver] = None
         self.sniffer: Optional[TrafficSniffer] = None
+        # Теневой режим: решения считаются, трафик не меняется (pcap — офлайн)
+        self.pcap = pcap
+        self.shadow = shadow or pcap is not None
+        self.shadow_report: Optional[ShadowReport] = None
+        # Разбор ClientHello/DNS и запись pcap — в отдельном процессе
+        self.tap = AnalysisTap() if tap else None
+        # Последние пакеты с решениями — для разбора ошибок
+        self.recorder = FlightRecorder() if recorder else None
+        # Сначала перехват, потом сеть: обновление IP — в фоне
+        self.fast_start = fast_start
+        # Разницы обновления IP (прогрев, периодический опрос): применяет поток захвата
+        self._ip_diffs = deque()
+        self._stopped = threading.Event()
+        # Готовый бэкенд вместо драйвера (тесты, бенчмарки)
+        self.backend = backend
+        # Паузы сборщика мусора; щадящий режим включается после старта
+        self.gc_monitor = GCMonitor() if SNIFFER.GC_MONITOR else None
+        self.gc_tuning = gc_tuning
         
     def check_prerequisites(self):
         """Проверяет prerequisites"""
         logger.info("Проверка окружения...")
 
-        # Проверка прав администратора
-        if not ctypes.windll.shell32.IsUserAnAdmin():
-            logger.error("Требуются права администратора!")
-            logger.info("Запусти: python -m src.main")
-            return False
-
-        # Проверка драйвера
-        if not check_driver():
-            logger.warning("Драйвер WinDivert не установлен!")
-            logger.info("Установи через: python tools/install_windiver t.py")
-            logger.info("Или pydivert попробует установить автоматически...")
-
-        # ОБНОВЛЯЕМ IP ИЗ СЕТИ
-        logger.info("Обновление списка IP Telegram...")
-        if TELEGRAM.update_ips_from_network():
-            logger.info(f"Загружено {len(TELEGRAM.IP_PREFIXES)} IP-префиксов")
+        if not sys.platform.startswith("win"):
+            # Linux (NFQUEUE): нужен root или CAP_NET_ADMIN + CAP_NET_RAW
+            if os.geteuid() != 0:
+                logger.error("Требуются права root (CAP_NET_ADMIN, CAP_NET_RAW)!")
+                return False
         else:
-            logger.info("Используем встроенный список IP")
+            import ctypes
+            # Проверка прав администратора
+            if not ctypes.windll.shell32.IsUserAnAdmin():
+                logger.error("Требуются права администратора!")
+                logger.info("Запусти: python -m src.main")
+                return False
+
+            # Проверка драйвера
+            if not check_driver():
+                logger.warning("Драйвер WinDivert не установлен!")
+                logger.info("Установи через: python tools/install_windiver t.py")
+                logger.info("Или pydivert попробует установить автоматически...")
 
         logger.info("Окружение готово")
         return True
+
+    def update_ips(self, allow_network: bool = True) -> bool:
+        """Обновляет список IP Telegram (из сети или только из кэша апдейтера)"""
+        logger.info("Обновление списка IP Telegram...")
+        if TELEGRAM.update_ips_from_network(allow_network=allow_network and not self.dns_learn):
+            logger.info(f"Загружено {len(TELEGRAM.IP_SOURCED)} диапазонов IP")
+            return True
+        logger.info("Используем встроенный список IP")
+        return False
         
     def run(self):
-        """Запускает обход блокировки"""
-        if not self.check_prerequisites():
+        """Запускает обход блокировки (блокирует до остановки)"""
+        if not self.prepare():
             sys.exit(1)
+        try:
+            self.sniffer.start()
+        except KeyboardInterrupt:
+            logger.info("Остановка по запросу пользователя")
+            self._print_final_stats()
+        except Exception as e:
+            logger.error(f"Ошибка: {e}")
+            logger.info("Возможно, драйвер WinDivert не установлен")
+            logger.info("Запусти: python tools/install_windiver t.py")
+        finally:
+            self.shutdown()
+
+    def prepare(self, handle_signals: bool = True) -> bool:
+        """
+        Собирает конвейер (классификаторы, сниффер, обёртки бэкенда) без запуска
+
+        Args:
+            handle_signals: сниффер ставит свой обработчик SIGINT (False — при встраивании)
+
+        Returns:
+            False, если окружение не готово
+        """
+        # Воспроизведению pcap не нужны ни права, ни драйвер, ни сеть
+        offline = self.pcap is not None
+        if not offline and self.backend is None and not self.check_prerequisites():
+            return False
+        if not offline:
+            # Быстрый старт: только кэш, сеть — после открытия хэндла
+            self.update_ips(allow_network=not self.fast_start)
+        try:
+            rules = load_rules(SNIFFER.RULES_FILE)
+        except ValueError as e:
+            logger.error(f"Ошибка в правилах {SNIFFER.RULES_FILE}: {e}")
+            return False
 
         logger.info("=" * 60)
         logger.info("Telegram DPI Bypass Tool v0.1")
         logger.info("=" * 60)
         logger.info(f"Fragment size: {self.fragment_size} bytes")
         logger.info(f"Delay: {self.delay_ms} ms")
+        logger.info(f"Adaptive strategy: {self.controller is not None}")
+        logger.info(f"DNS learning: {self.dns_learn}")
+        logger.info(f"Shadow mode: {self.shadow}" + (f" (pcap: {self.pcap})" if self.pcap else ""))
+        logger.info(f"Fast start: {self.fast_start}")
+        logger.info(f"GC tuning: {self.gc_tuning}")
+        logger.info(f"UDP strategy: {SNIFFER.UDP_STRATEGY or 'off (not diverted)'}")
+        logger.info(f"QUIC fast-fail: {SNIFFER.QUIC_FAST_FAIL or 'off'}")
+        logger.info(f"Priority lanes: {SNIFFER.LANES or 'off'}")
+        logger.info(f"Policy rules: {len(rules) if rules is not None else 0}")
         logger.info(f"Verbose: {self.verbose}")
         logger.info("=" * 60)
-        
-        # Callback для обработки пакетов
-        def on_packet(packet, sni, is_telegram, w):
-            dst_ip = str(packet.dst_addr)
-
-            # Используем конфиг вместо хардкода
-            tg_ips = TELEGRAM.IP_PREFIXES
-
-            if not is_telegram:
-                for ip_prefix in tg_ips:
-                    if dst_ip.startswith(ip_prefix):
-                        logger.debug(f"Detected Telegram IP: {dst_ip}")
-                        is_telegram = True
-                        break
-
-            if self.verbose and sni:
-                logger.debug(f"[TLS] {dst_ip} SNI={sni}")
-
-            if is_telegram:
-                if self.verbose:
-                    logger.debug(f"Fragmenting: {dst_ip} ({len(packet.tcp.payload) if packet.tcp.payload else 0} bytes)")
-                try:
-                    # Используем адаптивную фрагментацию!
-                    self.fragmenter.process_packet_adaptive(w, packet)
-                    return False
-                except Exception as e:
-                    logger.error(f"Fragmentation error: {e}")
-                    return True
 
-            return True
+        if offline:
+            self.ip_classifier = IPClassifier.from_config(TELEGRAM)
+        else:
+            self.ip_classifier = IPClassifier.from_config_cached(
+                Path(SNIFFER.RULES_CACHE_FILE), TELEGRAM)
+        if self.dns_learn:
+            cache_file = TelegramIPUpdater.CACHE_FILE
+            restored = self.ip_classifier.import_learned(cache_file)
+            logger.info(f"Восстановлено выученных IP: {restored}")
+            self.dns_observer = DNSObserver(self.ip_classifier, cache_file=cache_file)
         
         def on_error(error, packet):
             print(f"[ERROR] {error}")
             
         self.sniffer = TrafficSniffer(
             port=443,
-            on_packet=on_packet,
-            on_error=on_error
+            on_packet=self.on_packet,
+            on_error=on_error,
+            telemetry=self.telemetry,
+            dns_observer=self.dns_observer,
+            rst_filter=RSTFilter(on_fake_rst=self._on_fake_rst),
+            ip_classifier=self.ip_classifier,
+            on_started=self._on_started,
+            on_flow_reset=self.fragmenter.forget_flow,
+            handle_signals=handle_signals,
+            gc_monitor=self.gc_monitor,
+            rules=rules
         )
-        
-        try:
-            self.sniffer.start()
-        except KeyboardInterrupt:
-            logger.info("Остановка по запросу пользователя")
-            self._print_final_stats()
-        except Exception as e:
-            logger.error(f"Ошибка: {e}")
-            logger.info("Возможно, драйвер WinDivert не установлен")
-            logger.info("Запусти: python tools/install_windiver t.py")
-            
+        if self.gc_monitor is not None:
+            self.gc_monitor.install()
+        if self.backend is not None:
+            self.sniffer.backend = self.backend
+        if self.shadow:
+            self._setup_shadow()
+        if self.tap is not None:
+            self.tap.start()
+            self.sniffer.tap = self.tap
+        if self.recorder is not None:
+            self._setup_recorder(handle_signals)
+        return True
+
+    def shutdown(self):
+        """Останавливает отвод, сохраняет выученное и печатает отчёты"""
+        self._stopped.set()
+        if self.tap is not None:
+            for result in self.tap.stop():
+                if result[0] == "dns" and self.dns_observer is not None:
+                    self.dns_observer.apply(result[1], result[2])
+        if self.shadow_report is not None:
+            self.shadow_report.log()
+        if self.controller is not None:
+            self.controller.save(force=True)
+        if self.dns_observer is not None:
+            self.dns_observer.maybe_export(force=True)
+        if self.gc_monitor is not None:
+            self.gc_monitor.uninstall()
+
+    def _on_started(self):
+        """Хэндл открыт, пакеты уже перехватываются"""
+        if self.fast_start and self.pcap is None:
+            self._warm_up()
+        if (TELEGRAM.IP_REFRESH_INTERVAL > 0 and self.pcap is None and
+                self.backend is None and not self.dns_learn):
+            threading.Thread(target=self._ip_refresh_worker, name="tg-bypass-ip-refresh",
+                             daemon=True).start()
+        if self.gc_tuning:
+            # Всё, что создано при старте, живёт до выхода — сборщику не смотреть
+            apply_runtime_mode()
+
+    def _warm_up(self):
+        """Хэндл открыт: остальная подготовка — в фоновом потоке"""
+        threading.Thread(target=self._warm_up_worker, name="tg-bypass-warmup",
+                         daemon=True).start()
+
+    def _warm_up_worker(self):
+        started = time.perf_counter()
+        before = list(TELEGRAM.IP_SOURCED)
+        self.update_ips()
+        diff = IPDiff.between(before, TELEGRAM.IP_SOURCED)
+        if diff:
+            # Живой классификатор меняет только поток захвата
+            self._ip_diffs.append(diff)
+        logger.info(f"Warm-up done in {time.perf_counter() - started:.2f} s "
+                    f"(+{len(diff.added)} -{len(diff.removed)} IP ranges)")
+
+    def _ip_refresh_worker(self):
+        """Условный опрос источников IP раз в IP_REFRESH_INTERVAL"""
+        updater = get_ip_updater()
+        while not self._stopped.wait(TELEGRAM.IP_REFRESH_INTERVAL):
+            try:
+                diff = updater.refresh()
+            except OSError as e:
+                logger.warning(f"Не удалось обновить IP: {e}")
+                continue
+            if diff:
+                self._ip_diffs.append(diff)
+
+    def on_packet(self, packet, sni, is_telegram, w):
+        """Решение по исходящему пакету: фрагментировать или пропустить как есть"""
+        while self._ip_diffs:
+            diff = self._ip_diffs.popleft()
+            self.ip_classifier.apply_diff(diff.added, diff.removed)
+        dst_ip = str(packet.dst_addr)
+        # Сниффер передаёт вердикт потока только с первым сегментом
+        first = is_telegram
+        verdict = self.sniffer.verdict
+        rule = verdict.rule if verdict is not None else None
+        if rule is not None and rule.action == "pass":
+            # Правило политики важнее IP-диапазонов
+            self.fragmenter.observe_packet(packet)
+            return True
+
+        # Диапазоны из конфига/кэша и адреса, выученные из DNS
+        if not is_telegram and self.ip_classifier.contains(dst_ip):
+            logger.debug(f"Detected Telegram IP: {dst_ip}")
+            is_telegram = True
+
+        if self.verbose and sni:
+            logger.debug(f"[TLS] {dst_ip} SNI={sni}")
+
+        if is_telegram:
+            if self.verbose:
+                logger.debug(f"Fragmenting: {dst_ip} ({len(packet.tcp.payload) if packet.tcp.payload else 0} bytes)")
+            try:
+                # Используем адаптивную фрагментацию!
+                protocol = verdict.protocol if verdict else None
+                hint = verdict.strategy if verdict else None
+                if self.recorder is not None and sni is not None:
+                    self.recorder.annotate(f"{protocol} sni={sni} -> fragment"
+                                           + (f" (rule {rule.name})" if rule is not None else ""))
+                self.fragmenter.process_packet_adaptive(w, packet, protocol=protocol,
+                                                        strategy=hint, rule=rule)
+                if (first and verdict.fingerprint is not None and
+                        self.controller is not None and self.sniffer.hello_memo is not None):
+                    # Что сейчас работает для этого назначения — подсказка для новых диапазонов
+                    self.sniffer.hello_memo.set_strategy(
+                        verdict.fingerprint, self.controller.strategy_for(dst_ip))
+                return False
+            except FragmentationError as e:
+                logger.error(f"Fragmentation error: {e}")
+                if self.recorder is not None:
+                    self.recorder.annotate(f"error: {e}")
+                    self.recorder.dump(reason=f"FragmentationError: {e}", force=False)
+                # Фрагментатор уже отправил пакет как есть — не дублируем
+                return False
+            except Exception as e:
+                logger.error(f"Fragmentation error: {e}")
+                return True
+
+        # Исходы рукопожатий видны и по пакетам, которые не фрагментируем
+        self.fragmenter.observe_packet(packet)
+        return True
+
+    def _setup_shadow(self):
+        """Подменяет бэкенд сниффера на наблюдающий и включает замеры"""
+        self.shadow_report = ShadowReport()
+        if self.pcap is not None:
+            inner = PcapBackend(self.pcap)
+        elif self.backend is not None:
+            inner = self.backend
+        else:
+            inner = self.sniffer._create_backend(sniff=True)
+        self.sniffer.backend = ShadowBackend(inner, self.shadow_report)
+        attach_shadow(self.sniffer, self.fragmenter, self.shadow_report)
+        if self.controller is not None:
+            # Трафик не фрагментируется — его исходы не пишем в кэш стратегий
+            self.controller.persist = False
+
+    def _setup_recorder(self, handle_signals: bool = True):
+        """Оборачивает бэкенд самописцем и вешает дамп на сигнал"""
+        inner = self.sniffer.backend or self.sniffer._create_backend()
+        self.sniffer.backend = RecordingBackend(inner, self.recorder)
+        # SIGUSR1 (Linux) / Ctrl+Break (Windows) — дамп без остановки
+        sig = getattr(signal, "SIGUSR1", None) or getattr(signal, "SIGBREAK", None)
+        if sig is not None and handle_signals:
+            signal.signal(sig, lambda signum, frame: self.dump_flight_recorder("signal"))
+
+    def dump_flight_recorder(self, reason: str = "on demand"):
+        """Сбрасывает последние пакеты в data/flight/*.pcapng"""
+        if self.recorder is not None:
+            return self.recorder.dump(reason=reason)
+        return None
+
+    def _on_fake_rst(self, key: tuple):
+        """Внедрённый RST — признак того, что стратегия потока не сработала"""
+        if self.recorder is not None:
+            self.recorder.annotate("drop: fake RST")
+        if self.controller is not None:
+            self.controller.record_outcome(key, False)
+
     def _print_final_stats(self):
         """Выводит финальную статистику"""
         if self.sniffer:
@@ -136,6 +385,46 @@ class TelegramBypass:
         print(f"  Fragmented: {frag_stats['fragmented']}")
         print(f"  Passed:     {frag_stats['passed']}")
         print(f"  Errors:     {frag_stats['errors']}")
+        print(f"  Retransmits: {frag_stats.get('retransmits', 0)}")
+
+        if self.controller is not None:
+            strat_stats = self.controller.get_stats()
+            print("\nStrategy stats:")
+            print(f"  Ranges:      {strat_stats['ranges']}")
+            print(f"  Successes:   {strat_stats['successes']}")
+            print(f"  Failures:    {strat_stats['failures']}")
+            print(f"  Escalations: {strat_stats['escalations']}")
+
+        rule_stats = self.sniffer.rules.get_stats() if self.sniffer and self.sniffer.rules else None
+        if rule_stats is not None:
+            print("\nPolicy rules (flows matched):")
+            for name, hits in rule_stats["matched"].items():
+                print(f"  {name}: {hits}")
+            print(f"  (no rule): {rule_stats['unmatched']}")
+
+        quic_stats = self.sniffer.quic_filter.get_stats() \
+            if self.sniffer and self.sniffer.quic_filter else None
+        if quic_stats is not None:
+            print(f"\nQUIC Initial to Telegram ({quic_stats['action']}): {quic_stats['initial']}")
+            for addr, count in sorted(quic_stats["destinations"].items(),
+                                      key=lambda item: -item[1])[:10]:
+                print(f"  {addr}: {count}")
+
+        if self.gc_monitor is not None:
+            gc_stats = self.gc_monitor.get_stats()
+            print("\nGC pauses (count, p99 ms):")
+            for generation, summary in gc_stats["pause_ms"].items():
+                print(f"  {generation}: {summary['count']}, {summary['p99_ms']}")
+            print(f"  Max pause: {gc_stats['max_pause_ms']} ms")
+
+        if self.telemetry is not None:
+            print("\nHandshake latency by strategy (p50 / p90 ms):")
+            for strategy, metrics in self.telemetry.get_stats()["by_strategy"].items():
+                line = ", ".join(
+                    f"{name} {m['p50_ms']}/{m['p90_ms']} (n={m['count']})"
+                    for name, m in metrics.items()
+                )
+                print(f"  {strategy}: {line}")
 
 
 def main():
@@ -169,6 +458,116 @@ Examples:
         help=f"Задержка между фрагментами в мс (по умолчанию: {FRAGMENTATION.DEFAULT_DELAY_MS}, макс: {FRAGMENTATION.MAX_DELAY_MS})"
     )
 
+    parser.add_argument(
+        "--static",
+        action="store_true",
+        help="Фиксированная фрагментация (-s/-d) без самонастройки стратегии"
+    )
+
+    parser.add_argument(
+        "--telemetry",
+        action="store_true",
+        help="Замерять задержки рукопожатия (перехватывает и входящие SYN/ACK, ServerHello)"
+    )
+
+    parser.add_argument(
+        "--dns-learn",
+        action="store_true",
+        help="Изучать адреса Telegram по DNS-ответам, не обращаясь к сторонним API"
+    )
+
+    parser.add_argument(
+        "--shadow",
+        action="store_true",
+        help="Теневой режим: считать решения и их стоимость, не меняя трафик"
+    )
+
+    parser.add_argument(
+        "--pcap",
+        metavar="FILE",
+        help="Прогнать захват pcap/pcapng через конвейер (офлайн, теневой режим)"
+    )
+
+    parser.add_argument(
+        "--tap",
+        action="store_true",
+        help="Разбирать ClientHello/DNS в отдельном процессе, не задерживая пакеты"
+    )
+
+    parser.add_argument(
+        "--no-recorder",
+        action="store_true",
+        help="Не вести самописец последних пакетов (дамп в data/flight при ошибках)"
+    )
+
+    parser.add_argument(
+        "--no-fast-start",
+        action="store_true",
+        help="Дождаться обновления IP из сети до начала перехвата"
+    )
+
+    parser.add_argument(
+        "--gc-tuning",
+        action="store_true",
+        help="Заморозить объекты старта (gc.freeze) и реже собирать старшие поколения"
+    )
+
+    parser.add_argument(
+        "--backend",
+        choices=("auto", "windivert", "nfqueue"),
+        default=SNIFFER.BACKEND,
+        help="Бэкенд перехвата: WinDivert (Windows) или NFQUEUE (Linux-шлюз)"
+    )
+
+    parser.add_argument(
+        "--queue-num",
+        type=int,
+        default=SNIFFER.NFQUEUE_NUM,
+        help=f"Номер NFQUEUE (по умолчанию: {SNIFFER.NFQUEUE_NUM})"
+    )
+
+    parser.add_argument(
+        "--rules",
+        default=SNIFFER.RULES_FILE,
+        help=f"Файл правил политики, секция rules (по умолчанию: {SNIFFER.RULES_FILE})"
+    )
+
+    parser.add_argument(
+        "--udp-strategy",
+        choices=sorted(UDP_STRATEGIES),
+        default=SNIFFER.UDP_STRATEGY,
+        help="Перехват первых пакетов UDP-потоков (звонки); по умолчанию UDP не перехватывается"
+    )
+
+    parser.add_argument(
+        "--quic",
+        choices=QUIC_ACTIONS,
+        default=SNIFFER.QUIC_FAST_FAIL,
+        help="Отказ QUIC к адресам Telegram: icmp (port unreachable) или drop; "
+             "браузер сразу переходит на TCP"
+    )
+
+    parser.add_argument(
+        "--lanes",
+        choices=LANE_MODES,
+        default=SNIFFER.LANES,
+        help="Полосы приоритета: рукопожатия и управляющие пакеты вперёд закачек "
+             "(strict — строго, weighted — по весам; только с --backend nfqueue)"
+    )
+
+    parser.add_argument(
+        "--socks",
+        type=int,
+        metavar="PORT",
+        help="Режим без драйвера: локальный SOCKS5/HTTP CONNECT прокси на порту PORT"
+    )
+
+    parser.add_argument(
+        "--socks-host",
+        default=PROXY.HOST,
+        help=f"Адрес прокси (по умолчанию: {PROXY.HOST})"
+    )
+
     parser.add_argument(
         "-v", "--verbose",
         action="store_true",
@@ -182,13 +581,39 @@ Examples:
         print(f"[!] Ошибка: задержка должна быть между {FRAGMENTATION.MIN_DELAY_MS} и {FRAGMENTATION.MAX_DELAY_MS} мс")
         sys.exit(1)
     
+    SNIFFER.BACKEND = args.backend
+    SNIFFER.NFQUEUE_NUM = args.queue_num
+    SNIFFER.UDP_STRATEGY = args.udp_strategy
+    SNIFFER.QUIC_FAST_FAIL = args.quic
+    SNIFFER.LANES = args.lanes
+    SNIFFER.RULES_FILE = args.rules
+
     # Настраиваем логирование ДО создания приложения
     setup_logger(verbose=args.verbose)
 
+    if args.socks is not None:
+        # Драйвер и права администратора не нужны
+        from src.socks_proxy import serve
+        try:
+            serve(args.socks_host, args.socks)
+        except (OSError, ValueError) as e:
+            logger.error(f"Прокси не запущен: {e}")
+            sys.exit(1)
+        return
+
     app = TelegramBypass(
         fragment_size=args.fragment_size,
         delay_ms=args.delay,
-        verbose=args.verbose
+        verbose=args.verbose,
+        adaptive=FRAGMENTATION.ADAPTIVE_STRATEGY and not args.static,
+        telemetry=args.telemetry,
+        dns_learn=args.dns_learn,
+        shadow=args.shadow,
+        pcap=args.pcap,
+        tap=args.tap,
+        recorder=SNIFFER.RECORDER_ENABLED and not args.no_recorder,
+        fast_start=SNIFFER.FAST_START and not args.no_fast_start,
+        gc_tuning=SNIFFER.GC_TUNING or args.gc_tuning
     )
 
     try:
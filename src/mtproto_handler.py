@@ -3,84 +3,115 @@
 """
 
 import struct
-from typing import Optional, Tuple
+from typing import Optional
 from src.logger import logger
+from src.strategy import FragmentPlan
 
 
 class MTProtoDetector:
     """
-    Детектирует MTProto прокси-трафик по характерным признакам
+    Детектирует MTProto по первому payload потока
+
+    Транспорты:
+      - abridged:     первый байт 0xef и правдоподобная длина первого пакета
+      - intermediate: первые 4 байта 0xeeeeeeee
+      - padded:       первые 4 байта 0xdddddddd
+      - obfuscated2:  64 случайных байта init, которые не начинаются с
+                      маркеров выше, HTTP-методов или TLS и у которых
+                      байты 4..7 не нулевые (так их генерирует клиент)
     """
-    
-    # MTProto secret types
+
+    INIT_LEN = 64
+
+    # Самый короткий пакет MTProto: auth_key_id, message_id, длина и конструктор
+    MIN_PACKET_WORDS = 6
+
+    # Начала, которые клиент Telegram исключает при генерации obfuscated2 init
+    RESERVED_PREFIXES = (
+        b"HEAD", b"POST", b"GET ", b"OPTI",
+        b"\x16\x03\x01\x02",
+        b"\xdd\xdd\xdd\xdd",
+        b"\xee\xee\xee\xee",
+    )
+
+    # Совместимость со старым API
     SECRET_TYPES = {
         0x00: "simple",
         0x01: "secured",
         0x02: "tls_padding",
     }
-    
+
+    @classmethod
+    def detect(cls, payload: bytes) -> Optional[str]:
+        """
+        Определяет транспорт MTProto по первому сегменту
+
+        Returns:
+            "abridged" / "intermediate" / "padded" / "obfuscated2" или None
+        """
+        if len(payload) < 8:
+            return None
+        first = payload[0]
+        if first == 0xef:
+            return "abridged" if cls._abridged_length_ok(payload) else None
+        head = payload[:4]
+        if head == b"\xee\xee\xee\xee":
+            return "intermediate"
+        if head == b"\xdd\xdd\xdd\xdd":
+            return "padded"
+        if (len(payload) >= cls.INIT_LEN and
+                head not in cls.RESERVED_PREFIXES and
+                payload[4:8] != b"\x00\x00\x00\x00" and
+                first != 0x16):
+            return "obfuscated2"
+        return None
+
+    @classmethod
+    def _abridged_length_ok(cls, payload: bytes) -> bool:
+        """
+        За 0xef — длина первого пакета в 4-байтовых словах: байт (старший
+        бит — запрос quick ack) или 0x7f и три байта little-endian
+        """
+        words = payload[1] & 0x7f
+        if words == 0x7f:
+            # Длинная форма — только для пакетов от 0x7f слов
+            return int.from_bytes(payload[2:5], "little") >= 0x7f
+        return words >= cls.MIN_PACKET_WORDS
+
     @staticmethod
     def is_mtproto_payload(payload: bytes) -> bool:
         """
-        Проверяет, является ли payload MTProto handshake
-        
-        MTProto proxy handshake начинается с:
-        - 0xee для simple secret
-        - 0x01 для secured
-        - Или содержит specific byte patterns
+        Проверяет, является ли payload началом MTProto-соединения
+
+        Четырёхбайтовые маркеры надёжны; однобайтовый abridged и obfuscated2
+        отличимы только от известных протоколов, поэтому их стоит учитывать
+        лишь для адресов Telegram.
         """
-        if len(payload) < 8:
-            return False
-        
-        # Проверяем характерные признаки MTProto
-        first_byte = payload[0]
-        
-        # Simple secret: 0xee followed by 4 bytes timestamp
-        if first_byte == 0xee and len(payload) >= 64:
-            return True
-        
-        # Secured secret: начинается с 0x01 и длиной 32+ байт
-        if first_byte == 0x01 and len(payload) >= 32:
-            # Проверяем структуру
-            try:
-                # MTProto secured имеет специфичную структуру
-                return True  # Упрощённая проверка
-            except:
-                pass
-        
-        # TLS-like MTProto (с伪装ом под TLS)
-        if payload[0] == 0x16 and len(payload) > 5:
-            # Похоже на TLS, но может быть MTProto с TLS-обёрткой
-            return False  # Пусть TLS parser разбирается
-        
-        return False
-    
+        return MTProtoDetector.detect(payload) is not None
+
     @staticmethod
     def extract_mtproto_info(payload: bytes) -> Optional[dict]:
         """
         Извлекает информацию из MTProto handshake
-        
+
         Returns:
             dict с информацией или None
         """
-        if not MTProtoDetector.is_mtproto_payload(payload):
+        transport = MTProtoDetector.detect(payload)
+        if transport is None:
             return None
-        
+
         info = {
-            "type": "unknown",
+            "type": f"mtproto_{transport}",
             "length": len(payload),
         }
-        
-        first_byte = payload[0]
-        if first_byte == 0xee:
-            info["type"] = "mtproto_simple"
-            # Пытаемся извлечь timestamp (bytes 1-4)
-            if len(payload) >= 5:
-                timestamp = struct.unpack(">I", payload[1:5])[0]
-                info["timestamp"] = timestamp
-        elif first_byte == 0x01:
-            info["type"] = "mtproto_secured"
-        
+
+        if transport == "abridged" and len(payload) >= 2:
+            # Длина первого пакета в 4-байтовых словах
+            info["first_packet_words"] = payload[1]
+        elif transport in ("intermediate", "padded") and len(payload) >= 8:
+            info["first_packet_len"] = struct.unpack("<I", payload[4:8])[0]
+
         return info
 
 
@@ -88,31 +119,46 @@ class MTProtoFragmenter:
     """
     Специальная фрагментация для MTProto
     """
-    
+
+    # Разрезы внутри маркера/init: ни один сегмент не содержит его целиком
+    SPLITS = {
+        "abridged": (1,),
+        "intermediate": (2,),
+        "padded": (2,),
+        "obfuscated2": (1, 32),
+    }
+
     def __init__(self, base_fragmenter):
         self.base_fragmenter = base_fragmenter
-    
-    def process_mtproto(self, w, packet, payload: bytes) -> bool:
+
+    def plan(self, transport: str, payload: bytes) -> Optional[FragmentPlan]:
+        """План разбиения первого сегмента MTProto-потока"""
+        offsets = tuple(o for o in self.SPLITS.get(transport, ()) if o < len(payload))
+        if not offsets:
+            return None
+        return FragmentPlan(f"mtproto_{transport}", offsets)
+
+    def process_mtproto(self, w, packet, payload: bytes, transport: Optional[str] = None) -> bool:
         """
-        Обрабатывает MTProto пакет специальным образом
-        
+        Обрабатывает первый сегмент MTProto-потока
+
         MTProto требует особой осторожности с фрагментацией,
-        так как имеет свою криптографию
+        так как имеет свою криптографию: режем только маркер/init,
+        без задержек и без изменения байтов.
+
+        Returns:
+            True если пакет отправлен фрагментами
         """
         try:
-            # Для MTProto используем более консервативную фрагментацию
-            # Фрагментируем только первые байты handshake
-            info = MTProtoDetector.extract_mtproto_info(payload)
-            
-            if info and info.get("type") == "mtproto_simple":
-                # Simple MTProto: фрагментируем первые 8 байт
-                logger.debug("MTProto simple detected, applying light fragmentation")
-                # Здесь можно добавить специфичную логику
-                return self.base_fragmenter.process_packet(w, packet)
-            else:
-                # Secured или неизвестный тип: стандартная фрагментация
-                return self.base_fragmenter.process_packet(w, packet)
-                
+            transport = transport or MTProtoDetector.detect(payload)
+            plan = self.plan(transport, payload) if transport else None
+            if plan is None:
+                return False
+
+            logger.debug(f"MTProto {transport} detected, split at {plan.offsets}")
+            self.base_fragmenter._send_segments(w, packet, payload, plan.offsets, plan.delay_ms)
+            return True
+
         except Exception as e:
             logger.error(f"MTProto processing error: {e}")
-            return False
\ No newline at end of file
+            return False
@@ -0,0 +1,458 @@
+"""
+Бэкенд перехвата для Linux: netfilter queue через сырой сокет AF_NETLINK
+
+Без libnetfilter_queue и компилируемых расширений: сообщения nfnetlink
+собираются и разбираются через struct. Пакеты в очередь направляют правила
+iptables/nftables (см. iptables_rules), наши собственные пакеты помечаются
+SO_MARK и в очередь не возвращаются.
+
+Семантика как у WinDivert: send() исходного, не изменённого пакета —
+вердикт ACCEPT; всё остальное (фрагменты, изменённые пакеты) отправляется
+через raw-сокет, а исходный пакет получает DROP. Пакет, для которого
+send() не вызывали, тоже получает DROP.
+
+Вердикт выносится в done(packet), когда сниффер закончил с пакетом, а не
+при следующем recv: прочитанных вперёд пакетов (src.lanes) может быть
+несколько, и они завершаются не по порядку.
+"""
+
+import errno
+import socket
+import struct
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from src.backend import DivertBackend
+from src.config import SNIFFER
+from src.logger import logger
+from src.packet import Direction, RawPacket
+
+NETLINK_NETFILTER = 12
+NFNL_SUBSYS_QUEUE = 3
+
+NFQNL_MSG_PACKET = 0
+NFQNL_MSG_VERDICT = 1
+NFQNL_MSG_CONFIG = 2
+NFQNL_MSG_VERDICT_BATCH = 3
+
+NLM_F_REQUEST = 0x01
+NLM_F_ACK = 0x04
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+# Атрибуты конфигурации
+NFQA_CFG_CMD = 1
+NFQA_CFG_PARAMS = 2
+NFQA_CFG_QUEUE_MAXLEN = 3
+NFQA_CFG_MASK = 4
+NFQA_CFG_FLAGS = 5
+NFQNL_CFG_CMD_BIND = 1
+NFQNL_CFG_CMD_UNBIND = 2
+NFQNL_COPY_PACKET = 2
+NFQA_CFG_F_FAIL_OPEN = 0x01
+
+# Атрибуты пакета и вердикта
+NFQA_PACKET_HDR = 1
+NFQA_VERDICT_HDR = 2
+NFQA_MARK = 3
+NFQA_PAYLOAD = 10
+NLA_TYPE_MASK = 0x3FFF
+
+NF_DROP = 0
+NF_ACCEPT = 1
+
+# Хуки netfilter
+NF_INET_PRE_ROUTING = 0
+NF_INET_LOCAL_IN = 1
+NF_INET_FORWARD = 2
+NF_INET_LOCAL_OUT = 3
+NF_INET_POST_ROUTING = 4
+
+SO_MARK = getattr(socket, "SO_MARK", 36)
+IPV6_HDRINCL = 36
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_NFGENMSG = struct.Struct("!BBH")
+_NLATTR = struct.Struct("=HH")
+_PACKET_HDR = struct.Struct("!IHB")
+_VERDICT_HDR = struct.Struct("!II")
+
+
+def _align(n: int) -> int:
+    return (n + 3) & ~3
+
+
+def nla(attr_type: int, data: bytes) -> bytes:
+    """Атрибут netlink с выравниванием до 4 байт"""
+    length = _NLATTR.size + len(data)
+    return _NLATTR.pack(length, attr_type) + data + b"\0" * (_align(length) - length)
+
+
+def nfq_message(msg_type: int, queue_num: int, attrs: bytes = b"",
+                flags: int = NLM_F_REQUEST, seq: int = 0) -> bytes:
+    """Сообщение подсистемы queue: nlmsghdr + nfgenmsg + атрибуты"""
+    body = _NFGENMSG.pack(socket.AF_UNSPEC, 0, queue_num) + attrs
+    return _NLMSGHDR.pack(_NLMSGHDR.size + len(body),
+                          (NFNL_SUBSYS_QUEUE << 8) | msg_type,
+                          flags, seq, 0) + body
+
+
+def parse_attrs(buf: memoryview, pos: int, end: int) -> Dict[int, memoryview]:
+    """Атрибуты в диапазоне [pos, end) -> {тип: данные}"""
+    attrs = {}
+    while pos + _NLATTR.size <= end:
+        length, attr_type = _NLATTR.unpack_from(buf, pos)
+        if length < _NLATTR.size:
+            break
+        attrs[attr_type & NLA_TYPE_MASK] = buf[pos + _NLATTR.size:pos + length]
+        pos += _align(length)
+    return attrs
+
+
+def iter_messages(buf: memoryview, size: int):
+    """Разбирает датаграмму netlink: (тип, флаги, seq, начало тела, конец)"""
+    pos = 0
+    while pos + _NLMSGHDR.size <= size:
+        length, msg_type, flags, seq, _ = _NLMSGHDR.unpack_from(buf, pos)
+        if length < _NLMSGHDR.size or pos + length > size:
+            break
+        yield msg_type, flags, seq, pos + _NLMSGHDR.size, pos + length
+        pos += _align(length)
+
+
+def iptables_rules(queue_num: int = SNIFFER.NFQUEUE_NUM,
+                   mark: int = SNIFFER.NFQUEUE_MARK,
+                   tcp_ports: Optional[Iterable[int]] = None,
+                   udp_ports: Optional[Iterable[int]] = None,
+                   udp_first_packets: int = 0,
+                   quic_ports: Optional[Iterable[int]] = None,
+                   quic_cidrs: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Правила iptables для направления трафика в очередь
+
+    --queue-bypass: если процесс не запущен, пакеты идут мимо очереди.
+    UDP (udp_ports) — только первые udp_first_packets пакетов соединения
+    (connbytes), остальное ядро пропускает без процесса.
+    QUIC (quic_ports) — только к адресам quic_cidrs (src.quic_filter).
+    """
+    ports = ",".join(str(p) for p in (tcp_ports or SNIFFER.TCP_PORTS))
+    target = f"-m mark ! --mark {mark:#x} -j NFQUEUE --queue-num {queue_num} --queue-bypass"
+    rules = [
+        # Клиенты за шлюзом и сам шлюз
+        f"iptables -t mangle -A FORWARD -p tcp -m multiport --dports {ports} {target}",
+        f"iptables -t mangle -A OUTPUT -p tcp -m multiport --dports {ports} {target}",
+        # Входящие RST и SYN/ACK для RSTFilter
+        f"iptables -t mangle -A FORWARD -p tcp -m multiport --sports {ports} "
+        f"--tcp-flags RST RST {target}",
+        f"iptables -t mangle -A FORWARD -p tcp -m multiport --sports {ports} "
+        f"--tcp-flags SYN,ACK SYN,ACK {target}",
+    ]
+    if udp_ports and udp_first_packets > 0:
+        ports = ",".join(str(p) for p in udp_ports)
+        first = (f"-m connbytes --connbytes 1:{udp_first_packets} "
+                 f"--connbytes-dir original --connbytes-mode packets")
+        rules += [
+            f"iptables -t mangle -A FORWARD -p udp -m multiport --dports {ports} {first} {target}",
+            f"iptables -t mangle -A OUTPUT -p udp -m multiport --dports {ports} {first} {target}",
+        ]
+    if quic_ports and quic_cidrs:
+        ports = ",".join(str(p) for p in quic_ports)
+        cidrs = list(quic_cidrs)
+        for tool, family in (("iptables", [c for c in cidrs if ":" not in c]),
+                             ("ip6tables", [c for c in cidrs if ":" in c])):
+            if not family:
+                continue
+            dst = ",".join(family)
+            rules += [
+                f"{tool} -t mangle -A FORWARD -p udp -m multiport --dports {ports} -d {dst} {target}",
+                f"{tool} -t mangle -A OUTPUT -p udp -m multiport --dports {ports} -d {dst} {target}",
+            ]
+    return rules
+
+
+class NFQueueBackend(DivertBackend):
+    """
+    NFQUEUE поверх AF_NETLINK с пачками вердиктов
+
+    Подряд идущие ACCEPT копятся и отправляются одним NFQNL_MSG_VERDICT_BATCH:
+    когда пачка заполнилась, перед DROP и перед тем, как заблокироваться
+    в ожидании новых пакетов.
+
+    sock и inject_sockets можно подменить (запись netlink-потока в тестах).
+    """
+
+    RECV_BUFSIZE = 262144
+    read_ahead = True
+
+    def __init__(self,
+                 queue_num: int = SNIFFER.NFQUEUE_NUM,
+                 mark: int = SNIFFER.NFQUEUE_MARK,
+                 batch_size: int = SNIFFER.NFQUEUE_VERDICT_BATCH,
+                 fail_open: bool = SNIFFER.NFQUEUE_FAIL_OPEN,
+                 outbound_ports: Optional[Iterable[int]] = None,
+                 sock=None,
+                 inject_sockets: Optional[dict] = None,
+                 **queue_params):
+        super().__init__(**queue_params)
+        self.queue_num = queue_num
+        self.mark = mark
+        self.batch_size = batch_size
+        self.fail_open = fail_open
+        # На FORWARD направление определяем по порту назначения
+        self.outbound_ports = frozenset(outbound_ports or
+                                        set(SNIFFER.TCP_PORTS) | set(SNIFFER.UDP_PORTS))
+        self.sock = sock
+        self.inject_sockets = inject_sockets
+        self._buf = bytearray(self.RECV_BUFSIZE)
+        self._ready = deque()
+        self._seq = 0
+        # Прочитанные пакеты без вердикта, в порядке id:
+        # id(пакета) -> [id в очереди, пакет, исходные байты, принят]
+        self._outstanding: Dict[int, list] = {}
+        self._accept_upto = None
+        self._accept_count = 0
+        self.stats = {
+            "received": 0,
+            "accepted": 0,
+            "dropped": 0,
+            "injected": 0,
+            "verdict_msgs": 0,
+        }
+
+    # === Открытие и конфигурация ===
+
+    def open(self):
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_NETFILTER)
+            self.sock.bind((0, 0))
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.queue_size)
+            except OSError:
+                pass
+        if self.inject_sockets is None:
+            self.inject_sockets = {4: self._raw_socket(socket.AF_INET)}
+            try:
+                self.inject_sockets[6] = self._raw_socket(socket.AF_INET6)
+            except OSError as e:
+                logger.debug(f"IPv6 injection unavailable: {e}")
+
+        self._request(NFQA_CFG_CMD, struct.pack("!BxH", NFQNL_CFG_CMD_BIND, socket.AF_UNSPEC))
+        self._request(NFQA_CFG_PARAMS, struct.pack("!IB", 0xFFFF, NFQNL_COPY_PACKET))
+        self._request(NFQA_CFG_QUEUE_MAXLEN, struct.pack("!I", self.queue_length))
+        if self.fail_open:
+            self._request_attrs(nla(NFQA_CFG_FLAGS, struct.pack("!I", NFQA_CFG_F_FAIL_OPEN)) +
+                                nla(NFQA_CFG_MASK, struct.pack("!I", NFQA_CFG_F_FAIL_OPEN)))
+        logger.info(f"NFQUEUE {self.queue_num} bound (fail-open: {self.fail_open})")
+
+    def _raw_socket(self, family: int) -> socket.socket:
+        sock = socket.socket(family, socket.SOCK_RAW, socket.IPPROTO_RAW)
+        if family == socket.AF_INET6:
+            sock.setsockopt(socket.IPPROTO_IPV6, IPV6_HDRINCL, 1)
+        # Свои пакеты не должны снова попасть в очередь
+        sock.setsockopt(socket.SOL_SOCKET, SO_MARK, self.mark)
+        return sock
+
+    def _request(self, attr_type: int, data: bytes):
+        self._request_attrs(nla(attr_type, data))
+
+    def _request_attrs(self, attrs: bytes):
+        """Отправляет NFQNL_MSG_CONFIG и ждёт подтверждения"""
+        self._seq += 1
+        seq = self._seq
+        self.sock.send(nfq_message(NFQNL_MSG_CONFIG, self.queue_num, attrs,
+                                   flags=NLM_F_REQUEST | NLM_F_ACK, seq=seq))
+        while True:
+            size = self.sock.recv_into(self._buf)
+            if size == 0:
+                raise OSError(errno.ECONNRESET, "netlink socket closed")
+            if self._parse(size, ack_seq=seq):
+                return
+
+    def set_queue_params(self, length: int, time_ms: int, size: int):
+        super().set_queue_params(length, time_ms, size)
+        if self.sock is not None:
+            self._request(NFQA_CFG_QUEUE_MAXLEN, struct.pack("!I", length))
+
+    def close(self):
+        if self.sock is None:
+            return
+        try:
+            self._flush_accepts()
+            # Необработанные и так и не прочитанные пакеты отпускаем
+            for entry in self._outstanding.values():
+                self._verdict(NFQNL_MSG_VERDICT, NF_ACCEPT, entry[0])
+            self._outstanding.clear()
+            for queued_id, _, _, _ in self._ready:
+                self._verdict(NFQNL_MSG_VERDICT, NF_ACCEPT, queued_id)
+            self._ready.clear()
+            self.sock.send(nfq_message(NFQNL_MSG_CONFIG, self.queue_num,
+                                       nla(NFQA_CFG_CMD, struct.pack(
+                                           "!BxH", NFQNL_CFG_CMD_UNBIND, socket.AF_UNSPEC))))
+        except OSError as e:
+            logger.debug(f"NFQUEUE close: {e}")
+        finally:
+            self.sock.close()
+            self.sock = None
+            for sock in (self.inject_sockets or {}).values():
+                sock.close()
+            self.inject_sockets = None
+
+    # === Приём ===
+
+    def _parse(self, size: int, ack_seq: Optional[int] = None) -> bool:
+        """
+        Разбирает датаграмму: пакеты — в очередь готовых
+
+        Returns:
+            True, если встретилось подтверждение запроса ack_seq
+        """
+        buf = memoryview(self._buf)
+        acked = False
+        for msg_type, _, seq, start, end in iter_messages(buf, size):
+            if msg_type == NLMSG_ERROR:
+                code = struct.unpack_from("=i", buf, start)[0]
+                if code:
+                    raise OSError(-code, f"nfnetlink: {errno.errorcode.get(-code, code)}")
+                acked = acked or seq == ack_seq
+                continue
+            if msg_type != ((NFNL_SUBSYS_QUEUE << 8) | NFQNL_MSG_PACKET):
+                continue
+            attrs = parse_attrs(buf, start + _NFGENMSG.size, end)
+            hdr = attrs.get(NFQA_PACKET_HDR)
+            payload = attrs.get(NFQA_PAYLOAD)
+            if hdr is None or payload is None:
+                continue
+            packet_id, _, hook = _PACKET_HDR.unpack_from(hdr)
+            self.stats["received"] += 1
+            try:
+                packet = RawPacket(payload, direction=self._direction(hook, payload))
+            except (ValueError, IndexError, struct.error):
+                # Неразбираемый пакет сразу пропускаем
+                self._flush_accepts()
+                self._verdict(NFQNL_MSG_VERDICT, NF_ACCEPT, packet_id)
+                continue
+            self._ready.append((packet_id, packet, bytes(packet.raw), hook))
+        return acked
+
+    def _direction(self, hook: int, payload: memoryview) -> Direction:
+        if hook in (NF_INET_PRE_ROUTING, NF_INET_LOCAL_IN):
+            return Direction.INBOUND
+        if hook == NF_INET_FORWARD:
+            if payload[0] >> 4 == 6:
+                l4, proto = 40, payload[6]
+            else:
+                l4, proto = (payload[0] & 0x0F) * 4, payload[9]
+            if proto not in (6, 17):
+                return Direction.OUTBOUND
+            dst_port = (payload[l4 + 2] << 8) | payload[l4 + 3]
+            if dst_port not in self.outbound_ports:
+                return Direction.INBOUND
+        return Direction.OUTBOUND
+
+    def recv(self):
+        while not self._ready:
+            size = self._read()
+            if size is None:
+                return None
+            self._parse(size)
+        packet_id, packet, original, _ = self._ready.popleft()
+        self._outstanding[id(packet)] = [packet_id, packet, original, False]
+        return packet
+
+    def ready(self) -> bool:
+        if not self._ready and self.sock is not None:
+            try:
+                size = self.sock.recv_into(self._buf, 0, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                return False
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    raise
+                self.drops += 1
+                return False
+            if size:
+                self._parse(size)
+        return bool(self._ready)
+
+    def _read(self) -> Optional[int]:
+        """Читает датаграмму; перед блокировкой отправляет накопленные вердикты"""
+        while True:
+            try:
+                if self._accept_upto is not None:
+                    try:
+                        size = self.sock.recv_into(self._buf, 0, socket.MSG_DONTWAIT)
+                    except BlockingIOError:
+                        self._flush_accepts()
+                        continue
+                else:
+                    size = self.sock.recv_into(self._buf)
+            except OSError as e:
+                if e.errno == errno.ENOBUFS:
+                    # Ядро не смогло доставить часть пакетов — очередь переполнена
+                    self.drops += 1
+                    continue
+                raise
+            return size or None
+
+    def pending(self) -> int:
+        return len(self._ready)
+
+    # === Отправка и вердикты ===
+
+    def send(self, packet):
+        entry = self._outstanding.get(id(packet))
+        if entry is not None and not entry[3] and packet.raw == entry[2]:
+            entry[3] = True
+            return len(entry[2])
+        raw = bytes(packet.raw)
+        sock = self.inject_sockets[6 if raw[0] >> 4 == 6 else 4]
+        sock.sendto(raw, (packet.dst_addr, 0))
+        self.stats["injected"] += 1
+        return len(raw)
+
+    def done(self, packet):
+        entry = self._outstanding.pop(id(packet), None)
+        if entry is None:
+            return
+        packet_id = entry[0]
+        if not entry[3]:
+            # Отброшен фильтром или заменён фрагментами
+            self.stats["dropped"] += 1
+            self._flush_accepts()
+            self._verdict(NFQNL_MSG_VERDICT, NF_DROP, packet_id)
+            return
+        self.stats["accepted"] += 1
+        outstanding = self._outstanding
+        if outstanding and next(iter(outstanding.values()))[0] < packet_id:
+            # Пачка принимает все id до packet_id, а более ранний пакет ещё в работе
+            self._verdict(NFQNL_MSG_VERDICT, NF_ACCEPT, packet_id)
+            return
+        self._accept_upto = packet_id
+        self._accept_count += 1
+        if self._accept_count >= self.batch_size:
+            self._flush_accepts()
+
+    def detach(self, packet):
+        # Вердикт сразу: DROP, а пакет (или его фрагменты) потом уйдёт инъекцией
+        self.done(packet)
+
+    def _flush_accepts(self):
+        """ACCEPT для всех накопленных пакетов одним сообщением"""
+        if self._accept_upto is None:
+            return
+        if self._accept_count == 1:
+            self._verdict(NFQNL_MSG_VERDICT, NF_ACCEPT, self._accept_upto)
+        else:
+            self._verdict(NFQNL_MSG_VERDICT_BATCH, NF_ACCEPT, self._accept_upto)
+        self._accept_upto = None
+        self._accept_count = 0
+
+    def _verdict(self, msg_type: int, verdict: int, packet_id: int):
+        self.sock.send(nfq_message(msg_type, self.queue_num,
+                                   nla(NFQA_VERDICT_HDR, _VERDICT_HDR.pack(verdict, packet_id))))
+        self.stats["verdict_msgs"] += 1
+
+    def get_queue_stats(self) -> dict:
+        stats = super().get_queue_stats()
+        stats.update({f"nfqueue_{k}": v for k, v in self.stats.items()})
+        return stats
@@ -0,0 +1,400 @@
+"""
+Минимальная модель IP-пакета, совместимая с pydivert.Packet
+
+Нужна для бэкендов без WinDivert (fake, replay) — разбирает сырые байты
+IPv4/IPv6 + TCP/UDP и повторяет ту часть API pydivert, которой пользуются
+сниффер и фрагментатор.
+"""
+
+import socket
+import struct
+from enum import IntEnum
+from typing import Optional
+
+
+class Direction(IntEnum):
+    """Направление пакета (значения как в pydivert.Direction)"""
+    OUTBOUND = 0
+    INBOUND = 1
+
+
+PROTO_TCP = 6
+PROTO_UDP = 17
+PROTO_ICMP = 1
+PROTO_ICMPV6 = 58
+
+# Флаги TCP
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+TCP_URG = 0x20
+
+
+def internet_checksum(data) -> int:
+    """Контрольная сумма RFC 1071"""
+    if len(data) % 2:
+        data = bytes(data) + b"\x00"
+    total = sum(struct.unpack("!%dH" % (len(data) // 2), data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+class _IPv4Header:
+    def __init__(self, packet: "RawPacket"):
+        self._p = packet
+
+    @property
+    def ttl(self) -> int:
+        return self._p._buf[8]
+
+    @ttl.setter
+    def ttl(self, value: int):
+        self._p._buf[8] = value
+
+    @property
+    def ident(self) -> int:
+        return struct.unpack_from("!H", self._p._buf, 4)[0]
+
+    @ident.setter
+    def ident(self, value: int):
+        struct.pack_into("!H", self._p._buf, 4, value)
+
+    @property
+    def header_len(self) -> int:
+        return (self._p._buf[0] & 0x0F) * 4
+
+    @property
+    def packet_len(self) -> int:
+        return struct.unpack_from("!H", self._p._buf, 2)[0]
+
+    @property
+    def cksum(self) -> int:
+        return struct.unpack_from("!H", self._p._buf, 10)[0]
+
+
+class _IPv6Header:
+    def __init__(self, packet: "RawPacket"):
+        self._p = packet
+
+    @property
+    def hop_limit(self) -> int:
+        return self._p._buf[7]
+
+    @hop_limit.setter
+    def hop_limit(self, value: int):
+        self._p._buf[7] = value
+
+    # Для единообразия с IPv4 (RST-фильтр, телеметрия)
+    ttl = hop_limit
+
+    @property
+    def ident(self) -> int:
+        return 0
+
+    @property
+    def header_len(self) -> int:
+        return 40
+
+    @property
+    def payload_len(self) -> int:
+        return struct.unpack_from("!H", self._p._buf, 4)[0]
+
+
+class _L4Header:
+    def __init__(self, packet: "RawPacket"):
+        self._p = packet
+
+    @property
+    def src_port(self) -> int:
+        return struct.unpack_from("!H", self._p._buf, self._p._l4)[0]
+
+    @src_port.setter
+    def src_port(self, value: int):
+        struct.pack_into("!H", self._p._buf, self._p._l4, value)
+
+    @property
+    def dst_port(self) -> int:
+        return struct.unpack_from("!H", self._p._buf, self._p._l4 + 2)[0]
+
+    @dst_port.setter
+    def dst_port(self, value: int):
+        struct.pack_into("!H", self._p._buf, self._p._l4 + 2, value)
+
+    @property
+    def payload(self) -> bytes:
+        return bytes(self._p._buf[self._p._payload_offset():])
+
+    @payload.setter
+    def payload(self, value: bytes):
+        self._p._set_payload(value)
+
+
+class _TCPHeader(_L4Header):
+
+    def _flag(self, mask: int) -> bool:
+        return bool(self._p._buf[self._p._l4 + 13] & mask)
+
+    def _set_flag(self, mask: int, value: bool):
+        off = self._p._l4 + 13
+        if value:
+            self._p._buf[off] |= mask
+        else:
+            self._p._buf[off] &= ~mask & 0xFF
+
+    @property
+    def seq_num(self) -> int:
+        return struct.unpack_from("!I", self._p._buf, self._p._l4 + 4)[0]
+
+    @seq_num.setter
+    def seq_num(self, value: int):
+        struct.pack_into("!I", self._p._buf, self._p._l4 + 4, value & 0xFFFFFFFF)
+
+    @property
+    def ack_num(self) -> int:
+        return struct.unpack_from("!I", self._p._buf, self._p._l4 + 8)[0]
+
+    @ack_num.setter
+    def ack_num(self, value: int):
+        struct.pack_into("!I", self._p._buf, self._p._l4 + 8, value & 0xFFFFFFFF)
+
+    @property
+    def header_len(self) -> int:
+        return (self._p._buf[self._p._l4 + 12] >> 4) * 4
+
+    @property
+    def window_size(self) -> int:
+        return struct.unpack_from("!H", self._p._buf, self._p._l4 + 14)[0]
+
+    @window_size.setter
+    def window_size(self, value: int):
+        struct.pack_into("!H", self._p._buf, self._p._l4 + 14, value)
+
+    @property
+    def cksum(self) -> int:
+        return struct.unpack_from("!H", self._p._buf, self._p._l4 + 16)[0]
+
+    fin = property(lambda self: self._flag(TCP_FIN),
+                   lambda self, v: self._set_flag(TCP_FIN, v))
+    syn = property(lambda self: self._flag(TCP_SYN),
+                   lambda self, v: self._set_flag(TCP_SYN, v))
+    rst = property(lambda self: self._flag(TCP_RST),
+                   lambda self, v: self._set_flag(TCP_RST, v))
+    psh = property(lambda self: self._flag(TCP_PSH),
+                   lambda self, v: self._set_flag(TCP_PSH, v))
+    ack = property(lambda self: self._flag(TCP_ACK),
+                   lambda self, v: self._set_flag(TCP_ACK, v))
+    urg = property(lambda self: self._flag(TCP_URG),
+                   lambda self, v: self._set_flag(TCP_URG, v))
+
+
+class _UDPHeader(_L4Header):
+
+    @property
+    def cksum(self) -> int:
+        return struct.unpack_from("!H", self._p._buf, self._p._l4 + 6)[0]
+
+
+class RawPacket:
+    """
+    IP-пакет поверх bytearray с API в духе pydivert.Packet
+    """
+
+    def __init__(self, raw, direction: Direction = Direction.OUTBOUND,
+                 interface=None):
+        self._buf = bytearray(raw)
+        self.direction = Direction(direction)
+        self.interface = interface
+        self._parse()
+
+    def _parse(self):
+        buf = self._buf
+        self.version = buf[0] >> 4
+        if self.version == 4:
+            self.protocol = buf[9]
+            self._l4 = (buf[0] & 0x0F) * 4
+        elif self.version == 6:
+            # Extension headers не поддерживаем — для нашего трафика не нужны
+            self.protocol = buf[6]
+            self._l4 = 40
+        else:
+            raise ValueError(f"Unsupported IP version: {self.version}")
+
+    def _payload_offset(self) -> int:
+        if self.protocol == PROTO_TCP:
+            return self._l4 + (self._buf[self._l4 + 12] >> 4) * 4
+        if self.protocol == PROTO_UDP:
+            return self._l4 + 8
+        return self._l4
+
+    def _set_payload(self, value: bytes):
+        # Новый bytearray вместо resize: не ломает выданные memoryview
+        self._buf = self._buf[:self._payload_offset()] + bytearray(value)
+        total = len(self._buf)
+        if self.version == 4:
+            struct.pack_into("!H", self._buf, 2, total)
+        else:
+            struct.pack_into("!H", self._buf, 4, total - 40)
+        if self.protocol == PROTO_UDP:
+            struct.pack_into("!H", self._buf, self._l4 + 4, total - self._l4)
+
+    # === API pydivert ===
+
+    @property
+    def raw(self) -> memoryview:
+        return memoryview(self._buf)
+
+    @property
+    def is_outbound(self) -> bool:
+        return self.direction == Direction.OUTBOUND
+
+    @property
+    def is_inbound(self) -> bool:
+        return self.direction == Direction.INBOUND
+
+    @property
+    def ipv4(self) -> Optional[_IPv4Header]:
+        return _IPv4Header(self) if self.version == 4 else None
+
+    @property
+    def ipv6(self) -> Optional[_IPv6Header]:
+        return _IPv6Header(self) if self.version == 6 else None
+
+    @property
+    def ip(self):
+        return self.ipv4 if self.version == 4 else self.ipv6
+
+    @property
+    def tcp(self) -> Optional[_TCPHeader]:
+        return _TCPHeader(self) if self.protocol == PROTO_TCP else None
+
+    @property
+    def udp(self) -> Optional[_UDPHeader]:
+        return _UDPHeader(self) if self.protocol == PROTO_UDP else None
+
+    @property
+    def src_addr(self) -> str:
+        if self.version == 4:
+            return socket.inet_ntop(socket.AF_INET, bytes(self._buf[12:16]))
+        return socket.inet_ntop(socket.AF_INET6, bytes(self._buf[8:24]))
+
+    @property
+    def dst_addr(self) -> str:
+        if self.version == 4:
+            return socket.inet_ntop(socket.AF_INET, bytes(self._buf[16:20]))
+        return socket.inet_ntop(socket.AF_INET6, bytes(self._buf[24:40]))
+
+    @property
+    def src_port(self) -> Optional[int]:
+        hdr = self.tcp or self.udp
+        return hdr.src_port if hdr else None
+
+    @property
+    def dst_port(self) -> Optional[int]:
+        hdr = self.tcp or self.udp
+        return hdr.dst_port if hdr else None
+
+    @property
+    def payload(self) -> bytes:
+        return bytes(self._buf[self._payload_offset():])
+
+    def recalculate_checksums(self, flags: int = 0) -> int:
+        """Пересчитывает IP и TCP/UDP чексуммы, возвращает число пересчитанных"""
+        buf = self._buf
+        count = 0
+        if self.version == 4:
+            hlen = self._l4
+            struct.pack_into("!H", buf, 10, 0)
+            struct.pack_into("!H", buf, 10, internet_checksum(buf[:hlen]))
+            count += 1
+            pseudo = bytes(buf[12:20]) + struct.pack(
+                "!BBH", 0, self.protocol, len(buf) - hlen)
+        else:
+            pseudo = bytes(buf[8:40]) + struct.pack(
+                "!IxxxB", len(buf) - 40, self.protocol)
+
+        if self.protocol == PROTO_TCP:
+            cks_off = self._l4 + 16
+        elif self.protocol == PROTO_UDP:
+            cks_off = self._l4 + 6
+        else:
+            return count
+        struct.pack_into("!H", buf, cks_off, 0)
+        cks = internet_checksum(pseudo + bytes(buf[self._l4:]))
+        if self.protocol == PROTO_UDP and cks == 0:
+            cks = 0xFFFF
+        struct.pack_into("!H", buf, cks_off, cks)
+        return count + 1
+
+    def __repr__(self):
+        return (f"RawPacket({self.src_addr}:{self.src_port} -> "
+                f"{self.dst_addr}:{self.dst_port}, proto={self.protocol}, "
+                f"len={len(self._buf)})")
+
+
+def _ip_header(src: str, dst: str, proto: int, l4_len: int,
+               ttl: int, ident: int) -> bytes:
+    if ":" in src:
+        return struct.pack(
+            "!IHBB16s16s", 6 << 28, l4_len, proto, ttl,
+            socket.inet_pton(socket.AF_INET6, src),
+            socket.inet_pton(socket.AF_INET6, dst))
+    return struct.pack(
+        "!BBHHHBBH4s4s", 0x45, 0, 20 + l4_len, ident, 0x4000, ttl, proto, 0,
+        socket.inet_aton(src), socket.inet_aton(dst))
+
+
+def build_tcp_packet(src: str, dst: str, src_port: int, dst_port: int,
+                     payload: bytes = b"", seq: int = 0, ack: int = 0,
+                     flags: int = TCP_ACK, window: int = 65535,
+                     ttl: int = 64, ident: int = 0,
+                     direction: Direction = Direction.OUTBOUND) -> RawPacket:
+    """Собирает TCP-пакет с корректными чексуммами (для тестов и генераторов)"""
+    tcp = struct.pack("!HHIIBBHHH", src_port, dst_port, seq & 0xFFFFFFFF,
+                      ack & 0xFFFFFFFF, 5 << 4, flags, window, 0, 0) + payload
+    packet = RawPacket(_ip_header(src, dst, PROTO_TCP, len(tcp), ttl, ident) + tcp,
+                       direction=direction)
+    packet.recalculate_checksums()
+    return packet
+
+
+def build_udp_packet(src: str, dst: str, src_port: int, dst_port: int,
+                     payload: bytes = b"", ttl: int = 64, ident: int = 0,
+                     direction: Direction = Direction.OUTBOUND) -> RawPacket:
+    """Собирает UDP-пакет с корректными чексуммами"""
+    udp = struct.pack("!HHHH", src_port, dst_port, 8 + len(payload), 0) + payload
+    packet = RawPacket(_ip_header(src, dst, PROTO_UDP, len(udp), ttl, ident) + udp,
+                       direction=direction)
+    packet.recalculate_checksums()
+    return packet
+
+
+def build_icmp_unreachable(packet, ttl: int = 64) -> RawPacket:
+    """
+    ICMP port unreachable в ответ на исходящий пакет
+
+    Входящий пакет от имени адресата: цитирует заголовки исходного пакета,
+    по ним стек находит сокет клиента и сразу отдаёт ему ошибку.
+    """
+    raw = bytes(packet.raw)
+    src, dst = packet.dst_addr, packet.src_addr
+    if ":" in src:
+        # RFC 4443: цитата — сколько влезет в минимальный MTU 1280
+        quote = raw[:1280 - 48]
+        icmp = bytearray(struct.pack("!BBHI", 1, 4, 0, 0) + quote)
+        pseudo = (socket.inet_pton(socket.AF_INET6, src) + socket.inet_pton(socket.AF_INET6, dst) +
+                  struct.pack("!IxxxB", len(icmp), PROTO_ICMPV6))
+        struct.pack_into("!H", icmp, 2, internet_checksum(pseudo + bytes(icmp)))
+        proto = PROTO_ICMPV6
+    else:
+        # Заголовок IP и первые 8 байт UDP/TCP (RFC 792)
+        quote = raw[:(raw[0] & 0x0F) * 4 + 8]
+        icmp = bytearray(struct.pack("!BBHI", 3, 3, 0, 0) + quote)
+        struct.pack_into("!H", icmp, 2, internet_checksum(icmp))
+        proto = PROTO_ICMP
+    reply = RawPacket(_ip_header(src, dst, proto, len(icmp), ttl, 0) + icmp,
+                      direction=Direction.INBOUND, interface=getattr(packet, "interface", None))
+    reply.recalculate_checksums()
+    return reply
@@ -0,0 +1,299 @@
+"""
+Чтение захватов pcap/pcapng
+
+Отдаёт IP-пакеты (без канального заголовка) с временем захвата — для
+воспроизведения трафика через сниффер без драйвера.
+"""
+
+import struct
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+# Типы канального уровня (LINKTYPE_*)
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+_VLAN_TYPES = (0x8100, 0x88A8)
+
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BOM = 0x1A2B3C4D
+
+# Опции pcapng
+OPT_ENDOFOPT = 0
+OPT_COMMENT = 1
+EPB_FLAGS = 2
+EPB_INBOUND = 0x1
+EPB_OUTBOUND = 0x2
+
+
+class PcapError(Exception):
+    pass
+
+
+def strip_link_header(linktype: int, frame: bytes) -> Optional[memoryview]:
+    """IP-пакет из кадра канального уровня или None, если это не IP"""
+    view = memoryview(frame)
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        return view
+    if linktype == LINKTYPE_ETHERNET:
+        if len(view) < 14:
+            return None
+        pos = 12
+        ethertype = (view[pos] << 8) | view[pos + 1]
+        while ethertype in _VLAN_TYPES and len(view) >= pos + 6:
+            pos += 4
+            ethertype = (view[pos] << 8) | view[pos + 1]
+        pos += 2
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if len(view) < 16:
+            return None
+        ethertype = (view[14] << 8) | view[15]
+        pos = 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        if len(view) < 20:
+            return None
+        ethertype = (view[0] << 8) | view[1]
+        pos = 20
+    elif linktype == LINKTYPE_NULL:
+        if len(view) < 4:
+            return None
+        # Семейство адресов в порядке байт захватившей машины
+        family = struct.unpack("<I", view[:4])[0]
+        if family > 0xFFFF:
+            family = struct.unpack(">I", view[:4])[0]
+        if family == 2:
+            ethertype = ETHERTYPE_IPV4
+        elif family in (10, 23, 24, 28, 30):
+            ethertype = ETHERTYPE_IPV6
+        else:
+            return None
+        pos = 4
+    else:
+        return None
+    if ethertype not in (ETHERTYPE_IPV4, ETHERTYPE_IPV6):
+        return None
+    return view[pos:]
+
+
+def _read_pcap(f: BinaryIO, header: bytes) -> Iterator[Tuple[float, int, bytes]]:
+    magic = struct.unpack("<I", header[:4])[0]
+    if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+        endian = "<"
+    else:
+        endian = ">"
+        magic = struct.unpack(">I", header[:4])[0]
+    scale = 1e-9 if magic == PCAP_MAGIC_NS else 1e-6
+    linktype = struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF
+    record = struct.Struct(endian + "IIII")
+    while True:
+        head = f.read(record.size)
+        if len(head) < record.size:
+            return
+        sec, frac, incl_len, _ = record.unpack(head)
+        data = f.read(incl_len)
+        if len(data) < incl_len:
+            return
+        yield sec + frac * scale, linktype, data
+
+
+def _read_pcapng(f: BinaryIO) -> Iterator[Tuple[float, int, bytes]]:
+    endian = "<"
+    interfaces = []     # [(linktype, масштаб времени)]
+    while True:
+        head = f.read(8)
+        if len(head) < 8:
+            return
+        if head[:4] == b"\x0a\x0d\x0d\x0a":
+            # Section Header: порядок байт секции задаёт byte-order magic
+            bom = f.read(4)
+            endian = "<" if struct.unpack("<I", bom)[0] == PCAPNG_BOM else ">"
+            length = struct.unpack(endian + "I", head[4:8])[0]
+            f.read(length - 12)
+            interfaces = []
+            continue
+
+        block_type, length = struct.unpack(endian + "II", head)
+        if length < 12:
+            raise PcapError(f"Bad pcapng block length {length}")
+        body = f.read(length - 8)
+        if len(body) < length - 8:
+            return
+        body = body[:-4]
+
+        if block_type == PCAPNG_IDB:
+            linktype = struct.unpack(endian + "H", body[:2])[0]
+            interfaces.append((linktype, _if_tsresol(body[8:], endian)))
+        elif block_type == PCAPNG_EPB:
+            iface, ts_high, ts_low, cap_len = struct.unpack(endian + "IIII", body[:16])
+            linktype, scale = interfaces[iface]
+            yield ((ts_high << 32) | ts_low) * scale, linktype, body[20:20 + cap_len]
+        elif block_type == PCAPNG_SPB and interfaces:
+            orig_len = struct.unpack(endian + "I", body[:4])[0]
+            yield 0.0, interfaces[0][0], body[4:4 + orig_len]
+
+
+def _if_tsresol(options: bytes, endian: str) -> float:
+    """Разрешение времени интерфейса из опции if_tsresol (по умолчанию мкс)"""
+    pos = 0
+    while pos + 4 <= len(options):
+        code, length = struct.unpack(endian + "HH", options[pos:pos + 4])
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            value = options[pos + 4]
+            return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+        pos += 4 + ((length + 3) & ~3)
+    return 1e-6
+
+
+def read_frames(path: Union[str, Path]) -> Iterator[Tuple[float, int, bytes]]:
+    """Кадры захвата: (время, linktype, данные). Формат определяется по магии"""
+    with open(path, "rb") as f:
+        header = f.read(24)
+        if len(header) < 8:
+            return
+        magic = struct.unpack("<I", header[:4])[0]
+        if magic == PCAPNG_SHB:
+            f.seek(0)
+            yield from _read_pcapng(f)
+        elif magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS) or \
+                struct.unpack(">I", header[:4])[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            yield from _read_pcap(f, header)
+        else:
+            raise PcapError(f"Not a pcap/pcapng file: {path}")
+
+
+def read_packets(path: Union[str, Path]) -> Iterator[Tuple[float, memoryview]]:
+    """IP-пакеты захвата: (время, байты IP-пакета)"""
+    for ts, linktype, frame in read_frames(path):
+        packet = strip_link_header(linktype, frame)
+        if packet is not None and len(packet) >= 20:
+            yield ts, packet
+
+
+class PcapWriter:
+    """Потоковая запись классического pcap"""
+
+    def __init__(self, path: Union[str, Path], linktype: int = LINKTYPE_RAW,
+                 snaplen: int = 65535):
+        self._f = open(path, "wb")
+        self._f.write(struct.pack("<IHHiIII", PCAP_MAGIC_US, 2, 4, 0, 0, snaplen, linktype))
+
+    def write(self, ts: float, data, orig_len: Optional[int] = None):
+        sec = int(ts)
+        usec = int((ts - sec) * 1e6)
+        self._f.write(struct.pack("<IIII", sec, usec, len(data),
+                                  len(data) if orig_len is None else orig_len))
+        self._f.write(data)
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _options(options) -> bytes:
+    """Список опций pcapng [(код, bytes)] с выравниванием и opt_endofopt"""
+    if not options:
+        return b""
+    out = b""
+    for code, value in options:
+        out += struct.pack("<HH", code, len(value)) + value + b"\0" * ((-len(value)) % 4)
+    return out + struct.pack("<HH", OPT_ENDOFOPT, 0)
+
+
+def _block(block_type: int, body: bytes) -> bytes:
+    length = 12 + len(body)
+    return struct.pack("<II", block_type, length) + body + struct.pack("<I", length)
+
+
+class PcapngWriter:
+    """
+    Запись pcapng с комментариями к секции и пакетам
+
+    Один интерфейс LINKTYPE_RAW, время в микросекундах.
+    """
+
+    def __init__(self, path: Union[str, Path], comment: Optional[str] = None,
+                 snaplen: int = 65535):
+        self._f = open(path, "wb")
+        shb = struct.pack("<IHHq", PCAPNG_BOM, 1, 0, -1)
+        if comment:
+            shb += _options([(OPT_COMMENT, comment.encode("utf-8"))])
+        self._f.write(_block(PCAPNG_SHB, shb))
+        self._f.write(_block(PCAPNG_IDB, struct.pack("<HHI", LINKTYPE_RAW, 0, snaplen)))
+
+    def write(self, ts: float, data, orig_len: Optional[int] = None,
+              comment: Optional[str] = None, flags: int = 0):
+        usec = int(ts * 1_000_000)
+        pad = (-len(data)) % 4
+        options = []
+        if flags:
+            options.append((EPB_FLAGS, struct.pack("<I", flags)))
+        if comment:
+            options.append((OPT_COMMENT, comment.encode("utf-8")))
+        body = (struct.pack("<IIIII", 0, usec >> 32, usec & 0xFFFFFFFF, len(data),
+                            len(data) if orig_len is None else orig_len) +
+                bytes(data) + b"\0" * pad + _options(options))
+        self._f.write(_block(PCAPNG_EPB, body))
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_comments(path: Union[str, Path]) -> Tuple[Optional[str], list]:
+    """Комментарий секции и комментарии пакетов pcapng (для проверки дампов)"""
+    data = Path(path).read_bytes()
+    section, packets = None, []
+    pos = 0
+    while pos + 12 <= len(data):
+        block_type, length = struct.unpack_from("<II", data, pos)
+        body = data[pos + 8:pos + length - 4]
+        if block_type == PCAPNG_SHB:
+            section = _comment(body[16:])
+        elif block_type == PCAPNG_EPB:
+            cap_len = struct.unpack_from("<I", body, 12)[0]
+            packets.append(_comment(body[20 + cap_len + (-cap_len) % 4:]))
+        pos += length
+    return section, packets
+
+
+def _comment(options: bytes) -> Optional[str]:
+    pos = 0
+    while pos + 4 <= len(options):
+        code, length = struct.unpack_from("<HH", options, pos)
+        if code == OPT_ENDOFOPT:
+            break
+        if code == OPT_COMMENT:
+            return options[pos + 4:pos + 4 + length].decode("utf-8")
+        pos += 4 + length + (-length) % 4
+    return None
+
+
+def write_pcap(path: Union[str, Path], packets, linktype: int = LINKTYPE_RAW):
+    """Пишет классический pcap из [(время, байты), ...]"""
+    with PcapWriter(path, linktype) as writer:
+        for ts, data in packets:
+            writer.write(ts, data)
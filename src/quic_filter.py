@@ -0,0 +1,124 @@
+"""
+Быстрый отказ QUIC к адресам Telegram
+
+Браузер (web.telegram.org) сначала пробует QUIC по UDP/443. Если DPI
+молча глотает UDP, клиент ждёт таймаута рукопожатия QUIC и только потом
+уходит на TCP, где работает фрагментация. Стадия узнаёт Initial-пакеты
+по открытой части длинного заголовка (без расшифровки) и отвечает:
+
+- "icmp": ICMP port unreachable клиенту — сокет получает ошибку сразу;
+- "drop": пакет отбрасывается, клиент уходит на TCP по своему таймеру.
+
+Перехватывается только UDP/443 к диапазонам Telegram (условие в фильтре
+WinDivert и правила iptables), остальной QUIC идёт мимо процесса.
+"""
+
+import ipaddress
+from typing import Iterable, List, Optional
+
+from src.classifier import IPClassifier
+from src.config import SNIFFER
+from src.flow_table import FlowTable
+from src.packet import build_icmp_unreachable
+
+QUIC_ACTIONS = ("icmp", "drop")
+
+QUIC_V1 = 0x00000001
+QUIC_V2 = 0x6B3343CF
+# Датаграмма клиента с Initial дополняется минимум до 1200 байт (RFC 9000, 14.1)
+MIN_INITIAL_DATAGRAM = 1200
+
+
+def quic_initial_version(payload) -> Optional[int]:
+    """Версия QUIC, если payload — Initial с длинным заголовком, иначе None"""
+    if len(payload) < MIN_INITIAL_DATAGRAM:
+        return None
+    first = payload[0]
+    # Длинный заголовок; короткие пакеты (уже установленный QUIC) не трогаем
+    if not first & 0x80:
+        return None
+    version = int.from_bytes(payload[1:5], "big")
+    # 0 — Version Negotiation
+    if version == 0:
+        return None
+    # Тип пакета Initial: 0b00 в v1 и черновиках, 0b01 в v2 (RFC 9369)
+    if (first >> 4) & 0x03 != (1 if version == QUIC_V2 else 0):
+        return None
+    if payload[5] > 20:
+        return None
+    return version
+
+
+class QUICFilter:
+    """
+    Initial-пакеты QUIC к адресам Telegram — отказ, остальное — дальше
+
+    Счётчики по адресам назначения (ограниченная LRU-таблица) показывают,
+    куда клиенты пытались идти по QUIC и сколько раз получили отказ.
+    """
+
+    def __init__(self,
+                 action: str = "icmp",
+                 ip_classifier: Optional[IPClassifier] = None,
+                 ports: Optional[Iterable[int]] = None,
+                 max_destinations: int = 1024):
+        if action not in QUIC_ACTIONS:
+            raise ValueError(f"Unknown QUIC action: {action} "
+                             f"(available: {', '.join(QUIC_ACTIONS)})")
+        self.action = action
+        self.ip_classifier = ip_classifier or IPClassifier.from_config()
+        self.ports = tuple(ports or SNIFFER.QUIC_PORTS)
+        self._ports = frozenset(self.ports)
+        # addr -> число отказов
+        self.destinations = FlowTable(max_flows=max_destinations, idle_timeout=float("inf"))
+        self.stats = {"packets": 0, "initial": 0, "icmp": 0, "dropped": 0, "passed": 0}
+
+    def matches(self, packet) -> bool:
+        """Исходящий UDP-пакет на порт QUIC к адресу Telegram"""
+        return packet.dst_port in self._ports and self.ip_classifier.contains(packet.dst_addr)
+
+    def process(self, packet, w) -> bool:
+        """Обрабатывает пакет, для которого matches(). Returns: True — переслать как есть"""
+        self.stats["packets"] += 1
+        if quic_initial_version(packet.udp.payload) is None:
+            self.stats["passed"] += 1
+            return True
+        self.stats["initial"] += 1
+        dst = packet.dst_addr
+        self.destinations.put(dst, self.destinations.get(dst, 0) + 1)
+        if self.action == "icmp":
+            w.send(w.reply(packet, bytes(build_icmp_unreachable(packet).raw)))
+            self.stats["icmp"] += 1
+        else:
+            self.stats["dropped"] += 1
+        return False
+
+    def _ranges(self, version: int) -> List[tuple]:
+        make = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+        return [(make(start), make(end)) for start, end in self.ip_classifier.intervals(version)]
+
+    def filter_clause(self) -> str:
+        """Условие WinDivert: порты QUIC к статическим диапазонам Telegram"""
+        ports = " or ".join(f"udp.DstPort == {p}" for p in self.ports)
+        ranges = []
+        for version, field in ((4, "ip.DstAddr"), (6, "ipv6.DstAddr")):
+            for start, end in self._ranges(version):
+                if start == end:
+                    ranges.append(f"{field} == {start}")
+                else:
+                    ranges.append(f"({field} >= {start} and {field} <= {end})")
+        if not ranges:
+            return "false"
+        return f"(({ports}) and ({' or '.join(ranges)}))"
+
+    def cidrs(self) -> List[str]:
+        """Диапазоны Telegram в виде CIDR (для правил iptables)"""
+        result = []
+        for version in (4, 6):
+            for start, end in self._ranges(version):
+                result += [str(net) for net in ipaddress.summarize_address_range(start, end)]
+        return result
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, action=self.action,
+                    destinations=dict(self.destinations.items()))
@@ -2,46 +2,101 @@
 Фильтрация фейковых RST-пакетов от DPI/РКН
 """
 
+from typing import Callable, Optional
+
+from src.flow_table import FlowTable, flow_key
 from src.logger import logger
 
 
 class RSTFilter:
     """
     Блокирует поддельные TCP RST пакеты от DPI
-    
+
     РКН/DPI иногда внедряют RST-пакеты чтобы разорвать соединение.
+    По SYN/ACK сервера запоминаем «отпечаток» потока (TTL, IP-ID, окно).
+    Входящий RST, который с ним не сходится, пришёл не от сервера.
     """
-    
-    def __init__(self):
+
+    TTL_TOLERANCE = 1          # смена маршрута на один хоп допустима
+    IPID_MAX_DELTA = 4096      # насколько IP-ID сервера может уйти вперёд
+
+    def __init__(self,
+                 max_flows: int = 16384,
+                 on_fake_rst: Optional[Callable[[tuple], None]] = None):
+        # flow -> (ttl, ip_id, window) из SYN/ACK
+        self.flows = FlowTable(max_flows=max_flows, idle_timeout=300.0)
+        self.on_fake_rst = on_fake_rst
         self.blocked_rst_count = 0
-    
+        self.stats = {
+            "syn_acks": 0,
+            "rst_seen": 0,
+            "rst_passed": 0,
+            "rst_unknown_flow": 0,
+            "blocked_ttl": 0,
+            "blocked_ipid": 0,
+        }
+
+    def _fingerprint(self, packet) -> tuple:
+        ip = packet.ipv4 or packet.ipv6
+        return (ip.ttl, ip.ident, packet.tcp.window_size)
+
+    def _mismatch(self, baseline: tuple, observed: tuple) -> Optional[str]:
+        """Причина несовпадения с отпечатком или None"""
+        base_ttl, base_id, base_window = baseline
+        ttl, ip_id, window = observed
+        if abs(ttl - base_ttl) > self.TTL_TOLERANCE:
+            return "ttl"
+        # Нулевой IP-ID в SYN/ACK (Linux при DF) ничего не говорит: дальше
+        # сервер шлёт случайный IP-ID на сокет, сравнивать не с чем
+        if base_id != 0 and (((ip_id - base_id) & 0xFFFF) > self.IPID_MAX_DELTA and
+                             window not in (0, base_window)):
+            return "ipid"
+        return None
+
     def is_fake_rst(self, packet) -> bool:
         """
         Определяет, является ли RST-пакет фейковым
         """
-        # Проверяем наличие RST флага
-        if not hasattr(packet.tcp, 'rst') or not packet.tcp.rst:
+        # Смотрим только входящие RST; исходящие — от нашего стека
+        tcp = packet.tcp
+        if tcp is None or not tcp.rst or not packet.is_inbound:
+            return False
+
+        self.stats["rst_seen"] += 1
+        key = flow_key(packet)
+        baseline = self.flows.get(key)
+        if baseline is None:
+            self.stats["rst_unknown_flow"] += 1
+            return False
+
+        reason = self._mismatch(baseline, self._fingerprint(packet))
+        if reason is None:
+            self.stats["rst_passed"] += 1
+            self.flows.pop(key)
             return False
-        
-        # Простая эвристика: блокируем входящие RST от Telegram IP
-        # (в реальности RST должен идти от сервера, но DPI подделывает)
-        
-        src_port = packet.tcp.src_port
-        dst_port = packet.tcp.dst_port
-        
-        # Telegram порты
-        telegram_ports = [443, 80, 8080, 8443]
-        
-        if src_port in telegram_ports:
-            self.blocked_rst_count += 1
-            logger.debug(f"Blocked fake RST from {packet.src_addr}:{src_port}")
-            return True
-        
-        return False
-    
+
+        self.blocked_rst_count += 1
+        self.stats[f"blocked_{reason}"] += 1
+        logger.debug(f"Blocked fake RST from {packet.src_addr}:{tcp.src_port} ({reason})")
+        if self.on_fake_rst is not None:
+            self.on_fake_rst(key)
+        return True
+
+    def observe_syn_ack(self, packet) -> None:
+        """Запоминает отпечаток сервера из SYN/ACK"""
+        self.stats["syn_acks"] += 1
+        self.flows.put(flow_key(packet), self._fingerprint(packet))
+
     def should_drop(self, packet) -> bool:
         """Возвращает True если пакет нужно дропнуть"""
+        tcp = packet.tcp
+        if tcp is not None and tcp.syn and tcp.ack and packet.is_inbound:
+            self.observe_syn_ack(packet)
+            return False
         return self.is_fake_rst(packet)
-    
+
     def get_stats(self) -> dict:
-        return {"blocked_rst": self.blocked_rst_count}
\ No newline at end of file
+        stats = self.stats.copy()
+        stats["blocked_rst"] = self.blocked_rst_count
+        stats["tracked_flows"] = len(self.flows)
+        return stats
@@ -0,0 +1,352 @@
+"""
+Правила политики: какое назначение как обрабатывать (config.yaml)
+
+Правило — условия (CIDR, порт, SNI/Host, протокол) и действие:
+"fragment" со стратегией и параметрами или "pass". Внутри поля значения
+объединяются по «или», поля между собой — по «и»; из подходящих правил
+выигрывает первое по списку.
+
+При загрузке список компилируется в индексы по полям: для каждого
+значения — битовая маска правил, которые оно допускает (правила без
+условия на поле входят в маску «любое»). Оценка потока — несколько
+поисков (bisect по интервалам адресов, словари портов, протоколов и
+суффиксов имени) и AND масок; младший бит результата — первое
+подходящее правило.
+
+    rules:
+      - name: telegram-dc
+        match:
+          cidr: [149.154.160.0/20, 91.108.4.0/22]
+          port: [443]
+          protocol: [tls, mtproto]
+        strategy: split_delay
+        params: {delay_ms: 5}
+      - name: bank
+        match: {sni: [bank.example]}
+        action: pass
+"""
+
+import bisect
+import ipaddress
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.classifier import addr_to_int
+from src.config import FRAGMENTATION
+from src.logger import logger
+from src.strategy import STRATEGIES, FragmentPlan, build_plan
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+ACTIONS = ("fragment", "pass")
+MATCH_FIELDS = ("cidr", "port", "sni", "protocol")
+PARAMS = ("first_fragment_size", "delay_ms")
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _parse_ports(values) -> Tuple[int, ...]:
+    """443, "10000-10003" -> (443, 10000, 10001, 10002, 10003)"""
+    ports = []
+    for value in values:
+        if isinstance(value, str) and "-" in value:
+            low, high = (int(v) for v in value.split("-", 1))
+            ports.extend(range(low, high + 1))
+        else:
+            ports.append(int(value))
+    if any(not 0 < p < 65536 for p in ports):
+        raise ValueError(f"port out of range: {values}")
+    return tuple(ports)
+
+
+def _normalize_name(pattern: str) -> str:
+    """*.Example.com. -> example.com"""
+    pattern = pattern.lower().strip().rstrip(".")
+    if pattern.startswith("*."):
+        pattern = pattern[2:]
+    return pattern.lstrip(".")
+
+
+def protocol_keys(protocol: Optional[str]) -> Tuple[str, ...]:
+    """Ключи протокола для сопоставления: "mtproto_abridged" -> (точный, "mtproto")"""
+    if protocol is None:
+        return ("unknown",)
+    family = protocol.split("_", 1)[0]
+    return (protocol,) if family == protocol else (protocol, family)
+
+
+@dataclass
+class Rule:
+    """Правило политики; пустое поле условия — «любое значение»"""
+    name: str
+    action: str = "fragment"
+    strategy: Optional[str] = None
+    params: Dict[str, Any] = field(default_factory=dict)
+    cidrs: Tuple[str, ...] = ()
+    ports: Tuple[int, ...] = ()
+    sni: Tuple[str, ...] = ()
+    protocols: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_dict(cls, data: dict, index: int = 0) -> "Rule":
+        """Правило из элемента списка rules в config.yaml (ValueError при ошибке)"""
+        name = str(data.get("name") or f"rule{index}")
+        unknown = set(data) - {"name", "match", "action", "strategy", "params"}
+        if unknown:
+            raise ValueError(f"Rule {name}: unknown keys {sorted(unknown)}")
+        match = data.get("match") or {}
+        if "process" in match:
+            # Перехват видит только пакет: процесс-владелец неизвестен,
+            # и такое правило молча никогда бы не совпало
+            raise ValueError(f"Rule {name}: matching by process is not supported")
+        unknown = set(match) - set(MATCH_FIELDS)
+        if unknown:
+            raise ValueError(f"Rule {name}: unknown match fields {sorted(unknown)}")
+        params = dict(data.get("params") or {})
+        unknown = set(params) - set(PARAMS)
+        if unknown:
+            raise ValueError(f"Rule {name}: unknown params {sorted(unknown)}")
+
+        try:
+            cidrs = tuple(str(ipaddress.ip_network(str(c), strict=False))
+                          for c in _as_list(match.get("cidr")))
+            ports = _parse_ports(_as_list(match.get("port")))
+        except ValueError as e:
+            raise ValueError(f"Rule {name}: {e}") from None
+        rule = cls(
+            name=name,
+            action=str(data.get("action", "fragment")),
+            strategy=data.get("strategy"),
+            params=params,
+            cidrs=cidrs,
+            ports=ports,
+            sni=tuple(_normalize_name(str(s)) for s in _as_list(match.get("sni"))),
+            protocols=tuple(str(p).lower() for p in _as_list(match.get("protocol"))),
+        )
+        if rule.action not in ACTIONS:
+            raise ValueError(f"Rule {name}: action must be one of {ACTIONS}")
+        if rule.strategy is not None and rule.strategy not in STRATEGIES:
+            raise ValueError(f"Rule {name}: unknown strategy {rule.strategy} "
+                             f"(available: {', '.join(STRATEGIES)})")
+        return rule
+
+    def matches(self, dst_addr: str, dst_port: int, sni: Optional[str] = None,
+                protocol: Optional[str] = None) -> bool:
+        """Прямая проверка одного правила (эталон для скомпилированного RuleSet)"""
+        if self.ports and dst_port not in self.ports:
+            return False
+        if self.protocols and not set(protocol_keys(protocol)) & set(self.protocols):
+            return False
+        if self.cidrs:
+            addr = ipaddress.ip_address(dst_addr)
+            if not any(addr in ipaddress.ip_network(c) for c in self.cidrs):
+                return False
+        if self.sni:
+            if not sni:
+                return False
+            name = sni.lower().rstrip(".")
+            if not any(name == p or name.endswith("." + p) if "." in p else p in name
+                       for p in self.sni):
+                return False
+        return True
+
+    def build_plan(self, payload: bytes,
+                   first_fragment_size: int = FRAGMENTATION.DEFAULT_SIZE,
+                   delay_ms: float = FRAGMENTATION.DEFAULT_DELAY_MS) -> FragmentPlan:
+        """План по стратегии правила; params переопределяют размер и задержку"""
+        delay = self.params.get("delay_ms")
+        return build_plan(self.strategy, payload,
+                          first_fragment_size=self.params.get("first_fragment_size",
+                                                              first_fragment_size),
+                          delay_ms=delay_ms if delay is None else delay,
+                          small_delay_ms=FRAGMENTATION.SMALL_DELAY_MS if delay is None else delay)
+
+
+class _AddressIndex:
+    """Элементарные интервалы адресов (по версии IP) -> маска правил"""
+
+    def __init__(self, items: Iterable[Tuple[int, int, int, int]], base: int = 0):
+        # (версия, начало, конец, бит правила); base — правила без условия на адрес
+        events: Dict[int, Dict[int, List[Tuple[int, int]]]] = {4: {}, 6: {}}
+        for version, start, end, bit in items:
+            events[version].setdefault(start, []).append((bit, 1))
+            events[version].setdefault(end + 1, []).append((bit, -1))
+        self.starts = {4: [], 6: []}
+        self.masks = {4: [], 6: []}
+        self.base = base
+        for version, points in events.items():
+            counts: Dict[int, int] = {}
+            mask = base
+            for point in sorted(points):
+                for bit, delta in points[point]:
+                    counts[bit] = counts.get(bit, 0) + delta
+                    if counts[bit]:
+                        mask |= bit
+                    else:
+                        mask &= ~bit
+                self.starts[version].append(point)
+                self.masks[version].append(mask)
+
+    def lookup(self, addr: str) -> int:
+        version, value = addr_to_int(addr)
+        i = bisect.bisect_right(self.starts[version], value) - 1
+        return self.masks[version][i] if i >= 0 else self.base
+
+    def __len__(self) -> int:
+        return len(self.starts[4]) + len(self.starts[6])
+
+
+class RuleSet:
+    """
+    Скомпилированный список правил
+
+    match() возвращает первое подходящее правило или None; счётчики
+    совпадений по правилам — в get_stats().
+    """
+
+    CACHE_MAX = 4096
+
+    def __init__(self, rules: Iterable[Rule] = ()):
+        self.rules: List[Rule] = list(rules)
+        self.hits = [0] * len(self.rules)
+        self.unmatched = 0
+        self._compile()
+
+    @classmethod
+    def from_config(cls, data: Optional[dict]) -> "RuleSet":
+        """Из разобранного config.yaml (ключ rules)"""
+        entries = (data or {}).get("rules") or []
+        if not isinstance(entries, list):
+            raise ValueError("rules must be a list")
+        return cls(Rule.from_dict(entry, i) for i, entry in enumerate(entries))
+
+    def _compile(self):
+        self.all = (1 << len(self.rules)) - 1
+        # Маски правил без условия на поле
+        self.any = {name: 0 for name in MATCH_FIELDS}
+        self.ports: Dict[int, int] = {}
+        self.protocols: Dict[str, int] = {}
+        self.suffixes: Dict[str, int] = {}
+        self.keywords: Dict[str, int] = {}
+        addresses = []
+
+        for i, rule in enumerate(self.rules):
+            bit = 1 << i
+            for name, values in (("cidr", rule.cidrs), ("port", rule.ports),
+                                 ("sni", rule.sni), ("protocol", rule.protocols)):
+                if not values:
+                    self.any[name] |= bit
+            for cidr in rule.cidrs:
+                net = ipaddress.ip_network(cidr)
+                addresses.append((net.version, int(net.network_address),
+                                  int(net.broadcast_address), bit))
+            for port in rule.ports:
+                self.ports[port] = self.ports.get(port, 0) | bit
+            for protocol in rule.protocols:
+                self.protocols[protocol] = self.protocols.get(protocol, 0) | bit
+            for pattern in rule.sni:
+                index = self.suffixes if "." in pattern else self.keywords
+                index[pattern] = index.get(pattern, 0) | bit
+
+        self.addresses = _AddressIndex(addresses, self.any["cidr"])
+        # В индексах сразу маски «значение или любое»: одна операция на поле
+        for name, index in (("port", self.ports), ("protocol", self.protocols)):
+            for value in index:
+                index[value] |= self.any[name]
+        # Подстроки ищутся по длинам ключевых слов, а не перебором слов
+        self._keyword_lengths = tuple(sorted({len(k) for k in self.keywords}))
+        # Поля, по которым хоть одно правило ставит условие
+        self._active = frozenset(name for name in MATCH_FIELDS if self.any[name] != self.all)
+        self._names: Dict[str, int] = {}
+
+    def _name_mask(self, sni: Optional[str]) -> int:
+        if not sni:
+            return self.any["sni"]
+        mask = self._names.get(sni)
+        if mask is not None:
+            return mask
+        name = sni.lower().rstrip(".")
+        mask = self.any["sni"]
+        labels = name.split(".")
+        for i in range(len(labels)):
+            mask |= self.suffixes.get(".".join(labels[i:]), 0)
+        keywords = self.keywords
+        for length in self._keyword_lengths:
+            for i in range(len(name) - length + 1):
+                mask |= keywords.get(name[i:i + length], 0)
+        if len(self._names) >= self.CACHE_MAX:
+            self._names.clear()
+        self._names[sni] = mask
+        return mask
+
+    def match(self, dst_addr: str, dst_port: int, sni: Optional[str] = None,
+              protocol: Optional[str] = None) -> Optional[Rule]:
+        """Первое по списку правило, которому подходит поток"""
+        mask = self.all
+        active, anything = self._active, self.any
+        if "port" in active:
+            mask &= self.ports.get(dst_port, anything["port"])
+        if "protocol" in active and mask:
+            keys = protocol_keys(protocol)
+            allowed = self.protocols.get(keys[0], anything["protocol"])
+            if len(keys) > 1:
+                allowed |= self.protocols.get(keys[1], anything["protocol"])
+            mask &= allowed
+        if "cidr" in active and mask:
+            mask &= self.addresses.lookup(dst_addr)
+        if "sni" in active and mask:
+            mask &= self._name_mask(sni)
+        if not mask:
+            self.unmatched += 1
+            return None
+        index = (mask & -mask).bit_length() - 1
+        self.hits[index] += 1
+        return self.rules[index]
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def get_stats(self) -> dict:
+        return {
+            "rules": len(self.rules),
+            "matched": {rule.name: hits for rule, hits in zip(self.rules, self.hits) if hits},
+            "unmatched": self.unmatched,
+            "index": {"address_intervals": len(self.addresses), "ports": len(self.ports),
+                      "suffixes": len(self.suffixes), "keywords": len(self.keywords)},
+        }
+
+
+def load_rules(path: str) -> Optional[RuleSet]:
+    """
+    Правила из YAML-файла; None, если файла или правил нет
+
+    Ошибки в правилах — ValueError: запуск с неверной политикой хуже отказа.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except OSError:
+        return None
+    if not text.strip():
+        return None
+    if yaml is None:
+        logger.warning(f"pyyaml не установлен: правила из {path} не загружены")
+        return None
+    try:
+        data = yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        raise ValueError(f"{path}: {e}") from None
+    if not isinstance(data, dict):
+        return None
+    rules = RuleSet.from_config(data)
+    if not len(rules):
+        return None
+    logger.info(f"Правила: {len(rules)} из {path}")
+    return rules
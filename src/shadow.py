@@ -0,0 +1,164 @@
+"""
+Теневой режим: полный конвейер решений без изменения трафика
+
+Пакеты читаются хэндлом только для наблюдения (WinDivert SNIFF или
+воспроизведение pcap), сниффер и фрагментатор работают как обычно,
+но отправка и задержки между фрагментами ничего не делают — только
+учитываются. Отчёт показывает, что было бы фрагментировано, какую
+задержку это добавило бы и сколько стоит каждый этап обработки.
+"""
+
+import time
+from typing import Callable, Dict
+
+from src.backend import BackendWrapper, DivertBackend
+from src.logger import logger
+from src.packet import RawPacket
+
+STAGES = ("recv", "classify", "decide", "total")
+
+
+class ShadowReport:
+    """
+    Счётчики теневого режима
+
+    Реализует интерфейс телеметрии фрагментатора (clock/on_fragmented),
+    а add_delay подставляется вместо fragmenter.sleep.
+    """
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+        self.sends = 0
+        self.would_fragment = 0
+        self.would_delay_ms = 0.0
+        self.by_strategy: Dict[str, int] = {}
+        self.stage_ns = dict.fromkeys(STAGES, 0)
+        self._wall_start = None
+        self._cpu_start = None
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+
+    # === Интерфейс фрагментатора ===
+
+    clock = staticmethod(time.perf_counter)
+
+    def on_fragmented(self, packet, strategy: str, seconds: float):
+        self.would_fragment += 1
+        self.by_strategy[strategy] = self.by_strategy.get(strategy, 0) + 1
+
+    def add_delay(self, seconds: float):
+        self.would_delay_ms += seconds * 1000.0
+
+    # === Замеры ===
+
+    def start(self):
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    def stop(self):
+        if self._wall_start is None:
+            return
+        self.wall_s += time.perf_counter() - self._wall_start
+        self.cpu_s += time.process_time() - self._cpu_start
+        self._wall_start = None
+
+    def timed(self, stage: str, fn: Callable) -> Callable:
+        """Обёртка, суммирующая время вызовов fn в stage_ns[stage]"""
+        stage_ns = self.stage_ns
+        clock = time.perf_counter_ns
+
+        def wrapper(*args, **kwargs):
+            started = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stage_ns[stage] += clock() - started
+        return wrapper
+
+    def summary(self) -> dict:
+        packets = self.packets or 1
+        total_s = self.stage_ns["total"] / 1e9
+        return {
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "would_fragment": self.would_fragment,
+            "by_strategy": dict(self.by_strategy),
+            "segments_sent": self.sends,
+            "would_delay_ms": round(self.would_delay_ms, 3),
+            "avg_delay_ms": round(self.would_delay_ms / max(self.would_fragment, 1), 3),
+            # Сколько пакетов в секунду успевает обработать конвейер
+            "pps_capacity": round(self.packets / total_s) if total_s else 0,
+            "pps_wall": round(self.packets / self.wall_s) if self.wall_s else 0,
+            "cpu_s": round(self.cpu_s, 3),
+            "stage_ns_per_packet": {stage: round(ns / packets)
+                                    for stage, ns in self.stage_ns.items()},
+        }
+
+    def log(self):
+        s = self.summary()
+        logger.info("=" * 50)
+        logger.info("SHADOW MODE REPORT")
+        logger.info("=" * 50)
+        logger.info(f"Packets: {s['packets']} ({s['bytes']} bytes)")
+        logger.info(f"Would fragment: {s['would_fragment']} {s['by_strategy']}")
+        logger.info(f"Would add delay: {s['would_delay_ms']} ms "
+                    f"(avg {s['avg_delay_ms']} ms per fragmented packet)")
+        logger.info(f"Throughput: {s['pps_capacity']} pps capacity, {s['pps_wall']} pps wall, "
+                    f"CPU {s['cpu_s']} s")
+        stages = ", ".join(f"{k} {v} ns" for k, v in s["stage_ns_per_packet"].items())
+        logger.info(f"Per packet: {stages}")
+        logger.info("=" * 50)
+
+
+class ShadowBackend(BackendWrapper):
+    """
+    Обёртка над бэкендом: отправка — no-op со счётчиком
+
+    Если внутренний хэндл не только наблюдает (NFQUEUE), исходный пакет
+    пропускается сразу, а конвейер получает его копию.
+    """
+
+    def __init__(self, inner: DivertBackend, report: ShadowReport):
+        super().__init__(inner)
+        self.report = report
+        self.forward_original = not inner.sniff_only
+
+    @property
+    def sniff_only(self) -> bool:
+        return True
+
+    def open(self):
+        self.inner.open()
+        self.report.start()
+
+    def close(self):
+        self.report.stop()
+        self.inner.close()
+
+    def recv(self):
+        started = time.perf_counter_ns()
+        packet = self.inner.recv()
+        self.report.stage_ns["recv"] += time.perf_counter_ns() - started
+        if packet is None:
+            return None
+        self.report.packets += 1
+        self.report.bytes += len(packet.raw)
+        if self.forward_original:
+            self.inner.send(packet)
+            packet = RawPacket(bytes(packet.raw), direction=packet.direction)
+        return packet
+
+    def send(self, packet):
+        self.report.sends += 1
+        return len(packet.raw)
+
+
+def attach(sniffer, fragmenter, report: ShadowReport):
+    """Включает замеры этапов и отключает реальные задержки фрагментатора"""
+    sniffer._classify = report.timed("classify", sniffer._classify)
+    if sniffer.on_packet is not None:
+        sniffer.on_packet = report.timed("decide", sniffer.on_packet)
+    sniffer._process_packet = report.timed("total", sniffer._process_packet)
+    fragmenter.sleep = report.add_delay
+    fragmenter.telemetry = report
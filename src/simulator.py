@@ -0,0 +1,312 @@
+"""
+Офлайн-симулятор стратегий фрагментации на виртуальном времени
+
+Захват pcap/pcapng прогоняется через настоящие сниффер, решение
+TelegramBypass.on_packet и SmartFragmenter. Время виртуальное: задержки
+между фрагментами и таймауты таблиц потоков двигают часы мгновенно,
+поэтому часы трафика проигрываются за секунды.
+
+Пакеты принимаются в момент захвата, но не раньше, чем сниффер закончил
+предыдущий (задержки фрагментатора копят очередь). Отправленные сегменты
+проходят простую модель канала: полоса (сериализация по очереди) и RTT.
+Рукопожатие потока считается завершённым, когда последний байт первого
+сегмента клиента ушёл в канал плюс RTT на ответ сервера.
+
+Запуск: python -m src.simulator capture.pcap --strategy split legacy --delay 0 10
+"""
+
+import argparse
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+from src.backend import PcapBackend
+from src.classifier import IPClassifier
+from src.config import TELEGRAM
+from src.flow_table import flow_key
+from src.fragmenter import SmartFragmenter
+from src.logger import logger
+from src.strategy import STRATEGIES, StrategyController
+
+# Режимы, кроме отдельных стратегий контроллера:
+#   static   — без контроллера, параметры по размеру пакета
+#   adaptive — контроллер со всеми стратегиями
+MODES = ("static", "adaptive") + STRATEGIES
+
+
+class VirtualClock:
+    """Виртуальные часы: sleep() двигает время без ожидания"""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            self.advance_to(self.now + seconds)
+
+    def advance_to(self, when: float):
+        """Двигает время вперёд (назад не ходит)"""
+        if when > self.now:
+            self.now = when
+
+
+class LinkModel:
+    """
+    Канал от клиента: полоса bandwidth_mbps и задержка rtt_ms туда-обратно
+
+    Сегменты сериализуются по очереди: следующий не уходит, пока не ушёл
+    предыдущий.
+    """
+
+    def __init__(self, rtt_ms: float = 50.0, bandwidth_mbps: float = 20.0):
+        self.rtt = rtt_ms / 1000.0
+        self.bytes_per_s = bandwidth_mbps * 1_000_000 / 8
+        self.busy_until = 0.0
+
+    def serialization(self, size: int) -> float:
+        return size / self.bytes_per_s
+
+    def transmit(self, size: int, now: float) -> float:
+        """Момент, когда последний байт пакета ушёл в канал"""
+        self.busy_until = max(self.busy_until, now) + self.serialization(size)
+        return self.busy_until
+
+
+@dataclass
+class _Flow:
+    start: float              # время захвата первого сегмента с данными
+    size: int                 # размер этого сегмента
+    end_seq: int              # seq после него
+    strategy: str = "passthrough"
+    segments: int = 0
+    done: Optional[float] = None
+
+
+class SimBackend(PcapBackend):
+    """Воспроизведение захвата на виртуальных часах через модель канала"""
+
+    def __init__(self, path, clock: VirtualClock, link: LinkModel, **kwargs):
+        super().__init__(path, **kwargs)
+        self.vclock = clock
+        self.link = link
+        self.flows: Dict[tuple, _Flow] = {}
+        self.received_packets = 0
+        self.received_bytes = 0
+        self.queue_delay_s = 0.0
+        self.max_queue_delay_s = 0.0
+
+    def clock(self) -> float:
+        return self.vclock.now
+
+    def recv(self):
+        packet = super().recv()
+        if packet is None:
+            return None
+        # Пока сниффер занят (задержки фрагментатора), пакет ждёт в очереди
+        waited = self.vclock.now - self.now
+        if waited > 0:
+            self.queue_delay_s += waited
+            self.max_queue_delay_s = max(self.max_queue_delay_s, waited)
+        self.vclock.advance_to(self.now)
+        self.received_packets += 1
+        self.received_bytes += len(packet.raw)
+
+        tcp = packet.tcp
+        if packet.is_outbound and tcp is not None:
+            key = flow_key(packet)
+            size = len(tcp.payload)
+            if size and key not in self.flows:
+                self.flows[key] = _Flow(self.now, size, (tcp.seq_num + size) & 0xFFFFFFFF)
+        return packet
+
+    def send(self, packet):
+        size = super().send(packet)
+        departed = self.link.transmit(size, self.vclock.now)
+        tcp = packet.tcp
+        if packet.is_outbound and tcp is not None:
+            flow = self.flows.get(flow_key(packet))
+            if flow is not None and flow.done is None:
+                payload = len(tcp.payload)
+                if payload:
+                    flow.segments += 1
+                    if (tcp.seq_num + payload) & 0xFFFFFFFF == flow.end_seq:
+                        flow.done = departed
+        return size
+
+
+def _percentile(values: Sequence[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))]
+
+
+class Simulator:
+    """
+    Один прогон захвата с заданными режимом, задержкой и каналом
+
+    Args:
+        mode: "static", "adaptive" или имя стратегии из STRATEGIES
+        delay_ms: inter_fragment_delay_ms (стратегия legacy)
+    """
+
+    def __init__(self, pcap: str,
+                 mode: str = "adaptive",
+                 delay_ms: float = 10.0,
+                 fragment_size: int = 1,
+                 rtt_ms: float = 50.0,
+                 bandwidth_mbps: float = 20.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: {mode} (expected one of {', '.join(MODES)})")
+        self.pcap = pcap
+        self.mode = mode
+        self.delay_ms = delay_ms
+        self.fragment_size = fragment_size
+        self.rtt_ms = rtt_ms
+        self.bandwidth_mbps = bandwidth_mbps
+        self.clock = VirtualClock()
+        self.link = LinkModel(rtt_ms, bandwidth_mbps)
+        self.backend: Optional[SimBackend] = None
+        self.app = None
+        self.wall_s = 0.0
+
+    def _build(self):
+        # Импорт здесь: src.main настраивает путь к WinDivert при импорте
+        from src.main import TelegramBypass
+        from src.rst_filter import RSTFilter
+        from src.sniffer import TrafficSniffer
+
+        clock = self.clock
+        app = TelegramBypass(fragment_size=self.fragment_size, delay_ms=self.delay_ms,
+                             adaptive=False, recorder=False)
+        if self.mode != "static":
+            strategies = STRATEGIES if self.mode == "adaptive" else (self.mode,)
+            app.controller = StrategyController(strategies=strategies, clock=clock)
+            # Прогон начинается с чистого листа, без кэша прошлых запусков
+            app.controller.ranges.clear()
+        app.fragmenter = SmartFragmenter(first_fragment_size=self.fragment_size,
+                                         inter_fragment_delay_ms=self.delay_ms,
+                                         controller=app.controller)
+        app.fragmenter.sleep = clock.sleep
+        app.fragmenter.telemetry = self
+        app.ip_classifier = IPClassifier.from_config(TELEGRAM)
+
+        self.backend = SimBackend(self.pcap, clock, self.link)
+        app.sniffer = TrafficSniffer(on_packet=app.on_packet, backend=self.backend,
+                                     ip_classifier=app.ip_classifier,
+                                     rst_filter=RSTFilter(on_fake_rst=app._on_fake_rst))
+        # Таймауты потоков — тоже по виртуальным часам
+        for table in (app.sniffer.flows, app.sniffer.rst_filter.flows,
+                      app.fragmenter._planned):
+            table.clock = clock
+        self.app = app
+
+    # === Интерфейс телеметрии фрагментатора ===
+
+    def on_fragmented(self, packet, strategy: str, seconds: float):
+        flow = self.backend.flows.get(flow_key(packet))
+        if flow is not None:
+            flow.strategy = strategy
+
+    def run(self) -> dict:
+        self._build()
+        started = time.perf_counter()
+        self.app.sniffer.start()
+        self.wall_s = time.perf_counter() - started
+        return self.report()
+
+    def report(self) -> dict:
+        backend = self.backend
+        rtt = self.link.rtt
+        by_strategy: Dict[str, dict] = {}
+        handshakes, added = [], []
+        for flow in backend.flows.values():
+            if flow.done is None:
+                continue
+            handshake = flow.done + rtt - flow.start
+            baseline = self.link.serialization(flow.size) + rtt
+            handshakes.append(handshake)
+            added.append(handshake - baseline)
+            entry = by_strategy.setdefault(flow.strategy,
+                                           {"flows": 0, "segments": 0, "handshake_ms": []})
+            entry["flows"] += 1
+            entry["segments"] += flow.segments
+            entry["handshake_ms"].append(handshake * 1000.0)
+
+        for entry in by_strategy.values():
+            times = entry.pop("handshake_ms")
+            entry["avg_handshake_ms"] = round(sum(times) / len(times), 3)
+            entry["p95_handshake_ms"] = round(_percentile(times, 95), 3)
+
+        simulated = backend.now - min((f.start for f in backend.flows.values()), default=backend.now)
+        fragmenter = self.app.fragmenter.get_stats()
+        return {
+            "mode": self.mode,
+            "delay_ms": self.delay_ms,
+            "rtt_ms": self.rtt_ms,
+            "bandwidth_mbps": self.bandwidth_mbps,
+            "flows": len(handshakes),
+            "handshake_ms": {
+                "avg": round(1000.0 * sum(handshakes) / len(handshakes), 3) if handshakes else 0.0,
+                "p50": round(1000.0 * _percentile(handshakes, 50), 3),
+                "p95": round(1000.0 * _percentile(handshakes, 95), 3),
+            },
+            "added_ms": {
+                "avg": round(1000.0 * sum(added) / len(added), 3) if added else 0.0,
+                "p95": round(1000.0 * _percentile(added, 95), 3),
+            },
+            "by_strategy": by_strategy,
+            "packets_diverted": backend.received_packets,
+            "bytes_diverted": backend.received_bytes,
+            "packets_sent": backend.sent_packets,
+            "bytes_sent": backend.sent_bytes,
+            "fragmented": fragmenter["fragmented"],
+            "queue_delay_ms": {
+                "total": round(backend.queue_delay_s * 1000.0, 3),
+                "max": round(backend.max_queue_delay_s * 1000.0, 3),
+            },
+            "simulated_s": round(simulated, 3),
+            "wall_s": round(self.wall_s, 3),
+        }
+
+
+def sweep(pcap: str, modes: Sequence[str], delays: Sequence[float], **kwargs) -> List[dict]:
+    """Прогоны по всем сочетаниям режима и задержки"""
+    results = []
+    for mode in modes:
+        # Задержка из -d влияет только на legacy (и на adaptive, дошедший до него)
+        for delay in (delays if mode in ("legacy", "adaptive") else delays[:1]):
+            results.append(Simulator(pcap, mode=mode, delay_ms=delay, **kwargs).run())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline fragmentation strategy simulator")
+    parser.add_argument("pcap", help="Захват pcap/pcapng")
+    parser.add_argument("--strategy", nargs="+", default=["adaptive"], choices=MODES,
+                        help="Режимы для сравнения")
+    parser.add_argument("--delay", nargs="+", type=float, default=[10.0],
+                        help="Значения inter_fragment_delay_ms")
+    parser.add_argument("-s", "--size", type=int, default=1, help="Размер первого фрагмента")
+    parser.add_argument("--rtt", type=float, default=50.0, help="RTT канала, мс")
+    parser.add_argument("--bandwidth", type=float, default=20.0, help="Полоса канала, Мбит/с")
+    args = parser.parse_args()
+
+    results = sweep(args.pcap, args.strategy, args.delay, fragment_size=args.size,
+                    rtt_ms=args.rtt, bandwidth_mbps=args.bandwidth)
+    print(f"{'mode':<14}{'delay':>7}{'flows':>7}{'hs avg':>10}{'hs p95':>10}"
+          f"{'added':>9}{'sent':>8}{'diverted':>12}{'sim s':>9}{'wall s':>8}")
+    for r in results:
+        print(f"{r['mode']:<14}{r['delay_ms']:>7g}{r['flows']:>7}"
+              f"{r['handshake_ms']['avg']:>10.2f}{r['handshake_ms']['p95']:>10.2f}"
+              f"{r['added_ms']['avg']:>9.2f}{r['packets_sent']:>8}{r['bytes_diverted']:>12}"
+              f"{r['simulated_s']:>9.1f}{r['wall_s']:>8.2f}")
+        for strategy, s in sorted(r["by_strategy"].items()):
+            logger.info(f"  {r['mode']}/{r['delay_ms']:g} {strategy}: {s}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,22 @@
 from src.logger import logger
 from .config import TELEGRAM, SNIFFER
 from src.rst_filter import RSTFilter
+from src.backend import WinDivertBackend, QueueTuner
 import sys
+import time
 import signal
 from typing import Callable, Optional
-import pydivert
 
-from .tls_parser import get_sni_from_payload, is_tls_client_hello
+from .classifier import DomainClassifier, FlowVerdict, HelloMemo, IPClassifier
+from .flow_table import FlowTable, flow_key
+from .lanes import LANE_BULK, LaneScheduler
+from .http_parser import get_host_from_payload, is_http_request
+from .mtproto_handler import MTProtoDetector
+from .analysis_tap import TAG_DNS, TAG_HELLO
+from .tls_parser import get_sni_from_payload, hello_fingerprint, is_tls_client_hello
+from .rules import RuleSet
+from .quic_filter import QUICFilter
+from .udp_stage import UDPStage
 
 
 class TrafficSniffer:
@@ -20,23 +30,89 @@ class TrafficSniffer:
     def __init__(self, 
                  port: int = 443,
                  on_packet: Optional[Callable] = None,
-                 on_error: Optional[Callable] = None):
+                 on_error: Optional[Callable] = None,
+                 backend=None,
+                 telemetry=None,
+                 dns_observer=None,
+                 domains: Optional[DomainClassifier] = None,
+                 rst_filter: Optional[RSTFilter] = None,
+                 ip_classifier: Optional[IPClassifier] = None,
+                 tap=None,
+                 on_started: Optional[Callable] = None,
+                 on_flow_reset: Optional[Callable[[tuple], None]] = None,
+                 handle_signals: bool = True,
+                 hello_memo: Optional[HelloMemo] = None,
+                 gc_monitor=None,
+                 udp_stage: Optional[UDPStage] = None,
+                 rules: Optional[RuleSet] = None,
+                 quic_filter: Optional[QUICFilter] = None,
+                 lanes: Optional[LaneScheduler] = None):
         self.port = port
         self.on_packet = on_packet
         self.on_error = on_error
+        # Вызывается, когда хэндл открыт и пакеты уже перехватываются
+        self.on_started = on_started
+        # Вызывается с ключом потока, когда его состояние сброшено (SYN, FIN, RST)
+        self.on_flow_reset = on_flow_reset
+        # Свой обработчик SIGINT с sys.exit — только для запуска из консоли
+        self.handle_signals = handle_signals
         self.running = False
+        self.backend = backend
         self.w = None
         
-        self.rst_filter = RSTFilter()
+        self.rst_filter = rst_filter or RSTFilter()
+        self.divert_rst = SNIFFER.DIVERT_RST
 
-        self.filter_str = SNIFFER.get_filter()
+        # Телеметрия задержек требует входящего направления
+        self.telemetry = telemetry
+        self.divert_inbound = SNIFFER.DIVERT_INBOUND or telemetry is not None
+        # Изучение адресов по DNS-ответам
+        self.dns_observer = dns_observer
+        # Доменные правила для SNI и IP-диапазоны
+        self.domains = domains or DomainClassifier()
+        self.ip_classifier = ip_classifier
+        # AnalysisTap: дорогой анализ — в отдельном процессе
+        self.tap = tap
+        # Отпечатки ClientHello: классификация без SNI или с SNI не из правил
+        if hello_memo is None and TELEGRAM.HELLO_MEMO:
+            hello_memo = HelloMemo()
+        self.hello_memo = hello_memo
+        # Паузы сборщика мусора (src.gc_tuning.GCMonitor) — в общую статистику
+        self.gc_monitor = gc_monitor
+        # UDP (звонки) перехватывается только при включённой UDP-стратегии
+        if udp_stage is None and SNIFFER.UDP_STRATEGY:
+            udp_stage = UDPStage(SNIFFER.UDP_STRATEGY)
+        self.udp_stage = udp_stage
+        # QUIC к адресам Telegram: отказ, чтобы клиент сразу ушёл на TCP
+        if quic_filter is None and SNIFFER.QUIC_FAST_FAIL:
+            quic_filter = QUICFilter(SNIFFER.QUIC_FAST_FAIL, ip_classifier)
+        self.quic_filter = quic_filter
+        # Правила политики из config.yaml: решение на поток поверх классификации
+        self.rules = rules
 
-        # Генерируем фильтр для TCP и UDP
-        tcp_filter = " or ".join([f"tcp.DstPort == {p}" for p in SNIFFER.TCP_PORTS])
-        udp_filter = " or ".join([f"udp.DstPort == {p}" for p in TELEGRAM.UDP_PORTS])
-        self.filter_str = f"({tcp_filter}) or ({udp_filter})"
+        # Вердикты классификации по потокам: детектирование только на первом payload
+        self.flows = FlowTable(max_flows=16384, idle_timeout=300.0)
+        # Вердикт потока текущего пакета (доступен из on_packet)
+        self.verdict: Optional[FlowVerdict] = None
+        # Полосы приоритета: рукопожатия — вперёд накопившейся закачки
+        if lanes is None and SNIFFER.LANES:
+            lanes = LaneScheduler(mode=SNIFFER.LANES)
+        if lanes is not None:
+            lanes.flows = self.flows
+        self.lanes = lanes
+        # Пачка пересылаемых как есть пакетов (bulk-полоса), иначе None
+        self._outbox: Optional[list] = None
+
+        self.filter_str = self._build_filter()
         
-        logger.info(f"Filter: TCP[{len(SNIFFER.TCP_PORTS)} ports] + UDP[{len(SNIFFER.UDP_PORTS)} ports]")
+        if self.udp_stage is not None:
+            logger.info(f"Filter: TCP[{len(SNIFFER.TCP_PORTS)} ports] + "
+                        f"UDP[{len(self.udp_stage.ports)} ports, strategy {self.udp_stage.strategy}]")
+        else:
+            logger.info(f"Filter: TCP[{len(SNIFFER.TCP_PORTS)} ports], UDP not diverted")
+        if self.quic_filter is not None:
+            logger.info(f"QUIC to Telegram ranges: {self.quic_filter.action} "
+                        f"(ports {', '.join(map(str, self.quic_filter.ports))})")
         
         self.stats = {
             "total": 0,
@@ -44,7 +120,9 @@ class TrafficSniffer:
             "telegram": 0,
             "errors": 0
         }
-        
+
+        self.queue_tuner = QueueTuner() if SNIFFER.QUEUE_ADAPTIVE else None
+
     def start(self):
         """Запускает сниффер"""
         logger.info(f"Starting sniffer on port {self.port}...")
@@ -54,14 +132,31 @@ class TrafficSniffer:
         self.running = True
         
         # Сохраняем старый обработчик и устанавливаем новый
-        self._old_signal_handler = signal.signal(signal.SIGINT, self._signal_handler)
+        if self.handle_signals:
+            self._old_signal_handler = signal.signal(signal.SIGINT, self._signal_handler)
 
         try:
-            with pydivert.WinDivert(self.filter_str) as self.w:
+            self.w = self.backend if self.backend is not None else self._create_backend()
+            with self.w:
+                if self.on_started is not None:
+                    self.on_started()
+                if self.lanes is not None and self.w.read_ahead:
+                    self._run_lanes()
+                    return
+                if self.lanes is not None:
+                    logger.warning("Lanes: backend cannot read ahead, packets go in arrival order")
+                done = self.w.done
                 for packet in self.w:
                     if not self.running:
                         break
+                    if self.queue_tuner is None:
+                        self._process_packet(packet)
+                        done(packet)
+                        continue
+                    started = time.perf_counter()
                     self._process_packet(packet)
+                    done(packet)
+                    self._tune_queue(packet, time.perf_counter() - started)
 
         except Exception as e:
             logger.error(f"Sniffer error: {e}")
@@ -71,44 +166,167 @@ class TrafficSniffer:
             if hasattr(self, '_old_signal_handler'):
                 signal.signal(signal.SIGINT, self._old_signal_handler)
             
+    def _run_lanes(self):
+        """Обработка по полосам: вычитать ждущее в очереди, затем пачку по приоритету"""
+        w, lanes = self.w, self.lanes
+        logger.info(f"Lanes: {lanes.mode}, bulk batch {lanes.bulk_batch}")
+        process, done = self._process_packet, w.done
+        try:
+            while self.running:
+                if not len(lanes):
+                    # Полосы пусты — можно ждать драйвер
+                    packet = w.recv()
+                    if packet is None:
+                        break
+                    lanes.put(packet)
+                while not lanes.full() and w.ready():
+                    lanes.put(w.recv())
+                lane, batch = lanes.take()
+                if lane != LANE_BULK:
+                    for packet in batch:
+                        process(packet)
+                        done(packet)
+                    continue
+                self._outbox = []
+                try:
+                    for packet in batch:
+                        process(packet)
+                finally:
+                    outbox, self._outbox = self._outbox, None
+                    if outbox:
+                        w.send_batch(outbox)
+                    # Вердикты — после того, как пачка действительно отправлена
+                    for packet in batch:
+                        done(packet)
+        finally:
+            # Прочитанные, но не обработанные пакеты уходят как есть
+            rest = lanes.drain()
+            w.send_batch(rest)
+            for packet in rest:
+                done(packet)
+
+    def _build_filter(self) -> str:
+        """Генерирует фильтр WinDivert для TCP, UDP-стадий и (опционально) входящих"""
+        tcp_filter = " or ".join([f"tcp.DstPort == {p}" for p in SNIFFER.TCP_PORTS])
+        clauses = [f"({tcp_filter})"]
+        if self.udp_stage is not None:
+            clauses.append(self.udp_stage.filter_clause())
+        if self.quic_filter is not None:
+            clauses.append(f"(outbound and {self.quic_filter.filter_clause()})")
+
+        # Входящие: только управляющие пакеты и начало TLS-записей сервера,
+        # не весь входящий поток
+        inbound = []
+        if self.divert_rst:
+            inbound += ["tcp.Rst", "(tcp.Syn and tcp.Ack)"]
+        if self.divert_inbound:
+            inbound += ["tcp.Syn", "(tcp.PayloadLength > 0 and tcp.Payload[0] == 0x16)"]
+        if inbound:
+            src_ports = " or ".join([f"tcp.SrcPort == {p}" for p in SNIFFER.TCP_PORTS])
+            clauses.append(
+                f"(inbound and ({src_ports}) and ({' or '.join(dict.fromkeys(inbound))}))"
+            )
+        if self.dns_observer is not None:
+            clauses.append("(inbound and udp.SrcPort == 53)")
+        return " or ".join(clauses)
+
+    def _create_backend(self, sniff: bool = False):
+        """
+        Создаёт бэкенд перехвата (WinDivert или NFQUEUE) с параметрами очереди из конфига
+
+        Args:
+            sniff: хэндл только для наблюдения (WinDivert SNIFF), для теневого режима
+        """
+        backend = SNIFFER.BACKEND
+        if backend == "auto":
+            backend = "nfqueue" if sys.platform.startswith("linux") else "windivert"
+        if backend == "nfqueue":
+            from .nfqueue_backend import NFQueueBackend, iptables_rules
+            logger.info("NFQUEUE: трафик направляется в очередь правилами iptables:")
+            udp, quic = self.udp_stage, self.quic_filter
+            for rule in iptables_rules(SNIFFER.NFQUEUE_NUM, SNIFFER.NFQUEUE_MARK,
+                                       udp_ports=udp.ports if udp is not None else None,
+                                       udp_first_packets=udp.first_packets if udp is not None else 0,
+                                       quic_ports=quic.ports if quic is not None else None,
+                                       quic_cidrs=quic.cidrs() if quic is not None else None):
+                logger.info(f"  {rule}")
+            return NFQueueBackend(
+                queue_num=SNIFFER.NFQUEUE_NUM,
+                mark=SNIFFER.NFQUEUE_MARK,
+                queue_length=SNIFFER.QUEUE_LENGTH,
+                queue_time=SNIFFER.QUEUE_TIME,
+                queue_size=SNIFFER.QUEUE_SIZE,
+            )
+        return WinDivertBackend(
+            self.filter_str,
+            flags=WinDivertBackend.FLAG_SNIFF if sniff else 0,
+            queue_length=SNIFFER.QUEUE_LENGTH,
+            queue_time=SNIFFER.QUEUE_TIME,
+            queue_size=SNIFFER.QUEUE_SIZE,
+        )
+
+    def _tune_queue(self, packet, processing_s: float):
+        """Передаёт наблюдения в QueueTuner и применяет новые параметры"""
+        params = self.queue_tuner.observe(
+            self.w.pending(), processing_s, len(packet.raw), self.w.drops
+        )
+        if params:
+            self.w.set_queue_params(*params)
+
     def stop(self):
         """Останавливает сниффер"""
         self.running = False
         logger.info("Stopping sniffer...")
         
-    def _process_packet(self, packet: pydivert.Packet):
+    def _process_packet(self, packet: "pydivert.Packet"):
         """Обрабатывает перехваченный пакет"""
         try:
             self.stats["total"] += 1
+            if self.tap is not None and not self.stats["total"] & 0xFF:
+                self._drain_tap()
             
             # === ОБРАБОТКА TCP ===
-            if hasattr(packet, 'tcp'):
-                # Блокируем фейковые RST
-                if self.rst_filter.should_drop(packet):
+            if packet.tcp is not None:
+                if packet.is_inbound:
+                    self._process_inbound(packet)
                     return
-                
+
                 # Обрабатываем TCP payload
                 payload = None
                 try:
                     payload = packet.tcp.payload
                 except:
                     pass
-                    
+
+                if self.telemetry is not None:
+                    self.telemetry.on_outbound(packet, payload)
+
+                tcp = packet.tcp
+                if tcp.syn or ((tcp.fin or tcp.rst) and not payload):
+                    # Порт клиента может достаться новому соединению с тем же сервером
+                    self._reset_flow(flow_key(packet))
+
                 if not payload:
                     self._forward(packet)
                     return
                     
-                # Анализируем TLS
-                sni = None
-                is_telegram = False
-                
-                if len(payload) > 5 and payload[0] == 0x16:
-                    self.stats["tls"] = self.stats.get("tls", 0) + 1
-                    sni = get_sni_from_payload(payload)
-                    
-                    if sni and "telegram" in sni.lower():
-                        is_telegram = True
-                        self.stats["telegram"] = self.stats.get("telegram", 0) + 1
+                # Классифицируем поток по первому payload, дальше — из кэша
+                key = flow_key(packet)
+                verdict = self.flows.get(key)
+                if verdict is None:
+                    verdict = self._classify(packet, payload)
+                    self.flows.put(key, verdict)
+                    first = True
+                else:
+                    # Повтор ClientHello обрабатываем как первый сегмент
+                    first = verdict.protocol == "tls" and is_tls_client_hello(payload)
+                self.verdict = verdict
+
+                if first and self.tap is not None and verdict.protocol == "tls":
+                    self.tap.offer(packet, TAG_HELLO)
+
+                sni = verdict.sni if first else None
+                is_telegram = verdict.is_telegram if first else False
                         
                 # Вызываем callback
                 should_forward = True
@@ -126,19 +344,27 @@ class TrafficSniffer:
                     self._forward(packet)
             
             # === ОБРАБОТКА UDP (звонки) ===
-            elif hasattr(packet, 'udp'):
+            elif packet.udp is not None:
+                if packet.is_inbound:
+                    # Входящие перехватываются только для DNS-ответов
+                    if self.tap is not None and self.tap.handles_dns:
+                        self.tap.offer(packet, TAG_DNS)
+                    elif self.dns_observer is not None:
+                        self.dns_observer.on_packet(packet)
+                    self._forward(packet)
+                    return
+
                 self.stats["udp"] = self.stats.get("udp", 0) + 1
-                
-                # Пока просто пропускаем UDP пакеты
-                # Потом добавим фрагментацию UDP
-                try:
-                    payload = packet.udp.payload
-                    if payload:
-                        logger.debug(f"UDP packet: {packet.dst_addr}:{packet.udp.dst_port} ({len(payload)} bytes)")
-                except:
-                    pass
-                
-                self._forward(packet)
+                quic = self.quic_filter
+                if quic is not None and quic.matches(packet):
+                    if quic.process(packet, self.w):
+                        self._forward(packet)
+                    return
+                stage = self.udp_stage
+                if stage is None or stage.process(packet, self.w):
+                    self._forward(packet)
+                if stage is not None and stage.refilter_due():
+                    self._refilter()
             
             # === ДРУГИЕ ПРОТОКОЛЫ ===
             else:
@@ -155,21 +381,116 @@ class TrafficSniffer:
                 except:
                     pass
 
-    def _process_udp(self, packet: pydivert.Packet):
-        """Обрабатывает UDP пакеты (VoIP)"""
+    def _classify(self, packet: "pydivert.Packet", payload: bytes) -> FlowVerdict:
+        """Классифицирует первый payload потока: TLS/SNI, HTTP/Host, MTProto, IP"""
+        verdict = FlowVerdict()
+
+        if len(payload) > 5 and payload[0] == 0x16:
+            self.stats["tls"] = self.stats.get("tls", 0) + 1
+            verdict.protocol = "tls"
+            verdict.sni = get_sni_from_payload(payload)
+            if verdict.sni and self.domains.matches(verdict.sni):
+                verdict.is_telegram = True
+        elif is_http_request(payload):
+            # Host вместо SNI для HTTP (порты 80/8080)
+            self.stats["http"] = self.stats.get("http", 0) + 1
+            verdict.protocol = "http"
+            verdict.sni = get_host_from_payload(payload)
+            if verdict.sni and self.domains.matches(verdict.sni):
+                verdict.is_telegram = True
+        else:
+            transport = MTProtoDetector.detect(payload)
+            # Однобайтовый abridged и obfuscated2 отличимы от шума только
+            # по адресу назначения
+            if transport is not None and (
+                    transport not in ("abridged", "obfuscated2") or self._is_telegram_ip(packet)):
+                self.stats["mtproto"] = self.stats.get("mtproto", 0) + 1
+                verdict.protocol = f"mtproto_{transport}"
+                verdict.is_telegram = True
+
+        if not verdict.is_telegram and self._is_telegram_ip(packet):
+            verdict.is_telegram = True
+        if verdict.protocol == "tls" and self.hello_memo is not None:
+            self._classify_hello(payload, verdict)
+        if self.rules is not None:
+            rule = self.rules.match(packet.dst_addr, packet.dst_port, verdict.sni, verdict.protocol)
+            if rule is not None:
+                verdict.rule = rule
+                verdict.is_telegram = rule.action == "fragment"
+        if verdict.is_telegram:
+            self.stats["telegram"] = self.stats.get("telegram", 0) + 1
+        return verdict
+
+    def _reset_flow(self, key: tuple):
+        self.flows.pop(key)
+        if self.on_flow_reset is not None:
+            self.on_flow_reset(key)
+
+    def _classify_hello(self, payload: bytes, verdict: FlowVerdict):
+        """Сверяет форму ClientHello с памятью отпечатков и учит её"""
+        fingerprint = hello_fingerprint(payload)
+        if fingerprint is None:
+            return
+        verdict.fingerprint = fingerprint
+        if verdict.is_telegram:
+            self.hello_memo.vote(fingerprint, True)
+            return
+        if verdict.sni:
+            # Чужой домен с той же формой — голос против (решение можно отменить)
+            self.hello_memo.vote(fingerprint, False)
+            return
+        known = self.hello_memo.lookup(fingerprint)
+        if known is not None and known[0]:
+            # ECH, IP-литерал или нет SNI: узнаём клиента по форме
+            verdict.is_telegram = True
+            verdict.strategy = known[1]
+            self.stats["fingerprint"] = self.stats.get("fingerprint", 0) + 1
+
+    def _drain_tap(self):
+        """Применяет результаты анализатора (дешёвая часть — в потоке захвата)"""
+        for result in self.tap.poll_results():
+            kind = result[0]
+            if kind == "dns" and self.dns_observer is not None:
+                self.dns_observer.apply(result[1], result[2])
+            elif kind == "hello":
+                logger.debug(f"[tap] {result[1]} SNI={result[2]} "
+                             f"ciphers={result[3]} extensions={result[4]}")
+            elif kind == "error":
+                logger.debug(f"[tap] analyzer error: {result[1]}: {result[2]}")
+
+    def _is_telegram_ip(self, packet: "pydivert.Packet") -> bool:
+        return self.ip_classifier is not None and self.ip_classifier.contains(packet.dst_addr)
+
+    def _process_inbound(self, packet: "pydivert.Packet"):
+        """Обрабатывает входящий TCP-пакет (только наблюдение)"""
+        self.stats["inbound"] = self.stats.get("inbound", 0) + 1
+
+        # Блокируем фейковые RST
+        if self.rst_filter.should_drop(packet):
+            return
+
+        if self.telemetry is not None:
+            self.telemetry.on_inbound(packet, packet.tcp.payload)
+        self._forward(packet)
+
+    def _refilter(self):
+        """Сужает фильтр перехвата: выгруженные UDP-потоки идут мимо процесса"""
+        filter_str = self._build_filter()
         try:
-            # Пока просто пропускаем все UDP пакеты
-            # Потом добавим фрагментацию
-            self.stats["udp"] = self.stats.get("udp", 0) + 1
-            self._forward(packet)
-        except Exception as e:
-            logger.debug(f"UDP processing error: {e}")
-            self._forward(packet)
-                    
-    def _forward(self, packet: pydivert.Packet):
+            self.w.set_filter(filter_str)
+        except OSError as e:
+            logger.warning(f"UDP: filter update rejected, keeping the old one: {e}")
+            return
+        self.filter_str = filter_str
+        logger.debug(f"UDP: {len(self.udp_stage.offloaded)} flows offloaded, filter updated")
+
+    def _forward(self, packet: "pydivert.Packet"):
         """Пропускает пакет дальше"""
         if self.w:
-            self.w.send(packet)
+            if self._outbox is not None:
+                self._outbox.append(packet)
+            else:
+                self.w.send(packet)
             
     def _signal_handler(self, signum, frame):
         """Обработчик сигнала завершения"""
@@ -188,8 +509,38 @@ class TrafficSniffer:
         logger.info(f"TLS packets: {self.stats['tls']}")
         logger.info(f"Telegram: {self.stats['telegram']}")
         logger.info(f"Errors: {self.stats['errors']}")
+        logger.info(f"Blocked fake RST: {self.rst_filter.blocked_rst_count}")
+        if self.w is not None:
+            q = self.w.get_queue_stats()
+            logger.info(f"Queue: length={q['queue_length']} time={q['queue_time']}ms "
+                        f"size={q['queue_size']} drops={q['queue_drops']}")
         logger.info("=" * 50)
         
     def get_stats(self) -> dict:
         """Возвращает копию статистики"""
-        return self.stats.copy()
\ No newline at end of file
+        stats = self.stats.copy()
+        if self.w is not None:
+            stats.update(self.w.get_queue_stats())
+        if self.telemetry is not None:
+            stats["latency"] = self.telemetry.get_stats()
+        if self.dns_observer is not None:
+            stats["dns"] = self.dns_observer.get_stats()
+        stats["rst"] = self.rst_filter.get_stats()
+        if self.tap is not None:
+            stats["tap"] = self.tap.get_stats()
+        if self.hello_memo is not None:
+            stats["hello_memo"] = self.hello_memo.get_stats()
+        if self.gc_monitor is not None:
+            stats["gc"] = self.gc_monitor.get_stats()
+        if self.udp_stage is not None:
+            stats["udp_stage"] = self.udp_stage.get_stats()
+        if self.rules is not None:
+            stats["rules"] = self.rules.get_stats()
+        if self.quic_filter is not None:
+            stats["quic"] = self.quic_filter.get_stats()
+        if self.lanes is not None:
+            stats["lanes"] = self.lanes.get_stats()
+        if self.queue_tuner is not None:
+            stats["queue_peak_backlog"] = self.queue_tuner.peak_backlog
+            stats["queue_adjustments"] = self.queue_tuner.adjustments
+        return stats
\ No newline at end of file
@@ -0,0 +1,324 @@
+"""
+Режим без драйвера: локальный SOCKS5 и HTTP CONNECT прокси
+
+Клиенты Telegram умеют SOCKS5 сами: трафик приходит в прокси потоком
+байтов — без WinDivert, прав администратора и перехвата пакетов, в том
+числе на Linux. Для потоков Telegram первые байты клиента уходят к
+серверу кусками по тому же плану, что и во фрагментаторе (разрез по SNI
+из tls_parser, разрезы MTProto, правила из config.yaml): на сокете
+TCP_NODELAY, после каждого куска drain(), при необходимости — пауза.
+Пока буфер отправки пуст, write() сразу делает send(), и каждый кусок
+уходит отдельным сегментом. Дальше — перекачка большими блоками.
+
+Запуск: python -m src.main --socks 1080
+"""
+
+import asyncio
+import ipaddress
+import socket
+import struct
+from pathlib import Path
+from typing import Optional, Tuple
+
+from src.classifier import DomainClassifier, IPClassifier
+from src.config import FRAGMENTATION, PROXY, SNIFFER, TELEGRAM
+from src.http_parser import get_host_from_payload, is_http_request
+from src.logger import logger
+from src.mtproto_handler import MTProtoDetector, MTProtoFragmenter
+from src.rules import RuleSet, load_rules
+from src.strategy import FragmentPlan, build_plan
+from src.tls_parser import get_sni_from_payload, is_tls_client_hello
+
+# Коды ответа SOCKS5 (RFC 1928)
+REP_SUCCEEDED = 0x00
+REP_FAILURE = 0x01
+REP_HOST_UNREACHABLE = 0x04
+REP_CONNECTION_REFUSED = 0x05
+REP_COMMAND_NOT_SUPPORTED = 0x07
+REP_ADDRESS_NOT_SUPPORTED = 0x08
+
+
+class ProxyError(Exception):
+    """Ошибка рукопожатия клиента (ответ клиенту уже отправлен)"""
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+class SocksProxy:
+    """
+    asyncio-сервер SOCKS5 (CONNECT, без аутентификации) и HTTP CONNECT
+
+    Потоком Telegram считается совпавшее правило с действием "fragment",
+    имя из SNI/Host или из запроса по доменным правилам, адрес сервера
+    из диапазонов Telegram или MTProto в первых байтах.
+    """
+
+    def __init__(self,
+                 host: str = PROXY.HOST,
+                 port: int = PROXY.PORT,
+                 ip_classifier: Optional[IPClassifier] = None,
+                 domains: Optional[DomainClassifier] = None,
+                 rules: Optional[RuleSet] = None,
+                 strategy: str = PROXY.STRATEGY,
+                 delay_ms: float = PROXY.SPLIT_DELAY_MS,
+                 first_data_timeout: float = PROXY.FIRST_DATA_TIMEOUT_S,
+                 relay_buffer: int = PROXY.RELAY_BUFFER):
+        self.host = host
+        self.port = port
+        self.ip_classifier = ip_classifier
+        self.domains = domains or DomainClassifier()
+        self.rules = rules
+        self.strategy = strategy
+        self.delay_ms = delay_ms
+        self.first_data_timeout = first_data_timeout
+        self.relay_buffer = relay_buffer
+        self.mtproto = MTProtoFragmenter(None)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers = set()
+        self.stats = {
+            "connections": 0, "active": 0, "peak_active": 0,
+            "socks5": 0, "http": 0, "telegram": 0, "split": 0, "pieces": 0,
+            "bytes_up": 0, "bytes_down": 0, "errors": 0,
+        }
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port,
+            backlog=PROXY.BACKLOG, limit=self.relay_buffer)
+        # port=0: порт выбирает система
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Proxy: SOCKS5 / HTTP CONNECT on {self.host}:{self.port}")
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def stop(self):
+        """Закрывает сервер и все соединения"""
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    # === Соединение ===
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats["connections"] += 1
+        self.stats["active"] += 1
+        if self.stats["active"] > self.stats["peak_active"]:
+            self.stats["peak_active"] = self.stats["active"]
+        self._writers.add(writer)
+        upstream: Optional[asyncio.StreamWriter] = None
+        try:
+            first = await asyncio.wait_for(reader.readexactly(1), PROXY.HANDSHAKE_TIMEOUT_S)
+            if first[0] == 5:
+                host, port = await asyncio.wait_for(self._socks5_request(reader, writer),
+                                                    PROXY.HANDSHAKE_TIMEOUT_S)
+                socks = True
+            else:
+                host, port = await asyncio.wait_for(self._http_request(first, reader, writer),
+                                                    PROXY.HANDSHAKE_TIMEOUT_S)
+                socks = False
+            self.stats["socks5" if socks else "http"] += 1
+
+            try:
+                up_reader, upstream = await asyncio.wait_for(
+                    asyncio.open_connection(host, port, limit=self.relay_buffer),
+                    PROXY.CONNECT_TIMEOUT_S)
+            except (OSError, asyncio.TimeoutError) as e:
+                code = REP_CONNECTION_REFUSED if isinstance(e, ConnectionRefusedError) \
+                    else REP_HOST_UNREACHABLE
+                self._reply(writer, socks, code)
+                raise ProxyError(f"connect {host}:{port}: {e!r}") from None
+            self._writers.add(upstream)
+            upstream.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            upstream.transport.set_write_buffer_limits(high=self.relay_buffer)
+            self._reply(writer, socks, REP_SUCCEEDED, upstream.get_extra_info("sockname"))
+
+            # Первые байты клиента: по ним решается, резать ли поток
+            try:
+                data = await asyncio.wait_for(reader.read(self.relay_buffer),
+                                              self.first_data_timeout)
+            except asyncio.TimeoutError:
+                data = b""
+            if data:
+                peer = upstream.get_extra_info("peername")[0]
+                await self._send_first(upstream, data, self._plan(host, peer, port, data))
+                self.stats["bytes_up"] += len(data)
+            elif reader.at_eof():
+                upstream.write_eof()
+
+            await self._relay(reader, writer, up_reader, upstream)
+        except Exception as e:
+            # Рукопожатие, подключение, обрыв — соединение закрывается, сервер живёт
+            self.stats["errors"] += 1
+            logger.debug(f"Proxy: {e!r}")
+        finally:
+            self.stats["active"] -= 1
+            for w in (upstream, writer):
+                if w is not None:
+                    self._writers.discard(w)
+                    w.close()
+
+    async def _socks5_request(self, reader, writer) -> Tuple[str, int]:
+        """Выбор метода и запрос CONNECT (версия уже прочитана)"""
+        methods = await reader.readexactly((await reader.readexactly(1))[0])
+        if 0 not in methods:
+            writer.write(b"\x05\xff")
+            raise ProxyError("SOCKS5: no acceptable auth method")
+        writer.write(b"\x05\x00")
+        _, command, _, atyp = await reader.readexactly(4)
+        if atyp == 1:
+            host = socket.inet_ntoa(await reader.readexactly(4))
+        elif atyp == 3:
+            host = (await reader.readexactly((await reader.readexactly(1))[0])).decode("ascii", "replace")
+        elif atyp == 4:
+            host = socket.inet_ntop(socket.AF_INET6, await reader.readexactly(16))
+        else:
+            self._reply(writer, True, REP_ADDRESS_NOT_SUPPORTED)
+            raise ProxyError(f"SOCKS5: address type {atyp}")
+        port = struct.unpack("!H", await reader.readexactly(2))[0]
+        if command != 1:
+            self._reply(writer, True, REP_COMMAND_NOT_SUPPORTED)
+            raise ProxyError(f"SOCKS5: command {command}")
+        return host, port
+
+    async def _http_request(self, first: bytes, reader, writer) -> Tuple[str, int]:
+        """CONNECT host:port HTTP/1.1 (первый байт уже прочитан)"""
+        head = first + await reader.readuntil(b"\r\n\r\n")
+        parts = head.split(b"\r\n", 1)[0].decode("latin-1").split()
+        if len(parts) != 3 or parts[0].upper() != "CONNECT":
+            writer.write(b"HTTP/1.1 405 Method Not Allowed\r\nConnection: close\r\n\r\n")
+            raise ProxyError(f"HTTP: {' '.join(parts[:2])}")
+        host, _, port = parts[1].rpartition(":")
+        if not host or not port.isdigit():
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nConnection: close\r\n\r\n")
+            raise ProxyError(f"HTTP: bad target {parts[1]}")
+        return host.strip("[]"), int(port)
+
+    def _reply(self, writer, socks: bool, code: int, bound: Optional[tuple] = None):
+        if not socks:
+            status = b"200 Connection Established" if code == REP_SUCCEEDED else b"502 Bad Gateway"
+            writer.write(b"HTTP/1.1 " + status + b"\r\n\r\n")
+            return
+        addr, port = (bound[0], bound[1]) if bound else ("0.0.0.0", 0)
+        if ":" in addr:
+            packed = b"\x04" + socket.inet_pton(socket.AF_INET6, addr)
+        else:
+            packed = b"\x01" + socket.inet_aton(addr)
+        writer.write(bytes((5, code, 0)) + packed + struct.pack("!H", port))
+
+    # === Решение и отправка ===
+
+    def _plan(self, host: str, peer: str, port: int, data: bytes) -> Optional[FragmentPlan]:
+        """План разбиения первых байтов или None, если поток не трогаем"""
+        protocol = transport = name = None
+        if is_tls_client_hello(data):
+            protocol = "tls"
+            name = get_sni_from_payload(data)
+        elif is_http_request(data):
+            protocol = "http"
+            name = get_host_from_payload(data)
+        else:
+            transport = MTProtoDetector.detect(data)
+            if transport is not None and (transport != "obfuscated2" or self._is_telegram_ip(peer)):
+                protocol = f"mtproto_{transport}"
+        if name is None and not _is_ip(host):
+            name = host
+
+        rule = self.rules.match(peer, port, name, protocol) if self.rules is not None else None
+        if rule is not None:
+            if rule.action == "pass":
+                return None
+        elif not (protocol and protocol.startswith("mtproto_") or
+                  self.domains.matches(name) or self._is_telegram_ip(peer)):
+            return None
+        self.stats["telegram"] += 1
+
+        if rule is not None and rule.strategy is not None:
+            plan = rule.build_plan(data, delay_ms=self.delay_ms)
+        elif protocol is not None and protocol.startswith("mtproto_"):
+            plan = self.mtproto.plan(transport, data)
+        else:
+            plan = build_plan(self.strategy, data, delay_ms=self.delay_ms,
+                              small_delay_ms=self.delay_ms or FRAGMENTATION.SMALL_DELAY_MS)
+        return plan if plan is not None and plan.offsets else None
+
+    def _is_telegram_ip(self, addr: str) -> bool:
+        return self.ip_classifier is not None and self.ip_classifier.contains(addr)
+
+    async def _send_first(self, writer: asyncio.StreamWriter, data: bytes,
+                          plan: Optional[FragmentPlan]):
+        if plan is None:
+            writer.write(data)
+            await writer.drain()
+            return
+        self.stats["split"] += 1
+        delay = (plan.delay_ms or self.delay_ms) / 1000.0
+        bounds = (0,) + plan.offsets + (len(data),)
+        view = memoryview(data)
+        last = len(bounds) - 2
+        for i in range(last + 1):
+            writer.write(view[bounds[i]:bounds[i + 1]])
+            await writer.drain()
+            self.stats["pieces"] += 1
+            if i != last and delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _relay(self, reader, writer, up_reader, upstream):
+        """Перекачка в обе стороны до закрытия; ошибка одной стороны рвёт обе"""
+        tasks = [asyncio.ensure_future(self._pipe(reader, upstream, "bytes_up")),
+                 asyncio.ensure_future(self._pipe(up_reader, writer, "bytes_down"))]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+
+    async def _pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                    counter: str):
+        size = self.relay_buffer
+        stats = self.stats
+        while True:
+            data = await reader.read(size)
+            if not data:
+                break
+            stats[counter] += len(data)
+            writer.write(data)
+            await writer.drain()
+        # Полузакрытие: сторона закончила передачу, обратное направление ещё живо
+        if writer.can_write_eof() and not writer.is_closing():
+            writer.write_eof()
+
+    def get_stats(self) -> dict:
+        return self.stats.copy()
+
+
+def serve(host: str = PROXY.HOST, port: int = PROXY.PORT) -> SocksProxy:
+    """Запускает прокси до Ctrl+C (классификаторы — из кэша правил и config.yaml)"""
+    proxy = SocksProxy(host, port,
+                       ip_classifier=IPClassifier.from_config_cached(
+                           Path(SNIFFER.RULES_CACHE_FILE), TELEGRAM),
+                       rules=load_rules(SNIFFER.RULES_FILE))
+
+    async def main():
+        await proxy.start()
+        try:
+            await proxy.serve_forever()
+        finally:
+            await proxy.stop()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    logger.info(f"Proxy stats: {proxy.get_stats()}")
+    return proxy
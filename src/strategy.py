@@ -0,0 +1,304 @@
+"""
+Самонастройка стратегии фрагментации по диапазонам назначения
+
+Для каждого диапазона (/24 для IPv4, /48 для IPv6) пробуем стратегии
+от самой дешёвой к самой дорогой и останавливаемся на первой, с которой
+рукопожатия проходят. Результаты сохраняются в data/ для тёплого старта.
+"""
+
+import ipaddress
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from src.config import FRAGMENTATION
+from src.flow_table import FlowTable
+from src.http_parser import find_host_header
+from src.logger import logger
+from src.tls_parser import find_sni_offset
+
+
+# От дешёвой к дорогой:
+#   split        — один разрез внутри SNI (или Host для HTTP), без задержки
+#   header_split — разрез после заголовка TLS-записи (внутри "Host:")
+#                  и внутри имени, без задержки
+#   split_delay  — один разрез внутри SNI с небольшой задержкой
+#   legacy       — исходное поведение (-s/-d из командной строки)
+STRATEGIES = ("split", "header_split", "split_delay", "legacy")
+
+
+@dataclass
+class FragmentPlan:
+    """План разбиения payload на TCP-сегменты"""
+    strategy: str
+    offsets: Tuple[int, ...]
+    delay_ms: float = 0.0
+
+    @property
+    def added_delay_ms(self) -> float:
+        return self.delay_ms * len(self.offsets)
+
+
+def destination_range(addr: str) -> str:
+    """Диапазон назначения, по которому копится статистика"""
+    if ":" in addr:
+        return str(ipaddress.ip_network(f"{addr}/48", strict=False))
+    return addr.rsplit(".", 1)[0] + ".0/24"
+
+
+def _normalize(offsets, size: int) -> Tuple[int, ...]:
+    return tuple(sorted({o for o in offsets if 0 < o < size}))
+
+
+def build_plan(strategy: str,
+               payload: bytes,
+               first_fragment_size: int = FRAGMENTATION.DEFAULT_SIZE,
+               delay_ms: float = FRAGMENTATION.DEFAULT_DELAY_MS,
+               small_delay_ms: float = FRAGMENTATION.SMALL_DELAY_MS) -> FragmentPlan:
+    """Строит план для стратегии по содержимому первого сегмента"""
+    size = len(payload)
+    if strategy == "legacy":
+        return FragmentPlan(strategy, _normalize((first_fragment_size,), size), delay_ms)
+
+    # Имя хоста: SNI для TLS или Host для HTTP
+    header_cut = 1
+    name = find_sni_offset(payload)
+    if name:
+        header_cut = 5      # после заголовка TLS-записи
+    else:
+        host = find_host_header(payload)
+        if host:
+            name = host[1:]
+            header_cut = host[0] + 2    # внутри "Host:"
+    if name:
+        cut = name[0] + max(1, name[1] // 2)
+    else:
+        cut = first_fragment_size
+
+    if strategy == "header_split":
+        return FragmentPlan(strategy, _normalize((header_cut, cut), size))
+    if strategy == "split_delay":
+        return FragmentPlan(strategy, _normalize((cut,), size), small_delay_ms)
+    return FragmentPlan(strategy, _normalize((cut,), size))
+
+
+def _seq_after(a: int, b: int) -> bool:
+    """a > b в арифметике последовательностей TCP"""
+    return 0 < ((a - b) & 0xFFFFFFFF) < 0x80000000
+
+
+@dataclass
+class _Pending:
+    range_key: str
+    strategy: str
+    seq: int
+    ack: int
+
+
+class StrategyController:
+    """
+    Выбирает стратегию по диапазону назначения и учится на исходах
+
+    Исход рукопожатия определяется пассивно по исходящим пакетам потока:
+      - клиент подтвердил данные сервера (ack вырос) — успех
+      - повтор первого сегмента, RST или FIN до ответа, таймаут — неудача
+    """
+
+    FAILS_TO_ESCALATE = 2     # неудач подряд до перехода к более дорогой стратегии
+    PROBE_AFTER = 50          # успехов подряд до пробы более дешёвой
+    OUTCOME_TIMEOUT_S = 5.0
+    SAVE_INTERVAL_S = 30.0
+
+    def __init__(self,
+                 cache_file: Optional[str] = None,
+                 strategies: Tuple[str, ...] = STRATEGIES,
+                 clock: Callable[[], float] = time.monotonic,
+                 persist: bool = True):
+        self.cache_file = Path(cache_file or FRAGMENTATION.STRATEGY_CACHE_FILE)
+        # False — кэш только читается (теневой режим: исходы не отражают сеть)
+        self.persist = persist
+        self.strategies = strategies
+        self.clock = clock
+        self.ranges: Dict[str, dict] = {}
+        self.pending = FlowTable(max_flows=4096,
+                                 idle_timeout=self.OUTCOME_TIMEOUT_S,
+                                 clock=clock)
+        self.stats = {
+            "successes": 0,
+            "failures": 0,
+            "escalations": 0,
+            "probes": 0,
+        }
+        self._dirty = False
+        self._last_save = clock()
+        self.load()
+
+    # === Выбор стратегии ===
+
+    def _state(self, range_key: str) -> dict:
+        state = self.ranges.get(range_key)
+        if state is None:
+            state = {"index": 0, "fail_streak": 0, "ok_streak": 0,
+                     "probing": False, "results": {}}
+            self.ranges[range_key] = state
+        return state
+
+    def choose(self, dst_addr: str, hint: Optional[str] = None) -> str:
+        """
+        Стратегия для нового рукопожатия к dst_addr
+
+        hint — стратегия, с которой начать незнакомый диапазон
+        (например, из памяти отпечатков ClientHello)
+        """
+        self.expire()
+        range_key = destination_range(dst_addr)
+        if hint in self.strategies and range_key not in self.ranges:
+            self._state(range_key)["index"] = self.strategies.index(hint)
+        state = self._state(range_key)
+        index = state["index"]
+        if index > 0 and state["ok_streak"] >= self.PROBE_AFTER and not state["probing"]:
+            # Периодически проверяем, не хватит ли более дешёвой стратегии
+            state["probing"] = True
+            state["ok_streak"] = 0
+            self.stats["probes"] += 1
+            return self.strategies[index - 1]
+        return self.strategies[index]
+
+    def strategy_for(self, dst_addr: str) -> str:
+        """Текущая стратегия диапазона (без проб)"""
+        state = self.ranges.get(destination_range(dst_addr))
+        return self.strategies[state["index"] if state else 0]
+
+    # === Наблюдение исходов ===
+
+    def on_handshake_sent(self, key: tuple, dst_addr: str, strategy: str,
+                          seq: int, ack: int):
+        """Запоминает отправленный по стратегии первый сегмент потока"""
+        self.pending.put(key, _Pending(destination_range(dst_addr), strategy, seq, ack))
+
+    def observe_outbound(self, key: tuple, tcp, payload_len: int) -> Optional[bool]:
+        """
+        Проверяет исходящий пакет потока, ожидающего исхода
+
+        Returns:
+            True/False, если исход определён, иначе None
+        """
+        # Просроченные — неудачи, а не молча пропавшие записи
+        self.expire()
+        pending = self.pending.get(key)
+        if pending is None:
+            return None
+        if tcp.rst or tcp.fin:
+            success = False
+        elif _seq_after(tcp.ack_num, pending.ack):
+            success = True
+        elif payload_len and tcp.seq_num == pending.seq:
+            success = False   # ретрансмит первого сегмента
+        else:
+            return None
+        self.pending.pop(key)
+        self._record(pending, success)
+        return success
+
+    def record_outcome(self, key: tuple, success: bool) -> bool:
+        """Внешний сигнал об исходе (ответ сервера, RST). True если поток ждал исхода"""
+        pending = self.pending.pop(key)
+        if pending is None:
+            return False
+        self._record(pending, success)
+        return True
+
+    def expire(self):
+        """Потоки без исхода дольше OUTCOME_TIMEOUT_S считаются неудачными"""
+        if len(self.pending):
+            self.pending.expire(on_expire=lambda key, p: self._record(p, False))
+
+    def _record(self, pending: _Pending, success: bool):
+        state = self._state(pending.range_key)
+        results = state["results"].setdefault(pending.strategy, [0, 0])
+        index = self.strategies.index(pending.strategy)
+
+        if success:
+            results[0] += 1
+            self.stats["successes"] += 1
+            if index < state["index"]:
+                # Проба удалась — переходим на более дешёвую стратегию
+                state["index"] = index
+                state["probing"] = False
+                logger.info(f"Strategy {pending.range_key}: -> {pending.strategy}")
+            if index == state["index"]:
+                state["ok_streak"] += 1
+                state["fail_streak"] = 0
+        else:
+            results[1] += 1
+            self.stats["failures"] += 1
+            if index < state["index"]:
+                state["probing"] = False
+            elif index == state["index"]:
+                state["fail_streak"] += 1
+                state["ok_streak"] = 0
+                if (state["fail_streak"] >= self.FAILS_TO_ESCALATE and
+                        index < len(self.strategies) - 1):
+                    state["index"] = index + 1
+                    state["fail_streak"] = 0
+                    self.stats["escalations"] += 1
+                    logger.info(f"Strategy {pending.range_key}: "
+                                f"-> {self.strategies[index + 1]}")
+
+        self._dirty = True
+        self.save()
+
+    # === Сохранение ===
+
+    def load(self):
+        """Загружает результаты прошлых запусков"""
+        if not self.cache_file.exists():
+            return
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for range_key, saved in data.get("ranges", {}).items():
+                if saved.get("strategy") not in self.strategies:
+                    continue
+                state = self._state(range_key)
+                state["index"] = self.strategies.index(saved["strategy"])
+                state["results"] = {k: list(v) for k, v in saved.get("results", {}).items()}
+            logger.debug(f"Strategy cache: {len(self.ranges)} ranges")
+        except Exception as e:
+            logger.error(f"Ошибка загрузки кэша стратегий: {e}")
+
+    def save(self, force: bool = False):
+        """Сохраняет результаты (не чаще SAVE_INTERVAL_S, если не force)"""
+        if not self._dirty or not self.persist:
+            return
+        now = self.clock()
+        if not force and now - self._last_save < self.SAVE_INTERVAL_S:
+            return
+        data = {
+            "ranges": {
+                range_key: {
+                    "strategy": self.strategies[state["index"]],
+                    "results": state["results"],
+                }
+                for range_key, state in self.ranges.items()
+            }
+        }
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_file.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, self.cache_file)
+            self._dirty = False
+            self._last_save = now
+        except Exception as e:
+            logger.error(f"Ошибка сохранения кэша стратегий: {e}")
+
+    def get_stats(self) -> dict:
+        stats = self.stats.copy()
+        stats["ranges"] = len(self.ranges)
+        stats["pending"] = len(self.pending)
+        return stats
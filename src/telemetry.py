@@ -0,0 +1,148 @@
+"""
+Пассивная телеметрия задержек рукопожатия
+
+Измеряет по каждому потоку SYN -> SYN/ACK, ClientHello -> ServerHello и время,
+проведённое в нашем фрагментаторе. Результаты агрегируются в компактные
+гистограммы по диапазонам назначения и по стратегиям.
+"""
+
+import time
+from array import array
+from typing import Callable, Dict, Optional, Tuple
+
+from src.flow_table import FlowTable, flow_key
+from src.strategy import destination_range
+
+
+class LatencyHistogram:
+    """
+    Логарифмическая гистограмма задержек (корзины по степеням двойки в мкс)
+
+    Фиксированный размер: BUCKETS счётчиков, независимо от числа замеров.
+    """
+
+    BUCKETS = 24  # 1 мкс .. ~8 с
+
+    __slots__ = ("counts", "count", "total_us")
+
+    def __init__(self):
+        self.counts = array("I", bytes(4 * self.BUCKETS))
+        self.count = 0
+        self.total_us = 0
+
+    def add(self, seconds: float):
+        us = int(seconds * 1_000_000)
+        if us < 0:
+            return
+        self.counts[min(us.bit_length(), self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total_us += us
+
+    def percentile(self, p: float) -> float:
+        """Верхняя граница корзины p-го перцентиля, мс"""
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return (1 << bucket) / 1000.0
+        return (1 << (self.BUCKETS - 1)) / 1000.0
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_us / self.count / 1000.0, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+        }
+
+
+class HandshakeTelemetry:
+    """
+    Сбор задержек рукопожатия по потокам
+
+    Исходящие пакеты дают время SYN и ClientHello, входящие (если сниффер
+    перехватывает обратное направление) — SYN/ACK и ServerHello.
+    """
+
+    METRICS = ("syn_rtt", "hello_rtt", "fragmenter")
+    OTHER = "other"
+
+    def __init__(self,
+                 max_flows: int = 4096,
+                 max_prefixes: int = 256,
+                 clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.max_prefixes = max_prefixes
+        # flow -> [время SYN, время ClientHello, стратегия]
+        self.flows = FlowTable(max_flows=max_flows, idle_timeout=30.0, clock=clock)
+        self.by_prefix: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self.by_strategy: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._prefixes = set()
+
+    def _add(self, dst_addr: str, strategy: Optional[str], metric: str, seconds: float):
+        prefix = destination_range(dst_addr)
+        if prefix not in self._prefixes:
+            if len(self._prefixes) >= self.max_prefixes:
+                prefix = self.OTHER
+            else:
+                self._prefixes.add(prefix)
+        hist = self.by_prefix.get((prefix, metric))
+        if hist is None:
+            hist = self.by_prefix[(prefix, metric)] = LatencyHistogram()
+        hist.add(seconds)
+
+        strategy = strategy or "none"
+        hist = self.by_strategy.get((strategy, metric))
+        if hist is None:
+            hist = self.by_strategy[(strategy, metric)] = LatencyHistogram()
+        hist.add(seconds)
+
+    def on_outbound(self, packet, payload: bytes):
+        """Исходящий TCP-пакет: SYN или первый ClientHello потока"""
+        tcp = packet.tcp
+        if tcp.syn and not tcp.ack:
+            self.flows.put(flow_key(packet), [self.clock(), None, None])
+        elif payload and payload[0] == 0x16:
+            state = self.flows.get(flow_key(packet))
+            if state is not None and state[1] is None:
+                state[1] = self.clock()
+
+    def on_inbound(self, packet, payload: bytes):
+        """Входящий TCP-пакет: SYN/ACK или ServerHello"""
+        tcp = packet.tcp
+        if tcp.syn and tcp.ack:
+            state = self.flows.get(flow_key(packet))
+            if state is not None and state[0] is not None:
+                self._add(packet.src_addr, None, "syn_rtt", self.clock() - state[0])
+                state[0] = None
+        elif payload and payload[0] == 0x16:
+            key = flow_key(packet)
+            state = self.flows.get(key)
+            if state is not None and state[1] is not None:
+                self._add(packet.src_addr, state[2], "hello_rtt", self.clock() - state[1])
+                self.flows.pop(key)
+
+    def on_fragmented(self, packet, strategy: str, seconds: float):
+        """Время, проведённое во фрагментаторе (включая задержки между фрагментами)"""
+        key = flow_key(packet)
+        state = self.flows.get(key)
+        if state is not None:
+            state[2] = strategy
+        self._add(packet.dst_addr, strategy, "fragmenter", seconds)
+
+    def get_stats(self) -> dict:
+        """Сводка гистограмм: {"by_prefix": {...}, "by_strategy": {...}}"""
+        def group(hists):
+            out = {}
+            for (scope, metric), hist in hists.items():
+                out.setdefault(scope, {})[metric] = hist.summary()
+            return out
+        return {
+            "by_prefix": group(self.by_prefix),
+            "by_strategy": group(self.by_strategy),
+            "tracked_flows": len(self.flows),
+        }
@@ -3,9 +3,10 @@
 RFC 8446 - TLS 1.3
 """
 
+import hashlib
 import struct
 from dataclasses import dataclass
-from typing import Optional, List, Tuple
+from typing import Dict, Optional, List, Tuple
 
 
 @dataclass
@@ -177,4 +178,132 @@ def get_sni_from_payload(payload: bytes) -> Optional[str]:
         hello = parser.parse()
         return hello.sni if hello else None
     except TLSParserError:
-        return None
\ No newline at end of file
+        return None
+
+
+def find_sni_offset(payload: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Находит положение имени хоста SNI внутри payload без разбора ClientHello
+
+    Returns:
+        (смещение начала имени, длина имени) или None
+    """
+    if not is_tls_client_hello(payload):
+        return None
+    n = len(payload)
+    try:
+        # record(5) + handshake header(4) + version(2) + random(32)
+        pos = 43
+        pos += 1 + payload[pos]                                  # session_id
+        pos += 2 + ((payload[pos] << 8) | payload[pos + 1])      # cipher_suites
+        pos += 1 + payload[pos]                                  # compression
+        ext_end = pos + 2 + ((payload[pos] << 8) | payload[pos + 1])
+        pos += 2
+        ext_end = min(ext_end, n)
+        while pos + 4 <= ext_end:
+            ext_type = (payload[pos] << 8) | payload[pos + 1]
+            ext_len = (payload[pos + 2] << 8) | payload[pos + 3]
+            if ext_type == ClientHelloParser.EXT_SERVER_NAME:
+                # list_len(2) + name_type(1) + name_len(2)
+                name_len = (payload[pos + 7] << 8) | payload[pos + 8]
+                start = pos + 9
+                if payload[pos + 6] != 0x00 or start + name_len > n:
+                    return None
+                return (start, name_len)
+            pos += 4 + ext_len
+    except IndexError:
+        pass
+    return None
+
+
+_TLS_VERSIONS = {0x0304: "13", 0x0303: "12", 0x0302: "11", 0x0301: "10"}
+_GREASE = frozenset(0x0A0A + 0x1010 * i for i in range(16))
+_EXT_ALPN = 0x0010
+_EXT_SIGNATURE_ALGORITHMS = 0x000D
+_EXT_SUPPORTED_VERSIONS = 0x002B
+
+# Форма ClientHello -> строка отпечатка: повторные формы не форматируются и не хэшируются
+_FINGERPRINTS: Dict[tuple, str] = {}
+_FINGERPRINTS_MAX = 1024
+
+
+def _hash12(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:12] if text else "000000000000"
+
+
+def _format_fingerprint(shape: tuple) -> str:
+    version, sni, ciphers, extensions, alpn, sig_algs = shape
+    prefix = (f"t{_TLS_VERSIONS.get(version, '00')}{'d' if sni else 'i'}"
+              f"{min(len(ciphers), 99):02d}{min(len(extensions), 99):02d}{alpn}")
+    cipher_text = ",".join(f"{c:04x}" for c in ciphers)
+    ext_text = ",".join(f"{e:04x}" for e in extensions
+                        if e != ClientHelloParser.EXT_SERVER_NAME and e != _EXT_ALPN)
+    if sig_algs:
+        hexed = sig_algs.hex()
+        ext_text += "_" + ",".join(hexed[i:i + 4] for i in range(0, len(hexed), 4))
+    return f"{prefix}_{_hash12(cipher_text)}_{_hash12(ext_text)}"
+
+
+def hello_fingerprint(payload: bytes) -> Optional[str]:
+    """
+    Отпечаток формы ClientHello в духе JA4 прямо по байтам payload
+
+    "t13d1516h2_<шифры>_<расширения>": версия, есть ли SNI, число шифров
+    и расширений, ALPN и хэши отсортированных наборов. GREASE и порядок
+    расширений не влияют — отпечаток одинаков у всех рукопожатий клиента.
+
+    Returns:
+        Строка отпечатка или None (не ClientHello или расширения обрезаны)
+    """
+    if not is_tls_client_hello(payload):
+        return None
+    n = len(payload)
+    try:
+        version = (payload[9] << 8) | payload[10]
+        pos = 43
+        pos += 1 + payload[pos]                                  # session_id
+        count = ((payload[pos] << 8) | payload[pos + 1]) // 2
+        ciphers = tuple(sorted(c for c in struct.unpack_from(f"!{count}H", payload, pos + 2)
+                               if c not in _GREASE))
+        pos += 2 + 2 * count
+        pos += 1 + payload[pos]                                  # compression
+        ext_end = pos + 2 + ((payload[pos] << 8) | payload[pos + 1])
+        if ext_end > n:
+            # Остаток ClientHello во втором сегменте — набор расширений неполон
+            return None
+        pos += 2
+        extensions = []
+        sni = False
+        alpn = "00"
+        sig_algs = b""
+        while pos + 4 <= ext_end:
+            ext_type = (payload[pos] << 8) | payload[pos + 1]
+            data = pos + 4
+            pos = data + ((payload[pos + 2] << 8) | payload[pos + 3])
+            if ext_type in _GREASE:
+                continue
+            extensions.append(ext_type)
+            if ext_type == ClientHelloParser.EXT_SERVER_NAME:
+                sni = True
+            elif ext_type == _EXT_ALPN and pos - data > 3:
+                first = payload[data + 3:data + 3 + payload[data + 2]]
+                if first:
+                    alpn = chr(first[0]) + chr(first[-1])
+            elif ext_type == _EXT_SIGNATURE_ALGORITHMS:
+                sig_algs = bytes(payload[data + 2:pos])
+            elif ext_type == _EXT_SUPPORTED_VERSIONS:
+                for i in range(data + 1, pos, 2):
+                    value = (payload[i] << 8) | payload[i + 1]
+                    if value in _TLS_VERSIONS and value > version:
+                        version = value
+    except (IndexError, struct.error):
+        return None
+
+    extensions.sort()
+    shape = (version, sni, ciphers, tuple(extensions), alpn, sig_algs)
+    fingerprint = _FINGERPRINTS.get(shape)
+    if fingerprint is None:
+        if len(_FINGERPRINTS) >= _FINGERPRINTS_MAX:
+            _FINGERPRINTS.clear()
+        fingerprint = _FINGERPRINTS[shape] = _format_fingerprint(shape)
+    return fingerprint
@@ -0,0 +1,126 @@
+"""
+Обработка UDP (звонки): отдельная подключаемая стадия
+
+По умолчанию UDP не перехватывается совсем: медиа звонка (50 пакетов/с
+на поток) идёт мимо процесса и не получает добавочной задержки и
+дрожания от пересылки через Python. Стадия включается UDP-стратегией
+(SNIFFER.UDP_STRATEGY) и видит только первые UDP_FIRST_PACKETS пакетов
+каждого потока — этого хватает на STUN/рукопожатие. Дальше поток
+выгружается:
+
+- WinDivert: поток исключается из фильтра, хэндл открывается заново
+  (не чаще UDP_REFILTER_INTERVAL_S);
+- NFQUEUE: правило iptables с connbytes, ядро само пропускает остальное.
+"""
+
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from src.config import SNIFFER, TELEGRAM
+from src.flow_table import FlowTable, flow_key
+
+# Стратегия: (packet, w) -> True, если пакет обработан (отправлен или
+# отброшен) и пересылать его как есть не нужно
+UDP_STRATEGIES: Dict[str, Callable] = {}
+
+
+def register_udp_strategy(name: str):
+    """Декоратор: регистрирует UDP-стратегию под именем name"""
+    def decorator(func: Callable) -> Callable:
+        UDP_STRATEGIES[name] = func
+        return func
+    return decorator
+
+
+@register_udp_strategy("observe")
+def observe(packet, w) -> bool:
+    """Только наблюдение: пакет уходит без изменений"""
+    return False
+
+
+class UDPStage:
+    """
+    Первые пакеты UDP-потоков — в стратегию, потом поток выгружается
+
+    Выгруженные потоки хранятся в ограниченной LRU-таблице: вытесненный
+    поток снова попадёт в перехват и через несколько пакетов вернётся в неё.
+    """
+
+    # Исключение потока — три сравнения в фильтре WinDivert, а весь фильтр
+    # (с TCP-портами, входящими и QUIC) не длиннее 256 инструкций
+    MAX_EXCLUDED = 32
+
+    def __init__(self,
+                 strategy: str = "observe",
+                 ports: Optional[Iterable[int]] = None,
+                 first_packets: int = SNIFFER.UDP_FIRST_PACKETS,
+                 max_offloaded: int = SNIFFER.UDP_MAX_OFFLOADED,
+                 refilter_interval: float = SNIFFER.UDP_REFILTER_INTERVAL_S,
+                 clock: Callable[[], float] = time.monotonic):
+        if strategy not in UDP_STRATEGIES:
+            raise ValueError(f"Unknown UDP strategy: {strategy} "
+                             f"(available: {', '.join(sorted(UDP_STRATEGIES))})")
+        self.strategy = strategy
+        self.handler = UDP_STRATEGIES[strategy]
+        self.ports = tuple(ports or TELEGRAM.UDP_PORTS)
+        self._ports = frozenset(self.ports)
+        self.first_packets = first_packets
+        self.refilter_interval = refilter_interval
+        self.clock = clock
+        # Счётчик пакетов на поток, пока поток ещё перехватывается
+        self.flows = FlowTable(max_flows=4096, idle_timeout=120.0, clock=clock)
+        # Выгруженные потоки: исключения в фильтре перехвата
+        self.offloaded = FlowTable(max_flows=min(max_offloaded, self.MAX_EXCLUDED),
+                                   idle_timeout=float("inf"), clock=clock)
+        self._dirty = False
+        self._last_refilter = float("-inf")
+        self.stats = {"packets": 0, "handled": 0, "offloaded": 0, "refilters": 0}
+
+    def process(self, packet, w) -> bool:
+        """Обрабатывает исходящий UDP-пакет. Returns: True — переслать как есть"""
+        self.stats["packets"] += 1
+        key = flow_key(packet)
+        count = self.flows.get(key, 0) + 1
+        if count >= self.first_packets:
+            self.flows.pop(key)
+            self.offloaded.put(key, True)
+            self.stats["offloaded"] += 1
+            self._dirty = True
+        else:
+            self.flows.put(key, count)
+        if self.handler(packet, w):
+            self.stats["handled"] += 1
+            return False
+        return True
+
+    def matches(self, packet) -> bool:
+        """Попадает ли исходящий UDP-пакет под filter_clause()"""
+        return packet.dst_port in self._ports and flow_key(packet) not in self.offloaded
+
+    def filter_clause(self) -> str:
+        """Условие WinDivert для UDP: порты звонков без выгруженных потоков"""
+        ports = " or ".join(f"udp.DstPort == {p}" for p in self.ports)
+        excluded = []
+        for addr, dst_port, src_port in (key for key, _ in self.offloaded.items()):
+            field = "ipv6.DstAddr" if ":" in addr else "ip.DstAddr"
+            excluded.append(f"({field} == {addr} and udp.DstPort == {dst_port} "
+                            f"and udp.SrcPort == {src_port})")
+        if not excluded:
+            return f"({ports})"
+        return f"(({ports}) and not ({' or '.join(excluded)}))"
+
+    def refilter_due(self) -> bool:
+        """Пора ли обновить фильтр: есть новые выгруженные потоки и прошёл интервал"""
+        if not self._dirty:
+            return False
+        now = self.clock()
+        if now - self._last_refilter < self.refilter_interval:
+            return False
+        self._dirty = False
+        self._last_refilter = now
+        self.stats["refilters"] += 1
+        return True
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, strategy=self.strategy, tracked=len(self.flows),
+                    offloaded_now=len(self.offloaded))
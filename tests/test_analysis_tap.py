@@ -0,0 +1,66 @@
+"""
+Тесты отвода пакетов на анализ через кольцо в shared memory
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.analysis_tap import AnalysisTap, ShmRing, TAG_DNS
+from src.backend import FakeBackend
+from src.classifier import IPClassifier
+from src.dns_observer import DNSObserver
+from src.packet import build_tcp_packet, build_udp_packet, Direction
+from src.pcap import read_packets
+from src.sniffer import TrafficSniffer
+from tests.test_dns_observer import dns_response
+from tests.test_strategy import client_hello
+
+
+def test_ring_drops_when_full_and_truncates():
+    ring = ShmRing(slots=4, slot_size=64)
+    try:
+        pushed = [ring.push(bytes([i]) * (10 + i), ts=float(i), tag=TAG_DNS) for i in range(6)]
+        assert pushed == [True, True, True, True, False, False]
+        assert ring.dropped == 2 and len(ring) == 4
+
+        reader = ShmRing(name=ring.name)
+        ts, orig_len, direction, tag, data = reader.pop()
+        assert (ts, orig_len, tag, data) == (0.0, 10, TAG_DNS, b"\x00" * 10)
+        # Освободился слот — писатель снова может писать; длинное обрезается
+        assert ring.push(b"x" * 100)
+        items = [reader.pop() for _ in range(4)]
+        assert reader.pop() is None
+        assert items[-1][1] == 100 and len(items[-1][4]) == ring.capacity
+        reader.close()
+    finally:
+        ring.close()
+
+
+def test_sniffer_offloads_hello_and_dns(tmp_path):
+    hello = build_tcp_packet("10.0.0.1", "203.0.113.5", 50000, 443,
+                             payload=client_hello("web.telegram.org"))
+    response = build_udp_packet("8.8.8.8", "10.0.0.1", 53, 50001,
+                                payload=dns_response("web.telegram.org",
+                                                     [("149.154.167.99", 300)]),
+                                direction=Direction.INBOUND)
+    ips = IPClassifier()
+    observer = DNSObserver(ips)
+    tap = AnalysisTap(pcap_path=str(tmp_path / "tap.pcap"))
+    tap.start()
+    backend = FakeBackend([hello, response])
+    sniffer = TrafficSniffer(backend=backend, dns_observer=observer, tap=tap)
+    sniffer.start()
+
+    # Поток захвата не разбирал DNS сам
+    assert observer.stats["responses"] == 0
+    assert len(backend.sent) == 2
+
+    results = tap.stop()
+    kinds = {r[0]: r for r in results}
+    assert kinds["hello"][1:3] == ("203.0.113.5", "web.telegram.org")
+    assert kinds["dns"][1] == "web.telegram.org"
+    observer.apply(*kinds["dns"][1:])
+    assert "149.154.167.99" in ips
+    assert tap.stats["dropped"] == 0 and tap.stats["consumed"] == 2
+    assert len(list(read_packets(tmp_path / "tap.pcap"))) == 2
@@ -0,0 +1,149 @@
+"""
+Тесты FakeBackend и адаптивной очереди
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from src import backend as backend_module
+from src.backend import FakeBackend, QueueTuner, WinDivertBackend
+from src.config import SNIFFER
+from src.packet import build_tcp_packet, Direction, RawPacket, TCP_ACK, TCP_PSH
+from src.sniffer import TrafficSniffer
+
+
+def _burst(n, payload=b"x" * 100):
+    return [build_tcp_packet("10.0.0.1", "149.154.167.50", 40000 + i, 443,
+                             payload=payload, flags=TCP_ACK | TCP_PSH)
+            for i in range(n)]
+
+
+def test_raw_packet_roundtrip():
+    packet = build_tcp_packet("10.0.0.1", "149.154.167.50", 40000, 443,
+                              payload=b"hello", seq=1000)
+    copy = RawPacket(bytes(packet.raw))
+    assert copy.dst_addr == "149.154.167.50"
+    assert copy.tcp.dst_port == 443
+    assert copy.tcp.seq_num == 1000
+    assert copy.tcp.payload == b"hello"
+    assert copy.udp is None
+
+    # Смена payload должна обновить длину и чексуммы
+    cksum = copy.tcp.cksum
+    copy.tcp.payload = b"he"
+    copy.recalculate_checksums()
+    assert copy.ipv4.packet_len == len(copy.raw)
+    assert copy.tcp.cksum != cksum
+
+
+class _FakePydivert:
+    """pydivert без драйвера: фильтр с "bad" драйвер не принимает"""
+
+    class Param:
+        QUEUE_LEN, QUEUE_TIME, QUEUE_SIZE = range(3)
+
+    Direction = Direction
+
+    class Packet:
+        def __init__(self, raw, interface, direction):
+            self.raw, self.interface, self.direction = raw, interface, direction
+
+    class WinDivert:
+        def __init__(self, filter_str, flags=0):
+            self.filter_str = filter_str
+            self.is_open = False
+            self.params = {}
+
+        def open(self):
+            if "bad" in self.filter_str:
+                raise OSError(87, "invalid filter")
+            self.is_open = True
+
+        def close(self):
+            self.is_open = False
+
+        def set_param(self, param, value):
+            self.params[param] = value
+
+
+def test_windivert_set_filter_swaps_only_on_success(monkeypatch):
+    monkeypatch.setattr(backend_module, "pydivert", _FakePydivert)
+    monkeypatch.setattr(backend_module, "_load_pydivert", lambda: _FakePydivert)
+    backend = WinDivertBackend("tcp.DstPort == 443", queue_length=1024)
+    backend.open()
+    first = backend._handle
+
+    with pytest.raises(OSError):
+        backend.set_filter("bad")
+    assert backend._handle is first and first.is_open
+    assert backend.filter_str == "tcp.DstPort == 443"
+
+    backend.set_filter("tcp.DstPort == 443 or udp.DstPort == 10000")
+    assert backend._handle is not first and not first.is_open
+    assert backend._handle.params[_FakePydivert.Param.QUEUE_LEN] == 1024
+    assert backend.filter_str.endswith("udp.DstPort == 10000")
+    backend.close()
+
+
+def test_windivert_reply_keeps_interface(monkeypatch):
+    monkeypatch.setattr(backend_module, "pydivert", _FakePydivert)
+    packet = _FakePydivert.Packet(b"", (7, 1), Direction.OUTBOUND)
+    reply = WinDivertBackend("true").reply(packet, b"\x45")
+    assert (reply.raw, reply.interface, reply.direction) == (b"\x45", (7, 1), Direction.INBOUND)
+
+
+def test_fake_backend_bounded_queue():
+    backend = FakeBackend(bursts=[_burst(100)], queue_length=32)
+    with backend:
+        received = list(backend)
+    assert len(received) == 32
+    assert backend.drops == 68
+
+
+def test_queue_tuner_raises_on_drops():
+    tuner = QueueTuner(length=32, time_ms=100, size=1 << 20,
+                       max_length=1024, max_time=1000, max_size=1 << 22)
+    params = tuner.observe(backlog=31, processing_s=0.0001,
+                           packet_len=140, drops=68)
+    assert params is not None
+    length, time_ms, size = params
+    assert 64 <= length <= 1024
+    assert 100 <= time_ms <= 1000
+    # Нет новых потерь и мелкая очередь — параметры не трогаем
+    assert tuner.observe(backlog=0, processing_s=0.0001,
+                         packet_len=140, drops=68) is None
+
+
+def test_queue_tuner_respects_bounds():
+    tuner = QueueTuner(length=32, time_ms=100, size=1 << 20,
+                       max_length=64, max_time=200, max_size=1 << 21)
+    for drops in range(1, 10):
+        tuner.observe(backlog=5000, processing_s=0.01,
+                      packet_len=1500, drops=drops)
+    assert tuner.length == 64
+    assert tuner.time_ms == 200
+    assert tuner.size <= 1 << 21
+
+
+def test_queue_tuner_reads_config_at_construction(monkeypatch):
+    monkeypatch.setattr(SNIFFER, "QUEUE_LENGTH", 2048)
+    monkeypatch.setattr(SNIFFER, "QUEUE_LENGTH_MAX", 4096)
+    tuner = QueueTuner(time_ms=500)
+    assert (tuner.length, tuner.max_length, tuner.time_ms) == (2048, 4096, 500)
+
+
+def test_sniffer_adapts_queue():
+    backend = FakeBackend(bursts=[_burst(100)] * 3, queue_length=32)
+    sniffer = TrafficSniffer(backend=backend)
+    sniffer.queue_tuner = QueueTuner(length=32)
+    sniffer.start()
+
+    stats = sniffer.get_stats()
+    # Очередь растёт 32 -> 64 -> 128, третий всплеск проходит без потерь
+    assert stats["queue_drops"] == 68 + 36
+    assert stats["queue_length"] >= 128
+    assert stats["total"] == 32 + 64 + 100
+    assert len(backend.sent) == stats["total"]
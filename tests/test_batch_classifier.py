@@ -0,0 +1,81 @@
+"""
+Тесты пакетной классификации
+"""
+
+import sys
+import os
+from array import array
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from benchmarks import bench_batch_classifier
+from src.batch_classifier import (
+    BatchClassifier,
+    FLAG_PORT, FLAG_TELEGRAM_IP, FLAG_TLS, FLAG_HTTP, FLAG_PAYLOAD,
+)
+from src.classifier import IPClassifier
+from src.packet import build_tcp_packet, build_udp_packet
+
+
+def _buffers():
+    return [
+        bytes(build_tcp_packet("10.0.0.1", "149.154.167.51", 40000, 443,
+                               payload=b"\x16\x03\x01\x00\x10\x01").raw),
+        bytes(build_tcp_packet("10.0.0.1", "8.8.8.8", 40001, 80,
+                               payload=b"GET / HTTP/1.1\r\n").raw),
+        bytes(build_tcp_packet("10.0.0.1", "149.154.167.51", 40002, 5222).raw),
+        bytes(build_udp_packet("10.0.0.1", "149.154.167.51", 40003, 443, payload=b"x").raw),
+        bytes(build_tcp_packet("fd00::1", "2001:67c:4e8::a", 40004, 443,
+                               payload=b"\x16\x03\x01").raw),
+        bytes(build_tcp_packet("10.0.0.1", "203.0.113.7", 40005, 443, payload=b"\x17").raw),
+    ]
+
+
+EXPECTED = [
+    FLAG_PORT | FLAG_TELEGRAM_IP | FLAG_PAYLOAD | FLAG_TLS,
+    FLAG_PORT | FLAG_PAYLOAD | FLAG_HTTP,
+    FLAG_TELEGRAM_IP,
+    0,
+    FLAG_PORT | FLAG_TELEGRAM_IP | FLAG_PAYLOAD | FLAG_TLS,
+    FLAG_PORT | FLAG_PAYLOAD,
+]
+
+
+def _classifier():
+    ip = IPClassifier(cidrs=["149.154.160.0/20", "2001:67c:4e8::/48"])
+    ip.learn("203.0.113.7", 300)
+    return ip
+
+
+def test_scalar_path():
+    batch = BatchClassifier(_classifier(), use_numpy=False)
+    verdicts = batch.classify(_buffers())
+    expected = list(EXPECTED)
+    expected[5] |= FLAG_TELEGRAM_IP     # выученный адрес
+    assert list(verdicts) == expected
+    assert batch.candidates(verdicts) == [0, 1, 4, 5]
+
+
+def test_numpy_path_matches_scalar():
+    np = pytest.importorskip("numpy")
+    ip = _classifier()
+    buffers = _buffers() * 50
+    verdicts = BatchClassifier(ip).classify(buffers)
+    assert isinstance(verdicts, np.ndarray)
+    assert list(verdicts) == list(BatchClassifier(ip, use_numpy=False).classify(buffers))
+
+
+def test_small_batches_take_scalar_path():
+    pytest.importorskip("numpy")
+    batch = BatchClassifier(_classifier(), min_batch=8)
+    small = batch.classify(_buffers())
+    assert isinstance(small, array) and list(small) == list(
+        BatchClassifier(_classifier(), use_numpy=False).classify(_buffers()))
+    assert not isinstance(batch.classify(_buffers() * 2), array)
+
+
+def test_benchmark_runs():
+    report = bench_batch_classifier.run(packets=512)
+    assert set(report["sizes"]) == set(bench_batch_classifier.BATCH_SIZES)
+    assert report["threshold"] == BatchClassifier.NUMPY_MIN_BATCH
@@ -0,0 +1,47 @@
+"""
+Тесты генератора трафика и инструментов бенчмарков
+"""
+
+import random
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.compare import compare
+from benchmarks.runner import parse_mix, run
+from benchmarks.traffic import (TrafficGenerator, chrome_hello, firefox_hello,
+                                tdesktop_hello, mtproto_init, MSS)
+from src.mtproto_handler import MTProtoDetector
+from src.tls_parser import get_sni_from_payload
+
+
+def test_hello_profiles_parse():
+    rnd = random.Random(3)
+    for build in (chrome_hello, firefox_hello, tdesktop_hello):
+        assert get_sni_from_payload(build("web.telegram.org", rnd)) == "web.telegram.org"
+    pq = chrome_hello("t.me", rnd, pq=True)
+    # Постквантовый ClientHello не помещается в один сегмент
+    assert len(pq) > MSS and get_sni_from_payload(pq) == "t.me"
+    assert MTProtoDetector.detect(mtproto_init(random.Random(1))) is not None
+
+
+def test_generator_mix_is_deterministic():
+    mix = parse_mix("pq=1,rst=1")
+    first = TrafficGenerator(mix, seed=7).packets(50)
+    second = TrafficGenerator(mix, seed=7).packets(50)
+    assert [bytes(p.raw) for p in first] == [bytes(p.raw) for p in second]
+    assert len(first) == 50
+    assert any(p.is_inbound and p.tcp.rst for p in first)
+
+
+def test_runner_and_compare():
+    report = run(200, repeat=1, cases=["get_sni", "sniffer_process"])
+    assert set(report["results"]) == {"get_sni", "sniffer_process"}
+    result = report["results"]["sniffer_process"]
+    assert result["packets"] == 200 and result["pps"] > 0 and result["ns_per_packet"] > 0
+
+    slower = {"results": {"get_sni": dict(report["results"]["get_sni"])}}
+    slower["results"]["get_sni"]["ns_per_packet"] *= 1.5
+    rows, regressions = compare(report, slower, threshold=10.0)
+    assert [r["metric"] for r in regressions] == ["ns_per_packet"]
+    assert compare(report, report)[1] == []
@@ -0,0 +1,119 @@
+"""
+Тесты классификаторов и изучения адресов по DNS
+"""
+
+import sys
+import os
+import socket
+import struct
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.backend import FakeBackend
+from src.classifier import DomainClassifier, IPClassifier
+from src.dns_observer import DNSObserver, parse_dns_response
+from src.packet import build_udp_packet, Direction
+from src.sniffer import TrafficSniffer
+
+
+def _name(name: str) -> bytes:
+    return b"".join(bytes([len(l)]) + l.encode() for l in name.split(".")) + b"\x00"
+
+
+def dns_response(qname: str, answers, cname: str = None) -> bytes:
+    """Ответ с одним вопросом; имена ответов сжаты ссылкой на вопрос"""
+    records = b""
+    if cname:
+        target = _name(cname)
+        records += b"\xc0\x0c" + struct.pack("!HHIH", 5, 1, 300, len(target)) + target
+    for addr, ttl in answers:
+        if ":" in addr:
+            rdata = socket.inet_pton(socket.AF_INET6, addr)
+            rtype = 28
+        else:
+            rdata = bytes(int(o) for o in addr.split("."))
+            rtype = 1
+        records += b"\xc0\x0c" + struct.pack("!HHIH", rtype, 1, ttl, len(rdata)) + rdata
+    count = len(answers) + (1 if cname else 0)
+    header = struct.pack("!HHHHHH", 0x1234, 0x8180, 1, count, 0, 0)
+    return header + _name(qname) + struct.pack("!HH", 1, 1) + records
+
+
+def test_parse_dns_response():
+    data = dns_response("web.telegram.org",
+                        [("149.154.167.99", 300), ("2001:67c:4e8::1", 600)],
+                        cname="web.tg.example")
+    qname, answers = parse_dns_response(data)
+    assert qname == "web.telegram.org"
+    assert answers == [("149.154.167.99", 300), ("2001:67c:4e8::1", 600)]
+
+    assert parse_dns_response(b"\x00" * 5) is None
+    query = bytearray(data)
+    query[2] = 0x01   # QR=0 — это запрос
+    assert parse_dns_response(bytes(query)) is None
+
+
+def test_domain_classifier_suffix_semantics():
+    domains = DomainClassifier(["telegram", "t.me"])
+    assert domains.matches("web.telegram.org")
+    assert domains.matches("t.me")
+    assert domains.matches("cdn.t.me.")
+    assert not domains.matches("art.media")
+    assert not domains.matches("example.com")
+
+
+def test_ip_classifier_ranges_and_learning():
+    now = [1000.0]
+    ips = IPClassifier(ranges=[("149.154.160.0", "149.154.175.255")],
+                       cidrs=["91.108.0.0/16", "2001:67c:4e8::/48"],
+                       max_learned=2, clock=lambda: now[0])
+    assert ips.contains("149.154.167.50")
+    assert ips.contains("91.108.56.1")
+    assert ips.contains("2001:67c:4e8::10")
+    assert not ips.contains("8.8.8.8")
+
+    assert ips.learn("8.8.8.8", ttl=60)
+    assert ips.contains("8.8.8.8")
+    now[0] += 61
+    assert not ips.contains("8.8.8.8")
+
+    # Ограничение размера: вытесняется ближайший к истечению
+    ips.learn("1.1.1.1", 100)
+    ips.learn("1.0.0.1", 500)
+    ips.learn("9.9.9.9", 300)
+    assert len(ips.learned) == 2
+    assert "1.1.1.1" not in ips.learned
+
+
+def test_observer_learns_and_exports(tmp_path):
+    ips = IPClassifier()
+    cache = tmp_path / "telegram_ips.json"
+    cache.write_text('{"ips": ["149.154.160.0/20"], "updated": "0"}')
+    observer = DNSObserver(ips, cache_file=cache)
+
+    assert observer.observe(dns_response("example.com", [("93.184.216.34", 300)])) == 0
+    assert observer.observe(dns_response("web.telegram.org", [("5.6.7.8", 10)])) == 1
+    assert ips.contains("5.6.7.8")
+    assert not ips.contains("93.184.216.34")
+    # Короткий TTL поднимается до MIN_TTL
+    assert ips.learned["5.6.7.8"] - ips.clock() > DNSObserver.MIN_TTL - 5
+
+    observer.maybe_export(force=True)
+    warm = IPClassifier()
+    assert warm.import_learned(cache) == 1
+    assert warm.contains("5.6.7.8")
+    assert '"ips"' in cache.read_text()
+
+
+def test_sniffer_routes_dns_responses():
+    ips = IPClassifier()
+    observer = DNSObserver(ips)
+    response = build_udp_packet("8.8.8.8", "10.0.0.1", 53, 50000,
+                                payload=dns_response("t.me", [("5.6.7.9", 300)]),
+                                direction=Direction.INBOUND)
+    backend = FakeBackend([response])
+    sniffer = TrafficSniffer(backend=backend, dns_observer=observer)
+    assert "udp.SrcPort == 53" in sniffer.filter_str
+    sniffer.start()
+    assert ips.contains("5.6.7.9")
+    assert len(backend.sent) == 1
+    assert sniffer.get_stats()["errors"] == 0
@@ -0,0 +1,138 @@
+"""
+Тесты asyncio-движка на FakeBackend
+"""
+
+import asyncio
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.backend import FakeBackend
+from src.config import SNIFFER, TELEGRAM
+from src.engine import Engine
+from src.ip_updater import TelegramIPUpdater
+from src.packet import build_tcp_packet
+from src.nfqueue_backend import NFQNL_MSG_VERDICT, NF_DROP
+from tests.test_nfqueue import _backend as nfqueue_backend, packet_msg
+from tests.test_strategy import client_hello
+
+
+def _engine(tmp_path, monkeypatch, packets, backend=None, **kwargs):
+    monkeypatch.setattr(TelegramIPUpdater, "CACHE_FILE", tmp_path / "telegram_ips.json")
+    monkeypatch.setattr(SNIFFER, "RULES_CACHE_FILE", str(tmp_path / "rules.json"))
+    monkeypatch.setattr(TELEGRAM, "IP_PREFIXES", list(TELEGRAM.IP_PREFIXES))
+    monkeypatch.setattr(TELEGRAM, "IP_SOURCED", [])
+    backend = backend or FakeBackend(packets)
+    engine = Engine(adaptive=False, recorder=False, fast_start=False, backend=backend,
+                    delay_ms=10.0, **kwargs)
+    engine.app.update_ips = lambda allow_network=True: False
+    return engine, backend
+
+
+def _hello(port: int, dst: str = "149.154.167.51", sni: str = "web.telegram.org"):
+    return build_tcp_packet("10.0.0.2", dst, port, 443, seq=1000, payload=client_hello(sni))
+
+
+def test_fragments_sent_by_loop_timers(tmp_path, monkeypatch):
+    hello = _hello(40000)
+    size = len(hello.tcp.payload)
+    engine, backend = _engine(tmp_path, monkeypatch, [hello])
+
+    async def scenario():
+        await engine.start()
+        await engine.wait()
+        # Первый фрагмент ушёл сразу, второй ждёт таймера — цикл не заблокирован
+        assert len(backend.sent) == 1
+        assert engine.stats()["timers"]["pending"] == 1
+        await asyncio.sleep(0.05)
+        assert len(backend.sent) == 2
+        await engine.stop()
+
+    asyncio.run(scenario())
+    first, second = backend.sent
+    assert len(first.tcp.payload) == 1 and len(second.tcp.payload) == size - 1
+    assert second.tcp.seq_num == 1001
+    stats = engine.stats()
+    assert stats["timers"]["fired"] == 1 and stats["timers"]["flushed"] == 0
+    assert stats["processed"] == 1 and not stats["running"]
+
+
+def test_stop_flushes_pending_fragments_in_order(tmp_path, monkeypatch):
+    packets = [_hello(40000 + i) for i in range(3)]
+    engine, backend = _engine(tmp_path, monkeypatch, packets)
+
+    async def scenario():
+        await engine.start()
+        await engine.wait()
+        await engine.stop()
+
+    asyncio.run(scenario())
+    # Ничего не осталось неотправленным, и в каждом потоке порядок сохранён
+    assert len(backend.sent) == 6
+    assert engine.stats()["timers"] == dict(engine.sender.stats, pending=0)
+    assert engine.sender.stats["flushed"] == 3
+    for port in (40000, 40001, 40002):
+        seqs = [p.tcp.seq_num for p in backend.sent if p.tcp.src_port == port]
+        assert seqs == [1000, 1001]
+    assert not backend.is_open
+
+
+def test_decision_events(tmp_path, monkeypatch):
+    packets = [_hello(40000), _hello(40001, dst="93.184.216.34", sni="example.com")]
+    engine, backend = _engine(tmp_path, monkeypatch, packets)
+    events = []
+
+    async def consume():
+        async for event in engine.events():
+            events.append(event)
+
+    async def scenario():
+        await engine.start()
+        consumer = asyncio.create_task(consume())
+        await engine.wait()
+        await engine.stop()
+        await consumer
+
+    asyncio.run(scenario())
+    by_sni = {e.sni: e for e in events}
+    assert by_sni["web.telegram.org"].action == "fragment"
+    assert by_sni["web.telegram.org"].strategy == "static"
+    assert by_sni["web.telegram.org"].delay_ms == 10.0
+    assert by_sni["example.com"].action == "pass" and not by_sni["example.com"].is_telegram
+    assert engine.stats()["events"] == 2
+
+
+def test_bounded_queues(tmp_path, monkeypatch):
+    packets = [_hello(41000 + i, dst="93.184.216.34", sni="example.com") for i in range(50)]
+    engine, backend = _engine(tmp_path, monkeypatch, packets, queue_size=4, events_size=8)
+
+    async def scenario():
+        await engine.start()
+        await engine.wait()
+        await engine.stop()
+
+    asyncio.run(scenario())
+    stats = engine.stats()
+    assert stats["processed"] == 50 and len(backend.sent) == 50
+    # Приём опережал обработку и ждал места в очереди
+    assert stats["inbox_peak"] <= 4 and stats["backpressure"] > 0
+    # Событий никто не читал: очередь не растёт, лишнее отброшено
+    assert stats["events"] == 8 and stats["events_dropped"] >= 42
+
+
+def test_nfqueue_verdicts_stay_on_reader_thread(tmp_path, monkeypatch):
+    hello = _hello(40000)
+    other = build_tcp_packet("10.0.0.2", "93.184.216.34", 40001, 443, payload=b"\x17abc")
+    stream = [packet_msg(1, other) + packet_msg(2, hello)]
+    backend, sock, raw = nfqueue_backend(stream)
+    engine, _ = _engine(tmp_path, monkeypatch, [], backend=backend)
+
+    async def scenario():
+        await engine.start()
+        await engine.wait()
+        await engine.stop()
+
+    asyncio.run(scenario())
+    # Каждый пакет отпущен потоком приёма сразу, всё отправлено инъекцией
+    assert sock.verdicts() == [(NFQNL_MSG_VERDICT, NF_DROP, 1), (NFQNL_MSG_VERDICT, NF_DROP, 2)]
+    assert [len(data) - 40 for data, _ in raw.sent] == [4, 1, len(hello.tcp.payload) - 1]
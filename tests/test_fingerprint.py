@@ -0,0 +1,119 @@
+"""
+Тесты отпечатков ClientHello и классификации по памяти отпечатков
+"""
+
+import random
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.traffic import chrome_hello, firefox_hello, tdesktop_hello
+from src.backend import FakeBackend
+from src.classifier import HelloMemo, IPClassifier
+from src.config import TELEGRAM
+from src.packet import build_tcp_packet
+from src.sniffer import TrafficSniffer
+from src.strategy import StrategyController
+from src.tls_parser import hello_fingerprint
+
+
+def test_fingerprint_stable_per_client():
+    # GREASE и порядок расширений меняются от рукопожатия к рукопожатию
+    chrome = {hello_fingerprint(chrome_hello("example.com", random.Random(i))) for i in range(10)}
+    assert chrome == {"t13d1516h2_8daaf6152771_e5627efa2ab1"}
+    firefox = hello_fingerprint(firefox_hello("example.com", random.Random(1)))
+    tdesktop = hello_fingerprint(tdesktop_hello("web.telegram.org", random.Random(1)))
+    assert len({chrome.pop(), firefox, tdesktop}) == 3
+    assert tdesktop.startswith("t13d0506")
+    # Без SNI — другой префикс, но та же форма для памяти
+    literal = hello_fingerprint(tdesktop_hello("", random.Random(2)))
+    assert literal.startswith("t13i0505")
+    assert HelloMemo.key(literal) == HelloMemo.key(tdesktop)
+
+
+def test_fingerprint_rejects_partial_hello():
+    assert hello_fingerprint(b"GET / HTTP/1.1\r\n") is None
+    # Постквантовый ClientHello не помещается в один сегмент
+    assert hello_fingerprint(chrome_hello("example.com", random.Random(1), pq=True)[:1460]) is None
+
+
+def test_memo_votes():
+    memo = HelloMemo(max_entries=2, pinned={})
+    fp = hello_fingerprint(tdesktop_hello("t.me", random.Random(1)))
+    assert memo.lookup(fp) is None
+    for _ in range(HelloMemo.MIN_VOTES):
+        memo.vote(fp, True)
+    memo.set_strategy(fp, "split")
+    assert memo.lookup(fp) == (True, "split")
+
+    # Браузерная форма с редкими визитами в Telegram остаётся «чужой»
+    browser = hello_fingerprint(chrome_hello("example.com", random.Random(1)))
+    for _ in range(5):
+        memo.vote(browser, False)
+    memo.vote(browser, True)
+    assert memo.lookup(browser) is None
+
+    memo.vote(hello_fingerprint(firefox_hello("example.com", random.Random(1))), False)
+    assert len(memo) == 2 and memo.get_stats()["evicted"] == 1
+
+    pinned = HelloMemo(pinned={fp: "legacy"})
+    assert pinned.lookup(fp) == (True, "legacy")
+
+
+def test_sniffer_classifies_by_fingerprint():
+    decisions = []
+    backend = FakeBackend()
+    sniffer = TrafficSniffer(on_packet=lambda p, sni, tg, w: decisions.append((sni, tg)),
+                             backend=backend, ip_classifier=IPClassifier.from_config(TELEGRAM),
+                             hello_memo=HelloMemo(pinned={}))
+    sniffer.w = backend
+    rnd = random.Random(1)
+
+    def hello(port, payload):
+        sniffer._process_packet(build_tcp_packet("10.0.0.2", "5.6.7.8", port, 443,
+                                                 payload=payload))
+        return decisions[-1]
+
+    # Первое подключение по IP: форма ещё не знакома
+    assert hello(40000, tdesktop_hello("", rnd)) == (None, False)
+    for port in range(40001, 40004):
+        assert hello(port, tdesktop_hello("web.telegram.org", rnd)) == ("web.telegram.org", True)
+    # Теперь без SNI — узнаём по форме; SNI не из правил решает сам
+    assert hello(40004, tdesktop_hello("", rnd)) == (None, True)
+    assert hello(40005, tdesktop_hello("cdn.example.net", rnd)) == ("cdn.example.net", False)
+    assert hello(40006, chrome_hello("example.com", rnd)) == ("example.com", False)
+    stats = sniffer.get_stats()
+    # Голос cdn.example.net против: доля чужих выше MAX_OTHER_SHARE
+    assert stats["fingerprint"] == 1 and stats["hello_memo"]["telegram"] == 0
+
+
+def test_fingerprint_decision_flips_back():
+    decisions = []
+    backend = FakeBackend()
+    memo = HelloMemo(pinned={})
+    sniffer = TrafficSniffer(on_packet=lambda p, sni, tg, w: decisions.append(tg),
+                             backend=backend, hello_memo=memo)
+    sniffer.w = backend
+    rnd = random.Random(1)
+    port = iter(range(40000, 41000))
+
+    def hello(sni):
+        sniffer._process_packet(build_tcp_packet("10.0.0.2", "5.6.7.8", next(port), 443,
+                                                 payload=tdesktop_hello(sni, rnd)))
+        return decisions[-1]
+
+    for _ in range(HelloMemo.MIN_VOTES):
+        assert hello("web.telegram.org")
+    assert hello("")
+    # Та же форма у браузера: чужие домены не помечаются и голосуют против
+    assert not any(hello("google.com") for _ in range(100))
+    fp = hello_fingerprint(tdesktop_hello("", rnd))
+    assert memo.lookup(fp) is None
+    assert not hello("")
+
+
+def test_strategy_hint_for_new_range(tmp_path):
+    controller = StrategyController(cache_file=str(tmp_path / "s.json"))
+    assert controller.choose("5.6.7.8", hint="split_delay") == "split_delay"
+    # Знакомый диапазон — решает собственная история
+    assert controller.choose("5.6.7.9", hint="split") == "split_delay"
@@ -0,0 +1,55 @@
+"""
+Тесты самописца последних пакетов
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.flight_recorder import FlightRecorder
+from src.main import TelegramBypass
+from src.packet import build_tcp_packet, Direction
+from src.pcap import read_comments, read_packets, write_pcap
+from tests.test_strategy import client_hello
+
+
+def test_ring_keeps_last_packets_with_notes(tmp_path):
+    recorder = FlightRecorder(packets=4, snaplen=60)
+    packets = [build_tcp_packet("10.0.0.1", "1.1.1.1", 40000 + i, 443, payload=bytes(30))
+               for i in range(5)]
+    for packet in packets:
+        recorder.record(packet)
+    recorder.annotate("tls sni=t.me -> fragment")
+    reply = build_tcp_packet("1.1.1.1", "10.0.0.1", 443, 40004, direction=Direction.INBOUND)
+    recorder.record(reply, sent=True)
+
+    path = recorder.dump(tmp_path / "dump.pcapng", reason="test")
+    dumped = [bytes(p) for _, p in read_packets(path)]
+    # Старейшие вытеснены; длинные пакеты обрезаны до snaplen
+    assert dumped[0] == bytes(packets[2].raw)[:60]
+    assert dumped[-1] == bytes(reply.raw)
+    section, comments = read_comments(path)
+    assert section == "tg-bypass flight recorder: test"
+    assert comments == ["recv", "recv", "recv: tls sni=t.me -> fragment", "sent"]
+
+
+def test_fragmentation_error_dumps(tmp_path):
+    capture = tmp_path / "capture.pcap"
+    hello = build_tcp_packet("10.0.0.2", "203.0.113.5", 50000, 443,
+                             payload=client_hello("web.telegram.org"))
+    write_pcap(capture, [(1.0, hello.raw)])
+
+    app = TelegramBypass(adaptive=False, pcap=str(capture))
+    app.recorder.dump_dir = tmp_path / "flight"
+
+    def broken(*args):
+        raise RuntimeError("boom")
+    app.fragmenter._send_segments = broken
+    app.run()
+
+    [dump] = list((tmp_path / "flight").glob("*.pcapng"))
+    section, comments = read_comments(dump)
+    assert "FragmentationError" in section
+    assert comments[0].startswith("recv: error:")
+    # Пакет ушёл как есть ровно один раз
+    assert app.shadow_report.sends == 1
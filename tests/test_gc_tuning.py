@@ -0,0 +1,54 @@
+"""
+Тесты замера пауз сборщика мусора и щадящего режима
+"""
+
+import gc
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks import bench_soak
+from src.config import SNIFFER
+from src.gc_tuning import GCMonitor, apply_runtime_mode, reset_runtime_mode
+
+
+def test_monitor_records_pauses():
+    monitor = GCMonitor()
+    monitor.install()
+    try:
+        gc.collect()
+    finally:
+        monitor.uninstall()
+    stats = monitor.get_stats()
+    assert stats["pause_ms"]["gen2"]["count"] == 1
+    assert stats["max_pause_ms"] > 0
+    assert monitor._callback not in gc.callbacks
+
+
+def test_runtime_mode_freezes_and_restores():
+    before = gc.get_threshold()
+    previous = apply_runtime_mode((5000, 20, 100))
+    try:
+        assert previous == before
+        assert gc.get_threshold() == (5000, 20, 100)
+        assert gc.get_freeze_count() > 0
+    finally:
+        reset_runtime_mode(previous)
+    assert gc.get_threshold() == before and gc.get_freeze_count() == 0
+
+
+def test_runtime_mode_reads_config_at_call(monkeypatch):
+    monkeypatch.setattr(SNIFFER, "GC_THRESHOLDS", (7000, 15, 50))
+    previous = apply_runtime_mode()
+    try:
+        assert gc.get_threshold() == (7000, 15, 50)
+    finally:
+        reset_runtime_mode(previous)
+
+
+def test_soak_report():
+    report = bench_soak.run(3000, budget_mb=64, gc_tuning=True, samples=3)
+    assert report["ok"] and report["packets"] == 3000
+    assert len(report["timeline"]) == 3
+    assert report["gc"]["frozen"] > 0 and report["gc"]["threshold"] != gc.get_threshold()
+    assert report["latency_ms"]["count"] == 3000
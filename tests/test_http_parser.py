@@ -0,0 +1,59 @@
+"""
+Тесты разбора HTTP Host и его использования в классификации
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.backend import FakeBackend
+from src.http_parser import find_host_header, get_host_from_payload, is_http_request
+from src.packet import build_tcp_packet
+from src.sniffer import TrafficSniffer
+from src.strategy import build_plan
+
+REQUEST = (b"GET /k/ HTTP/1.1\r\n"
+           b"User-Agent: test\r\n"
+           b"hOsT:   web.telegram.org:8080\r\n"
+           b"Accept: */*\r\n\r\n")
+
+
+def test_host_header():
+    line, start, length = find_host_header(REQUEST)
+    assert REQUEST[line:line + 5] == b"hOsT:"
+    assert REQUEST[start:start + length] == b"web.telegram.org"
+    assert get_host_from_payload(REQUEST) == "web.telegram.org"
+    assert get_host_from_payload(memoryview(REQUEST)) == "web.telegram.org"
+    assert get_host_from_payload(b"GET / HTTP/1.1\r\nHost: [2001:db8::1]:80\r\n\r\n") == "2001:db8::1"
+
+
+def test_rejects_non_http():
+    assert not is_http_request(b"\x16\x03\x01\x00\x10")
+    assert not is_http_request(b"GETX / HTTP/1.1\r\n")
+    assert not is_http_request(b"\xef\x00\x00\x00")
+    # Заголовки кончились раньше Host
+    assert find_host_header(b"GET / HTTP/1.1\r\nA: b\r\n\r\nHost: x.org\r\n") is None
+    # Неполная строка запроса
+    assert find_host_header(b"GET / HTTP/1.1") is None
+
+
+def test_plans_split_inside_hostname():
+    _, start, length = find_host_header(REQUEST)
+    plan = build_plan("split", REQUEST)
+    assert plan.offsets == (start + length // 2,)
+    plan = build_plan("header_split", REQUEST)
+    assert plan.offsets[0] == REQUEST.index(b"hOsT:") + 2
+
+
+def test_sniffer_classifies_http_by_host():
+    seen = []
+    packets = [
+        build_tcp_packet("10.0.0.1", "203.0.113.9", 40100, 80, payload=REQUEST),
+        build_tcp_packet("10.0.0.1", "203.0.113.9", 40101, 80,
+                         payload=b"GET / HTTP/1.1\r\nHost: example.com\r\n\r\n"),
+    ]
+    sniffer = TrafficSniffer(on_packet=lambda p, sni, tg, w: seen.append((sni, tg)),
+                             backend=FakeBackend(packets))
+    sniffer.start()
+    assert seen == [("web.telegram.org", True), ("example.com", False)]
+    assert sniffer.get_stats()["http"] == 2
@@ -0,0 +1,131 @@
+"""
+Тесты апдейтера IP: условные запросы, слияние источников, разница для классификатора
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from src.classifier import IPClassifier
+from src.ip_updater import (CIDRListSource, FileSource, IPDiff, RIPEstatSource,
+                            TelegramIPUpdater, build_source)
+
+RFC_DATE = "Mon, 19 Oct 2026 00:00:00 GMT"
+
+
+class _Stand:
+    """HTTP-заглушка: /cidr.txt отвечает по ETag, /ripe.json — по Last-Modified"""
+
+    def __init__(self):
+        self.cidr = "# Telegram\n91.108.4.0/22\n149.154.160.0/20\n2001:67c:4e8::/48\n"
+        self.ripe = ["149.154.160.0/20", "185.76.151.0/24"]
+        self.version = 1
+        self.hits = []
+        stand = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand.hits.append(self.path)
+                if self.path == "/cidr.txt":
+                    etag = f'"v{stand.version}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        return self._reply(304)
+                    return self._reply(200, stand.cidr.encode(), ETag=etag)
+                if self.path == "/ripe.json":
+                    if self.headers.get("If-Modified-Since") == RFC_DATE and stand.version == 1:
+                        return self._reply(304)
+                    body = {"data": {"prefixes": [{"prefix": p} for p in stand.ripe]}}
+                    return self._reply(200, json.dumps(body).encode(), **{"Last-Modified": RFC_DATE})
+                self._reply(500)
+
+            def _reply(self, code, body=b"", **headers):
+                self.send_response(code)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stand():
+    stand = _Stand()
+    yield stand
+    stand.close()
+
+
+def _updater(tmp_path, monkeypatch, sources):
+    monkeypatch.setattr(TelegramIPUpdater, "CACHE_FILE", tmp_path / "telegram_ips.json")
+    return TelegramIPUpdater(sources)
+
+
+def test_conditional_refresh_and_provenance(stand, tmp_path, monkeypatch):
+    local = tmp_path / "extra.txt"
+    local.write_text("45.12.133.0/24\n")
+    updater = _updater(tmp_path, monkeypatch, [
+        CIDRListSource("telegram", stand.url + "/cidr.txt", timeout=2),
+        RIPEstatSource("ripestat", stand.url + "/ripe.json", timeout=2),
+        FileSource("local", str(local)),
+    ])
+    diff = updater.refresh()
+    assert len(diff.added) == 5 and not diff.removed
+    provenance = updater.provenance()
+    assert provenance["149.154.160.0/20"] == ["ripestat", "telegram"]
+    assert provenance["45.12.133.0/24"] == ["local"]
+
+    # Ничего не изменилось: 304 от обоих, кэш не переписан
+    written = (tmp_path / "telegram_ips.json").read_text()
+    assert not updater.refresh()
+    assert stand.hits == ["/cidr.txt", "/ripe.json"] * 2
+    assert (tmp_path / "telegram_ips.json").read_text() == written
+
+    stand.version = 2
+    stand.cidr = "91.108.4.0/22\n149.154.160.0/20\n"
+    stand.ripe = ["149.154.160.0/20"]
+    diff = updater.refresh()
+    assert diff == IPDiff(added=[], removed=["185.76.151.0/24", "2001:67c:4e8::/48"])
+    assert updater.get_ips() == ["149.154.160.0/20", "45.12.133.0/24", "91.108.4.0/22"]
+
+
+def test_failed_source_keeps_previous_list(stand, tmp_path, monkeypatch):
+    updater = _updater(tmp_path, monkeypatch, [
+        CIDRListSource("telegram", stand.url + "/cidr.txt", timeout=2),
+        CIDRListSource("broken", stand.url + "/missing", timeout=2),
+    ])
+    assert len(updater.refresh().added) == 3
+    stand.close()
+    with pytest.raises(OSError):
+        updater.refresh()
+    assert len(updater.get_ips(allow_network=False)) == 3
+    with pytest.raises(ValueError):
+        build_source({"type": "whois", "name": "x"})
+
+
+def test_classifier_applies_diff_over_static_ranges():
+    classifier = IPClassifier(cidrs=["149.154.160.0/20"])
+    assert classifier.apply_diff(added=["149.154.167.0/24", "91.108.4.0/22", "2001:67c:4e8::/48"])
+    assert classifier.contains("91.108.5.1") and classifier.contains("2001:67c:4e8::1")
+    generation = classifier.generation
+    assert not classifier.apply_diff(added=["91.108.4.0/22"])
+    assert classifier.generation == generation
+
+    # Удаление не задевает диапазон из конфига
+    assert classifier.apply_diff(removed=["149.154.167.0/24", "91.108.4.0/22"])
+    assert classifier.contains("149.154.167.51") and not classifier.contains("91.108.5.1")
+    assert classifier.intervals(4) == IPClassifier(cidrs=["149.154.160.0/20"]).intervals(4)
@@ -0,0 +1,93 @@
+"""
+Тесты полос приоритета: рукопожатия новых потоков — вперёд закачки
+"""
+
+import random
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from benchmarks import bench_lanes
+from benchmarks.traffic import tdesktop_hello
+from src.backend import FakeBackend
+from src.config import SNIFFER
+from src.flow_table import FlowTable, flow_key
+from src.lanes import LANE_BULK, LANE_CONTROL, LANE_HANDSHAKE, LaneScheduler
+from src.packet import TCP_ACK, TCP_PSH, TCP_SYN, Direction, build_tcp_packet, build_udp_packet
+from src.sniffer import TrafficSniffer
+
+DC = "149.154.167.51"
+
+
+def _hello(port: int, seed: int = 1):
+    payload = tdesktop_hello("web.telegram.org", random.Random(seed))
+    return build_tcp_packet("10.0.0.2", DC, port, 443, payload=payload, seq=1000, ack=1,
+                            flags=TCP_ACK | TCP_PSH)
+
+
+def _ack(port: int):
+    return build_tcp_packet("10.0.0.2", DC, port, 443, seq=5000, ack=1)
+
+
+def test_classify():
+    flows = FlowTable()
+    lanes = LaneScheduler(flows)
+    known = _hello(30000)
+    flows.put(flow_key(known), object())
+    assert lanes.classify(_hello(40000)) == LANE_HANDSHAKE
+    assert lanes.classify(known) == LANE_BULK
+    assert lanes.classify(_ack(40000)) == LANE_BULK
+    assert lanes.classify(build_tcp_packet("10.0.0.2", DC, 40001, 443, flags=TCP_SYN)) == LANE_CONTROL
+    assert lanes.classify(build_udp_packet("10.0.0.2", "8.8.8.8", 5353, 53)) == LANE_CONTROL
+    inbound = build_tcp_packet(DC, "10.0.0.2", 443, 30000, direction=Direction.INBOUND)
+    assert lanes.classify(inbound) == LANE_CONTROL
+    with pytest.raises(ValueError):
+        LaneScheduler(flows, "fair")
+
+
+def test_limits_and_weights():
+    lanes = LaneScheduler(FlowTable(), "weighted", limits=(8, 8, 4), weights=(2, 1, 3),
+                          bulk_batch=2)
+    for port in range(40000, 40003):
+        lanes.put(_hello(port))
+    for _ in range(4):
+        lanes.put(_ack(30000))
+    assert lanes.full() and len(lanes) == 7
+    # Кредиты: 2 рукопожатия, затем bulk пачками по 2 до исчерпания 3
+    taken = [(lane, len(batch)) for lane, batch in iter(lanes.take, (None, []))]
+    assert taken == [(LANE_HANDSHAKE, 2), (LANE_BULK, 2), (LANE_BULK, 1),
+                     (LANE_HANDSHAKE, 1), (LANE_BULK, 1)]
+    assert not lanes.full() and lanes.stats["by_lane"] == {"handshake": 3, "control": 0, "bulk": 4}
+
+
+def test_handshake_overtakes_queued_bulk():
+    first = _hello(30000)
+    acks = [_ack(30000) for _ in range(200)]
+    backend = FakeBackend(bursts=[[first], acks + [_hello(40000, seed=2)]])
+    sniffer = TrafficSniffer(backend=backend, lanes=LaneScheduler(mode="strict"))
+    sniffer.handle_signals = False
+    sniffer.start()
+
+    ports = [packet.src_port for packet in backend.sent]
+    assert len(ports) == 202
+    # После первого потока — сразу новое рукопожатие, закачка — за ним
+    assert ports[0] == 30000 and ports[1] == 40000 and ports[2:] == [30000] * 200
+    stats = sniffer.get_stats()["lanes"]
+    assert stats["by_lane"]["handshake"] == 2 and stats["batches"] == 2 + 200 // 64 + 1
+
+
+def test_benchmark_runs():
+    report = bench_lanes.run("weighted", seconds=0.3, rate=5000, hellos=50)
+    assert report["handshake"]["count"] > 0 and report["bulk"]["count"] > 0
+    assert report["lanes"]["queued"] == {"handshake": 0, "control": 0, "bulk": 0}
+    report = bench_lanes.run("strict", seconds=0.3, rate=5000, hellos=50, backend_kind="nfqueue")
+    assert report["handshake"]["count"] > 0 and report["bulk"]["count"] > 0
+    assert report["lanes"]["by_lane"]["handshake"] >= report["handshake"]["count"]
+
+
+def test_lanes_from_config(monkeypatch):
+    monkeypatch.setattr(SNIFFER, "LANES", "weighted")
+    sniffer = TrafficSniffer(backend=FakeBackend())
+    assert sniffer.lanes.mode == "weighted" and sniffer.lanes.flows is sniffer.flows
@@ -0,0 +1,135 @@
+"""
+Тесты детектирования MTProto и его обработки в горячем пути
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.backend import FakeBackend
+from src.classifier import IPClassifier
+from src.fragmenter import SmartFragmenter
+from src.mtproto_handler import MTProtoDetector
+from src.flow_table import FlowTable
+from src.packet import build_tcp_packet, TCP_ACK, TCP_FIN, TCP_PSH, TCP_SYN
+from src.sniffer import TrafficSniffer
+
+# Стабильный «случайный» init obfuscated2
+OBFS_INIT = bytes((i * 73 + 41) % 256 for i in range(64)) + b"\x10" * 40
+
+
+def test_detect_transports():
+    assert MTProtoDetector.detect(b"\xef\x0a" + b"\x05" * 40) == "abridged"
+    assert MTProtoDetector.detect(b"\xef\x7f\x80\x00\x00" + b"\x05" * 40) == "abridged"
+    assert MTProtoDetector.detect(b"\xee\xee\xee\xee" + b"\x00" * 8) == "intermediate"
+    assert MTProtoDetector.detect(b"\xdd\xdd\xdd\xdd" + b"\x00" * 8) == "padded"
+    assert MTProtoDetector.detect(OBFS_INIT) == "obfuscated2"
+
+    # То, что раньше ошибочно считалось MTProto или не должно им быть
+    assert MTProtoDetector.detect(b"\x01" + b"\x00" * 40) is None
+    # 0xef без правдоподобной длины первого пакета
+    assert MTProtoDetector.detect(b"\xef" + b"\x05" * 20) is None
+    assert MTProtoDetector.detect(b"\xef\x7f\x10\x00\x00" + b"\x05" * 40) is None
+    assert MTProtoDetector.detect(b"GET / HTTP/1.1\r\n" * 5) is None
+    assert MTProtoDetector.detect(b"\x16\x03\x01\x02\x00" + b"\x01" * 80) is None
+    assert MTProtoDetector.detect(OBFS_INIT[:4] + b"\x00" * 4 + OBFS_INIT[8:]) is None
+    assert MTProtoDetector.detect(OBFS_INIT[:40]) is None
+
+
+def _run(packets, ip_classifier=None):
+    fragmenter = SmartFragmenter()
+    seen = []
+
+    def on_packet(packet, sni, is_telegram, w):
+        seen.append((is_telegram, sniffer.verdict.protocol))
+        if is_telegram:
+            fragmenter.process_packet_adaptive(w, packet, protocol=sniffer.verdict.protocol)
+            return False
+        return True
+
+    backend = FakeBackend(packets)
+    sniffer = TrafficSniffer(on_packet=on_packet, backend=backend,
+                             ip_classifier=ip_classifier, on_flow_reset=fragmenter.forget_flow)
+    sniffer.start()
+    return backend, seen, sniffer
+
+
+def test_obfuscated2_to_telegram_ip_gets_tailored_split():
+    ips = IPClassifier(cidrs=["149.154.160.0/20"])
+    first = build_tcp_packet("10.0.0.1", "149.154.167.51", 40001, 443,
+                             payload=OBFS_INIT, seq=100, flags=TCP_ACK | TCP_PSH)
+    backend, seen, _ = _run([first], ip_classifier=ips)
+    assert seen == [(True, "mtproto_obfuscated2")]
+    assert [len(p.tcp.payload) for p in backend.sent] == [1, 31, len(OBFS_INIT) - 32]
+    assert backend.sent[2].tcp.seq_num == 132
+
+
+def test_obfuscated2_needs_telegram_ip():
+    packet = build_tcp_packet("10.0.0.1", "8.8.8.8", 40002, 443, payload=OBFS_INIT)
+    backend, seen, _ = _run([packet], ip_classifier=IPClassifier())
+    assert seen == [(False, None)]
+    assert len(backend.sent) == 1
+
+
+def test_abridged_needs_telegram_ip():
+    payload = b"\xef" + b"\x07" * 60
+    packets = [build_tcp_packet("10.0.0.1", "203.0.113.5", 40004, 443, payload=payload),
+               build_tcp_packet("10.0.0.1", "149.154.167.51", 40004, 443, payload=payload)]
+    backend, seen, _ = _run(packets, ip_classifier=IPClassifier(cidrs=["149.154.160.0/20"]))
+    assert seen == [(False, None), (True, "mtproto_abridged")]
+
+
+def test_explicit_marker_without_ip_match_and_flow_cache(monkeypatch):
+    calls = []
+    detect = MTProtoDetector.detect.__func__
+
+    def counting(cls, payload):
+        calls.append(len(payload))
+        return detect(cls, payload)
+
+    monkeypatch.setattr(MTProtoDetector, "detect", classmethod(counting))
+    packets = [
+        build_tcp_packet("10.0.0.1", "203.0.113.5", 40003, 443,
+                         payload=b"\xee" * 4 + b"\x07" * 57, seq=10, flags=TCP_ACK | TCP_PSH),
+        build_tcp_packet("10.0.0.1", "203.0.113.5", 40003, 443,
+                         payload=b"\x42" * 200, seq=71, flags=TCP_ACK | TCP_PSH),
+    ]
+    backend, seen, sniffer = _run(packets)
+    assert seen[0] == (True, "mtproto_intermediate")
+    # Второй пакет потока: вердикт из кэша, детектор не вызывался
+    assert calls == [61]
+    assert seen[1] == (False, "mtproto_intermediate")
+    assert [len(p.tcp.payload) for p in backend.sent] == [2, 59, 200]
+    assert sniffer.get_stats()["mtproto"] == 1
+
+
+def test_reused_client_port_starts_new_flow():
+    ips = IPClassifier(cidrs=["149.154.160.0/20"])
+
+    def segment(flags, payload=b"", seq=10):
+        return build_tcp_packet("10.0.0.1", "149.154.167.51", 40005, 443,
+                                payload=payload, seq=seq, flags=flags)
+    first = b"\xef" + b"\x07" * 60
+    packets = [
+        segment(TCP_SYN, seq=9),
+        segment(TCP_ACK | TCP_PSH, first),
+        segment(TCP_ACK | TCP_FIN, seq=71),
+        # Тот же порт, новое соединение: снова первый сегмент
+        segment(TCP_SYN, seq=499),
+        segment(TCP_ACK | TCP_PSH, first, seq=500),
+    ]
+    backend, seen, _ = _run(packets, ip_classifier=ips)
+    assert seen == [(True, "mtproto_abridged")] * 2
+    assert [len(p.tcp.payload) for p in backend.sent] == [0, 1, 60, 0, 0, 1, 60]
+
+
+def test_flow_table_idle_timeout():
+    now = [0.0]
+    table = FlowTable(idle_timeout=10.0, clock=lambda: now[0])
+    table.put("a", 1)
+    now[0] = 9.0
+    assert table.get("a") == 1
+    now[0] = 18.0
+    assert "a" in table
+    now[0] = 19.0
+    assert "a" not in table and table.get("a") is None and len(table) == 0
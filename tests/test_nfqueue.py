@@ -0,0 +1,204 @@
+"""
+Тесты NFQUEUE-бэкенда на записанном netlink-потоке
+"""
+
+import socket
+import struct
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.nfqueue_backend import (
+    NFQueueBackend, iter_messages, nfq_message, nla, parse_attrs, iptables_rules,
+    NFQA_CFG_CMD, NFQA_CFG_FLAGS, NFQA_CFG_F_FAIL_OPEN, NFQA_PACKET_HDR, NFQA_PAYLOAD,
+    NFQA_VERDICT_HDR, NFQNL_MSG_PACKET, NFQNL_MSG_VERDICT, NFQNL_MSG_VERDICT_BATCH,
+    NF_ACCEPT, NF_DROP, NF_INET_FORWARD, NLMSG_ERROR, NLM_F_ACK,
+)
+from src.lanes import LaneScheduler
+from src.packet import build_tcp_packet, TCP_RST, TCP_ACK, TCP_SYN
+from src.sniffer import TrafficSniffer
+from tests.test_strategy import client_hello
+
+
+def packet_msg(packet_id: int, packet, hook: int = NF_INET_FORWARD) -> bytes:
+    """Сообщение NFQNL_MSG_PACKET, как его присылает ядро"""
+    attrs = (nla(NFQA_PACKET_HDR, struct.pack("!IHB", packet_id, 0x0800, hook)) +
+             nla(NFQA_PAYLOAD, bytes(packet.raw)))
+    return nfq_message(NFQNL_MSG_PACKET, 0, attrs, flags=0)
+
+
+class RecordedNetlink:
+    """
+    Сокет, воспроизводящий записанные датаграммы
+
+    Запросы с NLM_F_ACK подтверждаются. Неблокирующее чтение между
+    датаграммами возвращает EAGAIN — как будто ядро ещё не прислало пакет.
+    """
+
+    def __init__(self, datagrams):
+        self.datagrams = list(datagrams)
+        self.acks = []
+        self.sent = []
+        self._drained = False
+
+    def send(self, data):
+        self.sent.append(bytes(data))
+        length, _, flags, seq, _ = struct.unpack_from("=IHHII", data)
+        if flags & NLM_F_ACK:
+            self.acks.append(struct.pack("=IHHII", 36, NLMSG_ERROR, 0, seq, 0) +
+                             struct.pack("=i", 0) + bytes(data[:16]))
+        return len(data)
+
+    def recv_into(self, buf, nbytes=0, flags=0):
+        if self.acks:
+            data = self.acks.pop(0)
+        elif flags & socket.MSG_DONTWAIT and self._drained:
+            raise BlockingIOError
+        elif self.datagrams:
+            data = self.datagrams.pop(0)
+        else:
+            return 0
+        self._drained = not flags & socket.MSG_DONTWAIT
+        buf[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        pass
+
+    def verdicts(self):
+        """[(тип сообщения, вердикт, id), ...]"""
+        result = []
+        for data in self.sent:
+            buf = memoryview(data)
+            for msg_type, _, _, start, end in iter_messages(buf, len(data)):
+                if msg_type & 0xFF not in (NFQNL_MSG_VERDICT, NFQNL_MSG_VERDICT_BATCH):
+                    continue
+                attrs = parse_attrs(buf, start + 4, end)
+                if NFQA_VERDICT_HDR in attrs:
+                    verdict, packet_id = struct.unpack("!II", attrs[NFQA_VERDICT_HDR])
+                    result.append((msg_type & 0xFF, verdict, packet_id))
+        return result
+
+
+class RecordingRawSocket:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append((bytes(data), addr))
+
+    def close(self):
+        pass
+
+
+def _backend(datagrams, **kwargs):
+    sock = RecordedNetlink(datagrams)
+    raw = RecordingRawSocket()
+    return NFQueueBackend(sock=sock, inject_sockets={4: raw, 6: raw}, **kwargs), sock, raw
+
+
+def test_config_requests_fail_open():
+    backend, sock, _ = _backend([])
+    with backend:
+        pass
+    config = sock.sent[:4]
+    assert all(struct.unpack_from("=IHHII", m)[2] & NLM_F_ACK for m in config)
+    flags_msg = memoryview(config[3])
+    attrs = parse_attrs(flags_msg, 20, len(config[3]))
+    assert struct.unpack("!I", attrs[NFQA_CFG_FLAGS])[0] == NFQA_CFG_F_FAIL_OPEN
+    # Последним уходит UNBIND
+    last = memoryview(sock.sent[-1])
+    assert NFQA_CFG_CMD in parse_attrs(last, 20, len(last))
+    assert any("--queue-bypass" in rule for rule in iptables_rules())
+
+
+def test_accepts_are_batched_per_burst():
+    plain = [build_tcp_packet("192.168.1.10", "1.1.1.1", 50000 + i, 443,
+                              payload=b"\x17\x03\x03data") for i in range(3)]
+    burst = b"".join(packet_msg(i + 1, p) for i, p in enumerate(plain))
+    backend, sock, raw = _backend([burst, packet_msg(4, plain[0])])
+
+    sniffer = TrafficSniffer(backend=backend)
+    sniffer.start()
+
+    assert sniffer.stats["total"] == 4
+    assert raw.sent == []
+    assert sock.verdicts() == [
+        (NFQNL_MSG_VERDICT_BATCH, NF_ACCEPT, 3),
+        (NFQNL_MSG_VERDICT, NF_ACCEPT, 4),
+    ]
+
+
+def test_fragments_are_injected_and_original_dropped():
+    hello = build_tcp_packet("192.168.1.10", "149.154.167.51", 50010, 443,
+                             payload=client_hello("web.telegram.org"), seq=1000)
+    other = build_tcp_packet("192.168.1.10", "1.1.1.1", 50011, 443, payload=b"\x17abc")
+    # RST от DPI на поток без SYN/ACK — пропускается, направление по порту
+    rst = build_tcp_packet("149.154.167.51", "192.168.1.10", 443, 50010,
+                           flags=TCP_RST | TCP_ACK)
+    stream = [packet_msg(1, other) + packet_msg(2, hello) + packet_msg(3, rst)]
+    backend, sock, raw = _backend(stream)
+
+    def on_packet(packet, sni, is_telegram, w):
+        if not is_telegram:
+            return True
+        payload = packet.tcp.payload
+        for start, end in ((0, 1), (1, len(payload))):
+            piece = build_tcp_packet(packet.src_addr, packet.dst_addr,
+                                     packet.src_port, packet.dst_port,
+                                     payload=payload[start:end], seq=1000 + start)
+            w.send(piece)
+        return False
+
+    sniffer = TrafficSniffer(on_packet=on_packet, backend=backend)
+    sniffer.start()
+
+    assert [len(data) - 40 for data, _ in raw.sent] == [1, len(hello.tcp.payload) - 1]
+    assert raw.sent[0][1] == ("149.154.167.51", 0)
+    assert sock.verdicts() == [
+        (NFQNL_MSG_VERDICT, NF_ACCEPT, 1),
+        (NFQNL_MSG_VERDICT, NF_DROP, 2),
+        (NFQNL_MSG_VERDICT, NF_ACCEPT, 3),
+    ]
+    stats = backend.get_queue_stats()
+    assert stats["nfqueue_injected"] == 2 and stats["nfqueue_dropped"] == 1
+    assert sniffer.stats["inbound"] == 1
+
+
+def test_read_ahead_lanes_give_verdicts_out_of_order():
+    def tcp(port, flags=TCP_ACK, payload=b"", seq=1000):
+        return build_tcp_packet("192.168.1.10", "149.154.167.51", port, 443,
+                                payload=payload, seq=seq, flags=flags)
+    hello = client_hello("web.telegram.org")
+    first = packet_msg(1, tcp(50020, payload=hello))
+    # Закачка по известному потоку, затем SYN и ClientHello новых соединений
+    burst = (b"".join(packet_msg(i, tcp(50020, seq=2000 + i)) for i in range(2, 6)) +
+             packet_msg(6, tcp(50021, flags=TCP_SYN)) +
+             packet_msg(7, tcp(50022, payload=hello)))
+    backend, sock, raw = _backend([first, burst])
+    order = []
+
+    def on_packet(packet, sni, is_telegram, w):
+        order.append(packet.src_port)
+        if not is_telegram:
+            return True
+        payload = packet.tcp.payload
+        w.send(build_tcp_packet(packet.src_addr, packet.dst_addr, packet.src_port,
+                                packet.dst_port, payload=payload, seq=packet.tcp.seq_num))
+        return False
+
+    sniffer = TrafficSniffer(on_packet=on_packet, backend=backend,
+                             lanes=LaneScheduler(mode="strict"))
+    sniffer.handle_signals = False
+    sniffer.start()
+
+    # Новое рукопожатие обогнало закачку, прочитанную раньше него
+    assert order[:2] == [50020, 50022]
+    assert sock.verdicts() == [
+        (NFQNL_MSG_VERDICT, NF_DROP, 1),
+        (NFQNL_MSG_VERDICT, NF_DROP, 7),
+        # SYN завершён раньше пакетов 2..5 — без пачки, чтобы не принять их
+        (NFQNL_MSG_VERDICT, NF_ACCEPT, 6),
+        (NFQNL_MSG_VERDICT_BATCH, NF_ACCEPT, 5),
+    ]
+    assert len(raw.sent) == 2 and sniffer.get_stats()["lanes"]["by_lane"]["bulk"] == 4
@@ -0,0 +1,109 @@
+"""
+Тесты быстрого отказа QUIC к адресам Telegram
+"""
+
+import struct
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from src.backend import FakeBackend
+from src.classifier import IPClassifier
+from src.nfqueue_backend import iptables_rules
+from src.packet import PROTO_ICMP, Direction, build_udp_packet, internet_checksum
+from src.quic_filter import QUIC_V1, QUIC_V2, QUICFilter, quic_initial_version
+from src.sniffer import TrafficSniffer
+
+
+def initial(version: int = QUIC_V1, first: int = 0xC3, size: int = 1250) -> bytes:
+    header = bytes([first]) + struct.pack("!I", version) + b"\x08" + b"\x11" * 8 + b"\x00"
+    return header + b"\x00" * (size - len(header))
+
+
+def _quic(dst: str, payload: bytes, src_port: int = 51000):
+    return build_udp_packet("10.0.0.2", dst, src_port, 443, payload=payload)
+
+
+def test_initial_recognized_by_header_only():
+    assert quic_initial_version(initial()) == QUIC_V1
+    assert quic_initial_version(initial(QUIC_V2, first=0xD3)) == QUIC_V2
+    # Handshake v1, Initial v1 с типом из v2, Version Negotiation
+    assert quic_initial_version(initial(first=0xE3)) is None
+    assert quic_initial_version(initial(QUIC_V2)) is None
+    assert quic_initial_version(initial(0)) is None
+    # Короткий заголовок и недополненная датаграмма
+    assert quic_initial_version(initial(first=0x43)) is None
+    assert quic_initial_version(initial(size=300)) is None
+
+
+def test_icmp_answer_and_counters():
+    quic = QUICFilter("icmp", IPClassifier(cidrs=["149.154.160.0/20"]))
+    backend = FakeBackend()
+    sniffer = TrafficSniffer(backend=backend, quic_filter=quic)
+    sniffer.w = backend
+    assert "(ip.DstAddr >= 149.154.160.0 and ip.DstAddr <= 149.154.175.255)" in sniffer.filter_str
+
+    packet = _quic("149.154.167.51", initial())
+    sniffer._process_packet(packet)
+    sniffer._process_packet(_quic("149.154.167.51", initial(), src_port=51001))
+    # Исходный пакет не ушёл, клиенту — ICMP port unreachable с его заголовками
+    assert len(backend.sent) == 2
+    reply = backend.sent[0]
+    assert reply.direction == Direction.INBOUND and reply.protocol == PROTO_ICMP
+    assert (reply.src_addr, reply.dst_addr) == ("149.154.167.51", "10.0.0.2")
+    icmp = bytes(reply.raw[20:])
+    assert icmp[:2] == b"\x03\x03" and internet_checksum(icmp) == 0
+    assert icmp[8:8 + 28] == bytes(packet.raw[:28])
+
+    # Установленный QUIC и чужие адреса идут дальше
+    backend.sent.clear()
+    sniffer._process_packet(_quic("149.154.167.51", initial(first=0x43)))
+    sniffer._process_packet(_quic("8.8.8.8", initial()))
+    assert len(backend.sent) == 2 and all(p.protocol != PROTO_ICMP for p in backend.sent)
+
+    stats = sniffer.get_stats()["quic"]
+    assert stats["initial"] == 2 and stats["icmp"] == 2 and stats["passed"] == 1
+    assert stats["destinations"] == {"149.154.167.51": 2}
+
+
+class _DriverBackend(FakeBackend):
+    """Как WinDivert: send() принимает только пакеты с интерфейсом драйвера"""
+
+    def send(self, packet):
+        if getattr(packet, "interface", None) is None:
+            raise TypeError("packet has no WinDivert address")
+        return super().send(packet)
+
+    def reply(self, packet, raw):
+        reply = super().reply(packet, raw)
+        reply.interface = packet.interface
+        return reply
+
+
+def test_icmp_answer_built_by_backend():
+    quic = QUICFilter("icmp", IPClassifier(cidrs=["149.154.160.0/20"]))
+    backend = _DriverBackend()
+    sniffer = TrafficSniffer(backend=backend, quic_filter=quic)
+    sniffer.w = backend
+    packet = _quic("149.154.167.51", initial())
+    packet.interface = (7, 0)
+    sniffer._process_packet(packet)
+    assert quic.stats["icmp"] == 1 and len(backend.sent) == 1
+    assert backend.sent[0].protocol == PROTO_ICMP
+
+
+def test_drop_ipv6_and_rules():
+    quic = QUICFilter("drop", IPClassifier(cidrs=["2001:67c:4e8::/48"]))
+    backend = FakeBackend()
+    quic.process(build_udp_packet("2001:db8::2", "2001:67c:4e8::a", 51000, 443,
+                                  payload=initial()), backend)
+    assert not backend.sent and quic.stats["dropped"] == 1
+    assert "ipv6.DstAddr >= 2001:67c:4e8::" in quic.filter_clause()
+
+    rules = iptables_rules(quic_ports=quic.ports, quic_cidrs=quic.cidrs())
+    assert any(r.startswith("ip6tables") and "--dports 443 -d 2001:67c:4e8::/48" in r
+               for r in rules)
+    with pytest.raises(ValueError):
+        QUICFilter("reset")
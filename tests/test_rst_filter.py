@@ -0,0 +1,72 @@
+"""
+Тесты отсева внедрённых RST по отпечатку SYN/ACK
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.backend import FakeBackend
+from src.packet import (build_tcp_packet, Direction,
+                        TCP_ACK, TCP_RST, TCP_SYN)
+from src.rst_filter import RSTFilter
+from src.sniffer import TrafficSniffer
+
+CLIENT, SERVER = "10.0.0.1", "149.154.167.50"
+
+
+def _syn():
+    return build_tcp_packet(CLIENT, SERVER, 40000, 443, seq=1000, flags=TCP_SYN)
+
+
+def _from_server(flags, ttl, ident, window=64240, sport=40000):
+    return build_tcp_packet(SERVER, CLIENT, 443, sport, seq=5000, ack=1001,
+                            flags=flags, ttl=ttl, ident=ident, window=window,
+                            direction=Direction.INBOUND)
+
+
+def test_synthetic_injection_dropped():
+    injected = []
+    timeline = [
+        (0.00, _syn()),
+        (0.04, _from_server(TCP_SYN | TCP_ACK, ttl=52, ident=0)),
+        # DPI ближе к клиенту: другой TTL
+        (0.05, _from_server(TCP_RST | TCP_ACK, ttl=61, ident=31337, window=0)),
+        # Настоящий RST сервера Linux: IP-ID в SYN/ACK нулевой, дальше — случайный
+        (0.07, _from_server(TCP_RST | TCP_ACK, ttl=52, ident=48211, window=0)),
+    ]
+    backend = FakeBackend.from_timeline(timeline)
+    sniffer = TrafficSniffer(backend=backend,
+                             rst_filter=RSTFilter(on_fake_rst=injected.append))
+    assert "tcp.Rst" in sniffer.filter_str
+    sniffer.start()
+
+    stats = sniffer.get_stats()["rst"]
+    assert stats["blocked_ttl"] == 1
+    assert stats["blocked_ipid"] == 0
+    assert stats["rst_passed"] == 1
+    assert injected == [(SERVER, 443, 40000)]
+    # SYN, SYN/ACK и настоящий RST пропущены
+    assert len(backend.sent) == 3
+
+
+def test_unknown_flow_and_outbound_rst_pass():
+    rst_filter = RSTFilter()
+    assert not rst_filter.should_drop(_from_server(TCP_RST, ttl=10, ident=1, sport=50000))
+    assert rst_filter.stats["rst_unknown_flow"] == 1
+
+    outbound = build_tcp_packet(CLIENT, SERVER, 40000, 443, flags=TCP_RST)
+    assert not rst_filter.should_drop(outbound)
+    assert rst_filter.stats["rst_seen"] == 1
+
+
+def test_ipid_tolerance_for_counting_servers():
+    rst_filter = RSTFilter()
+    rst_filter.should_drop(_from_server(TCP_SYN | TCP_ACK, ttl=52, ident=1000))
+    # IP-ID вырос умеренно — это тот же сервер
+    assert not rst_filter.should_drop(_from_server(TCP_RST, ttl=53, ident=1500, window=0))
+    # Скачок IP-ID при чужом окне — инжектор с тем же TTL
+    rst_filter.should_drop(_from_server(TCP_SYN | TCP_ACK, ttl=52, ident=1000, sport=40001))
+    assert rst_filter.should_drop(_from_server(TCP_RST, ttl=52, ident=40000, window=1234,
+                                               sport=40001))
+    assert rst_filter.stats["blocked_ipid"] == 1
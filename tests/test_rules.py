@@ -0,0 +1,95 @@
+"""
+Тесты правил политики: загрузка, компиляция, решение в конвейере
+"""
+
+import random
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from benchmarks import bench_rules, bench_soak
+from src.packet import build_tcp_packet
+from src.rules import Rule, RuleSet, load_rules
+from tests.test_strategy import client_hello
+
+CONFIG = """
+rules:
+  - name: bank
+    match: {sni: [bank.example], port: [443]}
+    action: pass
+  - name: dc
+    match:
+      cidr: [149.154.160.0/20]
+      protocol: [tls, mtproto]
+    strategy: legacy
+    params: {first_fragment_size: 3, delay_ms: 0}
+  - name: any-telegram
+    match: {sni: [telegram]}
+"""
+
+
+def test_load_and_match(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text(CONFIG, encoding="utf-8")
+    rules = load_rules(str(path))
+    assert [r.name for r in rules.rules] == ["bank", "dc", "any-telegram"]
+
+    assert rules.match("149.154.167.51", 443, "www.bank.example", "tls").name == "bank"
+    assert rules.match("149.154.167.51", 8443, "www.bank.example", "tls").name == "dc"
+    assert rules.match("149.154.167.51", 443, None, "mtproto_abridged").name == "dc"
+    assert rules.match("149.154.167.51", 80, None, "http") is None
+    assert rules.match("1.2.3.4", 443, "web.telegram.org", "tls").name == "any-telegram"
+    assert rules.match("1.2.3.4", 443, "notbank.example", "tls") is None
+    stats = rules.get_stats()
+    assert stats["matched"] == {"bank": 1, "dc": 2, "any-telegram": 1}
+    assert stats["unmatched"] == 2
+
+    path.write_text("", encoding="utf-8")
+    assert load_rules(str(path)) is None
+    assert load_rules(str(tmp_path / "missing.yaml")) is None
+
+
+def test_invalid_rules_rejected():
+    with pytest.raises(ValueError, match="unknown strategy"):
+        Rule.from_dict({"name": "x", "strategy": "tls_record"})
+    with pytest.raises(ValueError, match="unknown match fields"):
+        Rule.from_dict({"name": "x", "match": {"host": ["a.b"]}})
+    with pytest.raises(ValueError, match="x:"):
+        Rule.from_dict({"name": "x", "match": {"cidr": ["300.1.0.0/16"]}})
+    with pytest.raises(ValueError, match="process"):
+        Rule.from_dict({"name": "p", "match": {"process": ["telegram.exe"]}})
+
+
+def test_compiled_matches_linear_order():
+    rules = bench_rules.make_rules(200, seed=5)
+    compiled = RuleSet(rules)
+    for flow in bench_rules.make_flows(800, 200, seed=6):
+        expected = next((r for r in rules if r.matches(*flow)), None)
+        assert compiled.match(*flow) is expected
+
+
+def test_rules_in_pipeline(tmp_path):
+    app, backend = bench_soak.build_pipeline(str(tmp_path))
+    app.sniffer.rules = RuleSet.from_config({"rules": [
+        {"name": "keep", "match": {"sni": ["web.telegram.org"]}, "action": "pass"},
+        {"name": "forced", "match": {"sni": ["t.me"]}, "strategy": "legacy",
+         "params": {"first_fragment_size": 3, "delay_ms": 0}},
+    ]})
+
+    def hello(port, sni):
+        backend.sent.clear()
+        app.sniffer._process_packet(build_tcp_packet(
+            "10.0.0.2", "149.154.167.51", port, 443, seq=1000, payload=client_hello(sni)))
+        return [len(p.tcp.payload) for p in backend.sent]
+
+    # Адрес Telegram, но правило велит не трогать поток
+    payload = client_hello("web.telegram.org")
+    assert hello(40000, "web.telegram.org") == [len(payload)]
+    assert app.sniffer.verdict.rule.name == "keep" and not app.sniffer.verdict.is_telegram
+    # Стратегия и параметры из правила вместо выбора контроллера
+    assert hello(40001, "t.me") == [3, len(client_hello("t.me")) - 3]
+    assert app.controller.stats["successes"] + app.controller.stats["failures"] == 0
+    assert not len(app.controller.pending)
+    assert app.sniffer.get_stats()["rules"]["matched"] == {"keep": 1, "forced": 1}
@@ -0,0 +1,82 @@
+"""
+Тесты теневого режима и чтения pcap/pcapng
+"""
+
+import struct
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.config import FRAGMENTATION
+from src.main import TelegramBypass
+from src.packet import build_tcp_packet, TCP_SYN, TCP_ACK
+from src.pcap import read_packets, write_pcap, LINKTYPE_ETHERNET
+from tests.test_strategy import client_hello
+
+
+def _capture():
+    hello = build_tcp_packet("10.0.0.2", "203.0.113.5", 50000, 443,
+                             payload=client_hello("web.telegram.org"))
+    other = build_tcp_packet("10.0.0.2", "198.51.100.7", 50001, 443,
+                             payload=client_hello("example.com"))
+    dc = build_tcp_packet("10.0.0.2", "149.154.167.51", 50002, 443,
+                          payload=b"\xef\x19" + b"\x01" * 100)
+    syn_ack = build_tcp_packet("149.154.167.51", "10.0.0.2", 443, 50002,
+                               flags=TCP_SYN | TCP_ACK)
+    return [(1.0, hello.raw), (1.5, other.raw), (2.0, dc.raw), (2.1, syn_ack.raw)]
+
+
+def test_pcap_roundtrip_and_pcapng(tmp_path):
+    packets = _capture()
+    path = tmp_path / "raw.pcap"
+    write_pcap(path, packets)
+    assert [(ts, bytes(p)) for ts, p in read_packets(path)] == \
+        [(ts, bytes(p)) for ts, p in packets]
+
+    # pcapng с Ethernet и наносекундным if_tsresol
+    frame = b"\x00" * 12 + b"\x08\x00" + bytes(packets[0][1])
+    shb = struct.pack("<IIIHHq", 0x0A0D0D0A, 28, 0x1A2B3C4D, 1, 0, -1) + struct.pack("<I", 28)
+    idb_opts = struct.pack("<HHB3x", 9, 1, 9) + struct.pack("<HH", 0, 0)
+    idb_len = 20 + len(idb_opts)
+    idb = struct.pack("<IIHHI", 1, idb_len, LINKTYPE_ETHERNET, 0, 0) + idb_opts + \
+        struct.pack("<I", idb_len)
+    pad = (-len(frame)) % 4
+    epb_len = 32 + len(frame) + pad
+    ts = 1_500_000_000
+    epb = struct.pack("<IIIIIII", 6, epb_len, 0, ts >> 32, ts & 0xFFFFFFFF,
+                      len(frame), len(frame)) + frame + b"\0" * pad + struct.pack("<I", epb_len)
+    path = tmp_path / "eth.pcapng"
+    path.write_bytes(shb + idb + epb)
+    [(when, data)] = list(read_packets(path))
+    assert when == 1.5 and bytes(data) == bytes(packets[0][1])
+
+
+def test_shadow_replay_reports_decisions(tmp_path):
+    path = tmp_path / "capture.pcap"
+    write_pcap(path, _capture())
+
+    app = TelegramBypass(fragment_size=1, delay_ms=10.0, adaptive=False, pcap=str(path))
+    app.run()
+    report = app.shadow_report.summary()
+
+    assert report["packets"] == 4
+    # ClientHello по SNI и пакет к DC по адресу
+    assert report["would_fragment"] == 2
+    assert report["by_strategy"] == {"static": 1, "mtproto_abridged": 1}
+    assert report["would_delay_ms"] == 10.0
+    # 2 фрагмента hello + 2 MTProto + 2 как есть
+    assert report["segments_sent"] == 6
+    assert report["stage_ns_per_packet"]["total"] > 0
+    assert app.fragmenter.get_stats()["fragmented"] == 2
+
+
+def test_shadow_does_not_persist_strategies(tmp_path, monkeypatch):
+    cache = tmp_path / "strategy.json"
+    monkeypatch.setattr(FRAGMENTATION, "STRATEGY_CACHE_FILE", str(cache))
+    path = tmp_path / "capture.pcap"
+    write_pcap(path, _capture())
+
+    app = TelegramBypass(adaptive=True, pcap=str(path))
+    app.fragmenter.sleep = lambda seconds: None
+    app.run()
+    assert app.controller.persist is False and not cache.exists()
@@ -0,0 +1,86 @@
+"""
+Тесты офлайн-симулятора стратегий
+"""
+
+import sys
+import os
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.packet import build_tcp_packet
+from src.pcap import write_pcap
+from src.simulator import LinkModel, Simulator, VirtualClock, sweep
+from tests.test_strategy import client_hello
+
+DC = "149.154.167.51"
+
+
+def _capture(flows: int = 20, gap_s: float = 600.0):
+    """Рукопожатия к Telegram и к постороннему хосту раз в gap_s (часы трафика)"""
+    packets = []
+    for i in range(flows):
+        ts = 1000.0 + i * gap_s
+        hello = build_tcp_packet("10.0.0.2", DC, 40000 + i, 443, seq=1000,
+                                 payload=client_hello("web.telegram.org"))
+        reply = build_tcp_packet(DC, "10.0.0.2", 443, 40000 + i, seq=5000,
+                                 ack=1000 + len(hello.tcp.payload),
+                                 payload=b"\x16\x03\x03\x00\x10" + b"\x00" * 16)
+        ack = build_tcp_packet("10.0.0.2", DC, 40000 + i, 443,
+                               seq=1000 + len(hello.tcp.payload), ack=5021,
+                               payload=b"\x14\x03\x03\x00\x01\x01")
+        other = build_tcp_packet("10.0.0.2", "198.51.100.7", 50000 + i, 443,
+                                 payload=client_hello("example.com"))
+        packets += [(ts, hello.raw), (ts + 0.05, reply.raw), (ts + 0.051, ack.raw),
+                    (ts + 1.0, other.raw)]
+    return packets
+
+
+def test_virtual_clock_and_link():
+    clock = VirtualClock(10.0)
+    clock.sleep(0.5)
+    clock.advance_to(5.0)
+    assert clock() == 10.5
+
+    link = LinkModel(rtt_ms=40, bandwidth_mbps=8)
+    assert link.transmit(1000, 0.0) == 0.001
+    # Второй пакет ждёт, пока канал освободится
+    assert link.transmit(1000, 0.0) == 0.002
+
+
+def test_delay_cost_per_strategy(tmp_path):
+    path = tmp_path / "capture.pcap"
+    write_pcap(path, _capture())
+
+    started = time.perf_counter()
+    results = {(r["mode"], r["delay_ms"]): r
+               for r in sweep(str(path), ["split", "legacy"], [0.0, 20.0], rtt_ms=50.0)}
+    # ~3 часа трафика за доли секунды
+    assert time.perf_counter() - started < 5.0
+    assert results[("split", 0.0)]["simulated_s"] > 3 * 3600
+
+    split = results[("split", 0.0)]
+    assert split["flows"] == 40
+    assert split["by_strategy"]["split"]["flows"] == 20
+    assert split["by_strategy"]["passthrough"]["flows"] == 20
+    # Разрез без задержки: два сегмента, время рукопожатия ≈ RTT
+    assert split["by_strategy"]["split"]["segments"] == 40
+    assert abs(split["handshake_ms"]["p95"] - 50.0) < 1.0
+    assert split["packets_diverted"] == 80
+    assert split["packets_sent"] == 100
+    assert split["bytes_diverted"] > 0
+
+    # legacy: одна задержка между фрагментами на каждое рукопожатие Telegram
+    slow = results[("legacy", 20.0)]["by_strategy"]["legacy"]
+    fast = results[("legacy", 0.0)]["by_strategy"]["legacy"]
+    assert abs(slow["avg_handshake_ms"] - fast["avg_handshake_ms"] - 20.0) < 0.5
+
+
+def test_static_mode_without_controller(tmp_path):
+    path = tmp_path / "capture.pcap"
+    write_pcap(path, _capture(flows=2))
+    report = Simulator(str(path), mode="static").run()
+    # Маленький ClientHello: разрез по 1 байту с задержкой 10 мс
+    assert report["by_strategy"]["static"]["flows"] == 2
+    # Без контроллера фрагментируются все сегменты с данными, не только первый
+    assert report["fragmented"] == 4
+    assert report["added_ms"]["avg"] > 4.0
@@ -0,0 +1,72 @@
+"""
+Тесты режима без драйвера: SOCKS5 / HTTP CONNECT прокси
+"""
+
+import asyncio
+import random
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks import bench_socks
+from benchmarks.bench_socks import SERVER_HELLO, Stand, socks_connect
+from benchmarks.traffic import tdesktop_hello
+
+
+async def _exchange(reader, writer, hello: bytes, tail: bytes) -> bytes:
+    writer.write(hello)
+    assert await reader.readexactly(len(SERVER_HELLO)) == SERVER_HELLO
+    writer.write(tail)
+    echoed = await reader.readexactly(len(tail))
+    writer.close()
+    await writer.wait_closed()
+    return echoed
+
+
+def test_socks5_splits_telegram_hello():
+    hello = tdesktop_hello("web.telegram.org", random.Random(1))
+    tail = os.urandom(300_000)
+
+    async def client(stand):
+        reader, writer = await socks_connect(stand.proxy.port, "127.0.0.1", stand.server_port)
+        return await _exchange(reader, writer, hello, tail)
+
+    with Stand() as stand:
+        assert asyncio.run(client(stand)) == tail
+        stats = stand.proxy.get_stats()
+    assert stats["socks5"] == 1 and stats["telegram"] == 1
+    assert stats["split"] == 1 and stats["pieces"] >= 2
+    assert stats["bytes_up"] == len(hello) + len(tail)
+    assert stats["errors"] == 0
+
+
+def test_http_connect_and_untouched_flows():
+    hello = tdesktop_hello("www.example.com", random.Random(2))
+
+    async def client(stand):
+        reader, writer = await asyncio.open_connection("127.0.0.1", stand.proxy.port)
+        writer.write(f"CONNECT 127.0.0.1:{stand.server_port} HTTP/1.1\r\n"
+                     f"Host: 127.0.0.1\r\n\r\n".encode())
+        status = await reader.readuntil(b"\r\n\r\n")
+        assert status.startswith(b"HTTP/1.1 200")
+        return await _exchange(reader, writer, hello, b"ping")
+
+    async def bad_method(stand):
+        reader, writer = await asyncio.open_connection("127.0.0.1", stand.proxy.port)
+        writer.write(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n")
+        status = await reader.read(1024)
+        writer.close()
+        return status
+
+    with Stand() as stand:
+        assert asyncio.run(client(stand)) == b"ping"
+        assert asyncio.run(bad_method(stand)).startswith(b"HTTP/1.1 405")
+        stats = stand.proxy.get_stats()
+    assert stats["http"] == 1 and stats["telegram"] == 0 and stats["split"] == 0
+
+
+def test_benchmark_runs():
+    report = bench_socks.run(connections=100, concurrency=50, streams=2, megabytes=2)
+    assert report["proxy"]["handshakes"]["errors"] == 0
+    assert report["proxy"]["throughput"]["megabytes"] == 2.0
+    assert report["proxy_stats"]["split"] == 100
@@ -0,0 +1,79 @@
+"""
+Тесты быстрого старта: кэш правил и перехват до обращения к сети
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.backend import FakeBackend
+from src.classifier import IPClassifier
+from src.config import TELEGRAM, SNIFFER
+from src.ip_updater import IPDiff, TelegramIPUpdater
+from src.main import TelegramBypass
+from src.packet import TCP_ACK, build_tcp_packet
+from tests.test_strategy import client_hello
+
+
+def test_compiled_rules_cache(tmp_path, monkeypatch):
+    cache = tmp_path / "rules.json"
+    built = IPClassifier.from_config_cached(cache, TELEGRAM)
+    assert cache.exists()
+    loaded = IPClassifier.from_config_cached(cache, TELEGRAM)
+    assert loaded.intervals(4) == built.intervals(4)
+    assert loaded.contains("149.154.167.51") and not loaded.contains("8.8.8.8")
+
+    # Изменились исходные префиксы — кэш пересобирается
+    monkeypatch.setattr(TELEGRAM, "IP_PREFIXES", TELEGRAM.IP_PREFIXES + ["8.8."])
+    assert IPClassifier.from_config_cached(cache, TELEGRAM).contains("8.8.8.8")
+
+
+def _run(tmp_path, monkeypatch, fast_start: bool):
+    monkeypatch.setattr(TelegramIPUpdater, "CACHE_FILE", tmp_path / "telegram_ips.json")
+    monkeypatch.setattr(SNIFFER, "RULES_CACHE_FILE", str(tmp_path / "rules.json"))
+    monkeypatch.setattr(TELEGRAM, "IP_PREFIXES", list(TELEGRAM.IP_PREFIXES))
+    monkeypatch.setattr(TELEGRAM, "IP_SOURCED", [])
+
+    packets = [build_tcp_packet("10.0.0.2", "5.6.7.8", 40000 + i, 443,
+                                payload=client_hello("example.com")) for i in range(2)]
+    backend = FakeBackend(packets)
+    opened_before_fetch = []
+
+    def fetch(self):
+        opened_before_fetch.append(backend.is_open)
+        return ["5.6.0.0/16"]
+    monkeypatch.setattr(TelegramIPUpdater, "_fetch_from_network", fetch)
+
+    app = TelegramBypass(adaptive=False, recorder=False, fast_start=fast_start, backend=backend)
+    app.fragmenter.sleep = lambda seconds: None
+    # Фоновый поток — синхронно, чтобы порядок был детерминирован
+    app._warm_up = app._warm_up_worker
+    app.run()
+    return app, opened_before_fetch
+
+
+def test_fast_start_opens_handle_before_network(tmp_path, monkeypatch):
+    app, opened_before_fetch = _run(tmp_path, monkeypatch, fast_start=True)
+    assert opened_before_fetch == [True]
+    # Новые диапазоны применены в потоке захвата; кэш правил — только конфиг
+    assert app.ip_classifier.contains("5.6.7.8")
+    assert app.fragmenter.get_stats()["fragmented"] == 2
+    assert IPClassifier.from_config_cached(tmp_path / "rules.json", TELEGRAM).contains("5.6.1.1")
+    assert "5.6." not in TELEGRAM.IP_PREFIXES
+
+
+def test_upstream_removal_reaches_live_classifier(tmp_path, monkeypatch):
+    app, _ = _run(tmp_path, monkeypatch, fast_start=False)
+    assert app.ip_classifier.contains("5.6.7.8")
+    # Источник убрал диапазон: разница уходит потоку захвата со следующим пакетом
+    app._ip_diffs.append(IPDiff(removed=["5.6.0.0/16"]))
+    packet = build_tcp_packet("10.0.0.2", "5.6.7.8", 41000, 443, flags=TCP_ACK)
+    assert app.on_packet(packet, None, False, app.sniffer.w) is True
+    assert not app.ip_classifier.contains("5.6.7.8")
+    assert app.ip_classifier.contains("149.154.167.51")
+
+
+def test_blocking_start_fetches_first(tmp_path, monkeypatch):
+    app, opened_before_fetch = _run(tmp_path, monkeypatch, fast_start=False)
+    assert opened_before_fetch == [False]
+    assert app.fragmenter.get_stats()["fragmented"] == 2
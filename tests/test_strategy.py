@@ -0,0 +1,164 @@
+"""
+Тесты самонастройки стратегии фрагментации
+"""
+
+import sys
+import os
+import struct
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.backend import FakeBackend
+from src.fragmenter import SmartFragmenter
+from src.packet import build_tcp_packet, TCP_ACK, TCP_PSH, TCP_RST
+from src.strategy import StrategyController, build_plan, destination_range
+from src.tls_parser import find_sni_offset, get_sni_from_payload
+
+
+def client_hello(sni: str) -> bytes:
+    """Минимальный ClientHello с SNI"""
+    name = sni.encode()
+    sni_ext = struct.pack("!HHHBH", 0x0000, len(name) + 5, len(name) + 3, 0, len(name)) + name
+    body = (b"\x03\x03" + b"\x00" * 32 + b"\x00" +
+            b"\x00\x02\x13\x01" + b"\x01\x00" +
+            struct.pack("!H", len(sni_ext)) + sni_ext)
+    hs = b"\x01" + struct.pack("!I", len(body))[1:] + body
+    return b"\x16\x03\x01" + struct.pack("!H", len(hs)) + hs
+
+
+def _hello_packet(seq=1000, ack=5000, sport=40000, dst="149.154.167.50"):
+    return build_tcp_packet("10.0.0.1", dst, sport, 443,
+                            payload=client_hello("web.telegram.org"),
+                            seq=seq, ack=ack, flags=TCP_ACK | TCP_PSH)
+
+
+def test_find_sni_offset():
+    payload = client_hello("web.telegram.org")
+    start, length = find_sni_offset(payload)
+    assert payload[start:start + length] == b"web.telegram.org"
+    assert get_sni_from_payload(payload) == "web.telegram.org"
+    assert find_sni_offset(b"GET / HTTP/1.1\r\n") is None
+
+
+def test_build_plan_ladder():
+    payload = client_hello("web.telegram.org")
+    start, length = find_sni_offset(payload)
+
+    split = build_plan("split", payload)
+    assert split.offsets == (start + length // 2,)
+    assert split.added_delay_ms == 0
+
+    assert build_plan("header_split", payload).offsets == (5, start + length // 2)
+    assert build_plan("split_delay", payload).delay_ms > 0
+    legacy = build_plan("legacy", payload, first_fragment_size=1, delay_ms=10.0)
+    assert legacy.offsets == (1,) and legacy.delay_ms == 10.0
+
+
+def test_controller_escalates_and_persists(tmp_path):
+    cache = tmp_path / "strategy.json"
+    controller = StrategyController(cache_file=str(cache))
+    tcp = build_tcp_packet("10.0.0.1", "149.154.167.50", 1, 443,
+                           flags=TCP_RST).tcp
+
+    assert controller.choose("149.154.167.50") == "split"
+    for port in (1, 2):
+        controller.on_handshake_sent(("149.154.167.50", 443, port),
+                                     "149.154.167.50", "split", 1000, 5000)
+        assert controller.observe_outbound(("149.154.167.50", 443, port), tcp, 0) is False
+    assert controller.choose("149.154.167.99") == "header_split"
+
+    controller.save(force=True)
+    warm = StrategyController(cache_file=str(cache))
+    assert warm.strategy_for("149.154.167.1") == "header_split"
+    assert destination_range("149.154.167.1") in warm.ranges
+
+
+def test_controller_without_persist_never_writes(tmp_path):
+    cache = tmp_path / "strategy.json"
+    now = [0.0]
+    controller = StrategyController(cache_file=str(cache), clock=lambda: now[0], persist=False)
+    tcp = build_tcp_packet("10.0.0.1", "149.154.167.50", 1, 443, flags=TCP_RST).tcp
+    for port in range(1, 6):
+        now[0] += StrategyController.SAVE_INTERVAL_S + 1
+        controller.on_handshake_sent(("149.154.167.50", 443, port),
+                                     "149.154.167.50", "split", 1000, 5000)
+        controller.observe_outbound(("149.154.167.50", 443, port), tcp, 0)
+    controller.save(force=True)
+    assert controller.stats["failures"] == 5 and not cache.exists()
+
+
+def test_fragmenter_zero_delay_and_success(tmp_path):
+    controller = StrategyController(cache_file=str(tmp_path / "s.json"))
+    fragmenter = SmartFragmenter(controller=controller)
+    sleeps = []
+    fragmenter.sleep = sleeps.append
+
+    backend = FakeBackend()
+    hello = _hello_packet()
+    fragmenter.process_packet_adaptive(backend, hello)
+    assert len(backend.sent) == 2
+    assert sleeps == []
+    assert b"".join(p.tcp.payload for p in backend.sent) == client_hello("web.telegram.org")
+    assert backend.sent[1].tcp.seq_num == 1000 + len(backend.sent[0].tcp.payload)
+
+    # Следующий сегмент потока не фрагментируется, а ACK с ростом ack — успех
+    data = build_tcp_packet("10.0.0.1", "149.154.167.50", 40000, 443,
+                            payload=b"\x17" * 50, seq=2000, ack=6000,
+                            flags=TCP_ACK | TCP_PSH)
+    fragmenter.process_packet_adaptive(backend, data)
+    assert len(backend.sent) == 3
+    assert controller.stats["successes"] == 1
+    assert controller.stats["failures"] == 0
+
+
+def test_retransmit_counts_as_failure(tmp_path):
+    controller = StrategyController(cache_file=str(tmp_path / "s.json"))
+    fragmenter = SmartFragmenter(controller=controller)
+    backend = FakeBackend()
+    fragmenter.process_packet_adaptive(backend, _hello_packet())
+    fragmenter.process_packet_adaptive(backend, _hello_packet())
+    assert controller.stats["failures"] == 1
+    # Повтор снова фрагментирован
+    assert len(backend.sent) == 4
+
+
+def test_retransmit_reuses_plan_without_delay(tmp_path):
+    controller = StrategyController(cache_file=str(tmp_path / "s.json"))
+    controller.choose("149.154.167.50", hint="split_delay")
+    fragmenter = SmartFragmenter(controller=controller)
+    sleeps = []
+    fragmenter.sleep = sleeps.append
+    backend = FakeBackend()
+
+    fragmenter.process_packet_adaptive(backend, _hello_packet())
+    fragmenter.process_packet_adaptive(backend, _hello_packet())
+    original, repeat = backend.sent[:2], backend.sent[2:]
+    # Те же границы, задержка только у оригинала
+    assert [p.tcp.seq_num for p in repeat] == [p.tcp.seq_num for p in original]
+    assert [len(p.tcp.payload) for p in repeat] == [len(p.tcp.payload) for p in original]
+    assert len(sleeps) == 1
+    assert fragmenter.get_stats()["retransmits"] == 1
+    assert controller.stats["failures"] == 1
+
+    # Ответ сервера подтверждён — рукопожатие пройдено, план забыт
+    ack = build_tcp_packet("10.0.0.1", "149.154.167.50", 40000, 443,
+                           seq=1000 + len(client_hello("web.telegram.org")), ack=6000,
+                           flags=TCP_ACK)
+    fragmenter.observe_packet(ack)
+    assert len(fragmenter._sent_plans) == 0
+    assert controller.stats["successes"] == 1
+
+
+def test_retransmit_static_plan(tmp_path):
+    fragmenter = SmartFragmenter()
+    sleeps = []
+    fragmenter.sleep = sleeps.append
+    backend = FakeBackend()
+    for _ in range(3):
+        fragmenter.process_packet_adaptive(backend, _hello_packet())
+    assert len(backend.sent) == 6 and len(sleeps) == 1
+    assert fragmenter.get_stats()["retransmits"] == 2
+    # Другая длина с тем же seq — не повтор, план строится заново
+    fragmenter.process_packet_adaptive(backend, build_tcp_packet(
+        "10.0.0.1", "149.154.167.50", 40000, 443, payload=b"\x16" * 40,
+        seq=1000, ack=5000, flags=TCP_ACK | TCP_PSH))
+    assert len(sleeps) == 2
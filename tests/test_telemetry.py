@@ -0,0 +1,78 @@
+"""
+Тесты телеметрии задержек рукопожатия на сценарном двунаправленном трафике
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.backend import FakeBackend
+from src.fragmenter import SmartFragmenter
+from src.packet import (build_tcp_packet, Direction,
+                        TCP_ACK, TCP_PSH, TCP_SYN)
+from src.sniffer import TrafficSniffer
+from src.strategy import StrategyController
+from src.telemetry import HandshakeTelemetry, LatencyHistogram
+from tests.test_strategy import client_hello
+
+CLIENT, SERVER = "10.0.0.1", "149.154.167.50"
+
+
+def _out(payload=b"", flags=TCP_ACK, seq=1001, ack=5001):
+    return build_tcp_packet(CLIENT, SERVER, 40000, 443, payload=payload,
+                            seq=seq, ack=ack, flags=flags)
+
+
+def _in(payload=b"", flags=TCP_ACK, seq=5001, ack=1001):
+    return build_tcp_packet(SERVER, CLIENT, 443, 40000, payload=payload,
+                            seq=seq, ack=ack, flags=flags,
+                            direction=Direction.INBOUND)
+
+
+def test_histogram_percentiles():
+    hist = LatencyHistogram()
+    for _ in range(90):
+        hist.add(0.001)      # 1 мс
+    for _ in range(10):
+        hist.add(0.100)      # 100 мс
+    summary = hist.summary()
+    assert summary["count"] == 100
+    assert summary["p50_ms"] < 3
+    assert summary["p99_ms"] >= 100
+
+
+def test_scripted_handshake(tmp_path):
+    server_hello = b"\x16\x03\x03\x00\x30\x02" + b"\x00" * 47
+    timeline = [
+        (0.000, _out(flags=TCP_SYN, seq=1000, ack=0)),
+        (0.040, _in(flags=TCP_SYN | TCP_ACK, seq=5000, ack=1001)),
+        (0.041, _out()),
+        (0.042, _out(payload=client_hello("web.telegram.org"), flags=TCP_ACK | TCP_PSH)),
+        (0.090, _in(payload=server_hello)),
+    ]
+    backend = FakeBackend.from_timeline(timeline)
+    telemetry = HandshakeTelemetry(clock=backend.clock)
+
+    fragmenter = SmartFragmenter(
+        controller=StrategyController(cache_file=str(tmp_path / "s.json")))
+    fragmenter.telemetry = telemetry
+
+    def on_packet(packet, sni, is_telegram, w):
+        fragmenter.process_packet_adaptive(w, packet)
+        return False
+
+    sniffer = TrafficSniffer(on_packet=on_packet, backend=backend, telemetry=telemetry)
+    assert "inbound" in sniffer.filter_str
+    sniffer.start()
+
+    stats = sniffer.get_stats()
+    assert stats["inbound"] == 2
+    prefix = stats["latency"]["by_prefix"]["149.154.167.0/24"]
+    assert prefix["syn_rtt"]["count"] == 1
+    assert 32 <= prefix["syn_rtt"]["p50_ms"] <= 66
+    assert prefix["hello_rtt"]["count"] == 1
+    split = stats["latency"]["by_strategy"]["split"]
+    assert split["fragmenter"]["count"] == 1
+    assert split["hello_rtt"]["count"] == 1
+    # Входящие пакеты не фрагментируются и уходят как есть
+    assert len(backend.sent) == len(timeline) + 1
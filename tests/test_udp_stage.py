@@ -0,0 +1,114 @@
+"""
+Тесты UDP-стадии: по умолчанию UDP не перехватывается, иначе — первые пакеты потока
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks import bench_udp_jitter
+from src.backend import FakeBackend
+from src.nfqueue_backend import iptables_rules
+from src.packet import build_udp_packet
+from src.sniffer import TrafficSniffer
+from src.udp_stage import UDP_STRATEGIES, UDPStage, register_udp_strategy
+
+
+def _call(src_port: int, dst: str = "149.154.167.51"):
+    return build_udp_packet("10.0.0.2", dst, src_port, 10000, payload=b"\x00" * 160)
+
+
+class _Backend(FakeBackend):
+    def __init__(self):
+        super().__init__()
+        self.filters = []
+
+    def set_filter(self, filter_str: str):
+        self.filters.append(filter_str)
+
+
+def test_udp_not_diverted_by_default():
+    sniffer = TrafficSniffer(backend=FakeBackend())
+    assert sniffer.udp_stage is None
+    assert "udp.DstPort" not in sniffer.filter_str
+    assert not any("-p udp" in rule for rule in iptables_rules())
+
+
+def test_stage_offloads_after_first_packets():
+    now = [0.0]
+    stage = UDPStage("observe", first_packets=3, refilter_interval=1.0, clock=lambda: now[0])
+    backend = _Backend()
+    sniffer = TrafficSniffer(backend=backend, udp_stage=stage)
+    sniffer.w = backend
+    assert "udp.DstPort == 10000" in sniffer.filter_str
+
+    for _ in range(3):
+        sniffer._process_packet(_call(50000))
+    # Поток выгружен: фильтр сужен, пакеты пересланы как есть
+    assert len(backend.sent) == 3 and len(backend.filters) == 1
+    assert "not ((ip.DstAddr == 149.154.167.51 and udp.DstPort == 10000 " \
+           "and udp.SrcPort == 50000))" in backend.filters[0]
+    assert not stage.matches(_call(50000)) and stage.matches(_call(50001))
+
+    # Следующий поток ждёт интервала между сменами фильтра
+    for _ in range(3):
+        sniffer._process_packet(_call(50001))
+    assert len(backend.filters) == 1
+    now[0] = 1.5
+    sniffer._process_packet(_call(50002))
+    assert len(backend.filters) == 2 and "udp.SrcPort == 50001" in backend.filters[1]
+    assert sniffer.get_stats()["udp_stage"]["offloaded"] == 2
+
+
+def test_exclusions_capped_and_rejected_filter_kept():
+    stage = UDPStage("observe", first_packets=1, max_offloaded=1000, refilter_interval=0.0)
+    assert stage.offloaded.max_flows == UDPStage.MAX_EXCLUDED
+    backend = _Backend()
+    sniffer = TrafficSniffer(backend=backend, udp_stage=stage)
+    sniffer.w = backend
+    for port in range(50000, 50000 + 2 * UDPStage.MAX_EXCLUDED):
+        sniffer._process_packet(_call(port))
+    assert sniffer.filter_str.count("udp.SrcPort") == UDPStage.MAX_EXCLUDED
+
+    # Драйвер не принял фильтр — прежний остаётся и у сниффера
+    previous = sniffer.filter_str
+
+    def reject(filter_str):
+        raise OSError(87, "invalid filter")
+
+    backend.set_filter = reject
+    sniffer._process_packet(_call(60000))
+    assert sniffer.filter_str == previous
+
+
+def test_custom_strategy_and_nfqueue_rules():
+    seen = []
+
+    @register_udp_strategy("drop_first")
+    def drop_first(packet, w):
+        seen.append(packet.src_port)
+        return len(seen) == 1
+
+    try:
+        backend = FakeBackend()
+        sniffer = TrafficSniffer(backend=backend, udp_stage=UDPStage("drop_first"))
+        sniffer.w = backend
+        sniffer._process_packet(_call(50000))
+        sniffer._process_packet(_call(50000))
+        assert seen == [50000, 50000] and len(backend.sent) == 1
+    finally:
+        del UDP_STRATEGIES["drop_first"]
+
+    rules = iptables_rules(udp_ports=[3478, 10000], udp_first_packets=8)
+    udp = [rule for rule in rules if "-p udp" in rule]
+    assert len(udp) == 2
+    assert all("--dports 3478,10000 -m connbytes --connbytes 1:8" in rule for rule in udp)
+
+
+def test_jitter_benchmark():
+    off = bench_udp_jitter.run("off", calls=2, seconds=5)
+    first = bench_udp_jitter.run("first_n", calls=2, seconds=5)
+    everything = bench_udp_jitter.run("all", calls=2, seconds=5)
+    assert off["diverted"] == 0 and off["mean_us"] == 0
+    assert everything["diverted"] == everything["packets"] == 500
+    assert 0 < first["diverted"] < 100 and first["filter_updates"] >= 1